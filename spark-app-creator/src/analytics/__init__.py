@@ -0,0 +1,9 @@
+from analytics.dynamic_allocation_advisor import (
+    DynamicAllocationAdvisor, DynamicAllocationRecommendation,
+    ExecutorChurnStats)
+from analytics.executor_state_tracker import (ExecutorStateAggregator,
+                                              ExecutorStateTracker)
+from analytics.lifecycle_analyzer import (LifecycleAnalyzer, SparkAppTimeline,
+                                          compare_summaries)
+from analytics.event_log_analyzer import (EventLogAnalyzer, EventLogSummary,
+                                          StageStats, analyze_event_log)
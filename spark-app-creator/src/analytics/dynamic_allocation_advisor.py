@@ -0,0 +1,277 @@
+import logging
+import math
+import re
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from analytics.executor_state_tracker import ExecutorStateTracker
+from k8s_objects.spark_app import (DynamicAllocation, ExecutorStateEnum,
+                                   SparkApp, SparkAppStatus)
+from kubernetes.client.models import V1ObjectMeta
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import get_spark_app_template
+
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+FINISHED_EXECUTOR_STATES = (ExecutorStateEnum.COMPLETED.value, ExecutorStateEnum.FAILED.value)
+
+EXECUTOR_IDLE_TIMEOUT_CONF = "spark.dynamicAllocation.executorIdleTimeout"
+DEFAULT_EXECUTOR_IDLE_TIMEOUT_SECONDS = 60.0
+
+
+def parse_duration_seconds(value: str | None, default: float) -> float:
+    """
+    Spark time string (60s, 2min, 500ms, 1h) to seconds, a bare number is seconds
+    """
+    if value is None:
+        return default
+    matched = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(ms|s|m|min|h|d)?\s*", str(value))
+    if matched is None:
+        return default
+    multiplier = {"ms": 0.001, "s": 1, "m": 60, "min": 60, "h": 3600, "d": 86400}[matched.group(2) or "s"]
+    return float(matched.group(1)) * multiplier
+
+
+class ExecutorChurnStats():
+    def __init__(self, namespace: str, name: str, template: str, dynamic_allocation: DynamicAllocation, executor_idle_timeout: float) -> None:
+        """Executor churn of one SparkApp run with dynamic allocation."""
+        self.namespace = namespace
+        self.name = name
+        self.template = template
+        self.min_executors = dynamic_allocation.min_executors
+        self.max_executors = dynamic_allocation.max_executors
+        self.shuffle_tracking_timeout = dynamic_allocation.shuffle_tracking_timeout
+        self.executor_idle_timeout = executor_idle_timeout
+        self.tracker = ExecutorStateTracker()
+        # executors added once some were removed, the initial ramp-up is not churn
+        self.adds = 0
+        self.removes = 0
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self.lowest_running: int | None = None
+
+
+    @property
+    def duration_seconds(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return (self.finished_at - self.started_at).total_seconds()
+
+
+    @property
+    def peak_running(self) -> int:
+        return max((running for _, running in self.tracker.running_over_time()), default=0)
+
+
+    @property
+    def executor_seconds(self) -> float:
+        return self.tracker.executor_seconds(until=self.finished_at)
+
+
+    @property
+    def time_at_max_seconds(self) -> float:
+        if not self.max_executors:
+            return 0.0
+
+        series = self.tracker.running_over_time()
+        total = 0.0
+        for index, (timestamp, running) in enumerate(series):
+            until = series[index + 1][0] if index + 1 < len(series) else (self.finished_at or timestamp)
+            if running >= self.max_executors:
+                total += (until - timestamp).total_seconds()
+        return total
+
+
+    @property
+    def idle_executor_seconds(self) -> float:
+        """
+        Lower bound: every executor removed by dynamic allocation sat idle for `executorIdleTimeout` first
+        """
+        return self.removes * self.executor_idle_timeout
+
+
+class DynamicAllocationRecommendation():
+    def __init__(self, template: str, runs: int) -> None:
+        """Dynamic allocation settings recommended for a template, None means keep the current value."""
+        self.template = template
+        self.runs = runs
+        self.min_executors: int | None = None
+        self.max_executors: int | None = None
+        self.shuffle_tracking_timeout: int | None = None
+        self.executor_idle_timeout: str | None = None
+        self.wasted_executor_seconds = 0.0
+        self.reasons: list[str] = []
+
+
+    def __repr__(self) -> str:
+        return "DynamicAllocationRecommendation(template=%s, min_executors=%s, max_executors=%s, shuffle_tracking_timeout=%s, executor_idle_timeout=%s, wasted_executor_seconds=%.0f)" % (
+            self.template, self.min_executors, self.max_executors, self.shuffle_tracking_timeout,
+            self.executor_idle_timeout, self.wasted_executor_seconds,
+        )
+
+
+class DynamicAllocationAdvisor():
+    """
+    Register `observe` as a SparkApp listener. For SparkApps with dynamic allocation enabled it follows
+    the `executor_state` snapshots, counts executors removed (RUNNING -> finished) while the app runs and executors
+    added (-> RUNNING) after a removal, and `recommend` turns the finished runs of a template into settings:
+    - runs spending more than `saturated_fraction` of their time at `max_executors` get a max of max * `saturated_growth`
+    - runs whose peak stays well under `max_executors` get a max of peak * `headroom`
+    - heavy churn (removed executors added back later) raises `min_executors` to the lowest running count
+    - idle executor time above `idle_fraction` of executor time lowers the idle / shuffle tracking timeouts
+    A recommended max is never below the min. Only the last `max_runs_per_template` runs of each template are kept.
+    """
+
+    def __init__(self,
+                 headroom: float = 1.2,
+                 saturated_fraction: float = 0.5,
+                 saturated_growth: float = 1.5,
+                 churn_per_minute: float = 2.0,
+                 idle_fraction: float = 0.2,
+                 min_runs: int = 1,
+                 max_runs_per_template: int = 50) -> None:
+        self.headroom = headroom
+        self.saturated_fraction = saturated_fraction
+        self.saturated_growth = saturated_growth
+        self.churn_per_minute = churn_per_minute
+        self.idle_fraction = idle_fraction
+        self.min_runs = min_runs
+        self.max_runs_per_template = max_runs_per_template
+
+        self._lock = threading.Lock()
+        self._in_flight: dict[tuple[str, str], ExecutorChurnStats] = dict()
+        self._finished: dict[str, deque[ExecutorChurnStats]] = dict()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def observe(self, spark_app: SparkApp, observed_at: datetime = None) -> None:
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        dynamic_allocation: DynamicAllocation = spark_app.spec.dynamic_allocation
+        if dynamic_allocation is None or not dynamic_allocation.enabled:
+            return
+        if status is None or status.application_state is None:
+            return
+
+        observed_at = observed_at or datetime.now(timezone.utc)
+        state = status.application_state.state
+        key = (metadata.namespace, metadata.name)
+
+        with self._lock:
+            stats = self._in_flight.get(key)
+            if stats is None:
+                idle_timeout = parse_duration_seconds(
+                    (spark_app.spec.spark_conf or dict()).get(EXECUTOR_IDLE_TIMEOUT_CONF), DEFAULT_EXECUTOR_IDLE_TIMEOUT_SECONDS
+                )
+                stats = ExecutorChurnStats(
+                    namespace=metadata.namespace,
+                    name=metadata.name,
+                    template=get_spark_app_template(spark_app),
+                    dynamic_allocation=dynamic_allocation,
+                    executor_idle_timeout=idle_timeout,
+                )
+                self._in_flight[key] = stats
+
+            if state == SparkAppState.RUNNING.value and stats.started_at is None:
+                stats.started_at = observed_at
+
+            changes = [
+                (executor_id, executor_state, stats.tracker.state_of(executor_id))
+                for executor_id, executor_state in (status.executor_state or dict()).items()
+            ]
+            # removals first, so that executors replacing them in the same snapshot count as added back
+            for _, executor_state, previous in changes:
+                if executor_state in FINISHED_EXECUTOR_STATES and previous == ExecutorStateEnum.RUNNING.value:
+                    if state not in TERMINAL_STATES:
+                        stats.removes += 1
+            for executor_id, executor_state, previous in changes:
+                if executor_state == ExecutorStateEnum.RUNNING.value and previous != executor_state and stats.removes:
+                    stats.adds += 1
+                stats.tracker.apply_delta(executor_id, executor_state)
+            stats.tracker.update(None, observed_at=observed_at)
+
+            if stats.started_at is not None and state not in TERMINAL_STATES:
+                running = stats.tracker.running
+                if running and (stats.lowest_running is None or running < stats.lowest_running):
+                    stats.lowest_running = running
+
+            if state not in TERMINAL_STATES:
+                return
+
+            stats.finished_at = observed_at
+            del self._in_flight[key]
+            self._finished.setdefault(stats.template, deque(maxlen=self.max_runs_per_template)).append(stats)
+
+
+    def runs(self, template: str) -> list[ExecutorChurnStats]:
+        with self._lock:
+            return list(self._finished.get(template, []))
+
+
+    def recommendations(self) -> list[DynamicAllocationRecommendation]:
+        with self._lock:
+            templates = list(self._finished)
+        recommendations = [self.recommend(template) for template in templates]
+        return [recommendation for recommendation in recommendations if recommendation is not None]
+
+
+    def recommend(self, template: str) -> DynamicAllocationRecommendation | None:
+        runs = [run for run in self.runs(template) if run.duration_seconds > 0]
+        if len(runs) < self.min_runs:
+            return None
+
+        recommendation = DynamicAllocationRecommendation(template=template, runs=len(runs))
+        current = runs[-1]
+        total_seconds = sum(run.duration_seconds for run in runs)
+        executor_seconds = sum(run.executor_seconds for run in runs)
+        idle_seconds = sum(run.idle_executor_seconds for run in runs)
+        recommendation.wasted_executor_seconds = idle_seconds
+
+        peak = max(run.peak_running for run in runs)
+        time_at_max = sum(run.time_at_max_seconds for run in runs)
+        if current.max_executors and time_at_max / total_seconds > self.saturated_fraction:
+            recommendation.max_executors = math.ceil(current.max_executors * self.saturated_growth)
+            recommendation.reasons.append(
+                "at max_executors %.0f%% of the time" % (100 * time_at_max / total_seconds)
+            )
+        elif current.max_executors and math.ceil(peak * self.headroom) < current.max_executors:
+            recommendation.max_executors = max(math.ceil(peak * self.headroom), 1)
+            recommendation.reasons.append("peak of %s running executors for max_executors %s" % (peak, current.max_executors))
+
+        churn = sum(run.adds + run.removes for run in runs) / (total_seconds / 60)
+        lowest = [run.lowest_running for run in runs if run.lowest_running]
+        if churn > self.churn_per_minute and lowest:
+            min_executors = min(lowest)
+            if current.min_executors is None or min_executors > current.min_executors:
+                recommendation.min_executors = min_executors
+                recommendation.reasons.append(
+                    "%.1f executor adds/removes per minute, never fewer than %s running" % (churn, min_executors)
+                )
+
+        min_executors = recommendation.min_executors or current.min_executors
+        if recommendation.max_executors is not None and min_executors and recommendation.max_executors < min_executors:
+            # a peak under min_executors only means the app never needed them all
+            recommendation.max_executors = min_executors
+
+        if executor_seconds and idle_seconds / executor_seconds > self.idle_fraction:
+            idle_timeout = max(int(current.executor_idle_timeout / 2), 15)
+            recommendation.executor_idle_timeout = "%ss" % idle_timeout
+            if current.shuffle_tracking_timeout:
+                # shuffleTrackingTimeout is in milliseconds
+                recommendation.shuffle_tracking_timeout = max(int(current.shuffle_tracking_timeout / 2), idle_timeout * 1000)
+            recommendation.reasons.append(
+                "idle executors for at least %.0f%% of %.0f executor-seconds" % (100 * idle_seconds / executor_seconds, executor_seconds)
+            )
+
+        return recommendation
@@ -0,0 +1,307 @@
+import bz2
+import gzip
+import io
+import json
+import lzma
+import multiprocessing
+import os
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Jackson writes the event name first: `{"Event":"SparkListenerTaskEnd",...`
+EVENT_PREFIX = b'{"Event":"'
+TASK_END = b"SparkListenerTaskEnd"
+STAGE_COMPLETED = b"SparkListenerStageCompleted"
+ENVIRONMENT_UPDATE = b"SparkListenerEnvironmentUpdate"
+APPLICATION_START = b"SparkListenerApplicationStart"
+APPLICATION_END = b"SparkListenerApplicationEnd"
+EXECUTOR_ADDED = b"SparkListenerExecutorAdded"
+EXECUTOR_REMOVED = b"SparkListenerExecutorRemoved"
+PARSED_EVENTS = frozenset((
+    TASK_END, STAGE_COMPLETED, ENVIRONMENT_UPDATE, APPLICATION_START, APPLICATION_END, EXECUTOR_ADDED, EXECUTOR_REMOVED,
+))
+
+# rolling event logs (spark.eventLog.rolling.enabled): eventlog_v2_<app id>/events_<index>_<app id>[.<codec>]
+ROLLING_EVENT_FILE_PATTERN = re.compile(r"^events_(\d+)_")
+
+
+def open_event_log(path: str) -> BinaryIO:
+    """
+    Event log file opened for streaming, decompressed according to its extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".gz":
+        return gzip.open(path, "rb")
+    if extension == ".bz2":
+        return bz2.open(path, "rb")
+    if extension in (".xz", ".lzma"):
+        return lzma.open(path, "rb")
+    if extension in (".zst", ".zstd"):
+        if zstandard is None:
+            raise ValueError("Reading %s needs the `zstandard` package" % path)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    if extension in (".lz4", ".lzf", ".snappy"):
+        raise ValueError("Codec of %s is not supported, use spark.eventLog.compression.codec=zstd" % path)
+    return open(path, "rb")
+
+
+def event_log_files(path: str) -> list[str]:
+    """
+    Files of one event log, in order: the file itself or the event files of a rolling event log directory
+    """
+    if not os.path.isdir(path):
+        return [path]
+
+    indexed = []
+    for file_name in os.listdir(path):
+        matched = ROLLING_EVENT_FILE_PATTERN.match(file_name)
+        if matched is not None:
+            indexed.append((int(matched.group(1)), os.path.join(path, file_name)))
+    return [file_path for _, file_path in sorted(indexed)]
+
+
+class StageStats():
+    def __init__(self, stage_id: int, attempt: int, reservoir_size: int = 256) -> None:
+        """
+        Task metrics of one stage attempt. Task durations are kept in a fixed-size reservoir sample
+        for the median, so memory does not grow with the number of tasks.
+        """
+        self.stage_id = stage_id
+        self.attempt = attempt
+        self.name: str | None = None
+        self.tasks = 0
+        self.failed_tasks = 0
+        self.task_ms_total = 0
+        self.task_ms_max = 0
+        self.run_time_ms = 0
+        self.cpu_time_ns = 0
+        self.gc_time_ms = 0
+        self.memory_spilled_bytes = 0
+        self.disk_spilled_bytes = 0
+        self.peak_execution_memory_bytes = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.shuffle_read_bytes = 0
+        self.shuffle_write_bytes = 0
+        self.started_at: int | None = None
+        self.completed_at: int | None = None
+        self.failure_reason: str | None = None
+
+        self._reservoir_size = reservoir_size
+        self._reservoir: list[int] = []
+        self._random = random.Random(stage_id * 1000 + attempt)
+
+
+    def add_task(self, task_info: dict, task_metrics: dict | None) -> None:
+        self.tasks += 1
+        if task_info.get("Failed") or task_info.get("Killed"):
+            self.failed_tasks += 1
+
+        task_ms = (task_info.get("Finish Time") or 0) - (task_info.get("Launch Time") or 0)
+        if task_ms >= 0:
+            self.task_ms_total += task_ms
+            self.task_ms_max = max(self.task_ms_max, task_ms)
+            if len(self._reservoir) < self._reservoir_size:
+                self._reservoir.append(task_ms)
+            else:
+                index = self._random.randrange(self.tasks)
+                if index < self._reservoir_size:
+                    self._reservoir[index] = task_ms
+
+        if not task_metrics:
+            return
+        self.run_time_ms += task_metrics.get("Executor Run Time", 0)
+        self.cpu_time_ns += task_metrics.get("Executor CPU Time", 0)
+        self.gc_time_ms += task_metrics.get("JVM GC Time", 0)
+        self.memory_spilled_bytes += task_metrics.get("Memory Bytes Spilled", 0)
+        self.disk_spilled_bytes += task_metrics.get("Disk Bytes Spilled", 0)
+        self.peak_execution_memory_bytes = max(self.peak_execution_memory_bytes, task_metrics.get("Peak Execution Memory", 0))
+        self.input_bytes += (task_metrics.get("Input Metrics") or dict()).get("Bytes Read", 0)
+        self.output_bytes += (task_metrics.get("Output Metrics") or dict()).get("Bytes Written", 0)
+        shuffle_read = task_metrics.get("Shuffle Read Metrics") or dict()
+        self.shuffle_read_bytes += shuffle_read.get("Remote Bytes Read", 0) + shuffle_read.get("Local Bytes Read", 0)
+        self.shuffle_write_bytes += (task_metrics.get("Shuffle Write Metrics") or dict()).get("Shuffle Bytes Written", 0)
+
+
+    @property
+    def median_task_ms(self) -> float | None:
+        if not self._reservoir:
+            return None
+        ordered = sorted(self._reservoir)
+        return ordered[len(ordered) // 2]
+
+
+    @property
+    def skew(self) -> float | None:
+        """
+        Slowest task over the median task duration
+        """
+        median = self.median_task_ms
+        if not median:
+            return None
+        return self.task_ms_max / median
+
+
+    @property
+    def gc_ratio(self) -> float:
+        return self.gc_time_ms / self.run_time_ms if self.run_time_ms else 0.0
+
+
+    def __repr__(self) -> str:
+        return "StageStats(stage=%s.%s, tasks=%s, skew=%s, disk_spilled_bytes=%s, shuffle_read_bytes=%s)" % (
+            self.stage_id, self.attempt, self.tasks, self.skew, self.disk_spilled_bytes, self.shuffle_read_bytes
+        )
+
+
+class EventLogSummary():
+    def __init__(self, path: str, reservoir_size: int = 256) -> None:
+        """What one application's event log tells about its run, timestamps are epoch milliseconds."""
+        self.path = path
+        self.app_id: str | None = None
+        self.app_name: str | None = None
+        self.started_at: int | None = None
+        self.finished_at: int | None = None
+        self.spark_properties: dict[str, str] = dict()
+        self.stages: dict[tuple[int, int], StageStats] = dict()
+        self.executor_cores: int | None = None
+        self.peak_executors = 0
+        self.executor_ms = 0
+        self.events = 0
+        self.skipped_lines = 0
+
+        self._reservoir_size = reservoir_size
+        self._running_executors = 0
+        self._executors_changed_at: int | None = None
+
+
+    @property
+    def duration_ms(self) -> int | None:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+    @property
+    def run_time_ms(self) -> int:
+        return sum(stage.run_time_ms for stage in self.stages.values())
+
+
+    @property
+    def gc_time_ms(self) -> int:
+        return sum(stage.gc_time_ms for stage in self.stages.values())
+
+
+    @property
+    def core_utilization(self) -> float | None:
+        """
+        Task run time over the executor core time the app held
+        """
+        if not self.executor_ms or not self.executor_cores:
+            return None
+        return self.run_time_ms / (self.executor_ms * self.executor_cores)
+
+
+    def add_event(self, event_name: bytes, event: dict) -> None:
+        self.events += 1
+        if event_name == TASK_END:
+            stage = self._stage(event.get("Stage ID"), event.get("Stage Attempt ID", 0))
+            stage.add_task(event.get("Task Info") or dict(), event.get("Task Metrics"))
+        elif event_name == STAGE_COMPLETED:
+            stage_info = event.get("Stage Info") or dict()
+            stage = self._stage(stage_info.get("Stage ID"), stage_info.get("Stage Attempt ID", 0))
+            stage.name = stage_info.get("Stage Name")
+            stage.started_at = stage_info.get("Submission Time")
+            stage.completed_at = stage_info.get("Completion Time")
+            stage.failure_reason = stage_info.get("Failure Reason")
+        elif event_name == ENVIRONMENT_UPDATE:
+            self.spark_properties.update(event.get("Spark Properties") or dict())
+        elif event_name == APPLICATION_START:
+            self.app_id = event.get("App ID")
+            self.app_name = event.get("App Name")
+            self.started_at = event.get("Timestamp")
+        elif event_name == APPLICATION_END:
+            self.finished_at = event.get("Timestamp")
+            self._executors_running(self.finished_at, 0)
+        elif event_name == EXECUTOR_ADDED:
+            executor_info = event.get("Executor Info") or dict()
+            self.executor_cores = max(self.executor_cores or 0, executor_info.get("Total Cores", 0)) or None
+            self._executors_running(event.get("Timestamp"), self._running_executors + 1)
+        elif event_name == EXECUTOR_REMOVED:
+            self._executors_running(event.get("Timestamp"), max(self._running_executors - 1, 0))
+
+
+    def _stage(self, stage_id: int, attempt: int) -> StageStats:
+        stage = self.stages.get((stage_id, attempt))
+        if stage is None:
+            stage = self.stages[(stage_id, attempt)] = StageStats(stage_id, attempt, reservoir_size=self._reservoir_size)
+        return stage
+
+
+    def _executors_running(self, timestamp: int | None, running: int) -> None:
+        if timestamp is not None:
+            if self._executors_changed_at is not None:
+                self.executor_ms += self._running_executors * max(timestamp - self._executors_changed_at, 0)
+            self._executors_changed_at = timestamp
+        self._running_executors = running
+        self.peak_executors = max(self.peak_executors, running)
+
+
+def _event_lines(path: str) -> Iterator[bytes]:
+    for file_path in event_log_files(path):
+        with open_event_log(file_path) as f:
+            yield from f
+
+
+def analyze_event_log(path: str, reservoir_size: int = 256) -> EventLogSummary:
+    """
+    Streams one event log (a file or a rolling event log directory) into an `EventLogSummary`.
+    Only the event names are looked at for most lines, the JSON of the few events used is parsed.
+    """
+    summary = EventLogSummary(path, reservoir_size=reservoir_size)
+    start = len(EVENT_PREFIX)
+    for line in _event_lines(path):
+        if not line.startswith(EVENT_PREFIX):
+            summary.skipped_lines += 1
+            continue
+        event_name = line[start:line.find(b'"', start)]
+        if event_name not in PARSED_EVENTS:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            # the last line of the log of a running or killed app can be truncated
+            summary.skipped_lines += 1
+            continue
+        summary.add_event(event_name, event)
+    return summary
+
+
+class EventLogAnalyzer():
+    """
+    Analyzes Spark event logs (`spark.eventLog.dir`), one process per log with `max_workers` processes.
+    Each log is streamed line by line, memory stays constant whatever its size.
+    """
+
+    def __init__(self, max_workers: int = None, reservoir_size: int = 256, mp_context: str = "spawn") -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.reservoir_size = reservoir_size
+        self.mp_context = mp_context
+
+
+    def analyze(self, paths: list[str]) -> list[EventLogSummary]:
+        """
+        Summaries in the order of `paths`
+        """
+        if len(paths) <= 1 or self.max_workers == 1:
+            return [analyze_event_log(path, self.reservoir_size) for path in paths]
+
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(paths)),
+                                 mp_context=multiprocessing.get_context(self.mp_context)) as pool:
+            return list(pool.map(analyze_event_log, paths, [self.reservoir_size] * len(paths)))
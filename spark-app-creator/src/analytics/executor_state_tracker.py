@@ -0,0 +1,222 @@
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from k8s_objects.spark_app import ExecutorStateEnum, SparkApp, SparkAppStatus
+from kubernetes.client.models import V1ObjectMeta
+
+ABSENT = 0
+MAX_INDEXED_EXECUTOR_ID = 1 << 16
+STATES: tuple[str, ...] = tuple(state.value for state in ExecutorStateEnum)
+STATE_CODES: dict[str, int] = {state: code for code, state in enumerate(STATES, start=1)}
+
+
+class ExecutorStateTracker():
+    """
+    Compact `SparkAppStatus.executor_state` of one SparkApp.
+
+    Numeric executor ids (what Spark assigns, counting from 1) index a bytearray of state codes directly,
+    other ids get a slot in a second bytearray through a dict. Counts per `ExecutorStateEnum` are kept up to date
+    from the deltas between snapshots, and every change of the running count is appended
+    to an array-backed time series.
+    """
+
+    def __init__(self) -> None:
+        self._codes = bytearray()
+        self._named_codes = bytearray()
+        self._named_slots: dict[str, int] = dict()
+        self.counts: list[int] = [0] * (len(STATES) + 1)
+        self._times = array("d")
+        self._running = array("l")
+
+
+    def __len__(self) -> int:
+        return sum(self.counts[1:])
+
+
+    @property
+    def running(self) -> int:
+        return self.counts[STATE_CODES[ExecutorStateEnum.RUNNING.value]]
+
+
+    def count(self, state: ExecutorStateEnum | str) -> int:
+        state = state.value if isinstance(state, ExecutorStateEnum) else state
+        return self.counts[STATE_CODES[state]]
+
+
+    def counts_by_state(self) -> dict[str, int]:
+        return {state: self.counts[code] for state, code in STATE_CODES.items()}
+
+
+    def state_of(self, executor_id: str) -> str | None:
+        location = self._location(executor_id, create=False)
+        if location is None:
+            return None
+
+        codes, index = location
+        if index >= len(codes) or codes[index] == ABSENT:
+            return None
+        return STATES[codes[index] - 1]
+
+
+    def update(self, executor_state: dict[str, str] | None, observed_at: datetime = None) -> int:
+        """
+        Apply a full `executorState` snapshot, only executors whose state changed are touched and executors
+        missing from the snapshot are retired. None means no snapshot, only the running count is recorded.
+        Returns the number of changed executors.
+        """
+        changed = 0
+        if executor_state is not None:
+            for executor_id, state in executor_state.items():
+                changed += self.apply_delta(executor_id, state)
+            # every executor of the snapshot is known by now, more known ones means some are missing
+            if len(self) > len(executor_state):
+                changed += self._retire_missing(executor_state)
+
+        self._record_running(observed_at)
+        return changed
+
+
+    def apply_delta(self, executor_id: str, state: str) -> int:
+        code = STATE_CODES.get(state, STATE_CODES[ExecutorStateEnum.UNKNOWN.value])
+        codes, index = self._location(executor_id, create=True)
+        if index >= len(codes):
+            codes.extend(bytes(index - len(codes) + 1))
+
+        previous = codes[index]
+        if previous == code:
+            return 0
+
+        if previous != ABSENT:
+            self.counts[previous] -= 1
+        self.counts[code] += 1
+        codes[index] = code
+        return 1
+
+
+    def retire(self, executor_id: str) -> int:
+        location = self._location(executor_id, create=False)
+        if location is None:
+            return 0
+
+        codes, index = location
+        if index >= len(codes) or codes[index] == ABSENT:
+            return 0
+        self.counts[codes[index]] -= 1
+        codes[index] = ABSENT
+        return 1
+
+
+    def _retire_missing(self, executor_state: dict[str, str]) -> int:
+        missing = [str(index) for index, code in enumerate(self._codes) if code != ABSENT and str(index) not in executor_state]
+        missing.extend(
+            executor_id for executor_id, index in self._named_slots.items()
+            if self._named_codes[index] != ABSENT and executor_id not in executor_state
+        )
+        return sum(self.retire(executor_id) for executor_id in missing)
+
+
+    def running_over_time(self) -> list[tuple[datetime, int]]:
+        return [
+            (datetime.fromtimestamp(timestamp, tz=timezone.utc), running)
+            for timestamp, running in zip(self._times, self._running)
+        ]
+
+
+    def executor_seconds(self, until: datetime = None) -> float:
+        """
+        Integral of the running executors over time, up to `until` (defaults to the last observation)
+        """
+        if not self._times:
+            return 0.0
+
+        end = until.timestamp() if until is not None else self._times[-1]
+        total = 0.0
+        for index, (timestamp, running) in enumerate(zip(self._times, self._running)):
+            next_timestamp = self._times[index + 1] if index + 1 < len(self._times) else end
+            total += running * max(0.0, next_timestamp - timestamp)
+        return total
+
+
+    def _record_running(self, observed_at: datetime = None) -> None:
+        running = self.running
+        if self._running and self._running[-1] == running:
+            return
+
+        observed_at = observed_at or datetime.now(timezone.utc)
+        self._times.append(observed_at.timestamp())
+        self._running.append(running)
+
+
+    def _location(self, executor_id: str, create: bool) -> tuple[bytearray, int] | None:
+        if executor_id.isdigit() and int(executor_id) < MAX_INDEXED_EXECUTOR_ID:
+            return self._codes, int(executor_id)
+
+        index = self._named_slots.get(executor_id)
+        if index is None:
+            if not create:
+                return None
+            index = self._named_slots[executor_id] = len(self._named_slots)
+        return self._named_codes, index
+
+
+class ExecutorStateAggregator():
+    """
+    `ExecutorStateTracker` per SparkApp. Either register `observe` as a SparkApp listener,
+    or pass it to `SparkAppLauncher` which then feeds it the raw `executorState` of each event
+    and skips deserializing that dict entry by entry.
+
+    The launcher marks the trackers of SparkApps reaching a terminal state as finished, only the
+    `max_finished` least recently used of them are kept. Trackers of running SparkApps stay until `forget`.
+    """
+
+    def __init__(self, max_finished: int = 256) -> None:
+        self.max_finished = max_finished
+
+        self._lock = threading.Lock()
+        self._trackers: dict[tuple[str, str], ExecutorStateTracker] = dict()
+        self._finished: OrderedDict[tuple[str, str], None] = OrderedDict()
+
+
+    def tracker(self, namespace: str, name: str) -> ExecutorStateTracker:
+        with self._lock:
+            key = (namespace, name)
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = ExecutorStateTracker()
+            elif key in self._finished:
+                self._finished.move_to_end(key)
+            return tracker
+
+
+    def update(self, namespace: str, name: str, executor_state: dict[str, str] | None, observed_at: datetime = None) -> int:
+        return self.tracker(namespace, name).update(executor_state, observed_at=observed_at)
+
+
+    def observe(self, spark_app: SparkApp) -> None:
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        if status is not None:
+            self.update(metadata.namespace, metadata.name, status.executor_state)
+
+
+    def finish(self, namespace: str, name: str) -> None:
+        """
+        The SparkApp reached a terminal state, its tracker is evicted once `max_finished` others finished after it
+        """
+        with self._lock:
+            key = (namespace, name)
+            if key not in self._trackers:
+                return
+            self._finished[key] = None
+            self._finished.move_to_end(key)
+            while len(self._finished) > self.max_finished:
+                evicted, _ = self._finished.popitem(last=False)
+                self._trackers.pop(evicted, None)
+
+
+    def forget(self, namespace: str, name: str) -> None:
+        with self._lock:
+            self._trackers.pop((namespace, name), None)
+            self._finished.pop((namespace, name), None)
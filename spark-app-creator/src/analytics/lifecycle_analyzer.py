@@ -0,0 +1,235 @@
+import math
+import threading
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import Any
+
+from k8s_objects.spark_app import SparkApp, SparkAppStatus
+from kubernetes.client.models import V1ObjectMeta
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import get_spark_app_template
+
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+DURATIONS = ("queueing", "startup", "run")
+GROUP_KEYS = ("namespace", "template", "final_state")
+
+
+def _seconds_between(start: datetime | None, end: datetime | None) -> float:
+    if start is None or end is None:
+        return math.nan
+    return (end - start).total_seconds()
+
+
+def _percentile(sorted_values: list[float], percentile: float) -> float:
+    """
+    Linear interpolation between closest ranks, same as numpy's default
+    """
+    if not sorted_values:
+        return math.nan
+    rank = (len(sorted_values) - 1) * percentile / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+class SparkAppTimeline():
+    def __init__(self,
+                 namespace: str,
+                 name: str,
+                 template: str,
+                 created_at: datetime = None,
+                 submitted_at: datetime = None,
+                 running_at: datetime = None,
+                 terminated_at: datetime = None,
+                 final_state: str = None,
+                 submission_attempts: int = None,
+                 execution_attempts: int = None) -> None:
+        """
+        Lifecycle of one SparkApp run.
+        queueing = created -> submitted, startup = submitted -> running, run = running -> terminated
+        """
+        self.namespace = namespace
+        self.name = name
+        self.template = template
+        self.created_at = created_at
+        self.submitted_at = submitted_at
+        self.running_at = running_at
+        self.terminated_at = terminated_at
+        self.final_state = final_state
+        self.submission_attempts = submission_attempts
+        self.execution_attempts = execution_attempts
+
+
+    @property
+    def queueing_seconds(self) -> float:
+        return _seconds_between(self.created_at, self.submitted_at)
+
+
+    @property
+    def startup_seconds(self) -> float:
+        return _seconds_between(self.submitted_at, self.running_at)
+
+
+    @property
+    def run_seconds(self) -> float:
+        return _seconds_between(self.running_at, self.terminated_at)
+
+
+class LifecycleAnalyzer():
+    """
+    Builds `SparkAppTimeline`s from watch events (register `observe` as a SparkApp listener)
+    or from historical runs (`add_timeline`), and computes duration percentiles per group.
+
+    Finished timelines are stored column-wise so that `summary` sorts each group's durations
+    once instead of walking timeline objects. Timelines of SparkApps not observed for `in_flight_ttl`
+    (deleted before finishing, or no longer watched) are dropped, `forget` drops one at once.
+    """
+
+    def __init__(self, in_flight_ttl: timedelta = timedelta(hours=24)) -> None:
+        self.in_flight_ttl = in_flight_ttl
+        self._lock = threading.Lock()
+        self._in_flight: dict[tuple[str, str], SparkAppTimeline] = dict()
+        self._last_seen: dict[tuple[str, str], datetime] = dict()
+        self._next_eviction: datetime | None = None
+        self._columns: dict[str, list] = {key: [] for key in GROUP_KEYS}
+        self._durations: dict[str, array] = {duration: array("d") for duration in DURATIONS}
+
+
+    def __len__(self) -> int:
+        return len(self._durations["run"])
+
+
+    def observe(self, spark_app: SparkApp, observed_at: datetime = None) -> SparkAppTimeline | None:
+        """
+        Returns the finished timeline when `spark_app` reached a terminal state
+        """
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        if status is None or status.application_state is None:
+            return None
+
+        observed_at = observed_at or datetime.now(timezone.utc)
+        state = status.application_state.state
+        key = (metadata.namespace, metadata.name)
+
+        with self._lock:
+            self._evict_stale(observed_at)
+            timeline = self._in_flight.get(key)
+            if timeline is None:
+                timeline = SparkAppTimeline(
+                    namespace=metadata.namespace,
+                    name=metadata.name,
+                    template=get_spark_app_template(spark_app),
+                    created_at=metadata.creation_timestamp,
+                )
+                self._in_flight[key] = timeline
+
+            timeline.submitted_at = status.last_submission_attempt_time or timeline.submitted_at
+            timeline.submission_attempts = status.submission_attempts
+            timeline.execution_attempts = status.execution_attempts
+
+            if state == SparkAppState.RUNNING.value and timeline.running_at is None:
+                timeline.running_at = observed_at
+
+            if state not in TERMINAL_STATES:
+                self._last_seen[key] = observed_at
+                return None
+
+            timeline.final_state = state
+            timeline.terminated_at = status.termination_time or observed_at
+            del self._in_flight[key]
+            self._last_seen.pop(key, None)
+            self._append(timeline)
+            return timeline
+
+
+    def forget(self, namespace: str, name: str) -> None:
+        """
+        Drops the timeline of a SparkApp that will not finish, e.g. deleted while in flight
+        """
+        with self._lock:
+            self._in_flight.pop((namespace, name), None)
+            self._last_seen.pop((namespace, name), None)
+
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+
+    def add_timeline(self, timeline: SparkAppTimeline) -> None:
+        with self._lock:
+            self._append(timeline)
+
+
+    def summary(self,
+                group_by: tuple[str, ...] = ("namespace", "template"),
+                percentiles: tuple[float, ...] = (50, 95, 99)) -> dict[tuple, dict[str, Any]]:
+        """
+        {group: {"count": runs, duration: {percentile: seconds}}} for every duration in `DURATIONS`.
+        Durations that could not be computed (e.g. never reached RUNNING) are ignored.
+        """
+        for key in group_by:
+            if key not in GROUP_KEYS:
+                raise ValueError("Cannot group by %s, must be one of %s" % (key, GROUP_KEYS))
+
+        with self._lock:
+            group_columns = [self._columns[key] for key in group_by]
+            groups = list(zip(*group_columns)) if group_by else [()] * len(self)
+            # None (no template, still in flight) sorts first instead of failing to compare with strings
+            order = sorted(range(len(groups)), key=lambda row: tuple((value is not None, value or "") for value in groups[row]))
+            durations = {duration: self._durations[duration] for duration in DURATIONS}
+
+            result = dict()
+            for group, rows in groupby(order, key=groups.__getitem__):
+                rows = list(rows)
+                result[group] = {"count": len(rows)}
+                for duration, values in durations.items():
+                    group_values = sorted(value for value in map(values.__getitem__, rows) if not math.isnan(value))
+                    result[group][duration] = {p: _percentile(group_values, p) for p in percentiles}
+            return result
+
+
+    def _evict_stale(self, now: datetime) -> None:
+        # a full scan at most every tenth of the TTL
+        if self.in_flight_ttl is None or (self._next_eviction is not None and now < self._next_eviction):
+            return
+        self._next_eviction = now + self.in_flight_ttl / 10
+        for key in [key for key, last_seen in self._last_seen.items() if now - last_seen > self.in_flight_ttl]:
+            del self._in_flight[key]
+            del self._last_seen[key]
+
+
+    def _append(self, timeline: SparkAppTimeline) -> None:
+        self._columns["namespace"].append(timeline.namespace)
+        self._columns["template"].append(timeline.template)
+        self._columns["final_state"].append(timeline.final_state)
+        self._durations["queueing"].append(timeline.queueing_seconds)
+        self._durations["startup"].append(timeline.startup_seconds)
+        self._durations["run"].append(timeline.run_seconds)
+
+
+def compare_summaries(baseline: dict, current: dict, percentile: float = 95, tolerance: float = 0.2) -> list[dict]:
+    """
+    Groups whose `percentile` duration grew by more than `tolerance` (0.2 = 20%) from `baseline` to `current`,
+    e.g. summaries before and after upgrading the spark-operator chart
+    """
+    regressions = []
+    for group, durations in current.items():
+        if group not in baseline:
+            continue
+        for duration in DURATIONS:
+            before = baseline[group][duration].get(percentile, math.nan)
+            after = durations[duration].get(percentile, math.nan)
+            if math.isnan(before) or math.isnan(after) or before <= 0:
+                continue
+            if after > before * (1 + tolerance):
+                regressions.append({
+                    "group": group,
+                    "duration": duration,
+                    "before": before,
+                    "after": after,
+                    "ratio": after / before,
+                })
+    return sorted(regressions, key=lambda regression: regression["ratio"], reverse=True)
@@ -1,4 +1,4 @@
 from custom_exceptions.k8s_exceptions import (
-    PermissionDeniedException, PodFailedException,
+    NoHealthyClusterException, PermissionDeniedException, PodFailedException,
     ResourceObjectNotFoundException, SparkAppFailedException,
     SparkAppSubmissionFailedException)
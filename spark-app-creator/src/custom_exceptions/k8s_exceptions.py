@@ -10,6 +10,9 @@ class SparkAppSubmissionFailedException(Exception):
 class PermissionDeniedException(Exception):
     pass
 
+class NoHealthyClusterException(Exception):
+    pass
+
 
 class ResourceObjectNotFoundException(Exception):
     def __init__(self, resource_type: str, message: str | None = None) -> None:
@@ -0,0 +1,2 @@
+from history.run_history_store import RunHistoryStore, SparkAppRun
+from history.submission_journal import JournalEntry, SubmissionJournal
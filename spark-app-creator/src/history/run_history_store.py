@@ -0,0 +1,431 @@
+import logging
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from analytics import SparkAppTimeline
+from k8s_objects.spark_app import (ExecutorStateEnum, SparkApp,
+                                   SparkAppSpec, SparkAppStatus)
+from kubernetes.client.models import V1ObjectMeta
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import compute_spec_hash, get_spark_app_template
+
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+
+# totals reported by the Spark UI, see `observe_utilization`
+UTILIZATION_COLUMNS = (
+    "tasks_completed", "tasks_failed",
+    "executor_run_time_ms", "executor_cpu_time_ms", "jvm_gc_time_ms",
+    "input_bytes", "output_bytes", "shuffle_read_bytes", "shuffle_write_bytes",
+    "memory_spilled_bytes", "disk_spilled_bytes",
+)
+
+# INTEGER columns added after the first version of the schema
+ADDED_COLUMNS = UTILIZATION_COLUMNS + ("steady_executors",)
+
+RUN_COLUMNS = (
+    "namespace", "name", "template", "spec_hash",
+    "created_at", "submitted_at", "running_at", "terminated_at",
+    "final_state", "duration_seconds", "submission_attempts", "execution_attempts",
+    "driver_cores", "driver_memory", "driver_memory_overhead",
+    "executor_instances", "executor_cores", "executor_memory", "executor_memory_overhead",
+    "dynamic_allocation_min", "dynamic_allocation_max",
+    "peak_executors", "error_message",
+) + ADDED_COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    template TEXT NOT NULL,
+    spec_hash TEXT,
+    created_at REAL,
+    submitted_at REAL,
+    running_at REAL,
+    terminated_at REAL,
+    final_state TEXT,
+    duration_seconds REAL,
+    submission_attempts INTEGER,
+    execution_attempts INTEGER,
+    driver_cores INTEGER,
+    driver_memory TEXT,
+    driver_memory_overhead TEXT,
+    executor_instances INTEGER,
+    executor_cores INTEGER,
+    executor_memory TEXT,
+    executor_memory_overhead TEXT,
+    dynamic_allocation_min INTEGER,
+    dynamic_allocation_max INTEGER,
+    peak_executors INTEGER,
+    error_message TEXT,
+    %s
+);
+CREATE INDEX IF NOT EXISTS runs_template_submitted_at ON runs (template, submitted_at);
+CREATE INDEX IF NOT EXISTS runs_submitted_at ON runs (submitted_at);
+CREATE INDEX IF NOT EXISTS runs_spec_hash ON runs (spec_hash);
+CREATE TABLE IF NOT EXISTS transitions (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    state TEXT NOT NULL,
+    observed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_run_id ON transitions (run_id);
+""" % ",\n    ".join("%s INTEGER" % column for column in ADDED_COLUMNS)
+
+
+def _to_epoch(value: datetime | None) -> float | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _from_epoch(value: float | None) -> datetime | None:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+class SparkAppRun():
+    def __init__(self, **fields) -> None:
+        """
+        One finished SparkApp run, attributes are the `RUN_COLUMNS`.
+        Timestamps are timezone aware datetimes, `transitions` is a list of (state, observed_at).
+        `steady_executors` is the number of running executors the run spent the most time with.
+        """
+        for column in RUN_COLUMNS:
+            setattr(self, column, fields.get(column))
+        self.id: int | None = fields.get("id")
+        self.transitions: list[tuple[str, datetime]] = fields.get("transitions") or []
+
+        # while in flight: seconds spent per number of running executors, since the last (count, observed_at)
+        self.seconds_by_executors: dict[int, float] = dict()
+        self.last_executors: tuple[int, datetime] | None = None
+
+
+    def to_timeline(self) -> SparkAppTimeline:
+        return SparkAppTimeline(
+            namespace=self.namespace,
+            name=self.name,
+            template=self.template,
+            created_at=self.created_at,
+            submitted_at=self.submitted_at,
+            running_at=self.running_at,
+            terminated_at=self.terminated_at,
+            final_state=self.final_state,
+            submission_attempts=self.submission_attempts,
+            execution_attempts=self.execution_attempts,
+        )
+
+
+    def to_dict(self) -> dict[str, Any]:
+        return {column: getattr(self, column) for column in ("id",) + RUN_COLUMNS}
+
+
+class RunHistoryStore():
+    """
+    SQLite-backed history of finished SparkApp runs.
+
+    Register `observe` as a SparkApp listener: it tracks state transitions and peak executors in memory
+    and queues the run once a terminal state is seen. A background thread writes queued runs in batches
+    of `batch_size` or every `flush_interval` seconds, so the monitor loop never waits on disk.
+    Runs not observed for `in_flight_ttl` (deleted before finishing, or no longer watched) are dropped
+    without being recorded, `forget` drops one at once.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 1.0, in_flight_ttl: timedelta = timedelta(hours=24)) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.in_flight_ttl = in_flight_ttl
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._add_missing_columns()
+        self._db_lock = threading.Lock()
+
+        self._in_flight: dict[tuple[str, str], SparkAppRun] = dict()
+        self._last_seen: dict[tuple[str, str], datetime] = dict()
+        self._next_eviction: datetime | None = None
+        self._in_flight_lock = threading.Lock()
+
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="run-history-writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def observe(self, spark_app: SparkApp, observed_at: datetime = None) -> None:
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        if status is None or status.application_state is None:
+            return
+
+        now = observed_at or datetime.now(timezone.utc)
+        state = status.application_state.state
+        key = (metadata.namespace, metadata.name)
+
+        with self._in_flight_lock:
+            self._evict_stale(now)
+            run = self._in_flight.get(key)
+            if run is None:
+                run = self._new_run(spark_app)
+                self._in_flight[key] = run
+
+            if not run.transitions or run.transitions[-1][0] != state:
+                run.transitions.append((state, now))
+
+            if state == SparkAppState.RUNNING.value and run.running_at is None:
+                run.running_at = now
+
+            if status.executor_state:
+                running_executors = sum(
+                    1 for executor_state in status.executor_state.values()
+                    if executor_state == ExecutorStateEnum.RUNNING.value
+                )
+                run.peak_executors = max(run.peak_executors or 0, running_executors)
+                self._track_executors(run, running_executors, now)
+
+            run.submitted_at = status.last_submission_attempt_time or run.submitted_at
+            run.submission_attempts = status.submission_attempts
+            run.execution_attempts = status.execution_attempts
+
+            if state not in TERMINAL_STATES:
+                self._last_seen[key] = now
+                return
+
+            del self._in_flight[key]
+            self._last_seen.pop(key, None)
+
+        self._track_executors(run, 0, now)
+        busy = [(seconds, count) for count, seconds in run.seconds_by_executors.items() if count > 0]
+        run.steady_executors = max(busy)[1] if busy else None
+        run.final_state = state
+        run.terminated_at = status.termination_time or now
+        run.error_message = status.application_state.error_message
+        started_at = run.running_at or run.submitted_at or run.created_at
+        if started_at is not None:
+            run.duration_seconds = (run.terminated_at - started_at).total_seconds()
+
+        self.record(run)
+
+
+    def observe_utilization(self, namespace: str, name: str, **totals) -> None:
+        """
+        Latest cumulative `UTILIZATION_COLUMNS` of a SparkApp being observed, saved with its run
+        """
+        with self._in_flight_lock:
+            run = self._in_flight.get((namespace, name))
+            if run is None:
+                return
+            for column, value in totals.items():
+                if column in UTILIZATION_COLUMNS:
+                    setattr(run, column, value)
+
+
+    def forget(self, namespace: str, name: str) -> None:
+        """
+        Drops the run of a SparkApp that will not finish, e.g. deleted while in flight
+        """
+        with self._in_flight_lock:
+            self._in_flight.pop((namespace, name), None)
+            self._last_seen.pop((namespace, name), None)
+
+
+    def in_flight(self) -> int:
+        with self._in_flight_lock:
+            return len(self._in_flight)
+
+
+    def record(self, run: SparkAppRun) -> None:
+        self._queue.put(run)
+
+
+    def flush(self) -> None:
+        """
+        Block until every queued run is written
+        """
+        self._queue.join()
+
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join()
+        with self._db_lock:
+            self._connection.close()
+
+
+    def runs_for_template(self, template: str, since: datetime = None, until: datetime = None, limit: int = None) -> list[SparkAppRun]:
+        return self._select_runs(template=template, since=since, until=until, limit=limit)
+
+
+    def runs_between(self, since: datetime = None, until: datetime = None, namespace: str = None, limit: int = None) -> list[SparkAppRun]:
+        return self._select_runs(namespace=namespace, since=since, until=until, limit=limit)
+
+
+    def recorded(self, namespace: str, name: str, created_at: datetime = None) -> bool:
+        """
+        Whether the run of the SparkApp created at `created_at` is in the store, once the queued runs are written
+        """
+        self.flush()
+        condition = "created_at = ?" if created_at is not None else "created_at IS NULL"
+        parameters = [namespace, name] + ([_to_epoch(created_at)] if created_at is not None else [])
+        with self._db_lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM runs WHERE namespace = ? AND name = ? AND %s LIMIT 1" % condition, parameters
+            ).fetchone()
+        return row is not None
+
+
+    def transitions(self, run_id: int) -> list[tuple[str, datetime]]:
+        with self._db_lock:
+            rows = self._connection.execute(
+                "SELECT state, observed_at FROM transitions WHERE run_id = ? ORDER BY observed_at", (run_id,)
+            ).fetchall()
+        return [(state, _from_epoch(observed_at)) for state, observed_at in rows]
+
+
+    def _select_runs(self, template: str = None, namespace: str = None, since: datetime = None, until: datetime = None, limit: int = None) -> list[SparkAppRun]:
+        conditions, parameters = [], []
+        if template is not None:
+            conditions.append("template = ?")
+            parameters.append(template)
+        if namespace is not None:
+            conditions.append("namespace = ?")
+            parameters.append(namespace)
+        if since is not None:
+            conditions.append("submitted_at >= ?")
+            parameters.append(_to_epoch(since))
+        if until is not None:
+            conditions.append("submitted_at < ?")
+            parameters.append(_to_epoch(until))
+
+        query = "SELECT id, %s FROM runs" % ", ".join(RUN_COLUMNS)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY submitted_at DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT %d" % int(limit)
+
+        with self._db_lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+
+        runs = []
+        for row in rows:
+            fields = dict(zip(("id",) + RUN_COLUMNS, row))
+            for column in ("created_at", "submitted_at", "running_at", "terminated_at"):
+                fields[column] = _from_epoch(fields[column])
+            runs.append(SparkAppRun(**fields))
+        return runs
+
+
+    def _new_run(self, spark_app: SparkApp) -> SparkAppRun:
+        metadata: V1ObjectMeta = spark_app.metadata
+        spec: SparkAppSpec = spark_app.spec
+        driver, executor = spec.driver, spec.executor
+        dynamic_allocation = spec.dynamic_allocation
+
+        return SparkAppRun(
+            namespace=metadata.namespace,
+            name=metadata.name,
+            template=get_spark_app_template(spark_app),
+            spec_hash=compute_spec_hash(spec),
+            created_at=metadata.creation_timestamp,
+            driver_cores=driver.cores if driver is not None else None,
+            driver_memory=driver.memory if driver is not None else None,
+            driver_memory_overhead=driver.memory_overhead if driver is not None else None,
+            executor_instances=executor.instances if executor is not None else None,
+            executor_cores=executor.cores if executor is not None else None,
+            executor_memory=executor.memory if executor is not None else None,
+            executor_memory_overhead=executor.memory_overhead if executor is not None else None,
+            dynamic_allocation_min=dynamic_allocation.min_executors if dynamic_allocation is not None else None,
+            dynamic_allocation_max=dynamic_allocation.max_executors if dynamic_allocation is not None else None,
+        )
+
+
+    @staticmethod
+    def _track_executors(run: SparkAppRun, running_executors: int, now: datetime) -> None:
+        if run.last_executors is not None:
+            count, since = run.last_executors
+            run.seconds_by_executors[count] = run.seconds_by_executors.get(count, 0.0) + (now - since).total_seconds()
+        run.last_executors = (running_executors, now)
+
+
+    def _evict_stale(self, now: datetime) -> None:
+        # a full scan at most every tenth of the TTL
+        if self.in_flight_ttl is None or (self._next_eviction is not None and now < self._next_eviction):
+            return
+        self._next_eviction = now + self.in_flight_ttl / 10
+        for key in [key for key, last_seen in self._last_seen.items() if now - last_seen > self.in_flight_ttl]:
+            del self._in_flight[key]
+            del self._last_seen[key]
+
+
+    def _add_missing_columns(self) -> None:
+        """
+        Stores created by an older version lack the columns added since
+        """
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(runs)")}
+        with self._connection:
+            for column in ADDED_COLUMNS:
+                if column not in existing:
+                    self._connection.execute("ALTER TABLE runs ADD COLUMN %s INTEGER" % column)
+
+
+    def _write_loop(self) -> None:
+        closing = False
+        while not closing:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if None in batch:
+                closing = True
+            runs = [run for run in batch if run is not None]
+
+            try:
+                if runs:
+                    self._write_batch(runs)
+            except Exception:
+                self.logger.exception("Failed to write %s runs to %s" % (len(runs), self.path))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+    def _write_batch(self, runs: list[SparkAppRun]) -> None:
+        with self._db_lock, self._connection:
+            for run in runs:
+                values = []
+                for column in RUN_COLUMNS:
+                    value = getattr(run, column)
+                    values.append(_to_epoch(value) if isinstance(value, datetime) else value)
+
+                cursor = self._connection.execute(
+                    "INSERT INTO runs (%s) VALUES (%s)" % (", ".join(RUN_COLUMNS), ", ".join("?" * len(RUN_COLUMNS))),
+                    values,
+                )
+                run.id = cursor.lastrowid
+                self._connection.executemany(
+                    "INSERT INTO transitions (run_id, state, observed_at) VALUES (?, ?, ?)",
+                    [(run.id, state, _to_epoch(observed_at)) for state, observed_at in run.transitions],
+                )
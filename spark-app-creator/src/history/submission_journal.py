@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import threading
+from time import time
+
+from k8s_objects.spark_app import SparkApp, SparkAppStatus
+from kubernetes.client.models import V1ObjectMeta
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+
+# journal operations, in the order a SparkApp goes through them
+SUBMITTING = "submitting"
+CREATED = "created"
+OBSERVED = "observed"
+FINISHED = "finished"
+
+
+class JournalEntry():
+    def __init__(self, namespace: str, name: str) -> None:
+        """Last known journal state of one SparkApp."""
+        self.namespace = namespace
+        self.name = name
+        self.op: str | None = None
+        self.created = False
+        self.resource_version: str | None = None
+        self.state: str | None = None
+        self.updated_at: float | None = None
+
+
+    @property
+    def finished(self) -> bool:
+        return self.op == FINISHED
+
+
+    def apply(self, record: dict) -> None:
+        self.op = record["op"]
+        self.created = self.created or record["op"] in (CREATED, OBSERVED)
+        self.resource_version = record.get("resource_version") or self.resource_version
+        self.state = record.get("state") or self.state
+        self.updated_at = record.get("ts")
+
+
+    def __repr__(self) -> str:
+        return "JournalEntry(namespace=%s, name=%s, op=%s, state=%s, resource_version=%s)" % (
+            self.namespace, self.name, self.op, self.state, self.resource_version
+        )
+
+
+class SubmissionJournal():
+    """
+    Append-only JSON lines journal of submitted SparkApps, one record per line:
+    `submitting` before the create call, `created` after it, `observed` on each new state
+    (with the resourceVersion) and `finished` once the client cleaned up.
+
+    Each record is flushed (and fsync-ed with `fsync=True`) before the call returns, so after a crash
+    `in_flight` lists the SparkApps the orchestrator still owns. A torn last line is ignored on load.
+    The file is compacted on open, keeping only the unfinished entries.
+    """
+
+    def __init__(self, path: str, fsync: bool = True) -> None:
+        self.path = path
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], JournalEntry] = dict()
+        self._load()
+        self._compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def record_submitting(self, namespace: str, name: str) -> None:
+        self._append(SUBMITTING, namespace, name)
+
+
+    def record_created(self, namespace: str, name: str) -> None:
+        self._append(CREATED, namespace, name)
+
+
+    def record_finished(self, namespace: str, name: str, state: str = None) -> None:
+        self._append(FINISHED, namespace, name, state=state)
+
+
+    def observe(self, spark_app: SparkApp) -> None:
+        """
+        SparkApp listener, journals state changes only
+        """
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        if status is None or status.application_state is None:
+            return
+
+        state = status.application_state.state
+        with self._lock:
+            entry = self._entries.get((metadata.namespace, metadata.name))
+            if entry is None or entry.finished or entry.state == state:
+                return
+        self._append(OBSERVED, metadata.namespace, metadata.name, state=state, resource_version=metadata.resource_version)
+
+
+    def entry(self, namespace: str, name: str) -> JournalEntry | None:
+        with self._lock:
+            return self._entries.get((namespace, name))
+
+
+    def in_flight(self) -> list[JournalEntry]:
+        with self._lock:
+            return [entry for entry in self._entries.values() if not entry.finished]
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+    def _append(self, op: str, namespace: str, name: str, state: str = None, resource_version: str = None) -> None:
+        record = {"op": op, "namespace": namespace, "name": name, "ts": time()}
+        if state is not None:
+            record["state"] = state
+        if resource_version is not None:
+            record["resource_version"] = resource_version
+
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+            key = (namespace, name)
+            if op == SUBMITTING or key not in self._entries:
+                self._entries[key] = JournalEntry(namespace, name)
+            self._entries[key].apply(record)
+
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.logger.warning("Skipping unreadable journal line %s of %s" % (line_number, self.path))
+                    continue
+
+                key = (record["namespace"], record["name"])
+                if record["op"] == SUBMITTING or key not in self._entries:
+                    self._entries[key] = JournalEntry(*key)
+                self._entries[key].apply(record)
+
+
+    def _compact(self) -> None:
+        self._entries = {key: entry for key, entry in self._entries.items() if not entry.finished}
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        compacted_path = "%s.compact" % self.path
+        with open(compacted_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                for op in (SUBMITTING, CREATED) if entry.created else (SUBMITTING,):
+                    f.write(json.dumps({"op": op, "namespace": entry.namespace, "name": entry.name, "ts": entry.updated_at}, separators=(",", ":")) + "\n")
+                if entry.op == OBSERVED:
+                    f.write(json.dumps({
+                        "op": OBSERVED, "namespace": entry.namespace, "name": entry.name, "ts": entry.updated_at,
+                        "state": entry.state, "resource_version": entry.resource_version,
+                    }, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(compacted_path, self.path)
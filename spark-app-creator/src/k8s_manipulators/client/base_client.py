@@ -1,16 +1,32 @@
 import logging
 from abc import abstractmethod
+from contextlib import AbstractContextManager, nullcontext
 from functools import cached_property
 from typing import Callable
 
 import kubernetes
+from logs import LogPipeline
+from metrics import LauncherMetrics, MetricsRegistry
+from profiling import PhaseProfiler
 
 
 class BaseClient():
-    def __init__(self, hooks: list[Callable] = None, is_client_outside_cluster: bool = False, context: str = None) -> None:
+    def __init__(self,
+                 hooks: list[Callable] = None,
+                 is_client_outside_cluster: bool = False,
+                 context: str = None,
+                 metrics: MetricsRegistry = None,
+                 profiler: PhaseProfiler = None,
+                 log_pipeline: LogPipeline = None,
+                 api_client: kubernetes.client.ApiClient = None) -> None:
         self.hooks = hooks
         self.is_client_outside_cluster = is_client_outside_cluster
         self.context = context
+        self.launcher_metrics = LauncherMetrics(metrics) if metrics is not None else None
+        self.profiler = profiler
+        self.log_pipeline = log_pipeline
+        # shared by the clients of one cluster, otherwise built by `_get_api_client`
+        self._shared_api_client = api_client
 
     @property
     def logger(self) -> logging.Logger:
@@ -19,7 +35,11 @@ class BaseClient():
 
     @cached_property
     def api_client(self) -> kubernetes.client.ApiClient:
-        return self._get_api_client()
+        if self.profiler is None:
+            return self._get_api_client()
+
+        with self.profiler.phase("api_client"):
+            return self._get_api_client()
 
 
     def _setup_logger(self) -> logging.Logger:
@@ -30,18 +50,25 @@ class BaseClient():
         return logging.getLogger(logger_name)
 
 
+    def _profile_phase(self, name: str, sample: bool = False, **attributes) -> AbstractContextManager:
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name, sample=sample, **attributes)
+
+
     def _get_api_client(self) -> kubernetes.client.ApiClient:
         """
         Override this function if you need to customize the api client
         """
+        if self._shared_api_client is not None:
+            return self._shared_api_client
         if self.is_client_outside_cluster:
             if self.context is None:
                 raise ValueError("context cannot be None when is_client_outside_cluster == True")
-            kubernetes.config.load_kube_config(context=self.context)
-
-        else:
-            kubernetes.config.load_incluster_config()
+            # own configuration per client, so that clients for several contexts can live in one process
+            return kubernetes.config.new_client_from_config(context=self.context)
 
+        kubernetes.config.load_incluster_config()
         return kubernetes.client.ApiClient()
 
 
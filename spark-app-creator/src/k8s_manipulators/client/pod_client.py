@@ -9,7 +9,7 @@ from kubernetes.client.models import V1ObjectMeta, V1Pod
 class PodClient(BaseClient):
     def __init__(self, pod: V1Pod, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.launcher = PodLauncher(self.api_client)
+        self.launcher = PodLauncher(self.api_client, metrics=self.launcher_metrics, profiler=self.profiler, log_pipeline=self.log_pipeline)
         self.pod = pod
 
 
@@ -24,27 +24,34 @@ class PodClient(BaseClient):
             self.logger.error("Must define namespace for pod %s" % pod_metadata.name)
             raise ValueError("Must define namespace for pod %s" % pod_metadata.name)
         
-        if self.hooks is not None:
-            self._execute_hooks()
+        try:
+            if self.hooks is not None:
+                with self._profile_phase("execute_hooks", sample=True):
+                    self._execute_hooks()
 
-        self.launcher.create_pod(namespace=pod_namespace, pod=self.pod)
+            with self._profile_phase("create_pod"):
+                self.launcher.create_pod(namespace=pod_namespace, pod=self.pod)
 
-        try:
-            self.launcher.monitor_pod(pod=self.pod)
-        except PodFailedException:
-            if cleanup_on_failure:
-                self.logger.info(
-                    "Pod %s - Namespace %s | Pod failed, cleaning up ..." % (
-                    pod_metadata.name, pod_metadata.namespace
-                ))
-                self._clean_up()
-            raise
-
-        self.logger.info(
-            "Pod %s - Namespace %s | Pod finished running, cleaning up ..." % (
-            pod_metadata.name, pod_metadata.namespace
-        ))
-        self._clean_up()
+            try:
+                with self._profile_phase("monitor_pod", sample=True):
+                    self.launcher.monitor_pod(pod=self.pod)
+            except PodFailedException:
+                if cleanup_on_failure:
+                    self.logger.info(
+                        "Pod %s - Namespace %s | Pod failed, cleaning up ..." % (
+                        pod_metadata.name, pod_metadata.namespace
+                    ))
+                    self._clean_up()
+                raise
+
+            self.logger.info(
+                "Pod %s - Namespace %s | Pod finished running, cleaning up ..." % (
+                pod_metadata.name, pod_metadata.namespace
+            ))
+            self._clean_up()
+        finally:
+            if self.profiler is not None:
+                self.profiler.dump(run_name=self.pod.metadata.name)
 
 
     def _execute_hooks(self):
@@ -1,19 +1,99 @@
+from typing import Callable
+
 import kubernetes
+from analytics import ExecutorStateAggregator
 from custom_exceptions import (PodFailedException,
                                ResourceObjectNotFoundException,
                                SparkAppFailedException,
                                SparkAppSubmissionFailedException)
+from history import JournalEntry, SubmissionJournal
+from history.submission_journal import TERMINAL_STATES
 from k8s_manipulators.client import BaseClient
+from k8s_manipulators.collector import SparkAppCollector
+from k8s_manipulators.index import InFlightIndex
 from k8s_manipulators.launcher import SparkAppLauncher
+from k8s_manipulators.scheduler import SparkAppScheduler
 from k8s_objects.spark_app import SparkApp
 from kubernetes.client.models import V1ObjectMeta, V1Pod
+from kubernetes.client.rest import ApiException
+from utils import consts
 
 
 class SparkAppClient(BaseClient):
-    def __init__(self, spark_app: SparkApp, **kwargs) -> None:
+    def __init__(self,
+                 spark_app: SparkApp,
+                 scheduler: SparkAppScheduler = None,
+                 listeners: list[Callable] = None,
+                 executor_state_aggregator: ExecutorStateAggregator = None,
+                 journal: SubmissionJournal = None,
+                 collector: SparkAppCollector = None,
+                 in_flight_index: InFlightIndex = None,
+                 **kwargs) -> None:
         super().__init__(**kwargs)
-        self.launcher = SparkAppLauncher(self.api_client)
+        if journal is not None:
+            listeners = list(listeners or []) + [journal.observe]
+        if in_flight_index is not None:
+            listeners = list(listeners or []) + [in_flight_index.observe]
+
+        self.launcher = SparkAppLauncher(
+            self.api_client,
+            metrics=self.launcher_metrics,
+            profiler=self.profiler,
+            listeners=listeners,
+            executor_state_aggregator=executor_state_aggregator,
+            log_pipeline=self.log_pipeline,
+            in_flight_index=in_flight_index,
+        )
         self.spark_app = spark_app
+        self.scheduler = scheduler
+        self.journal = journal
+        self.collector = collector
+        self.in_flight_index = in_flight_index
+        self.submitted = False
+        # monitoring an identical SparkApp in flight
+        self.attached = False
+        # attached to a SparkApp created by another process, which may be gone: cleaned up by this client
+        self.adopted = False
+        # journaled resourceVersion of a reattached SparkApp, monitoring resumes from it
+        self.resume_resource_version: str | None = None
+
+
+    @classmethod
+    def reattach(cls, entry: JournalEntry, journal: SubmissionJournal, **kwargs) -> "SparkAppClient | None":
+        """
+        Client for a SparkApp left in flight by a previous run of the orchestrator, `run_spark_app`
+        then monitors and cleans up the existing SparkApplication instead of creating it again,
+        resuming the watch from the last journaled resourceVersion. Returns None, and closes the journal entry, if the SparkApplication no longer exists.
+        """
+        client = cls(spark_app=None, journal=journal, **kwargs)
+        spark_app = client.launcher.get_spark_app(namespace=entry.namespace, name=entry.name)
+        if spark_app is None:
+            client.logger.warning(
+                "SparkApp %s - Namespace %s | Journaled as %s but not found, %s" % (
+                entry.name, entry.namespace, entry.op,
+                "it was deleted meanwhile" if entry.created else "it was never created"
+            ))
+            journal.record_finished(namespace=entry.namespace, name=entry.name)
+            return None
+
+        client.logger.info(
+            "SparkApp %s - Namespace %s | Reattaching, last journaled state %s (resourceVersion %s)" % (
+            entry.name, entry.namespace, entry.state, entry.resource_version
+        ))
+        client.spark_app = spark_app
+        client.submitted = True
+        # a terminal state was journaled, no event follows it: start from the current state
+        if entry.state not in TERMINAL_STATES:
+            client.resume_resource_version = entry.resource_version
+        if not entry.created:
+            journal.record_created(namespace=entry.namespace, name=entry.name)
+        return client
+
+
+    @classmethod
+    def reattach_in_flight(cls, journal: SubmissionJournal, **kwargs) -> list["SparkAppClient"]:
+        clients = [cls.reattach(entry, journal=journal, **kwargs) for entry in journal.in_flight()]
+        return [client for client in clients if client is not None]
 
 
     def run_spark_app(self, namespace: str = None, cleanup_on_failure: bool = True):
@@ -27,13 +107,69 @@ class SparkAppClient(BaseClient):
             self.logger.error("Must define namespace for SparkApp %s" % spark_app_metadata.name)
             raise ValueError("Must define namespace for SparkApp %s" % spark_app_metadata.name)
         
-        if self.hooks is not None:
-            self._execute_hooks()
+        if not self.submitted:
+            # hooks, the scheduler and the monitor all read the namespace from the metadata
+            self.spark_app.metadata.namespace = spark_app_namespace
+
+        ticket = None
+        try:
+            # a reattached SparkApp already went through the hooks and the scheduler
+            if self.hooks is not None and not self.submitted:
+                with self._profile_phase("execute_hooks", sample=True):
+                    self._execute_hooks()
 
-        self.launcher.create_spark_app(namespace=spark_app_namespace, spark_app=self.spark_app)
+            if self.scheduler is not None and not self.submitted:
+                with self._profile_phase("scheduler_wait"):
+                    ticket = self.scheduler.submit(namespace=spark_app_namespace, spark_app=self.spark_app)
+                    ticket.wait()
+
+            self._run_admitted_spark_app(spark_app_namespace=spark_app_namespace, cleanup_on_failure=cleanup_on_failure)
+        finally:
+            if ticket is not None:
+                # interrupted while waiting: the ticket must not be admitted later, taking a slot no one releases
+                self.scheduler.cancel(ticket)
+                self.scheduler.release(ticket)
+            if self.profiler is not None:
+                self.profiler.dump(run_name=self.spark_app.metadata.name)
+
+
+    def _run_admitted_spark_app(self, spark_app_namespace: str, cleanup_on_failure: bool):
+        spark_app_metadata: V1ObjectMeta = self.spark_app.metadata
+
+        if not self.submitted:
+            if self.journal is not None:
+                self.journal.record_submitting(namespace=spark_app_namespace, name=spark_app_metadata.name)
+            try:
+                with self._profile_phase("create_spark_app"):
+                    run_name = self.launcher.create_spark_app(namespace=spark_app_namespace, spark_app=self.spark_app)
+            except ApiException as e:
+                if e.status == 409 and self.created_earlier(spark_app_namespace):
+                    # an earlier attempt went through but its response was lost
+                    self.logger.info(
+                        "SparkApp %s - Namespace %s | Already created with the same spec, reattaching" % (
+                        spark_app_metadata.name, spark_app_namespace
+                    ))
+                    run_name = spark_app_metadata.name
+                else:
+                    # rejected for sure, otherwise the entry stays in flight and a restart finds out whether it was created
+                    if self.journal is not None and 400 <= e.status < 500:
+                        self.journal.record_finished(namespace=spark_app_namespace, name=spark_app_metadata.name)
+                    raise
+            self.submitted = True
+            if run_name != spark_app_metadata.name:
+                if self.journal is not None:
+                    self.journal.record_finished(namespace=spark_app_namespace, name=spark_app_metadata.name)
+                spec_hash = (spark_app_metadata.annotations or dict()).get(consts.SPARK_APP_SPEC_HASH_ANNOTATION)
+                self.adopted = not self.in_flight_index.claimed_locally(spark_app_namespace, spec_hash, run_name)
+                spark_app_metadata.name = run_name
+                spark_app_metadata.namespace = spark_app_namespace
+                self.attached = True
+            elif self.journal is not None:
+                self.journal.record_created(namespace=spark_app_namespace, name=spark_app_metadata.name)
 
         try:
-            self.launcher.monitor_spark_app(spark_app=self.spark_app)
+            with self._profile_phase("monitor_spark_app", sample=True):
+                self.launcher.monitor_spark_app(spark_app=self.spark_app, resource_version=self.resume_resource_version)
         except (SparkAppFailedException, SparkAppSubmissionFailedException):
             if cleanup_on_failure:
                 self.logger.info(
@@ -41,6 +177,8 @@ class SparkAppClient(BaseClient):
                     spark_app_metadata.name, spark_app_metadata.namespace
                 ))
                 self._clean_up()
+            elif self.journal is not None:
+                self.journal.record_finished(namespace=spark_app_metadata.namespace, name=spark_app_metadata.name)
             raise
 
         self.logger.info(
@@ -50,15 +188,42 @@ class SparkAppClient(BaseClient):
         self._clean_up()
 
 
+    def created_earlier(self, namespace: str) -> bool:
+        """
+        Whether the SparkApp already existing under the name of `spark_app` runs the same spec
+        """
+        spark_app_metadata: V1ObjectMeta = self.spark_app.metadata
+        spec_hash = (spark_app_metadata.annotations or dict()).get(consts.SPARK_APP_SPEC_HASH_ANNOTATION)
+        if spec_hash is None:
+            return False
+        existing = self.launcher.get_spark_app(namespace=namespace, name=spark_app_metadata.name)
+        if existing is None:
+            return False
+        existing_metadata: V1ObjectMeta = existing.metadata
+        return (existing_metadata.annotations or dict()).get(consts.SPARK_APP_SPEC_HASH_ANNOTATION) == spec_hash
+
+
     def _execute_hooks(self):
         for hook in self.hooks:
             hook(spark_app=self.spark_app)
 
     
     def _clean_up(self):
+        if self.attached and not self.adopted:
+            self.logger.info("SparkApp %s | Attached run, leaving its clean up to its owner" % self.spark_app.metadata.name)
+            return
+
         try:
-            self.launcher.delete_spark_app(self.spark_app)
+            if self.collector is not None:
+                self.collector.defer(self.spark_app)
+            else:
+                self.launcher.delete_spark_app(self.spark_app)
         except ResourceObjectNotFoundException as e:
             pass
+
+        # an adopted run was never journaled by this client
+        if self.journal is not None and not self.attached:
+            spark_app_metadata: V1ObjectMeta = self.spark_app.metadata
+            self.journal.record_finished(namespace=spark_app_metadata.namespace, name=spark_app_metadata.name)
         
         self.logger.info("Cleaned up! Everything done aweeeeeesomely")
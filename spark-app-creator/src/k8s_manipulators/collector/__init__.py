@@ -0,0 +1 @@
+from .spark_app_collector import CollectionStats, SparkAppCollector
@@ -0,0 +1,335 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from time import monotonic, sleep
+
+import k8s_objects.spark_app
+import kubernetes
+from history import RunHistoryStore
+from k8s_objects.spark_app import SparkApp
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.rest import ApiException
+from utils import consts
+from utils.k8s_utils import MyDeserializer
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+
+DEFAULT_RETENTION_SECONDS = {
+    SparkAppState.COMPLETED.value: 3600.0,
+    SparkAppState.FAILED.value: 24 * 3600.0,
+    SparkAppState.SUBMISSION_FAILED.value: 24 * 3600.0,
+}
+
+
+class _RateLimiter():
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """Token bucket, `rate` tokens per second."""
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = monotonic()
+        self._lock = threading.Lock()
+
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            sleep(wait)
+
+
+class CollectionStats():
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.collected = 0
+        self.expired = 0
+        self.over_limit = 0
+        self.archived = 0
+        self.remaining = 0
+        self.config_maps = 0
+
+
+    def __repr__(self) -> str:
+        return "CollectionStats(namespace=%s, collected=%s, expired=%s, over_limit=%s, archived=%s, remaining=%s, config_maps=%s)" % (
+            self.namespace, self.collected, self.expired, self.over_limit, self.archived, self.remaining, self.config_maps
+        )
+
+
+class SparkAppCollector():
+    """
+    Background garbage collection of finished SparkApplications created by spark-app-creator
+    (`label_selector`, the launcher labels every SparkApp it creates).
+
+    Each sweep of a namespace:
+    1. deletes every SparkApp a client marked with `defer` in a single `delete_collection` call
+    2. pages through the remaining SparkApps and deletes, one by one, the finished ones older than their
+       retention: `spec.timeToLiveSeconds` if set, else `retention_seconds` of their state
+    3. deletes the oldest finished SparkApps beyond `max_finished_per_namespace`
+    4. deletes the ConfigMaps of `ConfExternalizer` that no SparkApp left references, once they were seen
+       unreferenced for `config_map_grace_seconds` (None keeps them): the first sweep to see one unreferenced
+       annotates it with the time, a sweep seeing it referenced again removes the annotation. Keep the grace well
+       above the `recheck_seconds` of the externalizers, which use a ConfigMap that long without checking it exists.
+
+    Deletes are rate limited to `deletes_per_second`. With `history`, SparkApps deleted in steps 2 and 3
+    are archived into it before being deleted, unless it already has their run (seen to the end by a client,
+    or archived by a sweep whose delete failed).
+    """
+
+    def __init__(self,
+                 api_client: ApiClient,
+                 namespaces: list[str],
+                 label_selector: str = "%s=%s" % (consts.SPARK_APP_MANAGED_BY_LABEL, consts.SPARK_APP_MANAGED_BY),
+                 retention_seconds: dict[str, float] = None,
+                 max_finished_per_namespace: int = None,
+                 interval: float = 60.0,
+                 deletes_per_second: float = 5.0,
+                 page_size: int = 200,
+                 history: RunHistoryStore = None,
+                 config_map_grace_seconds: float = 3600.0) -> None:
+        self.custom_object_api = kubernetes.client.CustomObjectsApi(api_client=api_client)
+        self.core_v1_api = kubernetes.client.CoreV1Api(api_client=api_client)
+        self.namespaces = list(namespaces)
+        self.label_selector = label_selector
+        self.retention_seconds = retention_seconds if retention_seconds is not None else dict(DEFAULT_RETENTION_SECONDS)
+        self.max_finished_per_namespace = max_finished_per_namespace
+        self.interval = interval
+        self.page_size = page_size
+        self.history = history
+        self.config_map_grace_seconds = config_map_grace_seconds
+
+        self._rate_limiter = _RateLimiter(deletes_per_second)
+        self._deserializer = MyDeserializer(custom_module=k8s_objects.spark_app)
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def start(self) -> "SparkAppCollector":
+        self._thread = threading.Thread(target=self._run, name="spark-app-collector", daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+    def defer(self, spark_app: SparkApp) -> None:
+        """
+        Mark a finished SparkApp for the next sweep instead of deleting it inline
+        """
+        metadata = spark_app.metadata
+        try:
+            self.custom_object_api.patch_namespaced_custom_object(
+                group=consts.SPARK_APP_GROUP,
+                version=consts.SPARK_APP_VERSION,
+                plural=consts.SPARK_APP_PLURAL,
+                namespace=metadata.namespace,
+                name=metadata.name,
+                body={"metadata": {"labels": {consts.SPARK_APP_COLLECTABLE_LABEL: "true"}}},
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return
+            raise e
+        if metadata.namespace not in self.namespaces:
+            self.namespaces.append(metadata.namespace)
+        self.logger.info("SparkApp %s - Namespace %s | Deferred to the collector" % (metadata.name, metadata.namespace))
+
+
+    def collect(self, now: datetime = None) -> list[CollectionStats]:
+        return [self.collect_namespace(namespace, now=now) for namespace in list(self.namespaces)]
+
+
+    def collect_namespace(self, namespace: str, now: datetime = None) -> CollectionStats:
+        now = now or datetime.now(timezone.utc)
+        stats = CollectionStats(namespace)
+
+        self._rate_limiter.acquire()
+        deleted = self.custom_object_api.delete_collection_namespaced_custom_object(
+            group=consts.SPARK_APP_GROUP,
+            version=consts.SPARK_APP_VERSION,
+            plural=consts.SPARK_APP_PLURAL,
+            namespace=namespace,
+            label_selector="%s,%s=true" % (self.label_selector, consts.SPARK_APP_COLLECTABLE_LABEL),
+        )
+        stats.collected = len((deleted or dict()).get("items") or [])
+
+        finished: list[tuple[datetime, dict]] = []
+        # ConfigMaps referenced by the SparkApps that are kept
+        referenced: set[str] = set()
+        for raw_spark_app in self._list(namespace):
+            labels = raw_spark_app["metadata"].get("labels") or dict()
+            if labels.get(consts.SPARK_APP_COLLECTABLE_LABEL) == "true":
+                continue
+
+            status = raw_spark_app.get("status") or dict()
+            state = (status.get("applicationState") or dict()).get("state", "")
+            if state not in DEFAULT_RETENTION_SECONDS:
+                referenced.update(self._config_maps(raw_spark_app))
+                continue
+
+            finished_at = self._finished_at(raw_spark_app)
+            ttl = (raw_spark_app.get("spec") or dict()).get("timeToLiveSeconds")
+            retention = ttl if ttl is not None else self.retention_seconds.get(state)
+            if retention is not None and now - finished_at >= timedelta(seconds=retention):
+                stats.archived += int(self._archive(raw_spark_app))
+                if self._delete(raw_spark_app):
+                    stats.expired += 1
+                continue
+            finished.append((finished_at, raw_spark_app))
+
+        over_limit: list[tuple[datetime, dict]] = []
+        if self.max_finished_per_namespace is not None and len(finished) > self.max_finished_per_namespace:
+            finished.sort(key=lambda item: item[0])
+            over_limit = finished[:len(finished) - self.max_finished_per_namespace]
+            for _, raw_spark_app in over_limit:
+                stats.archived += int(self._archive(raw_spark_app))
+                if self._delete(raw_spark_app):
+                    stats.over_limit += 1
+        stats.remaining = len(finished) - stats.over_limit
+
+        for _, raw_spark_app in finished[len(over_limit):]:
+            referenced.update(self._config_maps(raw_spark_app))
+        if self.config_map_grace_seconds is not None:
+            stats.config_maps = self._collect_config_maps(namespace, referenced, now)
+
+        self.logger.info("Collected SparkApps: %s" % stats)
+        return stats
+
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.collect()
+            except Exception:
+                self.logger.exception("SparkApp collection failed")
+            self._stopping.wait(self.interval)
+
+
+    def _list(self, namespace: str):
+        _continue = None
+        while True:
+            response = self.custom_object_api.list_namespaced_custom_object(
+                group=consts.SPARK_APP_GROUP,
+                version=consts.SPARK_APP_VERSION,
+                plural=consts.SPARK_APP_PLURAL,
+                namespace=namespace,
+                label_selector=self.label_selector,
+                limit=self.page_size,
+                _continue=_continue,
+            )
+            yield from response.get("items") or []
+
+            _continue = (response.get("metadata") or dict()).get("continue")
+            if not _continue:
+                return
+
+
+    def _finished_at(self, raw_spark_app: dict) -> datetime:
+        status = raw_spark_app.get("status") or dict()
+        for value in (status.get("terminationTime"), status.get("lastSubmissionAttemptTime"), raw_spark_app["metadata"].get("creationTimestamp")):
+            if value:
+                return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return datetime.now(timezone.utc)
+
+
+    def _delete(self, raw_spark_app: dict) -> bool:
+        metadata = raw_spark_app["metadata"]
+        self._rate_limiter.acquire()
+        try:
+            self.custom_object_api.delete_namespaced_custom_object(
+                group=consts.SPARK_APP_GROUP,
+                version=consts.SPARK_APP_VERSION,
+                plural=consts.SPARK_APP_PLURAL,
+                namespace=metadata["namespace"],
+                name=metadata["name"],
+                # do not delete a SparkApp that was recreated under the same name since it was listed
+                body=kubernetes.client.V1DeleteOptions(preconditions=kubernetes.client.V1Preconditions(uid=metadata.get("uid"))),
+            )
+        except ApiException as e:
+            if e.status not in (404, 409):
+                raise
+            return False
+        return True
+
+
+    def _collect_config_maps(self, namespace: str, referenced: set[str], now: datetime) -> int:
+        deleted = 0
+        config_maps = self.core_v1_api.list_namespaced_config_map(namespace=namespace, label_selector=consts.SPARK_CONF_CONFIG_MAP_LABEL)
+        for config_map in config_maps.items:
+            metadata = config_map.metadata
+            unreferenced_since = (metadata.annotations or dict()).get(consts.SPARK_CONF_CONFIG_MAP_UNREFERENCED_ANNOTATION)
+            if metadata.name in referenced:
+                if unreferenced_since is not None:
+                    self._mark_unreferenced(namespace, metadata.name, None)
+                continue
+            if unreferenced_since is None:
+                self._mark_unreferenced(namespace, metadata.name, now.isoformat())
+                continue
+            if now - datetime.fromisoformat(unreferenced_since) < timedelta(seconds=self.config_map_grace_seconds):
+                continue
+
+            self._rate_limiter.acquire()
+            try:
+                self.core_v1_api.delete_namespaced_config_map(
+                    name=metadata.name,
+                    namespace=namespace,
+                    # not if a sweep saw it referenced again, or it was recreated, since it was listed
+                    body=kubernetes.client.V1DeleteOptions(preconditions=kubernetes.client.V1Preconditions(
+                        uid=metadata.uid, resource_version=metadata.resource_version
+                    )),
+                )
+            except ApiException as e:
+                if e.status not in (404, 409):
+                    raise
+                continue
+            deleted += 1
+            self.logger.info("ConfigMap %s - Namespace %s | Unreferenced since %s, deleted" % (metadata.name, namespace, unreferenced_since))
+        return deleted
+
+
+    def _mark_unreferenced(self, namespace: str, name: str, since: str | None) -> None:
+        try:
+            self.core_v1_api.patch_namespaced_config_map(
+                name=name,
+                namespace=namespace,
+                body={"metadata": {"annotations": {consts.SPARK_CONF_CONFIG_MAP_UNREFERENCED_ANNOTATION: since}}},
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+
+    @staticmethod
+    def _config_maps(raw_spark_app: dict) -> list[str]:
+        spec = raw_spark_app.get("spec") or dict()
+        return [spec[key] for key in ("hadoopConfigMap", "sparkConfigMap") if spec.get(key)]
+
+
+    def _archive(self, raw_spark_app: dict) -> bool:
+        if self.history is None:
+            return False
+
+        spark_app: SparkApp = self._deserializer.deserialize_data(raw_spark_app, SparkApp)
+        metadata = spark_app.metadata
+        if self.history.recorded(metadata.namespace, metadata.name, metadata.creation_timestamp):
+            return False
+        self.history.observe(spark_app=spark_app)
+        return True
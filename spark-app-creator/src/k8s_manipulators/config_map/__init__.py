@@ -0,0 +1,2 @@
+from .conf_externalizer import (ConfExternalizer, core_site_xml,
+                                spark_defaults_conf)
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import threading
+from time import monotonic
+from xml.sax.saxutils import escape
+
+import kubernetes
+from k8s_objects.spark_app import SparkApp, SparkAppSpec
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.models import V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+from utils import consts
+
+HADOOP_PREFIX = "spark.hadoop."
+CORE_SITE = "core-site.xml"
+SPARK_DEFAULTS = "spark-defaults.conf"
+
+# read by spark-submit in the operator, before the driver pod (and the ConfigMap mounted in it) exists
+SUBMISSION_PREFIXES = (
+    "spark.kubernetes.", "spark.driver.", "spark.executor.", "spark.submit.", "spark.master", "spark.app.",
+    "spark.jars", "spark.files", "spark.archives", "spark.pyspark.", "spark.dynamicAllocation.",
+)
+
+
+def core_site_xml(hadoop_conf: dict[str, str]) -> str:
+    properties = "".join(
+        "  <property>\n    <name>%s</name>\n    <value>%s</value>\n  </property>\n" % (escape(key), escape(str(value)))
+        for key, value in sorted(hadoop_conf.items())
+    )
+    return '<?xml version="1.0"?>\n<configuration>\n%s</configuration>\n' % properties
+
+
+def spark_defaults_conf(spark_conf: dict[str, str]) -> str:
+    def _escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+    return "".join("%s %s\n" % (_escape(key), _escape(str(value))) for key, value in sorted(spark_conf.items()))
+
+
+class ConfExternalizer():
+    """
+    Moves the stable part of large confs out of the SparkApplication into immutable, content-addressed
+    ConfigMaps, pass it in the client `hooks` (after the hooks that edit the confs).
+
+    - `hadoop_conf` and the `spark.hadoop.*` entries of `spark_conf` go to the `core-site.xml` of a ConfigMap
+      set as `hadoop_config_map`. The operator mounts it on HADOOP_CONF_DIR, which the Spark image puts
+      on the classpath, so Hadoop reads the same values (a HADOOP_CONF_DIR baked in the image is replaced).
+    - with `spark_defaults=True`, the remaining `spark_conf` entries (but the ones spark-submit needs,
+      `SUBMISSION_PREFIXES`) go to the `spark-defaults.conf` of a ConfigMap set as `spark_config_map`,
+      mounted on SPARK_CONF_DIR. Only enable it for images whose driver loads spark-defaults.conf
+      from SPARK_CONF_DIR.
+
+    A conf is moved only when at least `min_entries` entries would move and the spec does not reference its
+    own ConfigMap already. Keys in `inline_keys` or starting with `inline_prefixes` (values changing
+    per run) always stay inline, so each distinct block makes one ConfigMap, named after its hash and
+    created once per namespace, whatever the number of SparkApps sharing it. It is created again (a 409
+    when it exists) at most every `recheck_seconds`, in case it was deleted since: the `SparkAppCollector`
+    deletes the ones no SparkApp references any more.
+    """
+
+    def __init__(self,
+                 api_client: ApiClient,
+                 namespace: str = None,
+                 spark_defaults: bool = False,
+                 min_entries: int = 20,
+                 inline_keys: list[str] = None,
+                 inline_prefixes: list[str] = None,
+                 name_prefix: str = "spark-app-creator",
+                 recheck_seconds: float = 60.0) -> None:
+        self.core_v1_api = kubernetes.client.CoreV1Api(api_client=api_client)
+        self.namespace = namespace
+        self.spark_defaults = spark_defaults
+        self.min_entries = min_entries
+        self.inline_keys = set(inline_keys or [])
+        self.inline_prefixes = tuple(inline_prefixes or [])
+        self.name_prefix = name_prefix
+        self.recheck_seconds = recheck_seconds
+
+        # (namespace, name) -> when it was last created or found to exist
+        self._created: dict[tuple[str, str], float] = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def __call__(self, spark_app: SparkApp, **kwargs) -> None:
+        namespace = spark_app.metadata.namespace or self.namespace
+        if not namespace:
+            raise ValueError("Must define namespace for SparkApp %s to externalize its confs" % spark_app.metadata.name)
+        self.externalize(namespace, spark_app.spec)
+
+
+    def externalize(self, namespace: str, spec: SparkAppSpec) -> None:
+        spark_conf = dict(spec.spark_conf or dict())
+
+        if spec.hadoop_config_map is None:
+            inline_hadoop_conf = dict(spec.hadoop_conf or dict())
+            prefixed = {key[len(HADOOP_PREFIX):]: value for key, value in spark_conf.items() if key.startswith(HADOOP_PREFIX)}
+            # a key set both ways with different values stays inline, as the operator resolves it today
+            conflicts = {key for key in prefixed if key in inline_hadoop_conf and str(inline_hadoop_conf[key]) != str(prefixed[key])}
+            hadoop_conf = {
+                key: value for key, value in {**inline_hadoop_conf, **prefixed}.items()
+                if key not in conflicts and self._movable(key) and self._movable(HADOOP_PREFIX + key)
+            }
+            if len(hadoop_conf) >= self.min_entries:
+                spec.hadoop_config_map = self._ensure_config_map(namespace, "hadoop-conf", {CORE_SITE: core_site_xml(hadoop_conf)})
+                spec.hadoop_conf = {key: value for key, value in inline_hadoop_conf.items() if key not in hadoop_conf} or None
+                for key in hadoop_conf:
+                    spark_conf.pop(HADOOP_PREFIX + key, None)
+
+        if self.spark_defaults and spec.spark_config_map is None:
+            defaults = {
+                key: value for key, value in spark_conf.items()
+                if self._movable(key) and not key.startswith(SUBMISSION_PREFIXES) and not key.startswith(HADOOP_PREFIX)
+            }
+            if len(defaults) >= self.min_entries:
+                spec.spark_config_map = self._ensure_config_map(namespace, "spark-conf", {SPARK_DEFAULTS: spark_defaults_conf(defaults)})
+                for key in defaults:
+                    del spark_conf[key]
+
+        spec.spark_conf = spark_conf or None
+
+
+    def _movable(self, key: str) -> bool:
+        return key not in self.inline_keys and not key.startswith(self.inline_prefixes)
+
+
+    def _ensure_config_map(self, namespace: str, kind: str, data: dict[str, str]) -> str:
+        digest = hashlib.sha256()
+        for file_name in sorted(data):
+            digest.update(file_name.encode() + b"\0" + data[file_name].encode() + b"\0")
+        name = "%s-%s-%s" % (self.name_prefix, kind, digest.hexdigest()[:16])
+
+        with self._lock:
+            if monotonic() - self._created.get((namespace, name), float("-inf")) < self.recheck_seconds:
+                return name
+
+        config_map = V1ConfigMap(
+            metadata=V1ObjectMeta(
+                name=name,
+                namespace=namespace,
+                labels={consts.SPARK_APP_MANAGED_BY_LABEL: consts.SPARK_APP_MANAGED_BY, consts.SPARK_CONF_CONFIG_MAP_LABEL: kind},
+            ),
+            data=data,
+            # content-addressed, never updated: immutable ConfigMaps are not watched by the kubelets
+            immutable=True,
+        )
+        try:
+            self.core_v1_api.create_namespaced_config_map(namespace=namespace, body=config_map)
+            self.logger.info("ConfigMap %s - Namespace %s | Created" % (name, namespace))
+        except ApiException as e:
+            if e.status != 409:
+                raise
+
+        with self._lock:
+            self._created[(namespace, name)] = monotonic()
+        return name
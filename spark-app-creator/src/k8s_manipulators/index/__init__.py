@@ -0,0 +1 @@
+from .in_flight_index import InFlightIndex, stamp_spec_hash
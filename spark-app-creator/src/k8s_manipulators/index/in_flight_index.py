@@ -0,0 +1,194 @@
+import logging
+import threading
+
+import kubernetes
+from k8s_objects.spark_app import SparkApp
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.models import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+from utils import consts
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import compute_spec_hash
+
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+
+
+def spec_hash_label(spec_hash: str) -> str:
+    return spec_hash[:63]
+
+
+def stamp_spec_hash(spark_app: SparkApp) -> str:
+    """
+    Computes the hash of the effective spec and stamps it on the SparkApp metadata
+    """
+    spec_hash = compute_spec_hash(spark_app.spec)
+    metadata: V1ObjectMeta = spark_app.metadata
+    metadata.annotations = metadata.annotations or dict()
+    metadata.annotations[consts.SPARK_APP_SPEC_HASH_ANNOTATION] = spec_hash
+    metadata.labels = metadata.labels or dict()
+    metadata.labels[consts.SPARK_APP_SPEC_HASH_LABEL] = spec_hash_label(spec_hash)
+    return spec_hash
+
+
+class _Entry():
+    def __init__(self, name: str, created: bool = False, listed: bool = False) -> None:
+        self.name = name
+        self.created = created
+        # found through a LIST, created by another process
+        self.listed = listed
+        self.settled = threading.Event()
+        if created:
+            self.settled.set()
+
+
+class InFlightIndex():
+    """
+    Index of the SparkApps in flight (not in a terminal state) per (namespace, spec hash), used by
+    `SparkAppLauncher.create_spark_app` to attach to an identical run instead of creating a duplicate.
+
+    SparkApps created from this process are looked up locally and checked with a GET on their name,
+    the others with a LIST on the spec hash label (only SparkApps stamped by `stamp_spec_hash` are found).
+    A claim is atomic within the process: two identical SparkApps created concurrently make a single run.
+    Pass `observe` in the client `listeners` so that finished runs leave the local index without a GET.
+    """
+
+    def __init__(self, api_client: ApiClient, list_in_flight: bool = True) -> None:
+        self.custom_object_api = kubernetes.client.CustomObjectsApi(api_client=api_client)
+        self.list_in_flight = list_in_flight
+
+        self._entries: dict[tuple[str, str], _Entry] = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def claim(self, namespace: str, spec_hash: str, name: str) -> str | None:
+        """
+        Name of the in-flight SparkApp with the same spec hash, or None after registering `name` as
+        the run of this spec hash, in which case `created` or `release` must follow.
+        """
+        key = (namespace, spec_hash)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None or entry.name == name:
+                break
+            # returns at once unless another thread is still creating it
+            entry.settled.wait()
+            if not entry.created:
+                continue
+            if self._is_in_flight(namespace, entry.name):
+                return entry.name
+            self._forget(key, entry)
+            break
+
+        existing = self._list_in_flight(namespace, spec_hash, exclude=name) if self.list_in_flight else None
+
+        with self._lock:
+            current = self._entries.get(key)
+            raced = current is not None and current is not entry and current.name != name
+            if not raced:
+                if existing is not None:
+                    self._entries[key] = _Entry(existing, created=True, listed=True)
+                    return existing
+                self._entries[key] = _Entry(name)
+                return None
+        # claimed by another thread meanwhile
+        return self.claim(namespace, spec_hash, name)
+
+
+    def created(self, namespace: str, spec_hash: str, name: str) -> None:
+        with self._lock:
+            entry = self._entries.get((namespace, spec_hash))
+        if entry is not None and entry.name == name:
+            entry.created = True
+            entry.settled.set()
+
+
+    def release(self, namespace: str, spec_hash: str, name: str) -> None:
+        with self._lock:
+            entry = self._entries.get((namespace, spec_hash))
+        if entry is not None and entry.name == name:
+            self._forget((namespace, spec_hash), entry)
+
+
+    def claimed_locally(self, namespace: str, spec_hash: str, name: str) -> bool:
+        """
+        Whether `name` is the run of this spec hash created from this process, and so cleaned up by its own client
+        """
+        with self._lock:
+            entry = self._entries.get((namespace, spec_hash))
+        return entry is not None and entry.name == name and not entry.listed
+
+
+    def _forget(self, key: tuple[str, str], entry: _Entry) -> None:
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.settled.set()
+
+
+    def observe(self, spark_app: SparkApp, **kwargs) -> None:
+        """
+        SparkApp listener, releases runs reaching a terminal state
+        """
+        metadata: V1ObjectMeta = spark_app.metadata
+        spec_hash = (metadata.annotations or dict()).get(consts.SPARK_APP_SPEC_HASH_ANNOTATION)
+        state = spark_app.status.application_state.state if spark_app.status and spark_app.status.application_state else None
+        if spec_hash is not None and state in TERMINAL_STATES:
+            self.release(metadata.namespace, spec_hash, metadata.name)
+
+
+    def _is_in_flight(self, namespace: str, name: str) -> bool:
+        try:
+            raw_spark_app = self.custom_object_api.get_namespaced_custom_object(
+                group=consts.SPARK_APP_GROUP,
+                version=consts.SPARK_APP_VERSION,
+                plural=consts.SPARK_APP_PLURAL,
+                namespace=namespace,
+                name=name,
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return False
+            raise
+        return self._state(raw_spark_app) not in TERMINAL_STATES
+
+
+    def _list_in_flight(self, namespace: str, spec_hash: str, exclude: str) -> str | None:
+        """
+        Oldest in-flight SparkApp of the namespace with this spec hash
+        """
+        response = self.custom_object_api.list_namespaced_custom_object(
+            group=consts.SPARK_APP_GROUP,
+            version=consts.SPARK_APP_VERSION,
+            plural=consts.SPARK_APP_PLURAL,
+            namespace=namespace,
+            label_selector="%s=%s" % (consts.SPARK_APP_SPEC_HASH_LABEL, spec_hash_label(spec_hash)),
+        )
+        candidates = [
+            raw_spark_app for raw_spark_app in response.get("items") or []
+            if raw_spark_app["metadata"]["name"] != exclude
+            and not raw_spark_app["metadata"].get("deletionTimestamp")
+            and (raw_spark_app["metadata"].get("annotations") or dict()).get(consts.SPARK_APP_SPEC_HASH_ANNOTATION) == spec_hash
+            and self._state(raw_spark_app) not in TERMINAL_STATES
+        ]
+        if not candidates:
+            return None
+        oldest = min(candidates, key=lambda raw_spark_app: raw_spark_app["metadata"].get("creationTimestamp") or "")
+        return oldest["metadata"]["name"]
+
+
+    @staticmethod
+    def _state(raw_spark_app: dict) -> str | None:
+        return ((raw_spark_app.get("status") or dict()).get("applicationState") or dict()).get("state")
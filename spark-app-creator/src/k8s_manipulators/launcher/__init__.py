@@ -1,3 +1,4 @@
+from .log_follower import PodLogFollower
 from .base_launcher import BaseLauncher
 from .pod_launcher import PodLauncher
 from .spark_app_launcher import SparkAppLauncher
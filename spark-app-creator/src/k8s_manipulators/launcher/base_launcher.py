@@ -1,14 +1,22 @@
 import logging
+from contextlib import AbstractContextManager, nullcontext
 from functools import cached_property
-from typing import Generator, Iterator
+from typing import Generator
 
 import kubernetes
+from k8s_manipulators.launcher.log_follower import PodLogFollower
 from kubernetes.client.models import V1ObjectMeta, V1Pod, V1WatchEvent
+from logs import LogPipeline
+from metrics import LauncherMetrics
+from profiling import PhaseProfiler
 
 
 class BaseLauncher():
-    def __init__(self, api_client: kubernetes.client.ApiClient) -> None:
+    def __init__(self, api_client: kubernetes.client.ApiClient, metrics: LauncherMetrics = None, profiler: PhaseProfiler = None, log_pipeline: LogPipeline = None) -> None:
         self.core_v1_api = kubernetes.client.CoreV1Api(api_client=api_client)
+        self.metrics = metrics
+        self.profiler = profiler
+        self.log_pipeline = log_pipeline
 
     @property
     def logger(self) -> logging.Logger:
@@ -23,20 +31,40 @@ class BaseLauncher():
         return logging.getLogger(logger_name)
 
 
-    def _read_pod_log(self, pod: V1Pod, tail_lines: int = 10) -> Iterator[bytes]:
+    def _profile_phase(self, name: str, sample: bool = False, **attributes) -> AbstractContextManager:
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name, sample=sample, **attributes)
+
+
+    def _profile_mark(self, name: str, **attributes) -> None:
+        if self.profiler is not None:
+            self.profiler.mark(name, **attributes)
+
+
+    def _pod_log_follower(self, pod: V1Pod) -> PodLogFollower:
+        """
+        Override this function if you need to customize how pod logs are followed
+        """
         pod_metadata: V1ObjectMeta = pod.metadata
-        pod_namespace = pod_metadata.namespace
-        pod_name = pod_metadata.name
-
-        kwargs = dict()
-        if tail_lines:
-            kwargs["tail_lines"] = tail_lines
-
-        return self.core_v1_api.read_namespaced_pod_log(
-                name=pod_name,
-                namespace=pod_namespace,
-                follow=True,
-                _preload_content=False,
-                **kwargs
-        )
+        return PodLogFollower(self.core_v1_api, namespace=pod_metadata.namespace, pod_name=pod_metadata.name, metrics=self.metrics)
+
+
+    def _emit_log_line(self, namespace: str, app: str, log_prefix: str, line: bytes) -> None:
+        """
+        Hands a pod log line to the log pipeline as raw bytes, or to the logger without one
+        """
+        if self.log_pipeline is not None:
+            self.log_pipeline.submit(namespace, app, line)
+        else:
+            self.logger.info("%s | %s" % (log_prefix, line.decode().strip()))
+
+        if self.metrics is not None:
+            self.metrics.log_lines.labels(namespace=namespace, app=app).inc()
+            self.metrics.log_bytes.labels(namespace=namespace, app=app).inc(len(line))
+
+
+    def _close_log(self, namespace: str, app: str) -> None:
+        if self.log_pipeline is not None:
+            self.log_pipeline.close_app(namespace, app)
 
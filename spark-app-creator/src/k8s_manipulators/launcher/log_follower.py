@@ -0,0 +1,181 @@
+import logging
+import math
+import random
+from datetime import datetime, timezone
+from time import sleep
+from typing import Iterator
+
+import kubernetes
+from kubernetes.client.models import V1Pod
+from kubernetes.client.rest import ApiException
+from metrics import LauncherMetrics
+from urllib3.exceptions import (ConnectionError, IncompleteRead, ProtocolError,
+                                ReadTimeoutError)
+from utils.k8s_utils import PodStatusPhaseEnum as PodStatusPhase
+from utils.k8s_utils import get_pod_status_phase
+
+FINISHED_PHASES = (PodStatusPhase.SUCCEEDED.value, PodStatusPhase.FAILED.value)
+
+
+def parse_log_timestamp(timestamp: bytes) -> tuple[str, int]:
+    """
+    RFC3339Nano timestamp of a log line as (seconds part, nanoseconds), which sorts correctly
+    even though the kubelet trims trailing zeros of the fraction
+    """
+    seconds, _, fraction = timestamp.decode().rstrip("Z").partition(".")
+    return seconds, int(fraction.ljust(9, "0")[:9]) if fraction else 0
+
+
+class PodLogFollower():
+    """
+    Follows the log of one pod container from its first line, across reconnects.
+
+    Lines are requested with `timestamps=True`, the position is the timestamp of the last line given out
+    plus how many lines carried that exact timestamp. On reconnect the stream restarts `since_seconds`
+    before that position (with `resume_margin` seconds of slack for clock drift) and the lines
+    already given out are skipped, so nothing is lost or duplicated. Connection errors are retried with
+    exponential backoff and jitter, up to `max_retries` in a row. Calling `follow` again resumes too.
+    """
+
+    def __init__(self,
+                 core_v1_api: kubernetes.client.CoreV1Api,
+                 namespace: str,
+                 pod_name: str,
+                 container: str = None,
+                 max_retries: int = 10,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30.0,
+                 resume_margin: int = 2,
+                 metrics: LauncherMetrics = None) -> None:
+        self.core_v1_api = core_v1_api
+        self.namespace = namespace
+        self.pod_name = pod_name
+        self.container = container
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.resume_margin = resume_margin
+        self.metrics = metrics
+
+        self.last_timestamp: tuple[str, int] | None = None
+        self.lines_at_last_timestamp = 0
+        self.offset = 0
+        self.lines = 0
+        self._seen_at_last_timestamp = 0
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def follow(self) -> Iterator[bytes]:
+        """
+        Log lines (without timestamp) until the container terminates
+        """
+        attempt = 0
+        while True:
+            try:
+                for line in self._follow_once():
+                    attempt = 0
+                    yield line
+                if self._pod_finished():
+                    return
+                reason = "closed"
+
+            except ApiException as e:
+                if e.status < 500:
+                    raise
+                reason = str(e.status)
+
+            except (ProtocolError, ConnectionError, IncompleteRead, ReadTimeoutError) as e:
+                reason = type(e).__name__
+
+            if attempt >= self.max_retries:
+                raise RuntimeError("Log of pod %s in namespace %s dropped %s times in a row" % (self.pod_name, self.namespace, attempt))
+
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            self.logger.warning(
+                "Pod %s - Namespace %s | Log stream dropped (%s) after %s bytes, resuming in %.1fs. Attempt: %s/%s" % (
+                self.pod_name, self.namespace, reason, self.offset, backoff, attempt, self.max_retries
+            ))
+            if self.metrics is not None:
+                self.metrics.log_reconnects.labels(namespace=self.namespace, app=self.pod_name, reason=reason).inc()
+            sleep(backoff)
+
+
+    def _follow_once(self) -> Iterator[bytes]:
+        kwargs = dict()
+        if self.container is not None:
+            kwargs["container"] = self.container
+        if self.last_timestamp is not None:
+            # the client has no since_time, since_seconds with a margin then skip what was already given out
+            last_second = datetime.fromisoformat(self.last_timestamp[0]).replace(tzinfo=timezone.utc)
+            elapsed = (datetime.now(timezone.utc) - last_second).total_seconds()
+            kwargs["since_seconds"] = max(math.ceil(elapsed) + self.resume_margin, 1)
+
+        response = self.core_v1_api.read_namespaced_pod_log(
+            name=self.pod_name,
+            namespace=self.namespace,
+            follow=True,
+            timestamps=True,
+            _preload_content=False,
+            **kwargs
+        )
+
+        try:
+            self._seen_at_last_timestamp = 0
+            partial_line = None
+            for raw_line in response:
+                if not raw_line.endswith(b"\n"):
+                    # only the last chunk of a stream can be an incomplete line, given out if the stream ends cleanly
+                    partial_line = raw_line
+                    continue
+                line = self._accept(raw_line)
+                if line is not None:
+                    yield line
+
+            if partial_line is not None:
+                line = self._accept(partial_line)
+                if line is not None:
+                    yield line
+        finally:
+            response.release_conn()
+
+
+    def _accept(self, raw_line: bytes) -> bytes | None:
+        timestamp, separator, line = raw_line.partition(b" ")
+        if not separator:
+            return None
+
+        position = parse_log_timestamp(timestamp)
+        if self.last_timestamp is not None:
+            if position < self.last_timestamp:
+                return None
+            if position == self.last_timestamp:
+                self._seen_at_last_timestamp += 1
+                if self._seen_at_last_timestamp <= self.lines_at_last_timestamp:
+                    return None
+
+        if position == self.last_timestamp:
+            self.lines_at_last_timestamp += 1
+        else:
+            self.last_timestamp = position
+            self.lines_at_last_timestamp = 1
+            self._seen_at_last_timestamp = 1
+        self.offset += len(line)
+        self.lines += 1
+        return line
+
+
+    def _pod_finished(self) -> bool:
+        pod: V1Pod = self.core_v1_api.read_namespaced_pod(name=self.pod_name, namespace=self.namespace)
+        return get_pod_status_phase(pod=pod) in FINISHED_PHASES
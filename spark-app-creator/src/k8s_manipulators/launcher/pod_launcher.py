@@ -1,4 +1,4 @@
-from time import sleep
+from time import monotonic, sleep
 from typing import Generator
 
 import kubernetes
@@ -8,6 +8,9 @@ from k8s_manipulators.launcher import BaseLauncher
 from kubernetes.client.api_client import ApiClient
 from kubernetes.client.models import V1ObjectMeta, V1Pod
 from kubernetes.client.rest import ApiException
+from logs import LogPipeline
+from metrics import LauncherMetrics
+from profiling import PhaseProfiler
 from urllib3.exceptions import ConnectionError, IncompleteRead, ProtocolError
 from utils.k8s_utils import PodEventTypeEnum as PodEventType
 from utils.k8s_utils import PodStatusPhaseEnum as PodStatusPhase
@@ -15,45 +18,62 @@ from utils.k8s_utils import get_pod_status_phase
 
 
 class PodLauncher(BaseLauncher):
-    def __init__(self, api_client: ApiClient) -> None:
-        super().__init__(api_client)
+    def __init__(self, api_client: ApiClient, metrics: LauncherMetrics = None, profiler: PhaseProfiler = None, log_pipeline: LogPipeline = None) -> None:
+        super().__init__(api_client, metrics=metrics, profiler=profiler, log_pipeline=log_pipeline)
 
     def create_pod(self, namespace: str, pod: V1Pod | dict) -> None:
-        if isinstance(pod, V1Pod):
-            body = self.core_v1_api.api_client.sanitize_for_serialization(pod)
-        else:
-            body = pod
+        with self._profile_phase("serialization", sample=True):
+            if isinstance(pod, V1Pod):
+                body = self.core_v1_api.api_client.sanitize_for_serialization(pod)
+            else:
+                body = pod
 
         self.logger.info("Creating pod %s in namespace %s ..." % (pod.metadata.name, namespace))
 
-        self.core_v1_api.create_namespaced_pod(
-            namespace=namespace,
-            body=body,
-        )
+        started_at = monotonic()
+        with self._profile_phase("create_namespaced_pod"):
+            self.core_v1_api.create_namespaced_pod(
+                namespace=namespace,
+                body=body,
+            )
+        if self.metrics is not None:
+            self.metrics.submission_seconds.labels(namespace=namespace, app=pod.metadata.name).observe(monotonic() - started_at)
 
         self.logger.info("Finished creating pod %s in namespace %s." % (pod.metadata.name, namespace))
 
 
     def monitor_pod(self, pod: V1Pod) -> None:
-        for yielded_pod in self._monitor_pod_status(pod=pod):
-            yielded_pod_metadata: V1ObjectMeta = yielded_pod.metadata
-            yielded_pod_namespace = yielded_pod_metadata.namespace
-            yielded_pod_name = yielded_pod_metadata.name
+        log_follower = None
+        try:
+            for yielded_pod in self._monitor_pod_status(pod=pod):
+                yielded_pod_metadata: V1ObjectMeta = yielded_pod.metadata
+                yielded_pod_namespace = yielded_pod_metadata.namespace
+                yielded_pod_name = yielded_pod_metadata.name
+
+                log_prefix = "Pod %s - Namespace %s" % (yielded_pod_name, yielded_pod_namespace)
+                phase = get_pod_status_phase(pod=yielded_pod)
 
-            log_prefix = "Pod %s - Namespace %s" % (yielded_pod_name, yielded_pod_namespace)
-            phase = get_pod_status_phase(pod=yielded_pod)
+                if phase not in (PodStatusPhase.RUNNING.value, PodStatusPhase.SUCCEEDED.value, PodStatusPhase.FAILED.value):
+                    continue
 
-            if phase not in (PodStatusPhase.RUNNING.value, PodStatusPhase.SUCCEEDED.value, PodStatusPhase.FAILED.value):
-                continue
+                if log_follower is None:
+                    log_follower = self._pod_log_follower(pod=yielded_pod)
 
-            for line in self._read_pod_log(pod=yielded_pod):
-                self.logger.info("%s | %s" % (log_prefix, line.decode().strip()))
+                for line in log_follower.follow():
+                    if log_follower.lines == 1:
+                        self._profile_mark("first_log_byte", pod=yielded_pod_name)
+                    self._emit_log_line(yielded_pod_namespace, yielded_pod_name, log_prefix, line)
 
-            if phase == PodStatusPhase.FAILED.value:
-                self.logger.info("%s | Pod failed!" % log_prefix)
-                raise PodFailedException()
+                if phase == PodStatusPhase.FAILED.value:
+                    self.logger.info("%s | Pod failed!" % log_prefix)
+                    self._close_log(yielded_pod_namespace, yielded_pod_name)
+                    raise PodFailedException()
 
-        self.logger.info("%s | Finished monitoring!" % log_prefix)
+            self._close_log(pod.metadata.namespace, pod.metadata.name)
+            self.logger.info("%s | Finished monitoring!" % log_prefix)
+        finally:
+            if self.metrics is not None:
+                self.metrics.forget(pod.metadata.namespace, pod.metadata.name)
 
 
     def delete_pod(self, pod: V1Pod, **kwargs) -> None:
@@ -101,6 +121,9 @@ class PodLauncher(BaseLauncher):
                         "Pod %s - Namespace %s | Event type: %s - Phase: %s" % (
                         event['object'].metadata.name, event['object'].metadata.namespace, event_type, phase
                     ))
+                    if self.metrics is not None:
+                        self.metrics.watch_events.labels(namespace=pod_namespace, app=pod_name).inc()
+                    self._profile_mark("watch_event", event_type=event_type, phase=phase)
 
                     if (phase in (PodStatusPhase.FAILED.value, PodStatusPhase.SUCCEEDED.value) or 
                         event_type in (PodEventType.DELETE.value, PodEventType.ERROR.value)):
@@ -115,8 +138,12 @@ class PodLauncher(BaseLauncher):
                 # https://kubernetes.io/docs/reference/using-api/api-concepts/#the-resourceversion-parameter
                 self.logger.warning("Kubernetes ApiException 410 (Gone): %s", e.reason)
                 self.logger.warning("Let's retry w/ most recent event")
+                if self.metrics is not None:
+                    self.metrics.watch_reconnects.labels(namespace=pod_namespace, app=pod_name, reason="410").inc()
 
             except (ProtocolError, ConnectionError, IncompleteRead) as e:
+                if self.metrics is not None:
+                    self.metrics.watch_reconnects.labels(namespace=pod_namespace, app=pod_name, reason=type(e).__name__).inc()
                 if connection_retry_attempt == 0:
                     raise
 
@@ -1,51 +1,128 @@
-from time import sleep
-from typing import Generator
+from time import monotonic, sleep
+from typing import Callable, Generator
 
 import k8s_objects.spark_app
 import kubernetes
+from analytics import ExecutorStateAggregator
 from custom_exceptions import (PermissionDeniedException,
                                ResourceObjectNotFoundException,
                                SparkAppFailedException,
                                SparkAppSubmissionFailedException)
+from k8s_manipulators.index import InFlightIndex, stamp_spec_hash
 from k8s_manipulators.launcher import BaseLauncher
 from k8s_objects.spark_app import SparkApp
 from kubernetes.client.api_client import ApiClient
 from kubernetes.client.models import V1ObjectMeta, V1Pod
 from kubernetes.client.rest import ApiException
+from logs import LogPipeline
+from metrics import LauncherMetrics
+from profiling import PhaseProfiler
 from urllib3.exceptions import ConnectionError, IncompleteRead, ProtocolError
 from utils import consts
 from utils.k8s_utils import MyDeserializer
 from utils.k8s_utils import PodStatusPhaseEnum as PodStatusPhase
 from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
-from utils.k8s_utils import get_pod_status_phase
+from utils.k8s_utils import get_monitor_shard, get_pod_status_phase
 
 
 class SparkAppLauncher(BaseLauncher):
-    def __init__(self, api_client: ApiClient) -> None:
-        super().__init__(api_client)
+    def __init__(self,
+                 api_client: ApiClient,
+                 metrics: LauncherMetrics = None,
+                 profiler: PhaseProfiler = None,
+                 listeners: list[Callable] = None,
+                 executor_state_aggregator: ExecutorStateAggregator = None,
+                 log_pipeline: LogPipeline = None,
+                 in_flight_index: InFlightIndex = None) -> None:
+        super().__init__(api_client, metrics=metrics, profiler=profiler, log_pipeline=log_pipeline)
         self.custom_object_api = kubernetes.client.CustomObjectsApi(api_client=api_client)
+        self.listeners = listeners
+        self.executor_state_aggregator = executor_state_aggregator
+        self.in_flight_index = in_flight_index
 
 
-    def create_spark_app(self, namespace: str, spark_app: SparkApp | dict) -> None:
-        if isinstance(spark_app, SparkApp):
-            body = self.custom_object_api.api_client.sanitize_for_serialization(spark_app)
-        else:
-            body = spark_app
+    def create_spark_app(self, namespace: str, spark_app: SparkApp | dict) -> str:
+        """
+        Returns the name of the SparkApp running the spec: `spark_app` itself, or with `in_flight_index`
+        an identical SparkApp already in flight, which is attached to instead of creating a duplicate.
+        SparkApp objects are stamped with their spec hash, dict bodies are sent as they are.
+        """
+        spec_hash = None
+        with self._profile_phase("serialization", sample=True):
+            if isinstance(spark_app, SparkApp):
+                spark_app_metadata: V1ObjectMeta = spark_app.metadata
+                spark_app_metadata.labels = spark_app_metadata.labels or dict()
+                spark_app_metadata.labels.setdefault(consts.SPARK_APP_MANAGED_BY_LABEL, consts.SPARK_APP_MANAGED_BY)
+                # always from the current name, a copy created under a new name must not keep the shard of the old one
+                spark_app_metadata.labels[consts.SPARK_APP_MONITOR_SHARD_LABEL] = get_monitor_shard(namespace, spark_app_metadata.name)
+                spec_hash = stamp_spec_hash(spark_app)
+                body = self.custom_object_api.api_client.sanitize_for_serialization(spark_app)
+            else:
+                body = spark_app
 
-        self.logger.info("Creating SparkApplication %s in namespace %s ..." % (spark_app.metadata.name, namespace))
+        name = body["metadata"]["name"]
+        if self.in_flight_index is not None and spec_hash is not None:
+            with self._profile_phase("in_flight_lookup"):
+                existing = self.in_flight_index.claim(namespace, spec_hash, name)
+            if existing is not None:
+                self.logger.info(
+                    "SparkApp %s - Namespace %s | Identical SparkApp %s already in flight, attaching to it" % (
+                    name, namespace, existing
+                ))
+                if self.metrics is not None:
+                    self.metrics.duplicate_runs.labels(namespace=namespace, app=name).inc()
+                return existing
 
-        self.custom_object_api.create_namespaced_custom_object(
-            group=consts.SPARK_APP_GROUP,
-            version=consts.SPARK_APP_VERSION,
-            plural=consts.SPARK_APP_PLURAL,
-            namespace=namespace,
-            body=body,
-        )
+        self.logger.info("Creating SparkApplication %s in namespace %s ..." % (name, namespace))
 
-        self.logger.info("Finished creating SparkApplication %s in namespace %s." % (spark_app.metadata.name, namespace))
+        started_at = monotonic()
+        try:
+            with self._profile_phase("create_namespaced_custom_object"):
+                self.custom_object_api.create_namespaced_custom_object(
+                    group=consts.SPARK_APP_GROUP,
+                    version=consts.SPARK_APP_VERSION,
+                    plural=consts.SPARK_APP_PLURAL,
+                    namespace=namespace,
+                    body=body,
+                )
+        except Exception:
+            if self.in_flight_index is not None and spec_hash is not None:
+                self.in_flight_index.release(namespace, spec_hash, name)
+            raise
+        if self.in_flight_index is not None and spec_hash is not None:
+            self.in_flight_index.created(namespace, spec_hash, name)
+        if self.metrics is not None:
+            self.metrics.submission_seconds.labels(namespace=namespace, app=name).observe(monotonic() - started_at)
+
+        self.logger.info("Finished creating SparkApplication %s in namespace %s." % (name, namespace))
+        return name
+
+
+    def get_spark_app(self, namespace: str, name: str) -> SparkApp | None:
+        """
+        Current SparkApplication, None if it does not exist
+        """
+        try:
+            raw_spark_app = self.custom_object_api.get_namespaced_custom_object(
+                group=consts.SPARK_APP_GROUP,
+                version=consts.SPARK_APP_VERSION,
+                plural=consts.SPARK_APP_PLURAL,
+                namespace=namespace,
+                name=name,
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise e
+
+        return MyDeserializer(custom_module=k8s_objects.spark_app).deserialize_data(raw_spark_app, SparkApp)
 
     
-    def monitor_spark_app(self, spark_app: SparkApp):
+    def monitor_spark_app(self, spark_app: SparkApp, resource_version: str = None):
+        """
+        Follows the SparkApp and its driver log until it terminates. With `resource_version` the watch
+        resumes from it, replaying the events since then, instead of starting from the current state.
+        """
         spark_app_metadata: V1ObjectMeta = spark_app.metadata
         spark_app_namespace = spark_app_metadata.namespace
         spark_app_name = spark_app_metadata.name
@@ -56,34 +133,59 @@ class SparkAppLauncher(BaseLauncher):
             driver_pod_name = f"{spark_app_name}-driver"
 
         log_prefix = "SparkApp %s - Namespace %s - Driver" % (spark_app_name, spark_app_namespace)
+        log_follower = None
 
-        for yielded_spark_app in self._monitor_spark_app_state(spark_app):
-            spark_app_status = yielded_spark_app.status
-            spark_app_state = spark_app_status.application_state.state
+        try:
+            for yielded_spark_app in self._monitor_spark_app_state(spark_app, resource_version=resource_version):
+                if self.listeners is not None:
+                    self._notify_listeners(yielded_spark_app)
 
-            if spark_app_state in (SparkAppState.PENDING_RERUN, SparkAppState.INVALIDATING, SparkAppState.UNKNOWN):
-                continue
+                spark_app_status = yielded_spark_app.status
+                spark_app_state = spark_app_status.application_state.state
 
-            spark_driver_pod = self.core_v1_api.read_namespaced_pod(
-                name=driver_pod_name,
-                namespace=spark_app_namespace,
-            )
-            driver_phase = get_pod_status_phase(pod=spark_driver_pod)
+                if self.executor_state_aggregator is not None and spark_app_state in (
+                    SparkAppState.FAILED, SparkAppState.SUBMISSION_FAILED, SparkAppState.COMPLETED
+                ):
+                    # kept for whoever reads the time series of the run, up to `max_finished` runs
+                    self.executor_state_aggregator.finish(spark_app_namespace, spark_app_name)
+
+                if spark_app_state in (SparkAppState.PENDING_RERUN, SparkAppState.INVALIDATING, SparkAppState.UNKNOWN):
+                    continue
+
+                spark_driver_pod = self.core_v1_api.read_namespaced_pod(
+                    name=driver_pod_name,
+                    namespace=spark_app_namespace,
+                )
+                driver_phase = get_pod_status_phase(pod=spark_driver_pod)
 
-            if driver_phase not in (PodStatusPhase.RUNNING.value, PodStatusPhase.SUCCEEDED.value, PodStatusPhase.FAILED.value):
-                continue
+                if driver_phase not in (PodStatusPhase.RUNNING.value, PodStatusPhase.SUCCEEDED.value, PodStatusPhase.FAILED.value):
+                    continue
 
-            for line in self._read_pod_log(pod=spark_driver_pod):
-                self.logger.info("%s | %s" % (log_prefix, line.decode().strip()))
+                # one follower for the whole run, so later events resume the log instead of reading it again
+                if log_follower is None:
+                    log_follower = self._pod_log_follower(pod=spark_driver_pod)
 
-            if spark_app_state == SparkAppState.FAILED:
-                self.logger.error("%s | Spark Application failed!" % log_prefix)
-                raise SparkAppFailedException()
-            elif spark_app_state == SparkAppState.SUBMISSION_FAILED:
-                self.logger.error("%s | Spark Application submission failed!" % log_prefix)
-                raise SparkAppSubmissionFailedException()
+                for line in log_follower.follow():
+                    if log_follower.lines == 1:
+                        self._profile_mark("first_log_byte", pod=driver_pod_name)
+                    self._emit_log_line(spark_app_namespace, spark_app_name, log_prefix, line)
 
-        self.logger.info("%s | Finished monitoring!" % log_prefix)
+                if spark_app_state in (SparkAppState.FAILED, SparkAppState.SUBMISSION_FAILED):
+                    self._close_log(spark_app_namespace, spark_app_name)
+
+                if spark_app_state == SparkAppState.FAILED:
+                    self.logger.error("%s | Spark Application failed!" % log_prefix)
+                    raise SparkAppFailedException()
+                elif spark_app_state == SparkAppState.SUBMISSION_FAILED:
+                    self.logger.error("%s | Spark Application submission failed!" % log_prefix)
+                    raise SparkAppSubmissionFailedException()
+
+            self._close_log(spark_app_namespace, spark_app_name)
+            self.logger.info("%s | Finished monitoring!" % log_prefix)
+        finally:
+            if self.metrics is not None:
+                self.metrics.forget(spark_app_namespace, spark_app_name)
+                self.metrics.forget(spark_app_namespace, driver_pod_name)
 
     def delete_spark_app(self, spark_app: SparkApp, **kwargs) -> None:
         spark_app_metadata: V1ObjectMeta = spark_app.metadata
@@ -114,16 +216,21 @@ class SparkAppLauncher(BaseLauncher):
             
             raise e
 
-    def _monitor_spark_app_state(self, spark_app: SparkApp) -> Generator[SparkApp, None, None]:
+    def _monitor_spark_app_state(self, spark_app: SparkApp, resource_version: str = None) -> Generator[SparkApp, None, None]:
         spark_app_metadata: V1ObjectMeta = spark_app.metadata
         spark_app_namespace = spark_app_metadata.namespace
         spark_app_name = spark_app_metadata.name
 
         deserializer = MyDeserializer(custom_module=k8s_objects.spark_app)
 
+        state_seen_at: dict[str, float] = dict()
+
         _w = kubernetes.watch.Watch()
         connection_retry_attempt = 0
         while True:
+            watch_kwargs = dict()
+            if resource_version is not None:
+                watch_kwargs["resource_version"] = resource_version
             try:
                 for event in _w.stream(
                     self.custom_object_api.list_namespaced_custom_object,
@@ -132,17 +239,39 @@ class SparkAppLauncher(BaseLauncher):
                     version=consts.SPARK_APP_VERSION,
                     plural=consts.SPARK_APP_PLURAL,
                     field_selector=f"metadata.name={spark_app_name}",
+                    **watch_kwargs
                 ):
-                    spark_app_obj: SparkApp = deserializer.deserialize_data(event["object"], SparkApp)
+                    raw_spark_app: dict = event["object"]
+                    raw_executor_state = None
+                    if self.executor_state_aggregator is not None and raw_spark_app.get("status"):
+                        # executor ids and states are plain strings, no need to deserialize them one by one
+                        raw_executor_state = raw_spark_app["status"].pop("executorState", None)
+
+                    deserialization_started_at = monotonic()
+                    spark_app_obj: SparkApp = deserializer.deserialize_data(raw_spark_app, SparkApp)
+                    if self.metrics is not None:
+                        self.metrics.watch_events.labels(namespace=spark_app_namespace, app=spark_app_name).inc()
+                        self.metrics.deserialization_seconds.labels(
+                            namespace=spark_app_namespace, app=spark_app_name
+                        ).observe(monotonic() - deserialization_started_at)
+
                     spark_app_status = spark_app_obj.status
+                    if self.executor_state_aggregator is not None and spark_app_status is not None:
+                        spark_app_status.executor_state = raw_executor_state
+                        self.executor_state_aggregator.update(spark_app_namespace, spark_app_name, raw_executor_state)
+
                     if spark_app_status is None or spark_app_status.application_state is None:
                         continue
                     
                     spark_app_state = spark_app_status.application_state.state
+                    self._profile_mark("watch_event", state=spark_app_state)
                     self.logger.info(
                         "SparkApp %s - Namespace %s | State: %s" % (
                         spark_app_name, spark_app_namespace, spark_app_state
                     ))
+                    if spark_app_state not in state_seen_at:
+                        state_seen_at[spark_app_state] = monotonic()
+                        self._observe_state_transition(spark_app_obj, spark_app_state, state_seen_at)
 
                     if spark_app_state in (SparkAppState.FAILED, SparkAppState.SUBMISSION_FAILED, SparkAppState.COMPLETED):
                         yield spark_app_obj
@@ -153,18 +282,50 @@ class SparkAppLauncher(BaseLauncher):
             except ApiException as e:
                 if e.status != 410:
                     raise
+                # too old to resume from, start over from the current state
+                resource_version = None
                 # https://kubernetes.io/docs/reference/using-api/api-concepts/#the-resourceversion-parameter
                 self.logger.warning("Kubernetes ApiException 410 (Gone): %s", e.reason)
                 self.logger.warning("Let's retry w/ most recent event")
+                if self.metrics is not None:
+                    self.metrics.watch_reconnects.labels(namespace=spark_app_namespace, app=spark_app_name, reason="410").inc()
 
             except (ProtocolError, ConnectionError, IncompleteRead) as e:
+                if self.metrics is not None:
+                    self.metrics.watch_reconnects.labels(namespace=spark_app_namespace, app=spark_app_name, reason=type(e).__name__).inc()
                 if connection_retry_attempt == 0:
                     raise
 
                 self.logger.warning("Unexpected Kubernetes connection error: %s", e)
 
                 connection_retry_attempt -= 1
+                resource_version = None
                 sleep(1)
 
                 self.logger.warning("Let's retry w/ most recent event. Attempt: %s/10", str(10 - connection_retry_attempt))
 
+
+    def _notify_listeners(self, spark_app: SparkApp) -> None:
+        for listener in self.listeners:
+            try:
+                listener(spark_app=spark_app)
+            except Exception:
+                self.logger.exception("SparkApp listener %s failed" % listener)
+
+
+    def _observe_state_transition(self, spark_app: SparkApp, spark_app_state: str, state_seen_at: dict[str, float]) -> None:
+        if self.metrics is None:
+            return
+
+        labels = dict(namespace=spark_app.metadata.namespace, app=spark_app.metadata.name)
+
+        if spark_app_state == SparkAppState.RUNNING and SparkAppState.SUBMITTED.value in state_seen_at:
+            self.metrics.state_transition_seconds.labels(**labels, transition="submitted_to_running").observe(
+                state_seen_at[SparkAppState.RUNNING.value] - state_seen_at[SparkAppState.SUBMITTED.value]
+            )
+
+        elif (spark_app_state in (SparkAppState.FAILED, SparkAppState.SUBMISSION_FAILED, SparkAppState.COMPLETED)
+              and SparkAppState.RUNNING.value in state_seen_at):
+            self.metrics.state_transition_seconds.labels(**labels, transition="running_to_terminal").observe(
+                state_seen_at[spark_app_state] - state_seen_at[SparkAppState.RUNNING.value]
+            )
@@ -0,0 +1 @@
+from .cluster_router import ClusterRouter, ClusterTarget
@@ -0,0 +1,295 @@
+import copy
+import logging
+import threading
+from functools import cached_property
+from time import monotonic
+
+import kubernetes
+from custom_exceptions import NoHealthyClusterException
+from k8s_manipulators.client import SparkAppClient
+from k8s_objects.spark_app import SparkApp
+from kubernetes.client.models import V1ObjectMeta
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import ConnectTimeoutError, HTTPError, MaxRetryError
+from utils import consts
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import get_spark_app_template
+
+PENDING_STATES = ("", SparkAppState.SUBMITTED.value, SparkAppState.PENDING_RERUN.value)
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+
+
+class ClusterTarget():
+    def __init__(self,
+                 name: str,
+                 context: str = None,
+                 is_client_outside_cluster: bool = True,
+                 max_active_apps: int = None,
+                 weight: float = 1.0) -> None:
+        """
+        One cluster the router can place SparkApps on. `context` is the kube context, use
+        `is_client_outside_cluster=False` for the cluster the orchestrator runs in.
+        `max_active_apps` is the quota of non-terminal SparkApps per namespace, None means unlimited.
+        """
+        self.name = name
+        self.context = context
+        self.is_client_outside_cluster = is_client_outside_cluster
+        self.max_active_apps = max_active_apps
+        self.weight = weight
+
+        # namespace -> (pending, active, updated_at), quotas and queues are per namespace
+        self.stats: dict[str, tuple[int, int, float]] = dict()
+        self.startup_latency: float | None = None
+        self.unhealthy_until = 0.0
+
+
+    @cached_property
+    def api_client(self) -> kubernetes.client.ApiClient:
+        if self.is_client_outside_cluster:
+            return kubernetes.config.new_client_from_config(context=self.context)
+        kubernetes.config.load_incluster_config()
+        return kubernetes.client.ApiClient()
+
+
+    @property
+    def healthy(self) -> bool:
+        return monotonic() >= self.unhealthy_until
+
+
+    def pending(self, namespace: str) -> int:
+        return self.stats.get(namespace, (0, 0, 0.0))[0]
+
+
+    def active(self, namespace: str) -> int:
+        return self.stats.get(namespace, (0, 0, 0.0))[1]
+
+
+    def __repr__(self) -> str:
+        return "ClusterTarget(name=%s, stats=%s, startup_latency=%s, healthy=%s)" % (
+            self.name, {namespace: stats[:2] for namespace, stats in self.stats.items()}, self.startup_latency, self.healthy
+        )
+
+
+class ClusterRouter():
+    """
+    Places each SparkApp on the least loaded of several clusters and runs it there with a `SparkAppClient`.
+
+    Load is scored from the pending SparkApps it manages (listed per namespace within `request_timeout` seconds,
+    cached `stats_ttl` seconds), quota headroom and the recent SUBMITTED -> RUNNING latency of the cluster.
+    A template sticks to the cluster it last ran on unless that cluster scores `sticky_tolerance` times worse than the best one.
+    A cluster whose API fails is skipped for `unhealthy_cooldown` seconds, and a SparkApp that failed
+    before being created is retried on the next cluster, from a copy of the SparkApp as it was given so that
+    the hooks run again there. A create that may have gone through (its response was lost) is only retried
+    elsewhere once a GET proved the SparkApp does not exist, otherwise it is monitored where it was created.
+    """
+
+    def __init__(self,
+                 clusters: list[ClusterTarget],
+                 stats_ttl: float = 15.0,
+                 sticky_tolerance: float = 1.5,
+                 unhealthy_cooldown: float = 60.0,
+                 latency_scale: float = 60.0,
+                 latency_smoothing: float = 0.3,
+                 request_timeout: float = 10.0) -> None:
+        if not clusters:
+            raise ValueError("ClusterRouter needs at least one cluster")
+
+        self.clusters = {cluster.name: cluster for cluster in clusters}
+        self.stats_ttl = stats_ttl
+        self.sticky_tolerance = sticky_tolerance
+        self.unhealthy_cooldown = unhealthy_cooldown
+        self.latency_scale = latency_scale
+        self.latency_smoothing = latency_smoothing
+        self.request_timeout = request_timeout
+
+        self._lock = threading.Lock()
+        self._sticky: dict[str, str] = dict()
+        self._submitted_at: dict[tuple[str, str, str], float] = dict()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def route(self, spark_app: SparkApp, namespace: str = None, exclude: set[str] = None) -> ClusterTarget:
+        metadata: V1ObjectMeta = spark_app.metadata
+        namespace = namespace or metadata.namespace
+        template = get_spark_app_template(spark_app)
+
+        candidates = [
+            cluster for name, cluster in self.clusters.items()
+            if cluster.healthy and name not in (exclude or set())
+        ]
+        for cluster in candidates:
+            self._refresh_stats(cluster, namespace)
+        candidates = [cluster for cluster in candidates if cluster.healthy]
+        if not candidates:
+            raise NoHealthyClusterException("No healthy cluster left for SparkApp %s" % metadata.name)
+
+        with_headroom = [
+            cluster for cluster in candidates
+            if cluster.max_active_apps is None or cluster.active(namespace) < cluster.max_active_apps
+        ]
+        candidates = with_headroom or candidates
+
+        best = min(candidates, key=lambda cluster: self._score(cluster, namespace))
+        with self._lock:
+            sticky = self.clusters.get(self._sticky.get(template))
+            if sticky in candidates and self._score(sticky, namespace) <= self._score(best, namespace) * self.sticky_tolerance:
+                best = sticky
+            self._sticky[template] = best.name
+            pending, active, updated_at = best.stats.get(namespace, (0, 0, float("-inf")))
+            best.stats[namespace] = (pending + 1, active + 1, updated_at)
+
+        self.logger.info("SparkApp %s | Routed to cluster %s, %s" % (metadata.name, best.name, candidates))
+        return best
+
+
+    def run_spark_app(self, spark_app: SparkApp, namespace: str = None, cleanup_on_failure: bool = True, **client_kwargs) -> ClusterTarget:
+        """
+        Route and run `spark_app`, `client_kwargs` are passed to every `SparkAppClient`.
+        Returns the cluster it ran on, attempts after the first one run on copies of `spark_app`.
+        """
+        # hooks mutate the SparkApp they run on, every other cluster starts over from this copy
+        pristine = copy.deepcopy(spark_app)
+        tried = set()
+        while True:
+            cluster = self.route(spark_app, namespace=namespace, exclude=tried)
+            tried.add(cluster.name)
+            client = self.client_for(cluster, spark_app, **client_kwargs)
+
+            try:
+                client.run_spark_app(namespace=namespace, cleanup_on_failure=cleanup_on_failure)
+                return cluster
+            except (ApiException, HTTPError) as e:
+                if client.submitted or not self._is_api_failure(e):
+                    raise
+                if not self._never_sent(e) and self._created_anyway(client, e):
+                    self.logger.warning(
+                        "SparkApp %s | Created on cluster %s despite %s, monitoring it there" % (spark_app.metadata.name, cluster.name, e)
+                    )
+                    client.submitted = True
+                    client.run_spark_app(namespace=namespace, cleanup_on_failure=cleanup_on_failure)
+                    return cluster
+                self.mark_unhealthy(cluster, reason=e)
+            spark_app = copy.deepcopy(pristine)
+
+
+    def client_for(self, cluster: ClusterTarget, spark_app: SparkApp, **client_kwargs) -> SparkAppClient:
+        listeners = list(client_kwargs.pop("listeners", None) or [])
+        listeners.append(lambda spark_app: self._observe_startup(cluster, spark_app))
+
+        return SparkAppClient(
+            spark_app=spark_app,
+            is_client_outside_cluster=cluster.is_client_outside_cluster,
+            context=cluster.context,
+            api_client=cluster.api_client,
+            listeners=listeners,
+            **client_kwargs,
+        )
+
+
+    def mark_unhealthy(self, cluster: ClusterTarget, reason: Exception = None) -> None:
+        cluster.unhealthy_until = monotonic() + self.unhealthy_cooldown
+        self.logger.warning("Cluster %s is unhealthy for %ss: %s" % (cluster.name, self.unhealthy_cooldown, reason))
+
+
+    def _score(self, cluster: ClusterTarget, namespace: str) -> float:
+        latency_penalty = 1 + (cluster.startup_latency or 0.0) / self.latency_scale
+        headroom_penalty = 1.0
+        if cluster.max_active_apps:
+            headroom_penalty += cluster.active(namespace) / cluster.max_active_apps
+        return (cluster.pending(namespace) + 1) * latency_penalty * headroom_penalty / cluster.weight
+
+
+    def _refresh_stats(self, cluster: ClusterTarget, namespace: str) -> None:
+        if monotonic() - cluster.stats.get(namespace, (0, 0, float("-inf")))[2] < self.stats_ttl:
+            return
+
+        try:
+            spark_apps = kubernetes.client.CustomObjectsApi(api_client=cluster.api_client).list_namespaced_custom_object(
+                group=consts.SPARK_APP_GROUP,
+                version=consts.SPARK_APP_VERSION,
+                plural=consts.SPARK_APP_PLURAL,
+                namespace=namespace,
+                label_selector="%s=%s" % (consts.SPARK_APP_MANAGED_BY_LABEL, consts.SPARK_APP_MANAGED_BY),
+                _request_timeout=self.request_timeout,
+            )
+        except (ApiException, HTTPError) as e:
+            if not self._is_api_failure(e):
+                raise
+            self.mark_unhealthy(cluster, reason=e)
+            return
+
+        pending, active = 0, 0
+        for item in spark_apps.get("items", []):
+            state = ((item.get("status") or dict()).get("applicationState") or dict()).get("state", "")
+            if state in TERMINAL_STATES:
+                continue
+            active += 1
+            if state in PENDING_STATES:
+                pending += 1
+
+        with self._lock:
+            cluster.stats[namespace] = (pending, active, monotonic())
+
+
+    def _observe_startup(self, cluster: ClusterTarget, spark_app: SparkApp) -> None:
+        status = spark_app.status
+        if status is None or status.application_state is None:
+            return
+
+        key = (cluster.name, spark_app.metadata.namespace, spark_app.metadata.name)
+        state = status.application_state.state
+        with self._lock:
+            if state == SparkAppState.SUBMITTED.value:
+                self._submitted_at.setdefault(key, monotonic())
+            elif state == SparkAppState.RUNNING.value and key in self._submitted_at:
+                latency = monotonic() - self._submitted_at.pop(key)
+                if cluster.startup_latency is None:
+                    cluster.startup_latency = latency
+                else:
+                    cluster.startup_latency += self.latency_smoothing * (latency - cluster.startup_latency)
+            elif state in TERMINAL_STATES:
+                self._submitted_at.pop(key, None)
+
+
+    def _created_anyway(self, client: SparkAppClient, error: Exception) -> bool:
+        """
+        Whether the SparkApp of `client` exists with its spec although it failed with `error`,
+        which is raised again if that cannot be told
+        """
+        spark_app_metadata: V1ObjectMeta = client.spark_app.metadata
+        try:
+            return client.created_earlier(spark_app_metadata.namespace)
+        except (ApiException, HTTPError) as e:
+            self.logger.error("SparkApp %s | Cannot tell whether it was created, not retrying it elsewhere: %s" % (spark_app_metadata.name, e))
+            raise error
+
+
+    @staticmethod
+    def _never_sent(e: Exception) -> bool:
+        """
+        Whether `e` proves the request never reached the API server: the connection could not be opened,
+        or an empty 5xx answer (from a proxy or load balancer in front of it)
+        """
+        if isinstance(e, ApiException):
+            return e.status >= 500 and not e.body
+        if isinstance(e, MaxRetryError):
+            e = e.reason
+        return isinstance(e, ConnectTimeoutError)
+
+
+    @staticmethod
+    def _is_api_failure(e: Exception) -> bool:
+        if isinstance(e, ApiException):
+            return e.status == 0 or e.status >= 500
+        return True
@@ -0,0 +1 @@
+from .spark_app_scheduler import SchedulerTicket, SparkAppScheduler
@@ -0,0 +1,243 @@
+import heapq
+import itertools
+import logging
+import threading
+from collections import defaultdict, deque
+from time import monotonic
+
+from k8s_objects.spark_app import SparkApp
+from kubernetes.client.models import V1ObjectMeta
+from metrics import MetricsRegistry
+
+DEFAULT_QUEUE = "default"
+DEFAULT_TEAM = "default"
+
+
+class SchedulerTicket():
+    """
+    Handle returned by `SparkAppScheduler.submit`. Wait on it before creating the SparkApp
+    and hand it back to `SparkAppScheduler.release` once the SparkApp is finished.
+    """
+
+    def __init__(self, namespace: str, spark_app: SparkApp, queue: str, team: str, priority: int) -> None:
+        self.namespace = namespace
+        self.spark_app = spark_app
+        self.queue = queue
+        self.team = team
+        self.priority = priority
+        self.enqueued_at = monotonic()
+        self.admitted_at: float | None = None
+        self.cancelled = False
+        self._admitted = threading.Event()
+
+
+    @property
+    def queueing_delay(self) -> float | None:
+        if self.admitted_at is None:
+            return None
+        return self.admitted_at - self.enqueued_at
+
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._admitted.wait(timeout=timeout)
+
+
+class SparkAppScheduler():
+    """
+    Client-side admission control in front of `SparkAppLauncher.create_spark_app`.
+
+    Waiting SparkApps are grouped per (queue, team). The next SparkApp to admit is the one with the
+    highest effective priority, which is its base priority plus `aging_rate` per second spent waiting,
+    so that low priority SparkApps cannot starve. Ties are broken by weighted fair share, the team
+    with the lowest running / weight ratio goes first. A queue never runs more than its concurrency limit.
+    """
+
+    def __init__(self,
+                 queue_limits: dict[str, int] = None,
+                 default_queue_limit: int = None,
+                 team_weights: dict[str, float] = None,
+                 priority_classes: dict[str, int] = None,
+                 aging_rate: float = 1 / 60,
+                 team_label: str = "team",
+                 delay_history_size: int = 1000,
+                 metrics: MetricsRegistry = None) -> None:
+        self.queue_limits = queue_limits or dict()
+        self.default_queue_limit = default_queue_limit
+        self.team_weights = team_weights or dict()
+        self.priority_classes = priority_classes or dict()
+        self.aging_rate = aging_rate
+        self.team_label = team_label
+
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._waiting: dict[tuple[str, str], list] = defaultdict(list)
+        self._waiting_count: dict[str, int] = defaultdict(int)
+        self._running_per_queue: dict[str, int] = defaultdict(int)
+        self._running_per_team: dict[str, int] = defaultdict(int)
+        self._delays: dict[str, deque] = defaultdict(lambda: deque(maxlen=delay_history_size))
+
+        self.queueing_seconds = None
+        if metrics is not None:
+            self.queueing_seconds = metrics.histogram(
+                "spark_app_creator_queueing_seconds",
+                "Time SparkApps waited in the client-side scheduler before being admitted",
+                ("namespace", "app", "queue"),
+            )
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def submit(self, namespace: str, spark_app: SparkApp) -> SchedulerTicket:
+        ticket = SchedulerTicket(
+            namespace=namespace,
+            spark_app=spark_app,
+            queue=self._get_queue(spark_app),
+            team=self._get_team(spark_app),
+            priority=self._get_priority(spark_app),
+        )
+
+        # effective priority = priority + aging_rate * (now - enqueued_at), every waiting ticket ages at
+        # the same rate so ordering by (priority - aging_rate * enqueued_at) stays valid forever
+        sort_key = (-(ticket.priority - self.aging_rate * ticket.enqueued_at), next(self._counter))
+
+        with self._lock:
+            heapq.heappush(self._waiting[(ticket.queue, ticket.team)], (sort_key, ticket))
+            self._waiting_count[ticket.queue] += 1
+            admitted = self._dispatch()
+
+        self.logger.info(
+            "SparkApp %s - Namespace %s | Queued in %s for team %s with priority %s" % (
+            spark_app.metadata.name, namespace, ticket.queue, ticket.team, ticket.priority
+        ))
+        self._notify(admitted)
+        return ticket
+
+
+    def cancel(self, ticket: SchedulerTicket) -> None:
+        with self._lock:
+            if ticket.admitted_at is None and not ticket.cancelled:
+                ticket.cancelled = True
+                self._waiting_count[ticket.queue] -= 1
+
+
+    def release(self, ticket: SchedulerTicket) -> None:
+        with self._lock:
+            if ticket.admitted_at is None:
+                return
+            self._running_per_queue[ticket.queue] -= 1
+            self._running_per_team[ticket.team] -= 1
+            admitted = self._dispatch()
+
+        self._notify(admitted)
+
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        Queueing delay metrics per queue, delays are in seconds over the most recent admissions
+        """
+        with self._lock:
+            queues = set(self._waiting_count) | set(self._running_per_queue) | set(self._delays)
+            result = dict()
+            for queue in queues:
+                delays = sorted(self._delays[queue])
+                result[queue] = {
+                    "waiting": self._waiting_count[queue],
+                    "running": self._running_per_queue[queue],
+                    "delay_p50": delays[len(delays) // 2] if delays else 0.0,
+                    "delay_p95": delays[min(len(delays) - 1, int(len(delays) * 0.95))] if delays else 0.0,
+                    "delay_max": delays[-1] if delays else 0.0,
+                }
+            return result
+
+
+    def waiting_spark_apps(self) -> list[SparkApp]:
+        """
+        SparkApps still waiting for admission, in no particular order
+        """
+        with self._lock:
+            return [ticket.spark_app for heap in self._waiting.values() for _, ticket in heap if not ticket.cancelled]
+
+
+    def _dispatch(self) -> list[SchedulerTicket]:
+        """
+        Must be called while holding `self._lock`
+        """
+        admitted = []
+        while True:
+            best = None
+            best_rank = None
+            now = monotonic()
+
+            for (queue, team), heap in self._waiting.items():
+                while heap and heap[0][1].cancelled:
+                    heapq.heappop(heap)
+                if not heap or not self._has_capacity(queue):
+                    continue
+
+                ticket = heap[0][1]
+                effective_priority = ticket.priority + self.aging_rate * (now - ticket.enqueued_at)
+                share = self._running_per_team[team] / self.team_weights.get(team, 1.0)
+                rank = (-int(effective_priority), share, heap[0][0])
+
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = (queue, team), rank
+
+            if best is None:
+                return admitted
+
+            _, ticket = heapq.heappop(self._waiting[best])
+            ticket.admitted_at = now
+            self._waiting_count[ticket.queue] -= 1
+            self._running_per_queue[ticket.queue] += 1
+            self._running_per_team[ticket.team] += 1
+            self._delays[ticket.queue].append(ticket.queueing_delay)
+            admitted.append(ticket)
+
+
+    def _notify(self, admitted: list[SchedulerTicket]) -> None:
+        for ticket in admitted:
+            self.logger.info(
+                "SparkApp %s - Namespace %s | Admitted from %s after %.3fs" % (
+                ticket.spark_app.metadata.name, ticket.namespace, ticket.queue, ticket.queueing_delay
+            ))
+            if self.queueing_seconds is not None:
+                self.queueing_seconds.labels(
+                    namespace=ticket.namespace, app=ticket.spark_app.metadata.name, queue=ticket.queue
+                ).observe(ticket.queueing_delay)
+            ticket._admitted.set()
+
+
+    def _has_capacity(self, queue: str) -> bool:
+        limit = self.queue_limits.get(queue, self.default_queue_limit)
+        return limit is None or self._running_per_queue[queue] < limit
+
+
+    def _get_queue(self, spark_app: SparkApp) -> str:
+        options = spark_app.spec.batch_scheduler_options
+        if options is not None and options.queue:
+            return options.queue
+        return DEFAULT_QUEUE
+
+
+    def _get_team(self, spark_app: SparkApp) -> str:
+        metadata: V1ObjectMeta = spark_app.metadata
+        if metadata.labels and metadata.labels.get(self.team_label):
+            return metadata.labels[self.team_label]
+        return DEFAULT_TEAM
+
+
+    def _get_priority(self, spark_app: SparkApp) -> int:
+        options = spark_app.spec.batch_scheduler_options
+        if options is not None and options.priority_class_name:
+            return self.priority_classes.get(options.priority_class_name, 0)
+        return 0
@@ -0,0 +1 @@
+from .monitor_supervisor import HashRing, MonitorSupervisor, monitor_worker
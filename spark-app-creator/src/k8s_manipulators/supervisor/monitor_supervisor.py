@@ -0,0 +1,526 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from time import monotonic, sleep
+from typing import Callable
+
+import kubernetes
+from custom_exceptions import (ResourceObjectNotFoundException,
+                               SparkAppFailedException,
+                               SparkAppSubmissionFailedException)
+from kubernetes.client.rest import ApiException
+from metrics import LauncherMetrics, MetricsRegistry
+from urllib3.exceptions import ConnectionError, IncompleteRead, ProtocolError
+from utils import consts
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import get_monitor_shard
+
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+# reported for a SparkApp deleted before reaching a terminal state
+DELETED = "DELETED"
+
+# commands are (kind, namespace, name), (SHARDS, None, shards) for the shards of a worker
+# results are flat tuples: (kind, worker_id, namespace, name, value)
+WATCH = "watch"
+UNWATCH = "unwatch"
+SHARDS = "shards"
+STOP = "stop"
+STATE = "state"
+STATS = "stats"
+ERROR = "error"
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing():
+    """
+    Consistent hashing of `namespace/name` keys onto nodes, each node owns `replicas` points of the ring.
+    Adding or removing a node only moves the keys of that node.
+    """
+
+    def __init__(self, nodes: list[str] = None, replicas: int = 64) -> None:
+        self.replicas = replicas
+        self._points: list[int] = []
+        self._owners: dict[int, str] = dict()
+        for node in nodes or []:
+            self.add(node)
+
+
+    def __len__(self) -> int:
+        return len(self._points) // self.replicas
+
+
+    def add(self, node: str) -> None:
+        for replica in range(self.replicas):
+            point = self._hash("%s#%s" % (node, replica))
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+            self._owners[point] = node
+
+
+    def remove(self, node: str) -> None:
+        for replica in range(self.replicas):
+            point = self._hash("%s#%s" % (node, replica))
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+
+    def owner(self, key: str) -> str:
+        if not self._points:
+            raise ValueError("HashRing has no nodes")
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def monitor_worker(worker_id: str,
+                   commands: multiprocessing.Queue,
+                   results: multiprocessing.Queue,
+                   context: str = None,
+                   is_client_outside_cluster: bool = False,
+                   stats_interval: float = 5.0,
+                   watch_timeout: int = 60) -> None:
+    """
+    Worker process: one watch per namespace serves every SparkApp of that namespace assigned to the worker.
+    Once given its shards, the watch only lists SparkApps labelled with them, otherwise every SparkApp of
+    the namespace. Watch events stay raw dicts, only state changes and event counts go back to the supervisor.
+    """
+    if is_client_outside_cluster:
+        api_client = kubernetes.config.new_client_from_config(context=context)
+    else:
+        kubernetes.config.load_incluster_config()
+        api_client = kubernetes.client.ApiClient()
+    custom_object_api = kubernetes.client.CustomObjectsApi(api_client=api_client)
+
+    lock = threading.Lock()
+    watched: dict[str, set[str]] = dict()
+    last_states: dict[tuple[str, str], str] = dict()
+    event_counts: dict[tuple[str, str], int] = dict()
+    # namespace -> (generation, thread), a watch thread exits once its generation is outdated
+    threads: dict[str, tuple[int, threading.Thread]] = dict()
+    stopping = threading.Event()
+    shards: tuple[str, ...] | None = None
+    generation = 0
+
+    def is_current(namespace: str, thread_generation: int) -> bool:
+        current = threads.get(namespace)
+        return current is not None and current[0] == thread_generation
+
+    def start_watch(namespace: str) -> None:
+        # called with the lock held
+        thread = threading.Thread(target=watch_namespace, args=(namespace, generation), daemon=True)
+        threads[namespace] = (generation, thread)
+        thread.start()
+
+    def watch_namespace(namespace: str, thread_generation: int) -> None:
+        _w = kubernetes.watch.Watch()
+        while not stopping.is_set():
+            with lock:
+                if not is_current(namespace, thread_generation):
+                    return
+                if not watched.get(namespace):
+                    threads.pop(namespace, None)
+                    return
+                label_selector = None
+                if shards is not None:
+                    label_selector = "%s in (%s)" % (consts.SPARK_APP_MONITOR_SHARD_LABEL, ",".join(shards))
+            try:
+                for event in _w.stream(
+                    custom_object_api.list_namespaced_custom_object,
+                    namespace=namespace,
+                    group=consts.SPARK_APP_GROUP,
+                    version=consts.SPARK_APP_VERSION,
+                    plural=consts.SPARK_APP_PLURAL,
+                    label_selector=label_selector,
+                    timeout_seconds=watch_timeout,
+                ):
+                    raw_spark_app: dict = event["object"]
+                    name = raw_spark_app.get("metadata", dict()).get("name")
+                    key = (namespace, name)
+                    if event["type"] == "DELETED":
+                        state = DELETED
+                    else:
+                        state = ((raw_spark_app.get("status") or dict()).get("applicationState") or dict()).get("state", "")
+
+                    with lock:
+                        if not is_current(namespace, thread_generation):
+                            _w.stop()
+                            break
+                        if name not in watched.get(namespace, ()):
+                            continue
+                        event_counts[key] = event_counts.get(key, 0) + 1
+                        if last_states.get(key) == state:
+                            continue
+                        last_states[key] = state
+                        if state in TERMINAL_STATES or state == DELETED:
+                            watched[namespace].discard(name)
+                            last_states.pop(key, None)
+                        empty = not watched[namespace]
+
+                    results.put((STATE, worker_id, namespace, name, state))
+                    if empty or stopping.is_set():
+                        _w.stop()
+
+            except ApiException as e:
+                if e.status != 410:
+                    results.put((ERROR, worker_id, namespace, None, "%s %s" % (e.status, e.reason)))
+                    with lock:
+                        if is_current(namespace, thread_generation):
+                            for name in watched.pop(namespace, set()):
+                                last_states.pop((namespace, name), None)
+                            threads.pop(namespace, None)
+                    return
+                logger.warning("Worker %s | Namespace %s | Kubernetes ApiException 410 (Gone), re-listing" % (worker_id, namespace))
+
+            except (ProtocolError, ConnectionError, IncompleteRead) as e:
+                logger.warning("Worker %s | Namespace %s | Unexpected Kubernetes connection error: %s" % (worker_id, namespace, e))
+                sleep(1)
+
+    def flush_stats() -> None:
+        with lock:
+            counts = dict(event_counts)
+            event_counts.clear()
+        if counts:
+            results.put((STATS, worker_id, None, None, counts))
+
+    next_flush = monotonic() + stats_interval
+    while True:
+        try:
+            kind, namespace, name = commands.get(timeout=max(next_flush - monotonic(), 0.01))
+        except queue.Empty:
+            kind = None
+
+        if kind == STOP:
+            stopping.set()
+            flush_stats()
+            return
+
+        if kind == WATCH:
+            with lock:
+                watched.setdefault(namespace, set()).add(name)
+                if namespace not in threads:
+                    start_watch(namespace)
+        elif kind == SHARDS:
+            with lock:
+                shards = tuple(name)
+                generation += 1
+                # restart the watches with the new label selector, the outdated ones exit on their next event
+                for watched_namespace, names in watched.items():
+                    if names:
+                        start_watch(watched_namespace)
+        elif kind == UNWATCH:
+            with lock:
+                watched.get(namespace, set()).discard(name)
+                last_states.pop((namespace, name), None)
+
+        if monotonic() >= next_flush:
+            flush_stats()
+            next_flush = monotonic() + stats_interval
+
+
+class _Worker():
+    def __init__(self, worker_id: str, process: multiprocessing.Process, commands: multiprocessing.Queue) -> None:
+        self.worker_id = worker_id
+        self.process = process
+        self.commands = commands
+
+
+class MonitorSupervisor():
+    """
+    Monitors SparkApps from a pool of worker processes, so that decoding watch events scales with cores
+    instead of being bound by the GIL of a single process.
+
+    SparkApps are split into `consts.SPARK_APP_MONITOR_SHARDS` shards on `namespace/name`, stamped as the
+    `consts.SPARK_APP_MONITOR_SHARD_LABEL` label by `SparkAppLauncher.create_spark_app`, and shards are assigned to
+    workers with consistent hashing. With `shard_filter=True` each worker watches its shards only (a label selector),
+    so the API server sends every watch event to a single worker; SparkApps without the label are then not seen,
+    use `shard_filter=False` to monitor them with unfiltered watches.
+    `monitor` returns a `Future` resolved with the terminal state, or failed with `SparkAppFailedException` /
+    `SparkAppSubmissionFailedException`, or `ResourceObjectNotFoundException` if the SparkApp is deleted before.
+    `state_listeners` are called as `listener(namespace=..., name=..., state=...)` on every state change.
+    A dead worker is dropped from the ring, its SparkApps are re-watched by their new owners and,
+    with `respawn=True`, a replacement worker joins the ring again.
+    """
+
+    def __init__(self,
+                 workers: int = None,
+                 context: str = None,
+                 is_client_outside_cluster: bool = False,
+                 metrics: MetricsRegistry = None,
+                 state_listeners: list[Callable] = None,
+                 replicas: int = 64,
+                 health_interval: float = 5.0,
+                 stats_interval: float = 5.0,
+                 respawn: bool = True,
+                 shard_filter: bool = True,
+                 mp_context: str = "spawn",
+                 worker_target: Callable = monitor_worker) -> None:
+        if is_client_outside_cluster and context is None:
+            raise ValueError("context cannot be None when is_client_outside_cluster == True")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.context = context
+        self.is_client_outside_cluster = is_client_outside_cluster
+        self.launcher_metrics = LauncherMetrics(metrics) if metrics is not None else None
+        self.state_listeners = state_listeners
+        self.health_interval = health_interval
+        self.stats_interval = stats_interval
+        self.respawn = respawn
+        self.shard_filter = shard_filter
+        self.worker_target = worker_target
+
+        self._mp_context = multiprocessing.get_context(mp_context)
+        self._results = self._mp_context.Queue()
+        self._ring = HashRing(replicas=replicas)
+        self._lock = threading.RLock()
+        self._workers: dict[str, _Worker] = dict()
+        self._assignments: dict[tuple[str, str], str] = dict()
+        self._futures: dict[tuple[str, str], Future] = dict()
+        self._next_worker_index = 0
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        self.worker_restarts = None
+        self.worker_apps = None
+        if metrics is not None:
+            self.worker_restarts = metrics.counter(
+                "spark_app_creator_monitor_worker_restarts_total",
+                "Monitor worker processes found dead and replaced",
+            )
+            self.worker_apps = metrics.gauge(
+                "spark_app_creator_monitor_worker_apps",
+                "SparkApps monitored per worker process",
+                ("worker",),
+            )
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def start(self) -> "MonitorSupervisor":
+        with self._lock:
+            for _ in range(self.workers):
+                self._spawn_worker()
+            self._assign_shards()
+
+        for target in (self._collect_results, self._watch_workers):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.commands.put((STOP, None, None))
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+    def monitor(self, namespace: str, name: str) -> Future:
+        key = (namespace, name)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                return future
+
+            future = self._futures[key] = Future()
+            worker_id = self._ring.owner(get_monitor_shard(namespace, name))
+            self._assignments[key] = worker_id
+            self._workers[worker_id].commands.put((WATCH, namespace, name))
+            self._update_worker_gauges()
+        return future
+
+
+    def owner_of(self, namespace: str, name: str) -> str | None:
+        with self._lock:
+            return self._assignments.get((namespace, name))
+
+
+    def assignments(self) -> dict[tuple[str, str], str]:
+        with self._lock:
+            return dict(self._assignments)
+
+
+    def _spawn_worker(self) -> _Worker:
+        worker_id = "worker-%s" % self._next_worker_index
+        self._next_worker_index += 1
+
+        commands = self._mp_context.Queue()
+        process = self._mp_context.Process(
+            target=self.worker_target,
+            name="spark-app-monitor-%s" % worker_id,
+            args=(worker_id, commands, self._results, self.context, self.is_client_outside_cluster, self.stats_interval),
+            daemon=True,
+        )
+        process.start()
+
+        worker = self._workers[worker_id] = _Worker(worker_id, process, commands)
+        self._ring.add(worker_id)
+        self.logger.info("Started monitor %s (pid %s)" % (worker_id, process.pid))
+        return worker
+
+
+    def _watch_workers(self) -> None:
+        while not self._stopping.wait(self.health_interval):
+            self._check_workers()
+
+
+    def _check_workers(self) -> None:
+        with self._lock:
+            dead = [worker for worker in self._workers.values() if not worker.process.is_alive()]
+            if not dead or self._stopping.is_set():
+                return
+
+            for worker in dead:
+                self.logger.warning("Monitor %s (pid %s) died with exit code %s" % (worker.worker_id, worker.process.pid, worker.process.exitcode))
+                del self._workers[worker.worker_id]
+                self._ring.remove(worker.worker_id)
+                if self.worker_restarts is not None:
+                    self.worker_restarts.labels().inc()
+                if self.worker_apps is not None:
+                    self.worker_apps.labels(worker=worker.worker_id).set(0)
+
+            if self.respawn:
+                for _ in dead:
+                    self._spawn_worker()
+            if not self._workers:
+                self._spawn_worker()
+
+            self._assign_shards()
+            self._rebalance()
+
+
+    def _assign_shards(self) -> None:
+        if not self.shard_filter:
+            return
+        shards = {worker_id: [] for worker_id in self._workers}
+        for shard in range(consts.SPARK_APP_MONITOR_SHARDS):
+            shards[self._ring.owner(str(shard))].append(str(shard))
+        for worker_id, worker_shards in shards.items():
+            self._workers[worker_id].commands.put((SHARDS, None, tuple(worker_shards)))
+
+
+    def _rebalance(self) -> None:
+        moved = 0
+        for key, worker_id in self._assignments.items():
+            owner = self._ring.owner(get_monitor_shard(*key))
+            if owner == worker_id:
+                continue
+            if worker_id in self._workers:
+                self._workers[worker_id].commands.put((UNWATCH,) + key)
+            self._workers[owner].commands.put((WATCH,) + key)
+            self._assignments[key] = owner
+            moved += 1
+
+        self._update_worker_gauges()
+        self.logger.info("Rebalanced %s of %s SparkApps over %s monitors" % (moved, len(self._assignments), len(self._workers)))
+
+
+    def _collect_results(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                kind, worker_id, namespace, name, value = self._results.get(timeout=self.health_interval)
+            except queue.Empty:
+                continue
+
+            if kind == STATE:
+                self._on_state(worker_id, namespace, name, value)
+            elif kind == STATS:
+                if self.launcher_metrics is not None:
+                    with self._lock:
+                        # counts sent before a SparkApp finished would bring its forgotten series back
+                        counts = {key: count for key, count in value.items() if key in self._assignments}
+                    for (event_namespace, event_name), count in counts.items():
+                        self.launcher_metrics.watch_events.labels(namespace=event_namespace, app=event_name).inc(count)
+            elif kind == ERROR:
+                self._on_error(worker_id, namespace, value)
+
+
+    def _on_state(self, worker_id: str, namespace: str, name: str, state: str) -> None:
+        key = (namespace, name)
+        with self._lock:
+            if self._assignments.get(key) != worker_id:
+                # stale message of a worker the SparkApp was moved away from
+                return
+            future = self._futures.get(key)
+            if state in TERMINAL_STATES or state == DELETED:
+                del self._assignments[key]
+                self._futures.pop(key, None)
+                self._update_worker_gauges()
+                if self.launcher_metrics is not None:
+                    self.launcher_metrics.forget(namespace, name)
+
+        self.logger.info("SparkApp %s - Namespace %s | State: %s (%s)" % (name, namespace, state, worker_id))
+        if self.state_listeners is not None:
+            for listener in self.state_listeners:
+                try:
+                    listener(namespace=namespace, name=name, state=state)
+                except Exception:
+                    self.logger.exception("SparkApp state listener %s failed" % listener)
+
+        if future is None or (state not in TERMINAL_STATES and state != DELETED):
+            return
+        if state == DELETED:
+            future.set_exception(ResourceObjectNotFoundException(
+                resource_type="sparkapplication",
+                message="SparkApp %s in namespace %s - deleted before reaching a terminal state" % (name, namespace),
+            ))
+        elif state == SparkAppState.FAILED.value:
+            future.set_exception(SparkAppFailedException())
+        elif state == SparkAppState.SUBMISSION_FAILED.value:
+            future.set_exception(SparkAppSubmissionFailedException())
+        else:
+            future.set_result(state)
+
+
+    def _on_error(self, worker_id: str, namespace: str, message: str) -> None:
+        self.logger.error("Monitor %s | Namespace %s | Watch failed: %s" % (worker_id, namespace, message))
+        failed = []
+        with self._lock:
+            for key, owner in list(self._assignments.items()):
+                if owner == worker_id and key[0] == namespace:
+                    del self._assignments[key]
+                    failed.append(self._futures.pop(key, None))
+            self._update_worker_gauges()
+
+        for future in failed:
+            if future is not None:
+                future.set_exception(RuntimeError("Watch on namespace %s failed: %s" % (namespace, message)))
+
+
+    def _update_worker_gauges(self) -> None:
+        if self.worker_apps is None:
+            return
+        apps = {worker_id: 0 for worker_id in self._workers}
+        for worker_id in self._assignments.values():
+            apps[worker_id] = apps.get(worker_id, 0) + 1
+        for worker_id, count in apps.items():
+            self.worker_apps.labels(worker=worker_id).set(count)
@@ -0,0 +1,2 @@
+from .image_warmer import (ImagePullStats, ImageWarmer, StartupSavingsReport,
+                           spark_app_images)
@@ -0,0 +1,392 @@
+import hashlib
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import kubernetes
+from k8s_manipulators.launcher import PodLauncher
+from k8s_manipulators.scheduler import SparkAppScheduler
+from k8s_objects.spark_app import SparkApp
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.models import (CoreV1Event, V1Container,
+                                      V1DaemonSet, V1DaemonSetSpec,
+                                      V1LabelSelector, V1LocalObjectReference,
+                                      V1Node, V1ObjectMeta, V1Pod, V1PodSpec,
+                                      V1PodTemplateSpec,
+                                      V1ResourceRequirements, V1Toleration)
+from kubernetes.client.rest import ApiException
+from logs import LogPipeline
+from metrics import LauncherMetrics
+from profiling import PhaseProfiler
+from utils import consts
+
+PULLED_PATTERN = re.compile(r'Successfully pulled image "(?P<image>[^"]+)" in (?P<duration>[\d.hmsunµ]+)')
+PRESENT_PATTERN = re.compile(r'Container image "(?P<image>[^"]+)" already present on machine')
+GO_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(h|ms|us|µs|ns|m|s)")
+GO_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6, "ns": 1e-9}
+
+# driver `<app>-driver`, executors `<app>-<id>-exec-<n>`
+SPARK_POD_PATTERN = re.compile(r"-driver$|-exec-\d+$")
+
+TINY_RESOURCES = V1ResourceRequirements(
+    requests={"cpu": "10m", "memory": "16Mi"},
+    limits={"cpu": "100m", "memory": "64Mi"},
+)
+
+
+def parse_go_duration(value: str) -> float:
+    """
+    Go duration string of kubelet messages (1m2.5s, 850ms) to seconds
+    """
+    return sum(float(amount) * GO_DURATION_UNITS[unit] for amount, unit in GO_DURATION_PATTERN.findall(value))
+
+
+def spark_app_images(spark_app: SparkApp | dict) -> list[str]:
+    """
+    Images a SparkApp (object or raw custom object) runs: the spec image and the driver / executor overrides
+    """
+    if isinstance(spark_app, SparkApp):
+        spec = spark_app.spec
+        candidates = [
+            spec.image,
+            spec.driver.image if spec.driver is not None else None,
+            spec.executor.image if spec.executor is not None else None,
+        ]
+    else:
+        spec = spark_app.get("spec") or dict()
+        candidates = [spec.get("image"), (spec.get("driver") or dict()).get("image"), (spec.get("executor") or dict()).get("image")]
+    return list(dict.fromkeys(image for image in candidates if image))
+
+
+class ImagePullStats():
+    def __init__(self, image: str) -> None:
+        """Pulls of `image` seen in events: durations of actual pulls and Spark pods that found it warmed on their node."""
+        self.image = image
+        self.pull_seconds: list[float] = []
+        self.warm_starts = 0
+
+
+    @property
+    def median_pull_seconds(self) -> float | None:
+        if not self.pull_seconds:
+            return None
+        ordered = sorted(self.pull_seconds)
+        return ordered[len(ordered) // 2]
+
+
+    @property
+    def saved_seconds(self) -> float:
+        """
+        Every Spark pod that found the image warmed saved a median pull
+        """
+        return self.warm_starts * (self.median_pull_seconds or 0.0)
+
+
+    def __repr__(self) -> str:
+        return "ImagePullStats(image=%s, pulls=%s, median_pull_seconds=%s, warm_starts=%s, saved_seconds=%.1f)" % (
+            self.image, len(self.pull_seconds), self.median_pull_seconds, self.warm_starts, self.saved_seconds
+        )
+
+
+class StartupSavingsReport():
+    def __init__(self, namespace: str, since: datetime | None, images: dict[str, ImagePullStats]) -> None:
+        self.namespace = namespace
+        self.since = since
+        self.images = images
+
+
+    @property
+    def saved_seconds(self) -> float:
+        return sum(stats.saved_seconds for stats in self.images.values())
+
+
+    def __repr__(self) -> str:
+        return "StartupSavingsReport(namespace=%s, saved_seconds=%.1f, images=%s)" % (
+            self.namespace, self.saved_seconds, list(self.images.values())
+        )
+
+
+class ImageWarmer(PodLauncher):
+    """
+    Keeps the images of recent and scheduled SparkApps pulled on the nodes of a node pool (`node_selector`),
+    so drivers and executors do not wait for multi-GB pulls on cold nodes.
+
+    `warm` manages one DaemonSet whose pods pull every image in an init container that exits right away,
+    then idle in a pause container, new nodes of the pool get warmed as they join. `warm_nodes` does the same
+    once with one short-lived pod per node instead. `cleanup` removes both.
+    `startup_savings` measures what warming saved from the kubelet `Pulled` events of the Spark pods.
+    """
+
+    def __init__(self,
+                 api_client: ApiClient,
+                 namespace: str,
+                 name: str = "spark-image-warmer",
+                 node_selector: dict[str, str] = None,
+                 tolerations: list[V1Toleration] = None,
+                 image_pull_secrets: list[str] = None,
+                 pause_image: str = "registry.k8s.io/pause:3.9",
+                 warm_command: list[str] = None,
+                 max_images: int = 10,
+                 metrics: LauncherMetrics = None,
+                 profiler: PhaseProfiler = None,
+                 log_pipeline: LogPipeline = None) -> None:
+        super().__init__(api_client, metrics=metrics, profiler=profiler, log_pipeline=log_pipeline)
+        self.apps_v1_api = kubernetes.client.AppsV1Api(api_client=api_client)
+        self.custom_object_api = kubernetes.client.CustomObjectsApi(api_client=api_client)
+        self.namespace = namespace
+        self.name = name
+        self.node_selector = node_selector
+        self.tolerations = tolerations
+        self.image_pull_secrets = image_pull_secrets
+        self.pause_image = pause_image
+        self.warm_command = warm_command or ["sh", "-c", "exit 0"]
+        self.max_images = max_images
+
+
+    def recent_images(self,
+                      namespaces: list[str],
+                      since: timedelta = timedelta(days=1),
+                      label_selector: str = "%s=%s" % (consts.SPARK_APP_MANAGED_BY_LABEL, consts.SPARK_APP_MANAGED_BY),
+                      page_size: int = 500) -> list[str]:
+        """
+        Images of the SparkApps created in the last `since`, most used first
+        """
+        created_after = datetime.now(timezone.utc) - since
+        counts: Counter = Counter()
+        for namespace in namespaces:
+            _continue = None
+            while True:
+                response = self.custom_object_api.list_namespaced_custom_object(
+                    group=consts.SPARK_APP_GROUP,
+                    version=consts.SPARK_APP_VERSION,
+                    plural=consts.SPARK_APP_PLURAL,
+                    namespace=namespace,
+                    label_selector=label_selector,
+                    limit=page_size,
+                    _continue=_continue,
+                )
+                for raw_spark_app in response.get("items") or []:
+                    creation_timestamp = (raw_spark_app.get("metadata") or dict()).get("creationTimestamp")
+                    if creation_timestamp and datetime.fromisoformat(creation_timestamp.replace("Z", "+00:00")) < created_after:
+                        continue
+                    counts.update(spark_app_images(raw_spark_app))
+
+                _continue = (response.get("metadata") or dict()).get("continue")
+                if not _continue:
+                    break
+
+        return [image for image, _ in counts.most_common()]
+
+
+    def images_to_warm(self, spark_apps: list[SparkApp] = None, scheduler: SparkAppScheduler = None, namespaces: list[str] = None) -> list[str]:
+        """
+        At most `max_images`: images of `spark_apps` and of the SparkApps waiting in `scheduler` first,
+        then the most used images of recent SparkApps in `namespaces`
+        """
+        spark_apps = list(spark_apps or [])
+        if scheduler is not None:
+            spark_apps.extend(scheduler.waiting_spark_apps())
+
+        images = [image for spark_app in spark_apps for image in spark_app_images(spark_app)]
+        if namespaces:
+            images.extend(self.recent_images(namespaces))
+        return list(dict.fromkeys(images))[:self.max_images]
+
+
+    def warm(self, images: list[str]) -> bool:
+        """
+        Creates or updates the warmer DaemonSet, returns False if it already pulls exactly `images`
+        """
+        images = sorted(set(images))
+        daemon_set = self._daemon_set(images)
+
+        try:
+            current: V1DaemonSet = self.apps_v1_api.read_namespaced_daemon_set(name=self.name, namespace=self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            current = None
+
+        if current is None:
+            self.apps_v1_api.create_namespaced_daemon_set(namespace=self.namespace, body=daemon_set)
+            self.logger.info("DaemonSet %s - Namespace %s | Created to warm %s images" % (self.name, self.namespace, len(images)))
+            return True
+
+        annotations = current.metadata.annotations or dict()
+        if annotations.get(consts.SPARK_IMAGE_WARMER_IMAGES_ANNOTATION) == daemon_set.metadata.annotations[consts.SPARK_IMAGE_WARMER_IMAGES_ANNOTATION]:
+            return False
+
+        daemon_set.metadata.resource_version = current.metadata.resource_version
+        self.apps_v1_api.replace_namespaced_daemon_set(name=self.name, namespace=self.namespace, body=daemon_set)
+        self.logger.info("DaemonSet %s - Namespace %s | Updated to warm %s images" % (self.name, self.namespace, len(images)))
+        return True
+
+
+    def warm_nodes(self, images: list[str], node_names: list[str] = None) -> list[str]:
+        """
+        One pod per node of the pool (or per `node_names`) pulling `images` and exiting, returns the pods created.
+        Pods already created for the same images and node are left alone.
+        """
+        images = sorted(set(images))
+        if node_names is None:
+            label_selector = ",".join("%s=%s" % item for item in (self.node_selector or dict()).items()) or None
+            nodes: list[V1Node] = self.core_v1_api.list_node(label_selector=label_selector).items
+            node_names = [node.metadata.name for node in nodes]
+
+        created = []
+        for node_name in node_names:
+            pod = V1Pod(
+                metadata=self._metadata(
+                    "%s-%s-%s" % (self.name, self._digest(images)[:10], hashlib.sha256(node_name.encode()).hexdigest()[:8]),
+                    images,
+                ),
+                spec=V1PodSpec(
+                    node_name=node_name,
+                    restart_policy="Never",
+                    init_containers=self._pull_containers(images)[:-1] or None,
+                    containers=self._pull_containers(images)[-1:],
+                    tolerations=self.tolerations,
+                    image_pull_secrets=self._image_pull_secrets(),
+                    termination_grace_period_seconds=0,
+                ),
+            )
+            try:
+                self.create_pod(namespace=self.namespace, pod=pod)
+            except ApiException as e:
+                if e.status != 409:
+                    raise
+                continue
+            created.append(pod.metadata.name)
+        return created
+
+
+    def cleanup(self) -> None:
+        """
+        Deletes the warmer DaemonSet and pods
+        """
+        try:
+            self.apps_v1_api.delete_namespaced_daemon_set(name=self.name, namespace=self.namespace, propagation_policy="Background")
+            self.logger.info("DaemonSet %s - Namespace %s | Deleted" % (self.name, self.namespace))
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        self.core_v1_api.delete_collection_namespaced_pod(
+            namespace=self.namespace,
+            label_selector="%s=%s" % (consts.SPARK_IMAGE_WARMER_LABEL, self.name),
+        )
+
+
+    def startup_savings(self, namespace: str, since: datetime = None) -> StartupSavingsReport:
+        """
+        Measured from the `Pulled` events of `namespace`, and of the warmer namespace when it is another one
+        (events are only kept for about an hour by default):
+        actual pulls of Spark or warmer pods give the cold pull time of an image, Spark pods that found
+        the image already present on a node where a warmer pod pulled it before count as warm starts.
+        Images present for another reason (an earlier Spark pod, the node image) are not counted, nor are
+        nodes warmed before the oldest event kept, so this is a lower bound
+        """
+        images: dict[str, ImagePullStats] = dict()
+        events: list[CoreV1Event] = []
+        for events_namespace in dict.fromkeys((namespace, self.namespace)):
+            events.extend(self.core_v1_api.list_namespaced_event(
+                namespace=events_namespace,
+                field_selector="involvedObject.kind=Pod,reason=Pulled",
+            ).items)
+
+        # (image, node) -> when a warmer pod pulled it there first
+        warmed: dict[tuple[str, str], datetime | None] = dict()
+        present_events: list[tuple[str, str | None, datetime | None, int]] = []
+        for event in events:
+            observed_at = event.last_timestamp or event.event_time or event.first_timestamp
+            if since is not None and observed_at is not None and observed_at < since:
+                continue
+            pod_name = event.involved_object.name or ""
+            pod_namespace = event.involved_object.namespace or event.metadata.namespace
+            spark_pod = pod_namespace == namespace and SPARK_POD_PATTERN.search(pod_name) is not None
+            warmer_pod = pod_namespace == self.namespace and pod_name.startswith(self.name)
+            if not spark_pod and not warmer_pod:
+                continue
+            node = event.source.host if event.source is not None else None
+
+            pulled = PULLED_PATTERN.search(event.message or "")
+            if pulled is not None:
+                stats = images.setdefault(pulled.group("image"), ImagePullStats(pulled.group("image")))
+                stats.pull_seconds.append(parse_go_duration(pulled.group("duration")))
+                if not spark_pod and node is not None:
+                    key = (pulled.group("image"), node)
+                    if key not in warmed or None not in (observed_at, warmed[key]) and observed_at < warmed[key]:
+                        warmed[key] = observed_at
+                continue
+            present = PRESENT_PATTERN.search(event.message or "")
+            if present is not None and spark_pod:
+                images.setdefault(present.group("image"), ImagePullStats(present.group("image")))
+                present_events.append((present.group("image"), node, observed_at, event.count or 1))
+
+        for image, node, observed_at, count in present_events:
+            if (image, node) not in warmed:
+                continue
+            warmed_at = warmed[(image, node)]
+            if warmed_at is None or observed_at is None or warmed_at <= observed_at:
+                images[image].warm_starts += count
+
+        report = StartupSavingsReport(namespace, since, images)
+        self.logger.info("Namespace %s | Image warming saved %.0fs of startup: %s" % (namespace, report.saved_seconds, report))
+        return report
+
+
+    def _daemon_set(self, images: list[str]) -> V1DaemonSet:
+        selector = {consts.SPARK_IMAGE_WARMER_LABEL: self.name}
+        return V1DaemonSet(
+            metadata=self._metadata(self.name, images),
+            spec=V1DaemonSetSpec(
+                selector=V1LabelSelector(match_labels=selector),
+                template=V1PodTemplateSpec(
+                    metadata=V1ObjectMeta(labels=selector),
+                    spec=V1PodSpec(
+                        # pulled by init containers, kept from image garbage collection by the running pod
+                        init_containers=self._pull_containers(images),
+                        containers=[V1Container(name="pause", image=self.pause_image, resources=TINY_RESOURCES)],
+                        node_selector=self.node_selector,
+                        tolerations=self.tolerations,
+                        image_pull_secrets=self._image_pull_secrets(),
+                        termination_grace_period_seconds=0,
+                    ),
+                ),
+            ),
+        )
+
+
+    def _metadata(self, name: str, images: list[str]) -> V1ObjectMeta:
+        return V1ObjectMeta(
+            name=name,
+            namespace=self.namespace,
+            labels={
+                consts.SPARK_APP_MANAGED_BY_LABEL: consts.SPARK_APP_MANAGED_BY,
+                consts.SPARK_IMAGE_WARMER_LABEL: self.name,
+            },
+            annotations={consts.SPARK_IMAGE_WARMER_IMAGES_ANNOTATION: self._digest(images)},
+        )
+
+
+    def _pull_containers(self, images: list[str]) -> list[V1Container]:
+        return [
+            V1Container(
+                name="pull-%s" % index,
+                image=image,
+                image_pull_policy="IfNotPresent",
+                command=self.warm_command,
+                resources=TINY_RESOURCES,
+            )
+            for index, image in enumerate(images)
+        ]
+
+
+    def _image_pull_secrets(self) -> list[V1LocalObjectReference] | None:
+        if not self.image_pull_secrets:
+            return None
+        return [V1LocalObjectReference(name=secret) for secret in self.image_pull_secrets]
+
+
+    @staticmethod
+    def _digest(images: list[str]) -> str:
+        return hashlib.sha256("\n".join(images).encode()).hexdigest()
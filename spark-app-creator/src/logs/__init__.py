@@ -0,0 +1,7 @@
+from logs.log_archive import (LogArchive, LogArchiveSink, LogArchiveWriter,
+                              LogLine)
+from logs.log_pipeline import LogPipeline
+from logs.log_sinks import (CallbackSink, LogSink, RotatingFileSink,
+                            StdoutSamplerSink)
+from logs.stage_progress import (ProgressEvent, StageProgress,
+                                 StageProgressParser, StageProgressTracker)
@@ -0,0 +1,357 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterator
+
+from logs.log_sinks import LogSink
+
+MAGIC = b"SACLOGA1"
+FOOTER = struct.Struct(">QQ8s")
+
+LEVELS = ("TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL")
+LEVEL_BITS = {level: 1 << index for index, level in enumerate(LEVELS)}
+LEVEL_BITS["WARNING"] = LEVEL_BITS["WARN"]
+
+# log4j default `yy/MM/dd HH:mm:ss LEVEL` and ISO-like `yyyy-MM-dd HH:mm:ss,SSS LEVEL`
+LINE_PATTERN = re.compile(
+    rb"^(?P<timestamp>(?:\d{2}|\d{4})[/-]\d{2}[/-]\d{2}[ T]\d{2}:\d{2}:\d{2})(?P<fraction>[.,]\d+)?Z?\s+"
+    rb"(?:\[[^\]]*\]\s+)?(?P<level>TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL)\b"
+)
+EXCEPTION_PATTERN = re.compile(
+    rb"^(?:Exception in thread |Traceback \(most recent call last\)|Caused by: |[\w$.]+(?:Exception|Error)(?::|\s*$))"
+)
+
+
+class _LineParser():
+    """
+    Timestamp and level of log lines, lines without them (stack traces, multi-line messages)
+    take the ones of the line before
+    """
+
+    def __init__(self) -> None:
+        self.timestamp: float | None = None
+        self.level: str | None = None
+        self._seconds_key: bytes | None = None
+        self._seconds: float | None = None
+
+
+    def parse(self, line: bytes) -> tuple[float | None, str | None, bool]:
+        matched = LINE_PATTERN.match(line)
+        if matched is not None:
+            seconds_key = matched.group("timestamp")
+            if seconds_key != self._seconds_key:
+                self._seconds_key = seconds_key
+                self._seconds = self._parse_seconds(seconds_key.decode())
+            fraction = matched.group("fraction")
+            self.timestamp = self._seconds + (float(b"0." + fraction[1:]) if fraction else 0.0)
+            self.level = matched.group("level").decode()
+        return self.timestamp, self.level, EXCEPTION_PATTERN.match(line) is not None
+
+
+    @staticmethod
+    def _parse_seconds(value: str) -> float:
+        value = value.replace("/", "-").replace("T", " ")
+        if len(value.split("-", 1)[0]) == 2:
+            value = "20" + value
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+class LogArchiveWriter():
+    """
+    Writes a log archive: independently zlib-compressed blocks of about `block_size` bytes of lines,
+    then a sparse index with, per block, its offset, first line number, time range, levels present and
+    the line numbers of exception markers (at most `max_exceptions_per_block`).
+
+    Layout: MAGIC, blocks, compressed JSON index, footer (index offset, index length, MAGIC).
+    With `append`, an existing archive is reopened: new blocks overwrite its index, written again on close.
+    """
+
+    def __init__(self,
+                 path: str,
+                 block_size: int = 1024 * 1024,
+                 compression_level: int = 6,
+                 max_exceptions_per_block: int = 64,
+                 append: bool = False) -> None:
+        self.path = path
+        self.block_size = block_size
+        self.compression_level = compression_level
+        self.max_exceptions_per_block = max_exceptions_per_block
+
+        self._parser = _LineParser()
+        self._blocks: list[dict] = []
+        self._lines: list[bytes] = []
+        self._size = 0
+        self._line_number = 0
+        self._block: dict | None = None
+        self._pending = b""
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if append and os.path.exists(path):
+            self._file = open(path, "r+b")
+            self._reopen()
+        else:
+            self._file = open(path, "wb")
+            self._file.write(MAGIC)
+
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Appends raw log bytes, a trailing incomplete line waits for the next chunk
+        """
+        data = self._pending + chunk
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._add_line(line)
+
+
+    def close(self) -> None:
+        if self._pending:
+            self._add_line(self._pending)
+            self._pending = b""
+        self._flush_block()
+
+        index = zlib.compress(json.dumps({
+            "blocks": self._blocks, "lines": self._line_number, "carry_ts": self._parser.timestamp, "carry_level": self._parser.level,
+        }).encode())
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self._file.close()
+
+
+    def _reopen(self) -> None:
+        self._file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, index_length, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a log archive" % self.path)
+        self._file.seek(index_offset)
+        index = json.loads(zlib.decompress(self._file.read(index_length)))
+        self._blocks, self._line_number = index["blocks"], index["lines"]
+        self._parser.timestamp, self._parser.level = index.get("carry_ts"), index.get("carry_level")
+
+        self._file.seek(index_offset)
+        self._file.truncate()
+
+
+    def _add_line(self, line: bytes) -> None:
+        if self._block is None:
+            # what continuation lines at the start of the block inherit
+            self._block = {
+                "first_line": self._line_number, "carry_ts": self._parser.timestamp, "carry_level": self._parser.level,
+                "min_ts": None, "max_ts": None, "levels": 0, "exceptions": [],
+            }
+        timestamp, level, is_exception = self._parser.parse(line)
+
+        block = self._block
+        if timestamp is not None:
+            block["min_ts"] = timestamp if block["min_ts"] is None else min(block["min_ts"], timestamp)
+            block["max_ts"] = timestamp if block["max_ts"] is None else max(block["max_ts"], timestamp)
+        if level is not None:
+            # continuation lines carry the level of the line before, searches by level must find them too
+            block["levels"] |= LEVEL_BITS[level]
+        if is_exception and len(block["exceptions"]) < self.max_exceptions_per_block:
+            block["exceptions"].append(self._line_number)
+
+        self._lines.append(line)
+        self._size += len(line) + 1
+        self._line_number += 1
+        if self._size >= self.block_size:
+            self._flush_block()
+
+
+    def _flush_block(self) -> None:
+        if self._block is None:
+            return
+
+        compressed = zlib.compress(b"\n".join(self._lines) + b"\n", self.compression_level)
+        self._block.update(offset=self._file.tell(), length=len(compressed), lines=len(self._lines))
+        self._file.write(compressed)
+        self._blocks.append(self._block)
+        self._block, self._lines, self._size = None, [], 0
+
+
+class LogLine():
+    def __init__(self, number: int, timestamp: float | None, level: str | None, text: bytes) -> None:
+        self.number = number
+        self.timestamp = timestamp
+        self.level = level
+        self.text = text
+
+
+    def __repr__(self) -> str:
+        return "LogLine(number=%s, level=%s, text=%r)" % (self.number, self.level, self.text[:80])
+
+
+class LogArchive():
+    """
+    Reads a log archive through a memory map. Searches use the index to only decompress
+    the blocks that can match the time range, levels or exception markers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_offset, index_length, magic = FOOTER.unpack(self._mmap[-FOOTER.size:])
+        if magic != MAGIC or self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a log archive" % path)
+        index = json.loads(zlib.decompress(self._mmap[index_offset:index_offset + index_length]))
+        self.blocks: list[dict] = index["blocks"]
+        self.line_count: int = index["lines"]
+
+
+    def __enter__(self) -> "LogArchive":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+
+    def search(self,
+               since: datetime = None,
+               until: datetime = None,
+               levels: list[str] = None,
+               pattern: bytes | re.Pattern = None,
+               limit: int = None) -> Iterator[LogLine]:
+        """
+        Lines in [since, until) at one of `levels` and matching `pattern`, in order
+        """
+        since_ts = since.timestamp() if since is not None else None
+        until_ts = until.timestamp() if until is not None else None
+        level_mask = 0
+        for level in levels or []:
+            level_mask |= LEVEL_BITS[level.upper()]
+        if isinstance(pattern, bytes):
+            pattern = re.compile(pattern)
+
+        found = 0
+        for block in self.blocks:
+            if since_ts is not None and block["max_ts"] is not None and block["max_ts"] < since_ts:
+                continue
+            if until_ts is not None and block["min_ts"] is not None and block["min_ts"] >= until_ts:
+                continue
+            if level_mask and not (block["levels"] | LEVEL_BITS.get(block["carry_level"], 0)) & level_mask:
+                continue
+
+            for line in self._read_block(block):
+                if since_ts is not None and (line.timestamp is None or line.timestamp < since_ts):
+                    continue
+                if until_ts is not None and (line.timestamp is None or line.timestamp >= until_ts):
+                    continue
+                if level_mask and not LEVEL_BITS.get(line.level, 0) & level_mask:
+                    continue
+                if pattern is not None and pattern.search(line.text) is None:
+                    continue
+
+                yield line
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+
+    def exceptions(self) -> Iterator[LogLine]:
+        for block in self.blocks:
+            if not block["exceptions"]:
+                continue
+            markers = set(block["exceptions"])
+            for line in self._read_block(block):
+                if line.number in markers:
+                    yield line
+
+
+    def first_exception(self, context_lines: int = 50) -> list[LogLine]:
+        """
+        The first exception marker and up to `context_lines` lines after it (the stack trace)
+        """
+        first = next(self.exceptions(), None)
+        if first is None:
+            return []
+        return self.lines(first.number, first.number + context_lines + 1)
+
+
+    def lines(self, start: int, end: int) -> list[LogLine]:
+        result = []
+        for block in self.blocks:
+            if block["first_line"] + block["lines"] <= start or block["first_line"] >= end:
+                continue
+            result.extend(line for line in self._read_block(block) if start <= line.number < end)
+        return result
+
+
+    def _read_block(self, block: dict) -> Iterator[LogLine]:
+        data = zlib.decompress(self._mmap[block["offset"]:block["offset"] + block["length"]])
+        parser = _LineParser()
+        parser.timestamp, parser.level = block["carry_ts"], block["carry_level"]
+        for number, text in enumerate(data.split(b"\n")[:-1], start=block["first_line"]):
+            timestamp, level, _ = parser.parse(text)
+            yield LogLine(number, timestamp, level, text)
+
+
+class LogArchiveSink(LogSink):
+    """
+    Archives each app's log into `<directory>/<namespace>/<app>.logarchive`, finished on `close_app`.
+    At most `max_open_writers` archives are kept open, the least recently written is finished first
+    and reopened to append to it on its next write.
+    """
+
+    def __init__(self, directory: str, block_size: int = 1024 * 1024, max_open_writers: int = 64) -> None:
+        self.directory = directory
+        self.block_size = block_size
+        self.max_open_writers = max_open_writers
+        self._writers: OrderedDict[tuple[str, str], LogArchiveWriter] = OrderedDict()
+        # apps whose archive was finished to make room, written to again
+        self._evicted: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+
+    def path(self, namespace: str, app: str) -> str:
+        return os.path.join(self.directory, namespace, "%s.logarchive" % app)
+
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        key = (namespace, app)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is not None:
+                self._writers.move_to_end(key)
+            else:
+                if len(self._writers) >= self.max_open_writers:
+                    evicted_key, evicted = self._writers.popitem(last=False)
+                    evicted.close()
+                    self._evicted.add(evicted_key)
+                writer = self._writers[key] = LogArchiveWriter(
+                    self.path(namespace, app), block_size=self.block_size, append=key in self._evicted,
+                )
+                self._evicted.discard(key)
+            # chunks are whole lines, an evicted writer has nothing pending
+            writer.write(chunk)
+
+
+    def close_app(self, namespace: str, app: str) -> None:
+        with self._lock:
+            writer = self._writers.pop((namespace, app), None)
+            self._evicted.discard((namespace, app))
+        if writer is not None:
+            writer.close()
+
+
+    def close(self) -> None:
+        with self._lock:
+            writers, self._writers = list(self._writers.values()), OrderedDict()
+            self._evicted.clear()
+        for writer in writers:
+            writer.close()
@@ -0,0 +1,169 @@
+import logging
+import threading
+from collections import deque
+from time import monotonic
+
+from logs.log_sinks import LogSink
+from metrics import MetricsRegistry
+
+
+class LogPipeline():
+    """
+    Bounded buffer between the launchers and the log sinks, drained by one background thread.
+
+    `submit` only appends the raw line to the buffer. The thread takes up to `batch_bytes` at a time
+    (or whatever arrived within `flush_interval`), joins the lines of each app into one chunk and hands it to every sink,
+    so sinks see few large writes and nothing is decoded on the way. When `max_buffer_bytes` are buffered,
+    `submit` blocks until the sinks catch up (`block=True`) or drops the line and counts it (`block=False`).
+    A failing sink is logged and skipped, it never stops the others.
+    """
+
+    def __init__(self,
+                 sinks: list[LogSink],
+                 max_buffer_bytes: int = 8 * 1024 * 1024,
+                 batch_bytes: int = 256 * 1024,
+                 flush_interval: float = 1.0,
+                 block: bool = True,
+                 metrics: MetricsRegistry = None) -> None:
+        self.sinks = sinks
+        self.max_buffer_bytes = max_buffer_bytes
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.block = block
+
+        self.dropped_bytes = 0
+        self._buffer: deque[tuple[str, str, bytes]] = deque()
+        self._buffered_bytes = 0
+        self._closed_apps: list[tuple[str, str]] = []
+        self._condition = threading.Condition()
+        self._closing = False
+        self._writing = False
+
+        self.dropped_bytes_counter = None
+        self.buffered_bytes_gauge = None
+        if metrics is not None:
+            self.dropped_bytes_counter = metrics.counter(
+                "spark_app_creator_log_pipeline_dropped_bytes_total",
+                "Log bytes dropped because the log pipeline buffer was full",
+                ("namespace", "app"),
+            )
+            self.buffered_bytes_gauge = metrics.gauge(
+                "spark_app_creator_log_pipeline_buffered_bytes",
+                "Log bytes waiting for the sinks",
+            )
+
+        self._thread = threading.Thread(target=self._run, name="log-pipeline", daemon=True)
+        self._thread.start()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def submit(self, namespace: str, app: str, line: bytes) -> bool:
+        """
+        Returns False if the line was dropped
+        """
+        if not line.endswith(b"\n"):
+            line += b"\n"
+
+        with self._condition:
+            if self._closing:
+                raise ValueError("LogPipeline is closed")
+
+            while self._buffered_bytes + len(line) > self.max_buffer_bytes and self._buffer:
+                if not self.block:
+                    self.dropped_bytes += len(line)
+                    if self.dropped_bytes_counter is not None:
+                        self.dropped_bytes_counter.labels(namespace=namespace, app=app).inc(len(line))
+                    return False
+                self._condition.wait()
+
+            self._buffer.append((namespace, app, line))
+            self._buffered_bytes += len(line)
+            if self._buffered_bytes >= self.batch_bytes:
+                self._condition.notify_all()
+        return True
+
+
+    def close_app(self, namespace: str, app: str) -> None:
+        """
+        The app is done, sinks may release what they hold for it once its buffered lines are written
+        """
+        with self._condition:
+            self._closed_apps.append((namespace, app))
+            self._condition.notify_all()
+
+
+    def drain(self, timeout: float = None) -> bool:
+        """
+        Waits until every line submitted so far reached the sinks, returns False on timeout
+        """
+        with self._condition:
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._buffer and not self._writing, timeout)
+
+
+    def close(self, timeout: float = None) -> None:
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+
+    def _run(self) -> None:
+        last_flush = monotonic()
+        while True:
+            with self._condition:
+                deadline = monotonic() + self.flush_interval
+                while (self._buffered_bytes < self.batch_bytes and not self._closing and not self._closed_apps
+                       and monotonic() < deadline):
+                    self._condition.wait(max(deadline - monotonic(), 0))
+
+                batch: dict[tuple[str, str], list[bytes]] = dict()
+                taken = 0
+                while self._buffer and taken < self.batch_bytes:
+                    namespace, app, line = self._buffer.popleft()
+                    batch.setdefault((namespace, app), []).append(line)
+                    taken += len(line)
+                self._buffered_bytes -= taken
+                closed_apps = []
+                if not self._buffer:
+                    closed_apps, self._closed_apps = self._closed_apps, []
+                closing = self._closing and not self._buffer
+                self._writing = bool(batch or closed_apps)
+                if self.buffered_bytes_gauge is not None:
+                    self.buffered_bytes_gauge.labels().set(self._buffered_bytes)
+                self._condition.notify_all()
+
+            for (namespace, app), lines in batch.items():
+                self._call_sinks("write", namespace, app, b"".join(lines))
+            for namespace, app in closed_apps:
+                self._call_sinks("close_app", namespace, app)
+            if batch or closed_apps:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+            if closing:
+                self._call_sinks("close")
+                return
+            if monotonic() - last_flush >= self.flush_interval:
+                self._call_sinks("flush")
+                last_flush = monotonic()
+
+
+    def _call_sinks(self, method: str, *args) -> None:
+        for sink in self.sinks:
+            try:
+                getattr(sink, method)(*args)
+            except Exception:
+                self.logger.exception("Log sink %s failed on %s" % (sink, method))
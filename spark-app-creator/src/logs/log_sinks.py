@@ -0,0 +1,188 @@
+import gzip
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class LogSink():
+    """
+    Receives raw log bytes of an app, always whole lines, possibly many of them per call.
+    Subclass it to ship logs somewhere else.
+    """
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        raise Exception("Must override method `write` in %s.%s" % (self.__class__.__module__, self.__class__.__name__))
+
+
+    def flush(self) -> None:
+        pass
+
+
+    def close_app(self, namespace: str, app: str) -> None:
+        pass
+
+
+    def close(self) -> None:
+        self.flush()
+
+
+class RotatingFileSink(LogSink):
+    """
+    One compressed file per app, `<directory>/<namespace>/<app>.log.gz` (or `.log.zst`, `.log`).
+    A file is rotated once `max_bytes` of uncompressed log went into it, keeping `backup_count` old files
+    (`<app>.log.gz.1` is the most recent). At most `max_open_files` files are kept open, the least recently
+    written is closed first, reopening appends a new gzip member / zstd frame.
+    """
+
+    EXTENSIONS = {"gzip": ".log.gz", "zstd": ".log.zst", None: ".log"}
+
+    def __init__(self,
+                 directory: str,
+                 compression: str | None = "gzip",
+                 compression_level: int = 6,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 backup_count: int = 5,
+                 max_open_files: int = 64) -> None:
+        if compression not in self.EXTENSIONS:
+            raise ValueError("Unknown compression %s, use one of %s" % (compression, list(self.EXTENSIONS)))
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the `zstandard` package")
+
+        self.directory = directory
+        self.compression = compression
+        self.compression_level = compression_level
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_open_files = max_open_files
+
+        self._lock = threading.Lock()
+        self._files: OrderedDict[tuple[str, str], BinaryIO] = OrderedDict()
+        self._written: dict[tuple[str, str], int] = dict()
+
+
+    def path(self, namespace: str, app: str) -> str:
+        return os.path.join(self.directory, namespace, app + self.EXTENSIONS[self.compression])
+
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        key = (namespace, app)
+        with self._lock:
+            if key not in self._written:
+                path = self.path(namespace, app)
+                self._written[key] = os.path.getsize(path) if self.compression is None and os.path.exists(path) else 0
+            if self._written[key] >= self.max_bytes:
+                self._rotate(key)
+
+            self._open(key).write(chunk)
+            self._written[key] += len(chunk)
+
+
+    def flush(self) -> None:
+        with self._lock:
+            for f in self._files.values():
+                f.flush()
+
+
+    def close_app(self, namespace: str, app: str) -> None:
+        with self._lock:
+            f = self._files.pop((namespace, app), None)
+            if f is not None:
+                f.close()
+
+
+    def close(self) -> None:
+        with self._lock:
+            while self._files:
+                self._files.popitem(last=False)[1].close()
+
+
+    def _open(self, key: tuple[str, str]) -> BinaryIO:
+        f = self._files.get(key)
+        if f is not None:
+            self._files.move_to_end(key)
+            return f
+
+        if len(self._files) >= self.max_open_files:
+            self._files.popitem(last=False)[1].close()
+
+        path = self.path(*key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.compression == "gzip":
+            f = gzip.open(path, "ab", compresslevel=self.compression_level)
+        elif self.compression == "zstd":
+            f = zstandard.ZstdCompressor(level=self.compression_level).stream_writer(open(path, "ab"), closefd=True)
+        else:
+            f = open(path, "ab")
+        self._files[key] = f
+        return f
+
+
+    def _rotate(self, key: tuple[str, str]) -> None:
+        f = self._files.pop(key, None)
+        if f is not None:
+            f.close()
+
+        path = self.path(*key)
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists("%s.%s" % (path, index)):
+                os.replace("%s.%s" % (path, index), "%s.%s" % (path, index + 1))
+        if self.backup_count > 0 and os.path.exists(path):
+            os.replace(path, "%s.1" % path)
+        elif os.path.exists(path):
+            os.remove(path)
+        self._written[key] = 0
+
+
+class StdoutSamplerSink(LogSink):
+    """
+    Writes one line out of `every_n_lines` of each app to `stream`, prefixed like the launcher logs,
+    to keep an eye on verbose apps without flooding stdout
+    """
+
+    def __init__(self, every_n_lines: int = 100, stream: BinaryIO = None) -> None:
+        self.every_n_lines = every_n_lines
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self._lines: dict[tuple[str, str], int] = dict()
+        self._lock = threading.Lock()
+
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        key = (namespace, app)
+        with self._lock:
+            seen = self._lines.get(key, 0)
+            self._lines[key] = seen + chunk.count(b"\n")
+            # index in this chunk of the next lines to sample
+            first = (-seen) % self.every_n_lines
+            if first >= chunk.count(b"\n"):
+                return
+
+            prefix = ("%s/%s | " % (namespace, app)).encode()
+            lines = chunk.split(b"\n")
+            sampled = b"".join(prefix + line + b"\n" for line in lines[first:-1:self.every_n_lines])
+            self.stream.write(sampled)
+
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+    def close_app(self, namespace: str, app: str) -> None:
+        with self._lock:
+            self._lines.pop((namespace, app), None)
+
+
+class CallbackSink(LogSink):
+    def __init__(self, callback: Callable[[str, str, bytes], None]) -> None:
+        """Calls `callback(namespace, app, chunk)` with each batch of lines."""
+        self.callback = callback
+
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        self.callback(namespace, app, chunk)
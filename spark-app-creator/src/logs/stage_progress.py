@@ -0,0 +1,358 @@
+import logging
+import re
+import threading
+from time import time
+from typing import Callable
+
+from logs.log_archive import _LineParser
+from logs.log_sinks import LogSink
+from metrics import MetricsRegistry
+
+STAGE_STARTED = "stage_started"
+TASK_FINISHED = "task_finished"
+STAGE_COMPLETED = "stage_completed"
+STAGE_FAILED = "stage_failed"
+SPILL = "spill"
+SHUFFLE_WARNING = "shuffle_warning"
+
+# Spark driver (DAGScheduler, TaskSchedulerImpl, TaskSetManager, sorters) messages
+STAGE_SUBMITTED_PATTERN = re.compile(
+    rb"Submitting (?P<tasks>\d+) missing tasks from (?P<kind>ResultStage|ShuffleMapStage) (?P<stage>\d+) \((?P<name>[^)]*)\)"
+)
+TASK_SET_PATTERN = re.compile(rb"Adding task set (?P<stage>\d+)\.(?P<attempt>\d+) with (?P<tasks>\d+) tasks")
+TASK_FINISHED_PATTERN = re.compile(
+    rb"Finished task [\d.]+ in stage (?P<stage>\d+)\.(?P<attempt>\d+) \(TID \d+\) in (?P<ms>\d+) ms"
+    rb".*\((?P<done>\d+)/(?P<total>\d+)\)\s*$"
+)
+STAGE_FINISHED_PATTERN = re.compile(
+    rb"(?P<kind>ResultStage|ShuffleMapStage) (?P<stage>\d+) \((?P<name>[^)]*)\) (?P<outcome>finished|failed) in [\d.]+ s"
+    rb"(?: due to (?P<reason>.*))?"
+)
+SPILL_PATTERN = re.compile(rb"spilling (?P<what>[\w -]+?) of (?P<size>[\d.]+) (?P<unit>[KMGTP]?i?B) to disk")
+SHUFFLE_WARNING_PATTERN = re.compile(
+    rb"Lost task [\d.]+ in stage (?P<stage>\d+)\.(?P<attempt>\d+) [^\n]*FetchFailed"
+    rb"|Retrying fetch \(\d+/\d+\)|Failed to fetch block|Error occurred while fetching"
+)
+
+SIZE_UNITS = {
+    b"B": 1,
+    b"KB": 1024, b"KiB": 1024,
+    b"MB": 1024 ** 2, b"MiB": 1024 ** 2,
+    b"GB": 1024 ** 3, b"GiB": 1024 ** 3,
+    b"TB": 1024 ** 4, b"TiB": 1024 ** 4,
+    b"PB": 1024 ** 5, b"PiB": 1024 ** 5,
+}
+
+
+class StageProgress():
+    def __init__(self, stage_id: int, attempt: int = 0, name: str = None, kind: str = None, started_at: float = None) -> None:
+        """
+        Progress of one stage attempt, times are log timestamps (epoch seconds)
+        """
+        self.stage_id = stage_id
+        self.attempt = attempt
+        self.name = name
+        self.kind = kind
+        self.tasks_total: int | None = None
+        self.tasks_done = 0
+        self.started_at = started_at
+        self.last_progress_at = started_at
+        self.completed_at: float | None = None
+        self.failure_reason: str | None = None
+        self.task_ms_total = 0
+        self.task_ms_max = 0
+
+
+    @property
+    def active(self) -> bool:
+        return self.completed_at is None
+
+
+    def tasks_per_second(self) -> float | None:
+        if not self.tasks_done or self.started_at is None or self.last_progress_at is None:
+            return None
+        elapsed = self.last_progress_at - self.started_at
+        return self.tasks_done / elapsed if elapsed > 0 else None
+
+
+    def eta_seconds(self) -> float | None:
+        rate = self.tasks_per_second()
+        if rate is None or self.tasks_total is None:
+            return None
+        return max(self.tasks_total - self.tasks_done, 0) / rate
+
+
+    def skew(self) -> float | None:
+        """
+        Slowest finished task over the mean task duration, a few stragglers show up as a high ratio
+        """
+        if not self.tasks_done or not self.task_ms_total:
+            return None
+        return self.task_ms_max / (self.task_ms_total / self.tasks_done)
+
+
+    def stalled_seconds(self, now: float) -> float | None:
+        """
+        Time since the last finished task of an active stage
+        """
+        if not self.active or self.last_progress_at is None:
+            return None
+        return max(now - self.last_progress_at, 0.0)
+
+
+    def __repr__(self) -> str:
+        return "StageProgress(stage=%s.%s, tasks=%s/%s, active=%s)" % (
+            self.stage_id, self.attempt, self.tasks_done, self.tasks_total, self.active
+        )
+
+
+class ProgressEvent():
+    def __init__(self, kind: str, namespace: str, app: str, timestamp: float, stage: StageProgress = None, **detail) -> None:
+        """
+        `stage` is the live progress of the stage, `detail` holds what the line adds (bytes spilled, failure reason, ...)
+        """
+        self.kind = kind
+        self.namespace = namespace
+        self.app = app
+        self.timestamp = timestamp
+        self.stage = stage
+        self.detail = detail
+
+
+    def __repr__(self) -> str:
+        return "ProgressEvent(kind=%s, app=%s/%s, stage=%s, detail=%s)" % (self.kind, self.namespace, self.app, self.stage, self.detail)
+
+
+class StageProgressParser():
+    """
+    Turns the driver log of one app, line by line, into `ProgressEvent`s and keeps the progress of its stages.
+
+    Almost every line of a driver log is irrelevant, so each rule first checks for a fixed marker with a substring
+    search and only runs its regex (and parses the timestamp) when the marker is there.
+    """
+
+    def __init__(self, namespace: str, app: str, clock: Callable[[], float] = time) -> None:
+        self.namespace = namespace
+        self.app = app
+        self.clock = clock
+
+        self.stages: dict[int, StageProgress] = dict()
+        self.spilled_bytes = 0
+        self.spills = 0
+        self.shuffle_warnings = 0
+
+        self._timestamps = _LineParser()
+        # most frequent first
+        self._rules = (
+            (b"Finished task ", TASK_FINISHED_PATTERN, self._task_finished),
+            (b"Submitting ", STAGE_SUBMITTED_PATTERN, self._stage_submitted),
+            (b"Adding task set ", TASK_SET_PATTERN, self._task_set_added),
+            (b"Stage ", STAGE_FINISHED_PATTERN, self._stage_finished),
+            (b"spilling ", SPILL_PATTERN, self._spill),
+            (b"FetchFailed", SHUFFLE_WARNING_PATTERN, self._shuffle_warning),
+            (b"fetch", SHUFFLE_WARNING_PATTERN, self._shuffle_warning),
+        )
+
+
+    def feed(self, line: bytes) -> ProgressEvent | None:
+        for marker, pattern, handler in self._rules:
+            if marker not in line:
+                continue
+            matched = pattern.search(line)
+            if matched is not None:
+                return handler(matched, self._timestamp(line))
+        return None
+
+
+    def active_stages(self) -> list[StageProgress]:
+        return [stage for stage in self.stages.values() if stage.active]
+
+
+    def eta_seconds(self) -> float | None:
+        """
+        Time left for the stages running now, at their combined task rate.
+        Stages the driver did not submit yet are unknown to the log, so this is a lower bound for the app.
+        """
+        remaining = 0
+        rate = 0.0
+        for stage in self.active_stages():
+            stage_rate = stage.tasks_per_second()
+            if stage_rate is None or stage.tasks_total is None:
+                continue
+            remaining += max(stage.tasks_total - stage.tasks_done, 0)
+            rate += stage_rate
+        if not rate:
+            return None
+        return remaining / rate
+
+
+    def _timestamp(self, line: bytes) -> float:
+        timestamp, _, _ = self._timestamps.parse(line)
+        return timestamp if timestamp is not None else self.clock()
+
+
+    def _stage(self, stage_id: int, attempt: int, timestamp: float) -> StageProgress:
+        stage = self.stages.get(stage_id)
+        if stage is None or stage.attempt != attempt:
+            stage = self.stages[stage_id] = StageProgress(
+                stage_id, attempt=attempt, started_at=timestamp,
+                name=stage.name if stage is not None else None, kind=stage.kind if stage is not None else None,
+            )
+        return stage
+
+
+    def _event(self, kind: str, timestamp: float, stage: StageProgress = None, **detail) -> ProgressEvent:
+        return ProgressEvent(kind, self.namespace, self.app, timestamp, stage=stage, **detail)
+
+
+    def _stage_submitted(self, matched: re.Match, timestamp: float) -> ProgressEvent:
+        stage_id = int(matched.group("stage"))
+        previous = self.stages.get(stage_id)
+        # a stage submitted again after it ended is its next attempt, `Adding task set` confirms the number
+        attempt = 0 if previous is None else previous.attempt + (0 if previous.active else 1)
+        stage = self._stage(stage_id, attempt, timestamp)
+        stage.name = matched.group("name").decode(errors="replace")
+        stage.kind = matched.group("kind").decode()
+        stage.tasks_total = int(matched.group("tasks"))
+        return self._event(STAGE_STARTED, timestamp, stage)
+
+
+    def _task_set_added(self, matched: re.Match, timestamp: float) -> None:
+        stage = self._stage(int(matched.group("stage")), int(matched.group("attempt")), timestamp)
+        stage.tasks_total = int(matched.group("tasks"))
+        return None
+
+
+    def _task_finished(self, matched: re.Match, timestamp: float) -> ProgressEvent:
+        stage = self._stage(int(matched.group("stage")), int(matched.group("attempt")), timestamp)
+        task_ms = int(matched.group("ms"))
+        stage.tasks_done = int(matched.group("done"))
+        stage.tasks_total = int(matched.group("total"))
+        stage.task_ms_total += task_ms
+        stage.task_ms_max = max(stage.task_ms_max, task_ms)
+        stage.last_progress_at = timestamp
+        return self._event(TASK_FINISHED, timestamp, stage, task_ms=task_ms)
+
+
+    def _stage_finished(self, matched: re.Match, timestamp: float) -> ProgressEvent | None:
+        stage = self.stages.get(int(matched.group("stage")))
+        if stage is None:
+            stage = self._stage(int(matched.group("stage")), 0, timestamp)
+        elif not stage.active:
+            return None
+        if stage.name is None:
+            stage.name = matched.group("name").decode(errors="replace")
+            stage.kind = matched.group("kind").decode()
+
+        stage.completed_at = timestamp
+        if matched.group("outcome") == b"failed":
+            stage.failure_reason = (matched.group("reason") or b"").decode(errors="replace").strip() or None
+            return self._event(STAGE_FAILED, timestamp, stage, reason=stage.failure_reason)
+        if stage.tasks_total is not None:
+            stage.tasks_done = stage.tasks_total
+        return self._event(STAGE_COMPLETED, timestamp, stage)
+
+
+    def _spill(self, matched: re.Match, timestamp: float) -> ProgressEvent:
+        spilled_bytes = int(float(matched.group("size")) * SIZE_UNITS.get(matched.group("unit"), 1))
+        self.spilled_bytes += spilled_bytes
+        self.spills += 1
+        return self._event(SPILL, timestamp, spilled_bytes=spilled_bytes, what=matched.group("what").decode())
+
+
+    def _shuffle_warning(self, matched: re.Match, timestamp: float) -> ProgressEvent:
+        self.shuffle_warnings += 1
+        stage = None
+        if matched.group("stage") is not None:
+            stage = self.stages.get(int(matched.group("stage")))
+        return self._event(SHUFFLE_WARNING, timestamp, stage, message=matched.group(0).decode(errors="replace"))
+
+
+class StageProgressTracker(LogSink):
+    """
+    Log sink keeping a `StageProgressParser` per app and calling every listener with each
+    `ProgressEvent`, as `listener(event=event)`. Add it to the sinks of the `LogPipeline`.
+    """
+
+    def __init__(self, listeners: list[Callable] = None, metrics: MetricsRegistry = None, clock: Callable[[], float] = time) -> None:
+        self.listeners = listeners or []
+        self.clock = clock
+        self._parsers: dict[tuple[str, str], StageProgressParser] = dict()
+        self._lock = threading.Lock()
+
+        self.eta_gauge = None
+        self.spilled_bytes_counter = None
+        self.shuffle_warnings_counter = None
+        if metrics is not None:
+            self.eta_gauge = metrics.gauge(
+                "spark_app_creator_stage_eta_seconds",
+                "Estimated time left for the running stages of a SparkApp",
+                ("namespace", "app"),
+            )
+            self.spilled_bytes_counter = metrics.counter(
+                "spark_app_creator_spilled_bytes_total",
+                "Bytes spilled to disk reported in the driver log",
+                ("namespace", "app"),
+            )
+            self.shuffle_warnings_counter = metrics.counter(
+                "spark_app_creator_shuffle_fetch_warnings_total",
+                "Shuffle fetch retries and failures reported in the driver log",
+                ("namespace", "app"),
+            )
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def progress(self, namespace: str, app: str) -> StageProgressParser | None:
+        with self._lock:
+            return self._parsers.get((namespace, app))
+
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        with self._lock:
+            parser = self._parsers.get((namespace, app))
+            if parser is None:
+                parser = self._parsers[(namespace, app)] = StageProgressParser(namespace, app, clock=self.clock)
+
+        events = []
+        for line in chunk.split(b"\n"):
+            event = parser.feed(line)
+            if event is not None:
+                events.append(event)
+        if not events:
+            return
+
+        for event in events:
+            self._observe(event)
+            for listener in self.listeners:
+                try:
+                    listener(event=event)
+                except Exception:
+                    self.logger.exception("SparkApp %s - Namespace %s | Progress listener %s failed" % (app, namespace, listener))
+
+        if self.eta_gauge is not None:
+            eta = parser.eta_seconds()
+            if eta is not None:
+                self.eta_gauge.labels(namespace=namespace, app=app).set(eta)
+
+
+    def close_app(self, namespace: str, app: str) -> None:
+        with self._lock:
+            self._parsers.pop((namespace, app), None)
+
+
+    def _observe(self, event: ProgressEvent) -> None:
+        if event.kind == SPILL and self.spilled_bytes_counter is not None:
+            self.spilled_bytes_counter.labels(namespace=event.namespace, app=event.app).inc(event.detail["spilled_bytes"])
+        elif event.kind == SHUFFLE_WARNING and self.shuffle_warnings_counter is not None:
+            self.shuffle_warnings_counter.labels(namespace=event.namespace, app=event.app).inc()
@@ -0,0 +1,3 @@
+from metrics.launcher_metrics import LauncherMetrics
+from metrics.registry import Counter, Gauge, Histogram, MetricsRegistry
+from metrics.server import MetricsServer
@@ -0,0 +1,70 @@
+from metrics.registry import MetricsRegistry
+
+LABELS = ("namespace", "app")
+
+
+class LauncherMetrics():
+    """
+    Metric families shared by the launchers, `app` is the SparkApp or pod name
+    """
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.registry = registry
+
+        self.submission_seconds = registry.histogram(
+            "spark_app_creator_submission_seconds",
+            "Latency of the create call for a SparkApp or pod",
+            LABELS,
+        )
+        self.duplicate_runs = registry.counter(
+            "spark_app_creator_duplicate_runs_total",
+            "SparkApps attached to an identical SparkApp in flight instead of being created",
+            LABELS,
+        )
+        self.state_transition_seconds = registry.histogram(
+            "spark_app_creator_state_transition_seconds",
+            "Observed time between SparkApp states, transition is submitted_to_running or running_to_terminal",
+            LABELS + ("transition",),
+        )
+        self.watch_reconnects = registry.counter(
+            "spark_app_creator_watch_reconnects_total",
+            "Watch stream interruptions, including the connection error ending a watch that gives up",
+            LABELS + ("reason",),
+        )
+        self.watch_events = registry.counter(
+            "spark_app_creator_watch_events_total",
+            "Watch events processed",
+            LABELS,
+        )
+        self.deserialization_seconds = registry.histogram(
+            "spark_app_creator_deserialization_seconds",
+            "Time spent deserializing watch events",
+            LABELS,
+            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+        )
+        self.log_lines = registry.counter(
+            "spark_app_creator_log_lines_total",
+            "Pod log lines streamed",
+            LABELS,
+        )
+        self.log_bytes = registry.counter(
+            "spark_app_creator_log_bytes_total",
+            "Pod log bytes streamed",
+            LABELS,
+        )
+        self.log_reconnects = registry.counter(
+            "spark_app_creator_log_reconnects_total",
+            "Pod log stream resumes",
+            LABELS + ("reason",),
+        )
+
+
+    def forget(self, namespace: str, app: str) -> None:
+        """
+        Drops the series of a finished SparkApp or pod, every app would otherwise stay in the registry
+        """
+        for metric in (
+            self.submission_seconds, self.duplicate_runs, self.state_transition_seconds, self.watch_reconnects,
+            self.watch_events, self.deserialization_seconds, self.log_lines, self.log_bytes, self.log_reconnects,
+        ):
+            metric.remove(namespace=namespace, app=app)
@@ -0,0 +1,193 @@
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = None) -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    if extra is not None:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric():
+    metric_type: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], object] = dict()
+
+
+    def labels(self, **labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("Metric %s expects labels %s, got %s" % (self.name, self.labelnames, tuple(labels)))
+
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+
+    def remove(self, **labels) -> int:
+        """
+        Drops every series matching `labels`, a subset of the label names, returns how many were dropped
+        """
+        if not set(labels) <= set(self.labelnames):
+            raise ValueError("Metric %s expects labels among %s, got %s" % (self.name, self.labelnames, tuple(labels)))
+
+        positions = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            keys = [key for key in self._children if all(key[index] == value for index, value in positions)]
+            for key in keys:
+                del self._children[key]
+        return len(keys)
+
+
+    def render(self) -> list[str]:
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.metric_type),
+        ]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+    def _new_child(self):
+        raise NotImplementedError
+
+
+    def _render_child(self, key: tuple[str, ...], child) -> list[str]:
+        raise NotImplementedError
+
+
+class _Value():
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+
+class _HistogramValue():
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+
+    def _render_child(self, key: tuple[str, ...], child: _Value) -> list[str]:
+        return ["%s%s %s" % (self.name, _format_labels(self.labelnames, key), _format_value(child.value))]
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+
+    def _render_child(self, key: tuple[str, ...], child: _HistogramValue) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            lines.append("%s_bucket%s %s" % (
+                self.name, _format_labels(self.labelnames, key, 'le="%s"' % _format_value(bound)), cumulative
+            ))
+        lines.append("%s_sum%s %s" % (self.name, _format_labels(self.labelnames, key), _format_value(child.sum)))
+        lines.append("%s_count%s %s" % (self.name, _format_labels(self.labelnames, key), cumulative))
+        return lines
+
+
+class MetricsRegistry():
+    """
+    Minimal in-process registry rendering the Prometheus text exposition format.
+    Registering a metric twice with the same name returns the existing one.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = dict()
+
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+    def _register(self, metric_class: type, name: str, documentation: str, labelnames: tuple[str, ...], **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class) or metric.labelnames != tuple(labelnames):
+                raise ValueError("Metric %s is already registered with a different type or labels" % name)
+            return metric
@@ -0,0 +1,2 @@
+from profiling.phase_profiler import PhaseProfiler, PhaseRecord
+from profiling.sampling_profiler import SamplingProfiler
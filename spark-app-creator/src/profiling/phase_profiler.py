@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, Iterator
+
+from profiling.sampling_profiler import SamplingProfiler, to_folded
+
+
+class PhaseRecord():
+    def __init__(self, name: str, start: float, end: float = None, attributes: dict[str, Any] = None) -> None:
+        self.name = name
+        self.start = start
+        self.end = end
+        self.attributes = attributes or dict()
+
+
+    @property
+    def duration(self) -> float:
+        if self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class PhaseProfiler():
+    """
+    Opt-in per-run timeline of the phases of `run_spark_app` / `run_pod`.
+
+    Phases are time ranges (`phase`) and instant events (`mark`), both relative to the start of the run.
+    With `sampling=True`, phases entered with `sample=True` are also sampled by a `SamplingProfiler`
+    and `dump` writes the folded stacks next to the timeline.
+    """
+
+    def __init__(self, output_dir: str = None, sampling: bool = False, sampling_interval: float = 0.005) -> None:
+        self.output_dir = output_dir
+        self.sampling = sampling
+        self.sampling_interval = sampling_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    @contextmanager
+    def phase(self, name: str, sample: bool = False, **attributes) -> Iterator[PhaseRecord]:
+        record = PhaseRecord(name=name, start=perf_counter() - self._origin, attributes=attributes)
+        with self._lock:
+            self.timeline.append(record)
+
+        sampler = None
+        if sample and self.sampling:
+            sampler = SamplingProfiler(interval=self.sampling_interval)
+            sampler.start(prefix=name)
+
+        try:
+            yield record
+        finally:
+            if sampler is not None:
+                sampler.stop()
+                self.samples.update(sampler.samples)
+            record.end = perf_counter() - self._origin
+
+
+    def mark(self, name: str, **attributes) -> PhaseRecord:
+        now = perf_counter() - self._origin
+        record = PhaseRecord(name=name, start=now, end=now, attributes=attributes)
+        with self._lock:
+            self.timeline.append(record)
+        return record
+
+
+    def report(self) -> str:
+        lines = ["%10s %10s  %s" % ("start(s)", "took(s)", "phase")]
+        for record in self.timeline:
+            attributes = " ".join("%s=%s" % item for item in record.attributes.items())
+            lines.append("%10.4f %10.4f  %s %s" % (record.start, record.duration, record.name, attributes))
+        return "\n".join(lines)
+
+
+    def to_folded(self) -> str:
+        with self._lock:
+            return to_folded(self.samples)
+
+
+    def dump(self, run_name: str) -> str | None:
+        """
+        Write the timeline (and the folded stacks when sampling) of the current run, then start a new run.
+        Returns the path of the timeline file, or None when `output_dir` is not set.
+        """
+        self.logger.info("Profile of %s\n%s" % (run_name, self.report()))
+
+        path = None
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base_name = "%s-%s" % (run_name, self._started_at.strftime("%Y%m%dT%H%M%S%f"))
+            path = os.path.join(self.output_dir, base_name + ".timeline.json")
+
+            with open(path, "w") as f:
+                json.dump({
+                    "run": run_name,
+                    "started_at": self._started_at.isoformat(),
+                    "phases": [record.to_dict() for record in self.timeline],
+                }, f, indent=2, default=str)
+
+            if self.samples:
+                with open(os.path.join(self.output_dir, base_name + ".folded"), "w") as f:
+                    f.write(self.to_folded())
+
+        self._reset()
+        return path
+
+
+    def _reset(self) -> None:
+        with self._lock:
+            self.timeline: list[PhaseRecord] = []
+            self.samples: Counter[str] = Counter()
+            self._origin = perf_counter()
+            self._started_at = datetime.now(timezone.utc)
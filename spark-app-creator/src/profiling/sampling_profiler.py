@@ -0,0 +1,70 @@
+import sys
+import threading
+from collections import Counter
+from time import sleep
+from types import FrameType
+
+
+def to_folded(samples: Counter[str]) -> str:
+    """
+    One `stack count` line per folded stack
+    """
+    return "".join("%s %s\n" % (stack, count) for stack, count in sorted(samples.items()))
+
+
+class SamplingProfiler():
+    """
+    Periodically samples the stack of one thread and aggregates the samples as folded stacks,
+    the input format of flamegraph.pl / speedscope / inferno.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._target_thread_id: int | None = None
+        self._prefix: str | None = None
+
+
+    def start(self, prefix: str = None, thread_id: int = None) -> None:
+        if self._thread is not None:
+            return
+
+        self._prefix = prefix
+        self._target_thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+
+    def to_folded(self) -> str:
+        return to_folded(self.samples)
+
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                self.samples[self._fold(frame)] += 1
+            sleep(self.interval)
+
+
+    def _fold(self, frame: FrameType) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s (%s:%s)" % (code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        if self._prefix:
+            stack.append(self._prefix)
+        return ";".join(reversed(stack))
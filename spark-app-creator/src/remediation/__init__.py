@@ -0,0 +1,3 @@
+from remediation.auto_remediation import RemediationRunner
+from remediation.failure_classifier import (FailureClassification,
+                                            FailureClassifier, classify_text)
@@ -0,0 +1,154 @@
+import copy
+import logging
+import math
+
+from custom_exceptions import (SparkAppFailedException,
+                               SparkAppSubmissionFailedException)
+from k8s_manipulators.client import SparkAppClient
+from k8s_objects.spark_app import SparkApp, SparkPodSpec
+from kubernetes.client.models import V1ObjectMeta
+from remediation.failure_classifier import (DRIVER_OOM, EXECUTOR_OOM,
+                                            SHUFFLE_FETCH,
+                                            FailureClassification,
+                                            FailureClassifier)
+from sizing import SizingBounds
+from tuning import resolve_profiles
+from utils import consts
+from utils.k8s_utils import format_memory_mb, parse_memory_mb
+
+# Spark default: max(384MiB, 10% of the memory)
+MIN_MEMORY_OVERHEAD_MB = 384
+MEMORY_OVERHEAD_FACTOR = 0.1
+
+
+class RemediationRunner():
+    """
+    Runs a SparkApp and, when it fails for a retryable reason, resubmits it with a remediation
+    up to `max_attempts` runs in total:
+    - driver / executor OOM: memory (Java heap OOM) or memory overhead (container killed) times `growth`
+    - shuffle fetch failure: the `shuffle_heavy` spark_conf profile (patient fetch retries, bigger buffers)
+
+    Every attempt is a new SparkApp named `<name>-r<attempt>`, the failed one is cleaned up as usual.
+    Image pull errors, bad arguments and unknown failures are raised right away.
+    """
+
+    def __init__(self,
+                 classifier: FailureClassifier = None,
+                 max_attempts: int = 3,
+                 growth: float = 1.5,
+                 driver_bounds: SizingBounds = None,
+                 executor_bounds: SizingBounds = None,
+                 drain_timeout: float = 10.0) -> None:
+        self.classifier = classifier or FailureClassifier()
+        self.max_attempts = max_attempts
+        self.growth = growth
+        self.driver_bounds = driver_bounds or SizingBounds()
+        self.executor_bounds = executor_bounds or SizingBounds()
+        self.drain_timeout = drain_timeout
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def run_spark_app(self, spark_app: SparkApp, namespace: str = None, **client_kwargs) -> SparkAppClient:
+        """
+        `client_kwargs` are passed to every `SparkAppClient`, returns the client of the successful attempt
+        """
+        listeners = list(client_kwargs.pop("listeners", None) or []) + [self.classifier.observe]
+        log_pipeline = client_kwargs.get("log_pipeline")
+        base_name = spark_app.metadata.name
+
+        for attempt in range(1, self.max_attempts + 1):
+            client = SparkAppClient(spark_app=spark_app, listeners=listeners, **client_kwargs)
+            metadata: V1ObjectMeta = spark_app.metadata
+            try:
+                client.run_spark_app(namespace=namespace)
+                # lines of the run still buffered would be classified again after it is forgotten
+                if log_pipeline is not None:
+                    log_pipeline.drain(timeout=self.drain_timeout)
+                return client
+            except (SparkAppFailedException, SparkAppSubmissionFailedException):
+                if log_pipeline is not None:
+                    log_pipeline.drain(timeout=self.drain_timeout)
+                classification = self.classifier.classify(metadata.namespace, metadata.name)
+                self.logger.warning("SparkApp %s - Namespace %s | Attempt %s/%s failed: %s" % (
+                    metadata.name, metadata.namespace, attempt, self.max_attempts, classification
+                ))
+
+                if attempt == self.max_attempts or not classification.retryable:
+                    raise
+
+                spark_app = self.next_attempt(spark_app, classification, "%s-r%s" % (base_name, attempt))
+                if spark_app is None:
+                    raise
+            finally:
+                # successful runs log retried task failures too
+                self.classifier.forget(metadata.namespace, metadata.name)
+
+
+    def next_attempt(self, spark_app: SparkApp, classification: FailureClassification, name: str) -> SparkApp | None:
+        """
+        Copy of `spark_app` with the remediation applied, None if nothing can be changed any more
+        """
+        next_spark_app = copy.deepcopy(spark_app)
+        next_spark_app.status = None
+        metadata: V1ObjectMeta = next_spark_app.metadata
+        metadata.name = name
+        metadata.resource_version = None
+        metadata.uid = None
+        metadata.creation_timestamp = None
+        # stamped from the name and spec of the previous attempt, stamped again on create
+        for label in (consts.SPARK_APP_MONITOR_SHARD_LABEL, consts.SPARK_APP_SPEC_HASH_LABEL):
+            (metadata.labels or dict()).pop(label, None)
+        (metadata.annotations or dict()).pop(consts.SPARK_APP_SPEC_HASH_ANNOTATION, None)
+
+        spec = next_spark_app.spec
+        if classification.category == DRIVER_OOM:
+            changed = self._grow_memory(spec.driver, self.driver_bounds, classification.heap)
+        elif classification.category == EXECUTOR_OOM:
+            changed = self._grow_memory(spec.executor, self.executor_bounds, classification.heap)
+        elif classification.category == SHUFFLE_FETCH:
+            # unlike a profile applied before the first run, it overrides the spark_conf that just failed
+            spark_conf = dict(spec.spark_conf or dict())
+            spark_conf.update(resolve_profiles(["shuffle_heavy"]))
+            changed = spark_conf != (spec.spark_conf or dict())
+            spec.spark_conf = spark_conf
+        else:
+            changed = False
+
+        if not changed:
+            self.logger.warning("SparkApp %s | No remediation left for %s" % (spark_app.metadata.name, classification.category))
+            return None
+        return next_spark_app
+
+
+    def _grow_memory(self, pod_spec: SparkPodSpec, bounds: SizingBounds, heap: bool) -> bool:
+        if pod_spec is None or pod_spec.memory is None:
+            return False
+
+        memory_mb = parse_memory_mb(pod_spec.memory)
+        if heap:
+            grown = bounds.clamp_memory(math.ceil(memory_mb * self.growth))
+            if grown <= memory_mb:
+                return False
+            pod_spec.memory = format_memory_mb(grown)
+            return True
+
+        overhead_mb = parse_memory_mb(pod_spec.memory_overhead)
+        if overhead_mb is None:
+            overhead_mb = max(MIN_MEMORY_OVERHEAD_MB, int(memory_mb * MEMORY_OVERHEAD_FACTOR))
+        grown = bounds.clamp_memory_overhead(math.ceil(overhead_mb * self.growth))
+        if grown <= overhead_mb:
+            return False
+        pod_spec.memory_overhead = format_memory_mb(grown)
+        return True
+
@@ -0,0 +1,139 @@
+import re
+import threading
+
+from k8s_objects.spark_app import SparkApp, SparkAppStatus
+from kubernetes.client.models import V1ObjectMeta
+from logs import LogSink
+
+IMAGE_PULL = "image_pull"
+BAD_ARGUMENTS = "bad_arguments"
+DRIVER_OOM = "driver_oom"
+EXECUTOR_OOM = "executor_oom"
+SHUFFLE_FETCH = "shuffle_fetch"
+UNKNOWN = "unknown"
+
+# when several categories match, the first one wins: a driver OOM also loses executors, a bad argument
+# also fails the driver, ...
+CATEGORY_PRIORITY = (IMAGE_PULL, BAD_ARGUMENTS, DRIVER_OOM, EXECUTOR_OOM, SHUFFLE_FETCH)
+RETRYABLE_CATEGORIES = (DRIVER_OOM, EXECUTOR_OOM, SHUFFLE_FETCH)
+
+CATEGORY_PATTERNS = {
+    IMAGE_PULL: (
+        r"ErrImagePull|ImagePullBackOff|Failed to pull image|pull access denied|manifest unknown",
+    ),
+    BAD_ARGUMENTS: (
+        r"Unrecognized option|Missing required (?:argument|option)|error: unrecognized arguments"
+        r"|error: the following arguments are required|Error: Failed to load class|ClassNotFoundException: [\w$.]+"
+        r"|IllegalArgumentException: (?:requirement failed|Invalid argument)",
+    ),
+    DRIVER_OOM: (
+        r"Exception in thread \"main\" java\.lang\.OutOfMemoryError(?:: (?P<driver_heap>Java heap space|GC overhead limit exceeded))?"
+        r"|driver (?:container|pod) (?:failed|terminated) with ExitCode: 137|driver[^\n]{0,80}OOMKilled",
+    ),
+    EXECUTOR_OOM: (
+        r"Lost task [^\n]*java\.lang\.OutOfMemoryError(?:: (?P<executor_heap>Java heap space|GC overhead limit exceeded))?"
+        r"|ExecutorLostFailure[^\n]*(?:OOMKilled|exit code 137|exceeding memory limits|Container killed)"
+        r"|Executor[^\n]{0,80}(?:OOMKilled|exited with code 137)",
+    ),
+    SHUFFLE_FETCH: (
+        r"FetchFailedException|MetadataFetchFailedException|Missing an output location for shuffle"
+        r"|Failed to connect to [^\n]*:7337",
+    ),
+}
+
+# one alternation with a named group per category, a single pass over the text finds every category
+COMBINED_PATTERN = re.compile(
+    "|".join("(?P<%s>%s)" % (category, "|".join(patterns)) for category, patterns in CATEGORY_PATTERNS.items())
+)
+COMBINED_BYTES_PATTERN = re.compile(COMBINED_PATTERN.pattern.encode())
+
+
+class FailureClassification():
+    def __init__(self, category: str, evidence: str = None, heap: bool = False) -> None:
+        """
+        `evidence` is the first matching text of the category, `heap` tells a Java heap OOM
+        from a container killed for exceeding its memory limit (off-heap)
+        """
+        self.category = category
+        self.evidence = evidence
+        self.heap = heap
+
+
+    @property
+    def retryable(self) -> bool:
+        return self.category in RETRYABLE_CATEGORIES
+
+
+    def __repr__(self) -> str:
+        return "FailureClassification(category=%s, heap=%s, evidence=%r)" % (self.category, self.heap, self.evidence)
+
+
+def classify_text(text: str | bytes) -> dict[str, FailureClassification]:
+    """
+    Every category found in `text` with its first evidence
+    """
+    pattern = COMBINED_BYTES_PATTERN if isinstance(text, bytes) else COMBINED_PATTERN
+    found: dict[str, FailureClassification] = dict()
+    for matched in pattern.finditer(text):
+        category = matched.lastgroup
+        if category in found:
+            continue
+        evidence = matched.group(category)
+        heap = bool(matched.group("driver_heap") or matched.group("executor_heap"))
+        found[category] = FailureClassification(
+            category,
+            evidence=evidence.decode(errors="replace") if isinstance(evidence, bytes) else evidence,
+            heap=heap,
+        )
+    return found
+
+
+class FailureClassifier(LogSink):
+    """
+    Classifies why a SparkApp failed from its `ApplicationState.error_message` and its driver log.
+
+    Register `observe` as a SparkApp listener for the error message, and add the classifier to the sinks
+    of the `LogPipeline` to scan the driver log: each batch of lines is searched in one pass of a
+    single combined regex, only the first evidence per category is kept.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._found: dict[tuple[str, str], dict[str, FailureClassification]] = dict()
+
+
+    def write(self, namespace: str, app: str, chunk: bytes) -> None:
+        found = classify_text(chunk)
+        if found:
+            self._merge(namespace, app, found)
+
+
+    def observe(self, spark_app: SparkApp) -> None:
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        if status is None or status.application_state is None or not status.application_state.error_message:
+            return
+        found = classify_text(status.application_state.error_message)
+        if found:
+            self._merge(metadata.namespace, metadata.name, found)
+
+
+    def classify(self, namespace: str, name: str) -> FailureClassification:
+        with self._lock:
+            found = dict(self._found.get((namespace, name), dict()))
+        for category in CATEGORY_PRIORITY:
+            if category in found:
+                return found[category]
+        return FailureClassification(UNKNOWN)
+
+
+    def forget(self, namespace: str, name: str) -> None:
+        with self._lock:
+            self._found.pop((namespace, name), None)
+
+
+    def _merge(self, namespace: str, app: str, found: dict[str, FailureClassification]) -> None:
+        with self._lock:
+            known = self._found.setdefault((namespace, app), dict())
+            for category, classification in found.items():
+                known.setdefault(category, classification)
@@ -0,0 +1,6 @@
+from sizing.executor_sizer import (ExecutorSizer, SizingBounds,
+                                   SizingRecommendation)
+from sizing.input_sizer import (InputSizer, InputSizingRules, InputStats,
+                                InputStatter, LocalFileSystemStatter,
+                                extract_input_paths)
+from sizing.event_log_advisor import EventLogAdvisor, EventLogRecommendation
@@ -0,0 +1,197 @@
+import logging
+import math
+
+from analytics.event_log_analyzer import EventLogSummary, StageStats
+from k8s_objects.spark_app import (DynamicAllocation, SparkApp,
+                                   SparkExecutorSpec)
+from sizing.executor_sizer import SizingBounds, SizingRecommendation
+from utils.k8s_utils import (format_memory_mb, get_spark_app_template,
+                             parse_memory_mb)
+
+SHUFFLE_PARTITIONS_CONF = "spark.sql.shuffle.partitions"
+DEFAULT_SHUFFLE_PARTITIONS = 200
+DEFAULT_EXECUTOR_MEMORY_MB = 1024
+
+
+class EventLogRecommendation(SizingRecommendation):
+    def __init__(self, template: str, spark_conf: dict[str, str] = None, **kwargs) -> None:
+        """Executor resources and `spark_conf` entries recommended from an event log, None means keep the current value."""
+        super().__init__(template, **kwargs)
+        self.spark_conf = spark_conf or dict()
+
+
+    def __repr__(self) -> str:
+        return "EventLogRecommendation(template=%s, instances=%s, memory=%s, memory_overhead=%s, spark_conf=%s)" % (
+            self.template, self.instances, self.memory, self.memory_overhead, self.spark_conf
+        )
+
+
+class EventLogAdvisor():
+    """
+    Turns the `EventLogSummary` of a run into recommendations for the SparkApp that produced it:
+    - skewed shuffle stages (slowest task `skew_ratio` times the median, and at least `min_skewed_task_seconds`)
+      enable adaptive query execution and its skew join handling
+    - disk spills grow `spark.sql.shuffle.partitions` to about `target_partition_bytes` of shuffle read per task,
+      or executor memory when partitions are already that small
+    - GC time above `gc_ratio` of the task run time grows executor memory by `memory_growth`
+    - shuffle stages of tiny tasks (median under `small_task_ms`) shrink `spark.sql.shuffle.partitions`
+    - executor cores busy less than half of `target_utilization` shrink `instances` (without dynamic allocation)
+    """
+
+    def __init__(self,
+                 bounds: SizingBounds = None,
+                 skew_ratio: float = 5.0,
+                 min_skewed_task_seconds: float = 30.0,
+                 gc_ratio: float = 0.1,
+                 target_partition_bytes: int = 128 * 1024 * 1024,
+                 small_task_ms: float = 200.0,
+                 target_utilization: float = 0.7,
+                 memory_growth: float = 1.5) -> None:
+        self.bounds = bounds or SizingBounds()
+        self.skew_ratio = skew_ratio
+        self.min_skewed_task_seconds = min_skewed_task_seconds
+        self.gc_ratio = gc_ratio
+        self.target_partition_bytes = target_partition_bytes
+        self.small_task_ms = small_task_ms
+        self.target_utilization = target_utilization
+        self.memory_growth = memory_growth
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def recommend(self, summary: EventLogSummary, spark_app: SparkApp) -> EventLogRecommendation:
+        recommendation = EventLogRecommendation(template=get_spark_app_template(spark_app))
+        shuffle_stages = [stage for stage in summary.stages.values() if stage.shuffle_read_bytes and stage.tasks]
+
+        self._recommend_skew(summary, spark_app, shuffle_stages, recommendation)
+        grow_memory = self._recommend_partitions(summary, spark_app, shuffle_stages, recommendation)
+        if summary.run_time_ms and summary.gc_time_ms / summary.run_time_ms > self.gc_ratio:
+            recommendation.reasons.append("GC took %.0f%% of the task run time" % (100 * summary.gc_time_ms / summary.run_time_ms))
+            grow_memory = True
+        if grow_memory:
+            self._recommend_memory(summary, spark_app, recommendation)
+        self._recommend_instances(summary, spark_app, recommendation)
+
+        self.logger.info("SparkApp %s | %s: %s" % (spark_app.metadata.name, recommendation, "; ".join(recommendation.reasons)))
+        return recommendation
+
+
+    def apply_recommendation(self, spark_app: SparkApp, recommendation: EventLogRecommendation) -> None:
+        spec = spark_app.spec
+        if recommendation.spark_conf:
+            spec.spark_conf = {**(spec.spark_conf or dict()), **recommendation.spark_conf}
+
+        if spec.executor is None:
+            spec.executor = SparkExecutorSpec()
+        if recommendation.instances is not None:
+            spec.executor.instances = recommendation.instances
+        if recommendation.memory is not None:
+            spec.executor.memory = recommendation.memory
+        if recommendation.memory_overhead is not None:
+            spec.executor.memory_overhead = recommendation.memory_overhead
+
+
+    def _conf(self, key: str, summary: EventLogSummary, spark_app: SparkApp) -> str | None:
+        """
+        Value of the spec, else the one the run had
+        """
+        spark_conf = spark_app.spec.spark_conf or dict()
+        if key in spark_conf:
+            return str(spark_conf[key])
+        return summary.spark_properties.get(key)
+
+
+    def _recommend_skew(self, summary: EventLogSummary, spark_app: SparkApp, shuffle_stages: list[StageStats],
+                        recommendation: EventLogRecommendation) -> None:
+        skewed = [
+            stage for stage in shuffle_stages
+            if stage.skew is not None and stage.skew >= self.skew_ratio and stage.task_ms_max >= self.min_skewed_task_seconds * 1000
+        ]
+        if not skewed:
+            return
+
+        worst = max(skewed, key=lambda stage: stage.skew)
+        reason = "%s skewed stages, stage %s slowest task %.0fs is %.0fx its median" % (
+            len(skewed), worst.stage_id, worst.task_ms_max / 1000, worst.skew
+        )
+        disabled = [
+            key for key in ("spark.sql.adaptive.enabled", "spark.sql.adaptive.skewJoin.enabled")
+            if (self._conf(key, summary, spark_app) or "").lower() != "true"
+        ]
+        recommendation.spark_conf.update({key: "true" for key in disabled})
+        if not disabled:
+            reason += ", skew join handling is already enabled: the skew is not in a join, consider salting the keys"
+        recommendation.reasons.append(reason)
+
+
+    def _recommend_partitions(self, summary: EventLogSummary, spark_app: SparkApp, shuffle_stages: list[StageStats],
+                              recommendation: EventLogRecommendation) -> bool:
+        """
+        Returns whether executor memory should grow instead
+        """
+        if not shuffle_stages:
+            return False
+
+        partitions = int(self._conf(SHUFFLE_PARTITIONS_CONF, summary, spark_app) or DEFAULT_SHUFFLE_PARTITIONS)
+        # size the partitions for the biggest shuffle
+        needed = max(math.ceil(stage.shuffle_read_bytes / self.target_partition_bytes) for stage in shuffle_stages)
+        spilled = sum(stage.disk_spilled_bytes for stage in shuffle_stages)
+
+        if spilled:
+            if needed > partitions:
+                recommendation.spark_conf[SHUFFLE_PARTITIONS_CONF] = str(needed)
+                recommendation.reasons.append("shuffle stages spilled %s MiB to disk with %s partitions" % (spilled // 2 ** 20, partitions))
+                return False
+            recommendation.reasons.append("shuffle stages spilled %s MiB to disk with partitions already small" % (spilled // 2 ** 20))
+            return True
+
+        total_cores = (summary.peak_executors or 1) * (summary.executor_cores or 1)
+        tiny = [
+            stage for stage in shuffle_stages
+            if stage.median_task_ms is not None and stage.median_task_ms < self.small_task_ms and stage.tasks > 2 * total_cores
+        ]
+        smaller = max(needed, 2 * total_cores)
+        if tiny and smaller < partitions / 2:
+            recommendation.spark_conf[SHUFFLE_PARTITIONS_CONF] = str(smaller)
+            recommendation.spark_conf["spark.sql.adaptive.coalescePartitions.enabled"] = "true"
+            recommendation.reasons.append("%s shuffle stages have a median task under %.0fms with %s partitions" % (
+                len(tiny), self.small_task_ms, partitions
+            ))
+        return False
+
+
+    def _recommend_memory(self, summary: EventLogSummary, spark_app: SparkApp, recommendation: EventLogRecommendation) -> None:
+        executor: SparkExecutorSpec = spark_app.spec.executor or SparkExecutorSpec()
+        memory_mb = (
+            parse_memory_mb(executor.memory) or parse_memory_mb(summary.spark_properties.get("spark.executor.memory"))
+            or DEFAULT_EXECUTOR_MEMORY_MB
+        )
+        grown = self.bounds.clamp_memory(math.ceil(memory_mb * self.memory_growth))
+        if grown > memory_mb:
+            recommendation.memory = format_memory_mb(grown)
+
+
+    def _recommend_instances(self, summary: EventLogSummary, spark_app: SparkApp, recommendation: EventLogRecommendation) -> None:
+        executor: SparkExecutorSpec = spark_app.spec.executor
+        dynamic_allocation: DynamicAllocation = spark_app.spec.dynamic_allocation
+        if executor is None or not executor.instances or (dynamic_allocation is not None and dynamic_allocation.enabled):
+            return
+
+        utilization = summary.core_utilization
+        if utilization is None or utilization >= self.target_utilization / 2:
+            return
+
+        instances = self.bounds.clamp_instances(math.ceil(executor.instances * utilization / self.target_utilization))
+        if instances < executor.instances:
+            recommendation.instances = instances
+            recommendation.reasons.append("executor cores were busy %.0f%% of the time" % (100 * utilization))
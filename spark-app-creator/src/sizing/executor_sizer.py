@@ -0,0 +1,242 @@
+import logging
+import math
+import re
+from datetime import datetime, timedelta, timezone
+
+from history import RunHistoryStore, SparkAppRun
+from k8s_objects.spark_app import (DynamicAllocation, SparkApp,
+                                   SparkExecutorSpec)
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+from utils.k8s_utils import (format_memory_mb, get_spark_app_template,
+                             parse_memory_mb)
+
+OOM_PATTERN = re.compile(
+    r"OutOfMemoryError|OOMKilled|exit code 137|exceeding memory limits|Container killed by|Java heap space|GC overhead limit exceeded",
+    re.IGNORECASE,
+)
+
+
+class SizingBounds():
+    def __init__(self,
+                 min_instances: int = 1,
+                 max_instances: int = None,
+                 min_memory_mb: int = 512,
+                 max_memory_mb: int = None,
+                 min_memory_overhead_mb: int = 384,
+                 max_memory_overhead_mb: int = None) -> None:
+        """Hard limits applied to every recommendation of `ExecutorSizer`."""
+        self.min_instances = min_instances
+        self.max_instances = max_instances
+        self.min_memory_mb = min_memory_mb
+        self.max_memory_mb = max_memory_mb
+        self.min_memory_overhead_mb = min_memory_overhead_mb
+        self.max_memory_overhead_mb = max_memory_overhead_mb
+
+
+    def clamp_instances(self, instances: int) -> int:
+        return self._clamp(instances, self.min_instances, self.max_instances)
+
+
+    def clamp_memory(self, memory_mb: int) -> int:
+        return self._clamp(memory_mb, self.min_memory_mb, self.max_memory_mb)
+
+
+    def clamp_memory_overhead(self, memory_overhead_mb: int) -> int:
+        return self._clamp(memory_overhead_mb, self.min_memory_overhead_mb, self.max_memory_overhead_mb)
+
+
+    @staticmethod
+    def _clamp(value: int, lower: int | None, upper: int | None) -> int:
+        if lower is not None:
+            value = max(value, lower)
+        if upper is not None:
+            value = min(value, upper)
+        return value
+
+
+class SizingRecommendation():
+    def __init__(self,
+                 template: str,
+                 instances: int = None,
+                 memory: str = None,
+                 memory_overhead: str = None,
+                 min_executors: int = None,
+                 max_executors: int = None,
+                 reasons: list[str] = None) -> None:
+        """Executor resources recommended for a template, None means keep the current value."""
+        self.template = template
+        self.instances = instances
+        self.memory = memory
+        self.memory_overhead = memory_overhead
+        self.min_executors = min_executors
+        self.max_executors = max_executors
+        self.reasons = reasons or []
+
+
+    def __repr__(self) -> str:
+        return "SizingRecommendation(template=%s, instances=%s, memory=%s, memory_overhead=%s, min_executors=%s, max_executors=%s)" % (
+            self.template, self.instances, self.memory, self.memory_overhead, self.min_executors, self.max_executors
+        )
+
+
+class ExecutorSizer():
+    """
+    Sizing stage to run before submission, pass it in the client `hooks`.
+
+    Looks at the recent runs of the SparkApp template in a `RunHistoryStore`:
+    - OOM-like failures since the last success grow executor memory and memory overhead by `oom_growth`
+    - the peak of running executors of successful runs (times `headroom`) caps `instances`
+      and dynamic allocation `max_executors`, over-requested executors only cost money and queueing time
+    - a low percentile of the executors successful runs spent most of their time with sets `min_executors`
+    - if successful runs kept every requested executor busy and took longer than `target_duration`,
+      `instances` grows by `saturation_growth`
+    With `apply=False` the recommendation is only logged.
+    """
+
+    def __init__(self,
+                 history: RunHistoryStore,
+                 bounds: SizingBounds = None,
+                 apply: bool = True,
+                 lookback: timedelta = timedelta(days=30),
+                 min_runs: int = 3,
+                 headroom: float = 1.2,
+                 oom_growth: float = 1.5,
+                 saturation_growth: float = 1.5,
+                 target_duration: timedelta = None) -> None:
+        self.history = history
+        self.bounds = bounds or SizingBounds()
+        self.apply = apply
+        self.lookback = lookback
+        self.min_runs = min_runs
+        self.headroom = headroom
+        self.oom_growth = oom_growth
+        self.saturation_growth = saturation_growth
+        self.target_duration = target_duration
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def __call__(self, spark_app: SparkApp, **kwargs) -> None:
+        recommendation = self.recommend(spark_app)
+        if recommendation is None:
+            return
+
+        self.logger.info("SparkApp %s | %s: %s" % (
+            spark_app.metadata.name, recommendation, "; ".join(recommendation.reasons)
+        ))
+        if self.apply:
+            self.apply_recommendation(spark_app, recommendation)
+
+
+    def recommend(self, spark_app: SparkApp) -> SizingRecommendation | None:
+        template = get_spark_app_template(spark_app)
+        runs = self.history.runs_for_template(template, since=datetime.now(timezone.utc) - self.lookback)
+        if len(runs) < self.min_runs:
+            return None
+
+        executor: SparkExecutorSpec = spark_app.spec.executor or SparkExecutorSpec()
+        recommendation = SizingRecommendation(template=template)
+
+        self._recommend_memory(runs, executor, recommendation)
+        self._recommend_instances(runs, spark_app, recommendation)
+
+        return recommendation
+
+
+    def apply_recommendation(self, spark_app: SparkApp, recommendation: SizingRecommendation) -> None:
+        if spark_app.spec.executor is None:
+            spark_app.spec.executor = SparkExecutorSpec()
+        executor: SparkExecutorSpec = spark_app.spec.executor
+
+        if recommendation.instances is not None:
+            executor.instances = recommendation.instances
+        if recommendation.memory is not None:
+            executor.memory = recommendation.memory
+        if recommendation.memory_overhead is not None:
+            executor.memory_overhead = recommendation.memory_overhead
+
+        dynamic_allocation: DynamicAllocation = spark_app.spec.dynamic_allocation
+        if dynamic_allocation is not None and dynamic_allocation.enabled:
+            if recommendation.min_executors is not None:
+                dynamic_allocation.min_executors = recommendation.min_executors
+            if recommendation.max_executors is not None:
+                dynamic_allocation.max_executors = recommendation.max_executors
+
+
+    def _recommend_memory(self, runs: list[SparkAppRun], executor: SparkExecutorSpec, recommendation: SizingRecommendation) -> None:
+        # runs are sorted from the most recent, OOMs that happened before the last success are already fixed
+        oom_runs = []
+        for run in runs:
+            if run.final_state == SparkAppState.COMPLETED.value:
+                break
+            if run.error_message and OOM_PATTERN.search(run.error_message):
+                oom_runs.append(run)
+
+        if not oom_runs:
+            return
+
+        memory_mb = parse_memory_mb(executor.memory or oom_runs[0].executor_memory) or self.bounds.min_memory_mb
+        overhead_mb = parse_memory_mb(executor.memory_overhead or oom_runs[0].executor_memory_overhead)
+        if overhead_mb is None:
+            # Spark default overhead: max(384m, 10% of executor memory)
+            overhead_mb = max(384, int(memory_mb * 0.1))
+
+        recommendation.memory = format_memory_mb(self.bounds.clamp_memory(int(memory_mb * self.oom_growth)))
+        recommendation.memory_overhead = format_memory_mb(
+            self.bounds.clamp_memory_overhead(int(overhead_mb * self.oom_growth))
+        )
+        recommendation.reasons.append("%s OOM-like failures since the last success" % len(oom_runs))
+
+
+    def _recommend_instances(self, runs: list[SparkAppRun], spark_app: SparkApp, recommendation: SizingRecommendation) -> None:
+        succeeded = [
+            run for run in runs
+            if run.final_state == SparkAppState.COMPLETED.value and run.peak_executors
+        ]
+        if len(succeeded) < self.min_runs:
+            return
+
+        peaks = sorted(run.peak_executors for run in succeeded)
+        peak_p95 = peaks[min(len(peaks) - 1, int(len(peaks) * 0.95))]
+        requested = spark_app.spec.executor.instances if spark_app.spec.executor is not None else None
+
+        dynamic_allocation: DynamicAllocation = spark_app.spec.dynamic_allocation
+        if dynamic_allocation is not None and dynamic_allocation.enabled:
+            recommendation.max_executors = self.bounds.clamp_instances(math.ceil(peaks[-1] * self.headroom))
+            recommendation.reasons.append("executor peaks between %s and %s over %s runs" % (peaks[0], peaks[-1], len(peaks)))
+            # the floor runs settle at between bursts, even the lowest peak is only reached for a while
+            steady = sorted(run.steady_executors for run in succeeded if run.steady_executors)
+            if steady:
+                floor = steady[int(len(steady) * 0.1)]
+                recommendation.min_executors = min(self.bounds.clamp_instances(floor), recommendation.max_executors)
+                recommendation.reasons.append("p10 of steady executors is %s" % floor)
+            return
+
+        if requested is None:
+            return
+
+        saturated = all(run.peak_executors >= (run.executor_instances or requested) for run in succeeded)
+        durations = sorted(run.duration_seconds for run in succeeded if run.duration_seconds is not None)
+        too_slow = (
+            self.target_duration is not None and durations
+            and durations[len(durations) // 2] > self.target_duration.total_seconds()
+        )
+
+        if saturated and too_slow:
+            recommendation.instances = self.bounds.clamp_instances(math.ceil(requested * self.saturation_growth))
+            recommendation.reasons.append(
+                "every executor was busy and median duration %.0fs is above the target" % durations[len(durations) // 2]
+            )
+        elif math.ceil(peak_p95 * self.headroom) < requested:
+            recommendation.instances = self.bounds.clamp_instances(math.ceil(peak_p95 * self.headroom))
+            recommendation.reasons.append("p95 peak of running executors is %s out of %s requested" % (peak_p95, requested))
@@ -0,0 +1,242 @@
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from urllib.parse import urlparse
+
+from k8s_objects.spark_app import SparkApp, SparkExecutorSpec
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+
+SHUFFLE_PARTITIONS_CONF = "spark.sql.shuffle.partitions"
+MAX_PARTITION_BYTES_CONF = "spark.sql.files.maxPartitionBytes"
+
+
+class InputStats():
+    def __init__(self, total_bytes: int = 0, file_count: int = 0) -> None:
+        self.total_bytes = total_bytes
+        self.file_count = file_count
+
+
+    def __add__(self, other: "InputStats") -> "InputStats":
+        return InputStats(self.total_bytes + other.total_bytes, self.file_count + other.file_count)
+
+
+    def __repr__(self) -> str:
+        return "InputStats(total_bytes=%s, file_count=%s)" % (self.total_bytes, self.file_count)
+
+
+class InputStatter():
+    """
+    Computes the size of an input path. Subclass it to support another storage (object stores, HDFS, ...)
+    """
+
+    def supports(self, path: str) -> bool:
+        raise Exception("Must override method `supports` in %s.%s" % (self.__class__.__module__, self.__class__.__name__))
+
+
+    def stat(self, path: str) -> InputStats | None:
+        """
+        Size of the files under `path`, None if it does not exist
+        """
+        raise Exception("Must override method `stat` in %s.%s" % (self.__class__.__module__, self.__class__.__name__))
+
+
+class LocalFileSystemStatter(InputStatter):
+    """
+    Local and mounted filesystems, paths without a scheme or with `file://`.
+
+    Directories are scanned in parallel. Each directory listing is cached with the directory mtime,
+    an unchanged directory is not listed again, only stat-ed. Files rewritten in place without
+    touching their directory are not detected.
+    """
+
+    def __init__(self, max_workers: int = 16) -> None:
+        self.max_workers = max_workers
+        self._cache: dict[str, tuple[int, int, int, list[str]]] = dict()
+        self._cache_lock = threading.Lock()
+
+
+    def supports(self, path: str) -> bool:
+        return urlparse(path).scheme in ("", "file")
+
+
+    def stat(self, path: str) -> InputStats | None:
+        local_path = urlparse(path).path if path.startswith("file:") else path
+        if os.path.isfile(local_path):
+            return InputStats(os.stat(local_path).st_size, 1)
+        if not os.path.isdir(local_path):
+            return None
+
+        stats = InputStats()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = [pool.submit(self._scan_directory, local_path)]
+            while pending:
+                total_bytes, file_count, subdirectories = pending.pop().result()
+                stats = stats + InputStats(total_bytes, file_count)
+                pending.extend(pool.submit(self._scan_directory, subdirectory) for subdirectory in subdirectories)
+        return stats
+
+
+    def _scan_directory(self, directory: str) -> tuple[int, int, list[str]]:
+        mtime_ns = os.stat(directory).st_mtime_ns
+        with self._cache_lock:
+            cached = self._cache.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1:]
+
+        total_bytes, file_count, subdirectories = 0, 0, []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file() and not entry.name.startswith((".", "_")):
+                    # hidden and marker files (_SUCCESS, .crc) are not read by Spark
+                    total_bytes += entry.stat().st_size
+                    file_count += 1
+
+        with self._cache_lock:
+            self._cache[directory] = (mtime_ns, total_bytes, file_count, subdirectories)
+        return total_bytes, file_count, subdirectories
+
+
+class InputSizingRules():
+    def __init__(self,
+                 bytes_per_executor: int = 8 * GIB,
+                 min_instances: int = 1,
+                 max_instances: int = 50,
+                 target_shuffle_partition_bytes: int = 128 * MIB,
+                 min_shuffle_partitions: int = 8,
+                 max_shuffle_partitions: int = 4000,
+                 tasks_per_core: int = 2,
+                 min_max_partition_bytes: int = 16 * MIB,
+                 max_max_partition_bytes: int = 512 * MIB) -> None:
+        """Rules turning input size into executor instances and partitioning settings."""
+        self.bytes_per_executor = bytes_per_executor
+        self.min_instances = min_instances
+        self.max_instances = max_instances
+        self.target_shuffle_partition_bytes = target_shuffle_partition_bytes
+        self.min_shuffle_partitions = min_shuffle_partitions
+        self.max_shuffle_partitions = max_shuffle_partitions
+        self.tasks_per_core = tasks_per_core
+        self.min_max_partition_bytes = min_max_partition_bytes
+        self.max_max_partition_bytes = max_max_partition_bytes
+
+
+    def derive(self, stats: InputStats, executor_cores: int = 1) -> dict[str, int]:
+        instances = min(max(math.ceil(stats.total_bytes / self.bytes_per_executor), self.min_instances), self.max_instances)
+
+        shuffle_partitions = math.ceil(stats.total_bytes / self.target_shuffle_partition_bytes)
+        shuffle_partitions = min(max(shuffle_partitions, self.min_shuffle_partitions), self.max_shuffle_partitions)
+
+        # enough read tasks to keep every core busy `tasks_per_core` times, never more tasks than files
+        # when files are small, as Spark packs small files together up to maxPartitionBytes
+        read_tasks = max(instances * executor_cores * self.tasks_per_core, 1)
+        if stats.file_count:
+            read_tasks = min(read_tasks, stats.file_count)
+        max_partition_bytes = math.ceil(stats.total_bytes / read_tasks) if stats.total_bytes else self.min_max_partition_bytes
+        max_partition_bytes = min(max(max_partition_bytes, self.min_max_partition_bytes), self.max_max_partition_bytes)
+
+        return {
+            "instances": instances,
+            "shuffle_partitions": shuffle_partitions,
+            "max_partition_bytes": max_partition_bytes,
+        }
+
+
+def extract_input_paths(spark_app: SparkApp,
+                        argument_names: tuple[str, ...] = ("--input", "--input-path"),
+                        spark_conf_keys: tuple[str, ...] = ()) -> list[str]:
+    """
+    Input paths passed as `--input <path>` / `--input=<path>` in the arguments or under `spark_conf_keys`
+    """
+    paths = []
+    arguments = spark_app.spec.arguments or []
+    for index, argument in enumerate(arguments):
+        name, separator, value = argument.partition("=")
+        if name not in argument_names:
+            continue
+        if separator:
+            paths.append(value)
+        elif index + 1 < len(arguments):
+            paths.append(arguments[index + 1])
+
+    spark_conf = spark_app.spec.spark_conf or dict()
+    for key in spark_conf_keys:
+        if spark_conf.get(key):
+            paths.extend(path.strip() for path in spark_conf[key].split(",") if path.strip())
+    return paths
+
+
+class InputSizer():
+    """
+    Sizing hook deriving `executor.instances`, `spark.sql.shuffle.partitions` and
+    `spark.sql.files.maxPartitionBytes` from the size of the SparkApp input, pass it in the client `hooks`.
+
+    Values set explicitly in `spark_conf` are kept unless `override=True`. So is `executor.instances`,
+    except that with `cap_instances` an input too small for it brings it down to the derived count.
+    The spec is left untouched when an input cannot be sized (no statter, or the path does not exist).
+    """
+
+    def __init__(self,
+                 rules: InputSizingRules = None,
+                 statters: list[InputStatter] = None,
+                 path_extractor: Callable[[SparkApp], list[str]] = extract_input_paths,
+                 override: bool = False,
+                 cap_instances: bool = True) -> None:
+        self.rules = rules or InputSizingRules()
+        self.statters = statters if statters is not None else [LocalFileSystemStatter()]
+        self.path_extractor = path_extractor
+        self.override = override
+        self.cap_instances = cap_instances
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def __call__(self, spark_app: SparkApp, **kwargs) -> None:
+        paths = self.path_extractor(spark_app)
+        if not paths:
+            return
+
+        stats = InputStats()
+        for path in paths:
+            statter = next((statter for statter in self.statters if statter.supports(path)), None)
+            if statter is None:
+                self.logger.warning("SparkApp %s | No statter for input %s, skipping input sizing" % (spark_app.metadata.name, path))
+                return
+            path_stats = statter.stat(path)
+            if path_stats is None:
+                self.logger.warning("SparkApp %s | Input %s not found, skipping input sizing" % (spark_app.metadata.name, path))
+                return
+            stats = stats + path_stats
+
+        if spark_app.spec.executor is None:
+            spark_app.spec.executor = SparkExecutorSpec()
+        executor: SparkExecutorSpec = spark_app.spec.executor
+        derived = self.rules.derive(stats, executor_cores=executor.cores or 1)
+
+        self.logger.info("SparkApp %s | %s for %s: %s" % (spark_app.metadata.name, stats, paths, derived))
+
+        if self.override or executor.instances is None:
+            executor.instances = derived["instances"]
+        elif self.cap_instances and executor.instances > derived["instances"]:
+            # an explicit count is sized for the largest inputs, executors beyond the input would sit idle
+            executor.instances = derived["instances"]
+        spark_conf = spark_app.spec.spark_conf if spark_app.spec.spark_conf is not None else dict()
+        for key, value in ((SHUFFLE_PARTITIONS_CONF, derived["shuffle_partitions"]), (MAX_PARTITION_BYTES_CONF, derived["max_partition_bytes"])):
+            if self.override or key not in spark_conf:
+                spark_conf[key] = str(value)
+        spark_app.spec.spark_conf = spark_conf
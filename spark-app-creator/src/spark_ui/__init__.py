@@ -0,0 +1 @@
+from spark_ui.rest_poller import SparkUiPoller, driver_ui_url
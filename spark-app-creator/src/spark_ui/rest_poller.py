@@ -0,0 +1,359 @@
+import json
+import logging
+import threading
+from time import monotonic
+from typing import Any, Callable
+
+import urllib3
+from history import RunHistoryStore
+from k8s_objects.spark_app import DriverInfo, SparkApp, SparkAppStatus
+from kubernetes.client.models import V1ObjectMeta
+from metrics import MetricsRegistry
+from utils.k8s_utils import SparkApplicationStateEnum as SparkAppState
+
+LABELS = ("namespace", "app")
+
+# Spark REST API StageData field -> (history column, scale)
+STAGE_FIELDS = {
+    "numCompleteTasks": ("tasks_completed", 1),
+    "numFailedTasks": ("tasks_failed", 1),
+    "executorRunTime": ("executor_run_time_ms", 1),
+    "executorCpuTime": ("executor_cpu_time_ms", 1e-6),
+    "jvmGcTime": ("jvm_gc_time_ms", 1),
+    "inputBytes": ("input_bytes", 1),
+    "outputBytes": ("output_bytes", 1),
+    "shuffleReadBytes": ("shuffle_read_bytes", 1),
+    "shuffleWriteBytes": ("shuffle_write_bytes", 1),
+    "memoryBytesSpilled": ("memory_spilled_bytes", 1),
+    "diskBytesSpilled": ("disk_spilled_bytes", 1),
+}
+FINISHED_STAGE_STATUSES = ("COMPLETE", "FAILED", "SKIPPED")
+TERMINAL_STATES = (SparkAppState.COMPLETED.value, SparkAppState.FAILED.value, SparkAppState.SUBMISSION_FAILED.value)
+
+
+def driver_ui_url(namespace: str, driver_info: DriverInfo, prefer_ingress: bool = False) -> str | None:
+    """
+    Base URL of the Spark UI of a driver: its ingress if asked for (or the only address known),
+    else the service address, else the service DNS name
+    """
+    if driver_info is None:
+        return None
+    if driver_info.web_ui_ingress_address and (prefer_ingress or not driver_info.web_ui_address):
+        address = driver_info.web_ui_ingress_address
+    elif driver_info.web_ui_address:
+        address = driver_info.web_ui_address
+    elif driver_info.web_ui_service_name and driver_info.web_ui_port:
+        address = "%s.%s.svc:%s" % (driver_info.web_ui_service_name, namespace, driver_info.web_ui_port)
+    else:
+        return None
+    if "://" not in address:
+        address = "http://" + address
+    return address.rstrip("/")
+
+
+class _PolledApp():
+    def __init__(self, namespace: str, name: str, base_url: str, app_id: str | None, interval: float) -> None:
+        self.namespace = namespace
+        self.name = name
+        self.base_url = base_url
+        self.app_id = app_id
+        self.interval = interval
+        self.due_at = monotonic()
+        # (stageId, attemptId) -> last values of STAGE_FIELDS, finished stages are never processed again
+        self.stages: dict[tuple[int, int], tuple] = dict()
+        self.finished_stages: set[tuple[int, int]] = set()
+        self.totals: dict[str, float] = {column: 0 for column, _ in STAGE_FIELDS.values()}
+        self.active_tasks: int | None = None
+        # held while polling, the listener thread polls a terminated app while the poller thread may still be at it
+        self.lock = threading.Lock()
+
+
+    def new_attempt(self, base_url: str, app_id: str | None) -> None:
+        """
+        A rerun has a new driver and Spark application, whose stage ids start over. Totals carry on.
+        """
+        self.base_url = base_url
+        self.app_id = app_id
+        self.stages.clear()
+        self.finished_stages.clear()
+        self.active_tasks = None
+
+
+class SparkUiPoller():
+    """
+    Polls the REST API of the Spark UI of running SparkApps (`/api/v1/applications/<id>/stages` and `/executors`)
+    from one background thread, over a pool of keep-alive connections.
+
+    Register `observe` as a SparkApp listener: an app is polled once it runs and its driver UI address is known,
+    until it terminates, when it is polled one last time (best effort, the driver may already be gone) to catch
+    the stages that finished since the previous poll. Other states (UNKNOWN while the driver is unreachable, reruns)
+    keep what was counted so far, a rerun is polled from its new Spark application once it runs. Only what changed since the previous poll is processed: stage
+    counters are diffed per stage attempt and finished stages are skipped. The interval of an app grows by `backoff`
+    up to `max_interval` while nothing changes (or the UI does not answer) and drops back to `min_interval` on progress.
+
+    Deltas feed the `metrics` counters, cumulative totals go to the run in `history` (which observes the app as well,
+    register the poller first so that the last totals are saved with the run).
+    """
+
+    def __init__(self,
+                 metrics: MetricsRegistry = None,
+                 history: RunHistoryStore = None,
+                 min_interval: float = 2.0,
+                 max_interval: float = 30.0,
+                 backoff: float = 2.0,
+                 timeout: float = 5.0,
+                 max_connections: int = 32,
+                 prefer_ingress: bool = False,
+                 url_resolver: Callable[[SparkApp], str | None] = None) -> None:
+        self.history = history
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.prefer_ingress = prefer_ingress
+        self.url_resolver = url_resolver
+
+        # one keep-alive connection per driver UI, idle ones beyond `max_connections` drivers are closed
+        self._http = urllib3.PoolManager(
+            num_pools=max_connections,
+            maxsize=1,
+            retries=False,
+            timeout=urllib3.Timeout(total=timeout),
+            headers={"Accept": "application/json", "Accept-Encoding": "gzip"},
+        )
+        self._apps: dict[tuple[str, str], _PolledApp] = dict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+        self.metrics = None
+        if metrics is not None:
+            self.metrics = {
+                "tasks": metrics.counter(
+                    "spark_app_creator_spark_tasks_total",
+                    "Spark tasks reported by the Spark UI, status is completed or failed",
+                    LABELS + ("status",),
+                ),
+                "executor_seconds": metrics.counter(
+                    "spark_app_creator_spark_executor_seconds_total",
+                    "Executor time of Spark tasks reported by the Spark UI, kind is run, cpu or gc",
+                    LABELS + ("kind",),
+                ),
+                "bytes": metrics.counter(
+                    "spark_app_creator_spark_bytes_total",
+                    "Bytes of Spark tasks reported by the Spark UI, kind is input, output, shuffle_read, shuffle_write, "
+                    "memory_spilled or disk_spilled",
+                    LABELS + ("kind",),
+                ),
+                "active_tasks": metrics.gauge(
+                    "spark_app_creator_spark_active_tasks",
+                    "Tasks running on the executors of a SparkApp",
+                    LABELS,
+                ),
+                "slot_utilization": metrics.gauge(
+                    "spark_app_creator_spark_slot_utilization",
+                    "Running tasks over task slots of the active executors of a SparkApp",
+                    LABELS,
+                ),
+                "poll_errors": metrics.counter(
+                    "spark_app_creator_spark_ui_poll_errors_total",
+                    "Failed polls of the Spark UI REST API",
+                    LABELS,
+                ),
+            }
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def start(self) -> "SparkUiPoller":
+        self._thread = threading.Thread(target=self._run, name="spark-ui-poller", daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self, timeout: float = None) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._http.clear()
+
+
+    def observe(self, spark_app: SparkApp) -> None:
+        metadata: V1ObjectMeta = spark_app.metadata
+        status: SparkAppStatus = spark_app.status
+        if status is None or status.application_state is None:
+            return
+        key = (metadata.namespace, metadata.name)
+        state = status.application_state.state
+
+        if state in TERMINAL_STATES:
+            with self._lock:
+                app = self._apps.pop(key, None)
+            if app is not None:
+                self._poll_safely(app)
+            return
+        if state != SparkAppState.RUNNING.value:
+            return
+
+        with self._lock:
+            app = self._apps.get(key)
+        if app is not None and status.spark_application_id in (None, app.app_id):
+            return
+        if self.url_resolver is not None:
+            base_url = self.url_resolver(spark_app)
+        else:
+            base_url = driver_ui_url(metadata.namespace, status.driver_info, prefer_ingress=self.prefer_ingress)
+        if base_url is None:
+            return
+
+        if app is not None:
+            if app.app_id is not None:
+                self.logger.info("SparkApp %s - Namespace %s | Polling the Spark UI of attempt %s" % (
+                    metadata.name, metadata.namespace, status.spark_application_id
+                ))
+            with app.lock:
+                app.new_attempt(base_url, status.spark_application_id)
+            return
+
+        with self._wakeup:
+            self._apps[key] = _PolledApp(metadata.namespace, metadata.name, base_url, status.spark_application_id, self.min_interval)
+            self._wakeup.notify_all()
+
+
+    def poll(self, namespace: str, name: str) -> bool:
+        """
+        Polls one app now, returns whether anything changed since the previous poll
+        """
+        with self._lock:
+            app = self._apps.get((namespace, name))
+        if app is None:
+            return False
+        return self._poll_app(app)
+
+
+    def _poll_app(self, app: _PolledApp) -> bool:
+        with app.lock:
+            return self._poll_app_locked(app)
+
+
+    def _poll_app_locked(self, app: _PolledApp) -> bool:
+        if app.app_id is None:
+            applications = self._get(app, "/api/v1/applications")
+            if not applications:
+                return False
+            app.app_id = applications[0]["id"]
+
+        changed = self._process_stages(app, self._get(app, "/api/v1/applications/%s/stages" % app.app_id))
+        changed = self._process_executors(app, self._get(app, "/api/v1/applications/%s/executors" % app.app_id)) or changed
+
+        if changed and self.history is not None:
+            self.history.observe_utilization(app.namespace, app.name, **{column: int(value) for column, value in app.totals.items()})
+        return changed
+
+
+    def _poll_safely(self, app: _PolledApp) -> bool:
+        try:
+            return self._poll_app(app)
+        except Exception as e:
+            self.logger.warning("SparkApp %s - Namespace %s | Spark UI poll failed: %s" % (app.name, app.namespace, e))
+            if self.metrics is not None:
+                self.metrics["poll_errors"].labels(namespace=app.namespace, app=app.name).inc()
+            return False
+
+
+    def _get(self, app: _PolledApp, path: str) -> Any:
+        response = self._http.request("GET", app.base_url + path)
+        if response.status != 200:
+            raise urllib3.exceptions.HTTPError("GET %s%s returned %s" % (app.base_url, path, response.status))
+        return json.loads(response.data)
+
+
+    def _process_stages(self, app: _PolledApp, stages: list[dict]) -> bool:
+        deltas = {column: 0 for column, _ in STAGE_FIELDS.values()}
+        changed = False
+        for stage in stages:
+            key = (stage.get("stageId"), stage.get("attemptId", 0))
+            if key in app.finished_stages:
+                continue
+
+            values = tuple(stage.get(field) or 0 for field in STAGE_FIELDS)
+            previous = app.stages.get(key)
+            if stage.get("status") in FINISHED_STAGE_STATUSES:
+                app.finished_stages.add(key)
+                app.stages.pop(key, None)
+            else:
+                app.stages[key] = values
+            if values == previous:
+                continue
+
+            changed = True
+            for (column, scale), value, previous_value in zip(STAGE_FIELDS.values(), values, previous or (0,) * len(values)):
+                deltas[column] += max(value - previous_value, 0) * scale
+
+        if not changed:
+            return False
+        for column, delta in deltas.items():
+            app.totals[column] += delta
+        self._export_deltas(app, deltas)
+        return True
+
+
+    def _process_executors(self, app: _PolledApp, executors: list[dict]) -> bool:
+        executors = [executor for executor in executors if executor.get("id") != "driver" and executor.get("isActive", True)]
+        active_tasks = sum(executor.get("activeTasks", 0) for executor in executors)
+        slots = sum(executor.get("maxTasks") or executor.get("totalCores", 0) for executor in executors)
+
+        if self.metrics is not None:
+            self.metrics["active_tasks"].labels(namespace=app.namespace, app=app.name).set(active_tasks)
+            self.metrics["slot_utilization"].labels(namespace=app.namespace, app=app.name).set(active_tasks / slots if slots else 0)
+
+        changed = active_tasks != app.active_tasks
+        app.active_tasks = active_tasks
+        return changed
+
+
+    def _export_deltas(self, app: _PolledApp, deltas: dict[str, float]) -> None:
+        if self.metrics is None:
+            return
+        labels = dict(namespace=app.namespace, app=app.name)
+        self.metrics["tasks"].labels(status="completed", **labels).inc(deltas["tasks_completed"])
+        self.metrics["tasks"].labels(status="failed", **labels).inc(deltas["tasks_failed"])
+        for kind in ("run", "cpu"):
+            self.metrics["executor_seconds"].labels(kind=kind, **labels).inc(deltas["executor_%s_time_ms" % kind] / 1000)
+        self.metrics["executor_seconds"].labels(kind="gc", **labels).inc(deltas["jvm_gc_time_ms"] / 1000)
+        for kind in ("input", "output", "shuffle_read", "shuffle_write", "memory_spilled", "disk_spilled"):
+            self.metrics["bytes"].labels(kind=kind, **labels).inc(deltas["%s_bytes" % kind])
+
+
+    def _run(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._stopping:
+                    if self._apps:
+                        due_at, key = min((app.due_at, key) for key, app in self._apps.items())
+                        if due_at <= monotonic():
+                            break
+                        self._wakeup.wait(due_at - monotonic())
+                    else:
+                        self._wakeup.wait()
+                if self._stopping:
+                    return
+                app = self._apps[key]
+
+            changed = self._poll_safely(app)
+
+            with self._lock:
+                app.interval = self.min_interval if changed else min(app.interval * self.backoff, self.max_interval)
+                app.due_at = monotonic() + app.interval
@@ -0,0 +1,3 @@
+from staging.blob_store import BlobStore, FileSystemBlobStore, S3BlobStore
+from staging.dependency_stager import (DependencyStager, StagedArtifact,
+                                       local_path)
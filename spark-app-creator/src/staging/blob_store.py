@@ -0,0 +1,233 @@
+import hashlib
+import hmac
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote, urlparse
+from xml.etree import ElementTree
+
+import urllib3
+
+MIB = 1024 * 1024
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+def _chunks(size: int, chunk_size: int) -> list[tuple[int, int]]:
+    """
+    (offset, length) of the chunks of a file, at least one even for an empty file
+    """
+    return [(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size)] or [(0, 0)]
+
+
+def _read_chunk(path: str, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class BlobStore():
+    """
+    Content-addressed storage of staged dependencies. Subclass it to support another storage.
+    Keys are written once and never change, so `exists` is enough to skip an upload.
+    """
+
+    def exists(self, key: str) -> bool:
+        raise Exception("Must override method `exists` in %s.%s" % (self.__class__.__module__, self.__class__.__name__))
+
+
+    def upload(self, path: str, key: str) -> None:
+        raise Exception("Must override method `upload` in %s.%s" % (self.__class__.__module__, self.__class__.__name__))
+
+
+    def uri(self, key: str) -> str:
+        """
+        URI the driver and executors download the blob from
+        """
+        raise Exception("Must override method `uri` in %s.%s" % (self.__class__.__module__, self.__class__.__name__))
+
+
+class FileSystemBlobStore(BlobStore):
+    """
+    Blobs under `root`, a filesystem shared with the Spark pods (NFS, a mounted PVC, ...).
+    `uri_prefix` is where the pods see `root`, for example `local:///mnt/deps`, defaults to `file://<root>`.
+
+    Chunks are copied in parallel into a temporary file renamed into place once complete,
+    so a blob is never seen half written.
+    """
+
+    def __init__(self, root: str, uri_prefix: str = None, chunk_size: int = 8 * MIB, max_workers: int = 4) -> None:
+        self.root = os.path.abspath(root)
+        self.uri_prefix = (uri_prefix or "file://%s" % self.root).rstrip("/")
+        self.chunk_size = chunk_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fs-blob-store")
+
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(os.path.join(self.root, key))
+
+
+    def upload(self, path: str, key: str) -> None:
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = "%s.%s.part" % (target, uuid.uuid4().hex)
+
+        size = os.stat(path).st_size
+        with open(temporary, "wb") as f:
+            f.truncate(size)
+        try:
+            fd = os.open(temporary, os.O_WRONLY)
+            try:
+                futures = [
+                    self._pool.submit(lambda offset, length: os.pwrite(fd, _read_chunk(path, offset, length), offset), offset, length)
+                    for offset, length in _chunks(size, self.chunk_size)
+                ]
+                for future in futures:
+                    future.result()
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(temporary, target)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+
+    def uri(self, key: str) -> str:
+        return "%s/%s" % (self.uri_prefix, key)
+
+
+class S3BlobStore(BlobStore):
+    """
+    Blobs in `bucket` of an S3-compatible object store (AWS S3, MinIO, Ceph RGW, ...), with path-style
+    requests to `endpoint_url` signed with AWS Signature V4 (unsigned when `access_key` is None).
+
+    Files bigger than `chunk_size` go through a multipart upload, parts sent in parallel over a pool of
+    keep-alive connections. AWS S3 needs parts of at least 5 MiB.
+    """
+
+    def __init__(self,
+                 endpoint_url: str,
+                 bucket: str,
+                 prefix: str = "",
+                 access_key: str = None,
+                 secret_key: str = None,
+                 region: str = "us-east-1",
+                 uri_scheme: str = "s3a",
+                 chunk_size: int = 16 * MIB,
+                 max_workers: int = 8,
+                 timeout: float = 60.0) -> None:
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.uri_scheme = uri_scheme
+        self.chunk_size = chunk_size
+
+        self._host = urlparse(self.endpoint_url).netloc
+        self._http = urllib3.PoolManager(maxsize=max_workers, timeout=timeout, retries=urllib3.Retry(total=3, backoff_factor=0.5))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-blob-store")
+
+
+    def exists(self, key: str) -> bool:
+        response = self._request("HEAD", key)
+        if response.status == 404:
+            return False
+        self._check(response, "HEAD", key)
+        return True
+
+
+    def upload(self, path: str, key: str) -> None:
+        size = os.stat(path).st_size
+        if size <= self.chunk_size:
+            with open(path, "rb") as f:
+                self._check(self._request("PUT", key, body=f.read()), "PUT", key)
+            return
+
+        response = self._check(self._request("POST", key, query={"uploads": ""}), "POST", key)
+        upload_id = self._find(response.data, "UploadId")
+        try:
+            futures = [
+                self._pool.submit(self._upload_part, path, key, upload_id, part_number, offset, length)
+                for part_number, (offset, length) in enumerate(_chunks(size, self.chunk_size), start=1)
+            ]
+            etags = [future.result() for future in futures]
+            parts = "".join(
+                "<Part><PartNumber>%s</PartNumber><ETag>%s</ETag></Part>" % (part_number, etag)
+                for part_number, etag in enumerate(etags, start=1)
+            )
+            body = ("<CompleteMultipartUpload>%s</CompleteMultipartUpload>" % parts).encode()
+            self._check(self._request("POST", key, query={"uploadId": upload_id}, body=body), "POST", key)
+        except BaseException:
+            self._request("DELETE", key, query={"uploadId": upload_id})
+            raise
+
+
+    def uri(self, key: str) -> str:
+        return "%s://%s/%s" % (self.uri_scheme, self.bucket, self._object_key(key))
+
+
+    def _upload_part(self, path: str, key: str, upload_id: str, part_number: int, offset: int, length: int) -> str:
+        response = self._request(
+            "PUT", key, query={"partNumber": str(part_number), "uploadId": upload_id}, body=_read_chunk(path, offset, length)
+        )
+        return self._check(response, "PUT", key).headers["ETag"]
+
+
+    def _object_key(self, key: str) -> str:
+        return "%s/%s" % (self.prefix, key) if self.prefix else key
+
+
+    def _request(self, method: str, key: str, query: dict[str, str] = None, body: bytes = None) -> urllib3.BaseHTTPResponse:
+        path = quote("/%s/%s" % (self.bucket, self._object_key(key)), safe="/-_.~")
+        canonical_query = "&".join(
+            "%s=%s" % (quote(name, safe="-_.~"), quote(value, safe="-_.~")) for name, value in sorted((query or dict()).items())
+        )
+        headers = self._sign(method, path, canonical_query)
+        url = self.endpoint_url + path + ("?" + canonical_query if canonical_query else "")
+        return self._http.request(method, url, body=body, headers=headers, preload_content=True)
+
+
+    def _sign(self, method: str, path: str, canonical_query: str) -> dict[str, str]:
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers = {"host": self._host, "x-amz-content-sha256": UNSIGNED_PAYLOAD, "x-amz-date": amz_date}
+        if self.access_key is None:
+            return headers
+
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join((
+            method, path, canonical_query,
+            "".join("%s:%s\n" % (name, headers[name]) for name in sorted(headers)),
+            signed_headers, UNSIGNED_PAYLOAD,
+        ))
+        scope = "%s/%s/s3/aws4_request" % (amz_date[:8], self.region)
+        string_to_sign = "\n".join(("AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()))
+
+        signing_key = ("AWS4" + self.secret_key).encode()
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        headers["authorization"] = "AWS4-HMAC-SHA256 Credential=%s/%s, SignedHeaders=%s, Signature=%s" % (
+            self.access_key, scope, signed_headers, signature
+        )
+        return headers
+
+
+    @staticmethod
+    def _check(response: urllib3.BaseHTTPResponse, method: str, key: str) -> urllib3.BaseHTTPResponse:
+        if response.status >= 300:
+            raise IOError("%s %s failed with HTTP %s: %s" % (method, key, response.status, response.data[:200]))
+        return response
+
+
+    @staticmethod
+    def _find(xml: bytes, tag: str) -> str:
+        for element in ElementTree.fromstring(xml).iter():
+            # namespaced or not, depending on the store
+            if element.tag == tag or element.tag.endswith("}" + tag):
+                return element.text
+        raise IOError("No %s in %s" % (tag, xml[:200]))
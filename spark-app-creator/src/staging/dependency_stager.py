@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from urllib.parse import urlparse
+
+from k8s_objects.spark_app import SparkApp, SparkAppSpec, SparkDependencies
+from metrics import MetricsRegistry
+from staging.blob_store import MIB, BlobStore
+
+DEPENDENCY_FIELDS = ("jars", "files", "py_files")
+
+
+def local_path(uri: str) -> str | None:
+    """
+    Path of a dependency on the submitting machine, None for remote URIs and `local://` (in the image)
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme == "":
+        return uri
+    if parsed.scheme == "file":
+        return parsed.path
+    return None
+
+
+class StagedArtifact():
+    def __init__(self, path: str, key: str, size: int, uri: str, uploaded: bool) -> None:
+        self.path = path
+        self.key = key
+        self.size = size
+        self.uri = uri
+        self.uploaded = uploaded
+
+
+    def __repr__(self) -> str:
+        return "StagedArtifact(path=%s, uri=%s, size=%s, uploaded=%s)" % (self.path, self.uri, self.size, self.uploaded)
+
+
+class DependencyStager():
+    """
+    Stages the local artifacts of a SparkApp (`deps.jars`, `deps.files`, `deps.py_files` and, with
+    `stage_main_application_file`, `main_application_file`) into a content-addressed `BlobStore`
+    and rewrites their URIs in the spec, pass it in the client `hooks`. `file://` URIs must exist on the
+    submitting machine, paths without a scheme are staged when they do and left as they are otherwise
+    (Spark reads them from the default filesystem).
+
+    Blobs are keyed `<sha256>/<file name>`: the file name is kept since Spark uses it (`--py-files`
+    extensions, `SparkFiles.get`), and a blob already in the store is not uploaded again. Files are
+    hashed and uploaded in parallel. Hashes are cached per (path, size, mtime), so an unchanged artifact
+    is not read again by this process. Blobs known to be in the store are not checked again
+    for `present_ttl` seconds.
+    """
+
+    def __init__(self,
+                 store: BlobStore,
+                 max_workers: int = 4,
+                 stage_main_application_file: bool = True,
+                 present_ttl: float = 300.0,
+                 metrics: MetricsRegistry = None) -> None:
+        self.store = store
+        self.max_workers = max_workers
+        self.stage_main_application_file = stage_main_application_file
+        self.present_ttl = present_ttl
+
+        self._digests: dict[str, tuple[int, int, str]] = dict()
+        # key -> monotonic time until which the blob is assumed to be in the store
+        self._present: dict[str, float] = dict()
+        self._key_locks: dict[str, threading.Lock] = dict()
+        self._lock = threading.Lock()
+
+        self.staged_bytes = None
+        if metrics is not None:
+            self.staged_bytes = metrics.counter(
+                "spark_app_creator_staged_bytes_total",
+                "Bytes of local dependencies staged, result is uploaded or cached",
+                ("result",),
+            )
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def __call__(self, spark_app: SparkApp, **kwargs) -> None:
+        artifacts = self.stage(spark_app.spec)
+        if artifacts:
+            uploaded = [artifact for artifact in artifacts if artifact.uploaded]
+            self.logger.info(
+                "SparkApp %s | Staged %s dependencies, uploaded %s (%s MiB)" % (
+                spark_app.metadata.name, len(artifacts), len(uploaded), sum(artifact.size for artifact in uploaded) // MIB
+            ))
+
+
+    def stage(self, spec: SparkAppSpec) -> list[StagedArtifact]:
+        deps: SparkDependencies = spec.deps or SparkDependencies()
+        uris = [uri for field in DEPENDENCY_FIELDS for uri in getattr(deps, field) or []]
+        if self.stage_main_application_file and spec.main_application_file:
+            uris.append(spec.main_application_file)
+
+        local_uris = list(dict.fromkeys(uri for uri in uris if self._is_local(uri)))
+        if not local_uris:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(local_uris)), thread_name_prefix="dependency-stager") as pool:
+            artifacts = list(pool.map(self._stage_file, local_uris))
+
+        staged = {uri: artifact.uri for uri, artifact in zip(local_uris, artifacts)}
+        for field in DEPENDENCY_FIELDS:
+            if getattr(deps, field):
+                setattr(deps, field, [staged.get(uri, uri) for uri in getattr(deps, field)])
+        if spec.main_application_file in staged:
+            spec.main_application_file = staged[spec.main_application_file]
+        return artifacts
+
+
+    def _is_local(self, uri: str) -> bool:
+        path = local_path(uri)
+        if path is None:
+            return False
+        if urlparse(uri).scheme == "" and not os.path.isfile(path):
+            self.logger.warning("Dependency %s not found locally, left as is" % uri)
+            return False
+        return True
+
+
+    def _stage_file(self, uri: str) -> StagedArtifact:
+        path = os.path.abspath(local_path(uri))
+        stat = os.stat(path)
+        key = "%s/%s" % (self._digest(path, stat), os.path.basename(path))
+
+        # one upload per key at a time, concurrent SparkApps sharing an artifact wait for it
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                present_until = self._present.get(key, 0.0)
+            uploaded = False
+            if present_until < monotonic():
+                uploaded = not self.store.exists(key)
+                if uploaded:
+                    self.store.upload(path, key)
+                with self._lock:
+                    self._present[key] = monotonic() + self.present_ttl
+
+        if self.staged_bytes is not None:
+            self.staged_bytes.labels(result="uploaded" if uploaded else "cached").inc(stat.st_size)
+        return StagedArtifact(path=path, key=key, size=stat.st_size, uri=self.store.uri(key), uploaded=uploaded)
+
+
+    def _digest(self, path: str, stat: os.stat_result) -> str:
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(MIB), b""):
+                digest.update(block)
+
+        with self._lock:
+            self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+        return digest.hexdigest()
@@ -0,0 +1,5 @@
+from tuning.spark_conf_profiles import (PROFILES, SparkConfDiff,
+                                        SparkConfProfile, SparkConfProfileHook,
+                                        apply_spark_conf_profiles,
+                                        diff_spark_conf, get_profile,
+                                        register_profile, resolve_profiles)
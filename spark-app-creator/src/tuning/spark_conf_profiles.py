@@ -0,0 +1,213 @@
+import logging
+
+from k8s_objects.spark_app import SparkApp, SparkAppSpec
+
+
+class SparkConfProfile():
+    def __init__(self, name: str, spark_conf: dict[str, str], description: str = None, extends: list[str] = None) -> None:
+        """Named, reusable `spark_conf` block. `extends` profiles are applied first."""
+        self.name = name
+        self.spark_conf = spark_conf
+        self.description = description
+        self.extends = extends or []
+
+
+    def __repr__(self) -> str:
+        return "SparkConfProfile(name=%s, extends=%s)" % (self.name, self.extends)
+
+
+class SparkConfDiff():
+    def __init__(self, missing: dict[str, str], changed: dict[str, tuple[str, str]], extra: dict[str, str]) -> None:
+        """
+        missing: profile keys absent from the conf, changed: key -> (conf value, profile value),
+        extra: conf keys the profile does not define
+        """
+        self.missing = missing
+        self.changed = changed
+        self.extra = extra
+
+
+    @property
+    def matches(self) -> bool:
+        return not self.missing and not self.changed
+
+
+    def __repr__(self) -> str:
+        return "SparkConfDiff(missing=%s, changed=%s, extra=%s)" % (self.missing, self.changed, self.extra)
+
+
+PROFILES: dict[str, SparkConfProfile] = dict()
+
+
+def register_profile(profile: SparkConfProfile) -> SparkConfProfile:
+    PROFILES[profile.name] = profile
+    return profile
+
+
+def get_profile(name: str) -> SparkConfProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError("Unknown spark_conf profile %s, known profiles: %s" % (name, sorted(PROFILES)))
+
+
+def resolve_profiles(profile_names: list[str]) -> dict[str, str]:
+    """
+    spark_conf of the profiles merged in order, a later profile overrides an earlier one
+    and a profile overrides the profiles it extends. Raises ValueError on cyclic `extends`.
+    """
+    return _resolve_profiles(profile_names, chain=())
+
+
+def _resolve_profiles(profile_names: list[str], chain: tuple[str, ...]) -> dict[str, str]:
+    resolved = dict()
+    for name in profile_names:
+        if name in chain:
+            raise ValueError("Cyclic spark_conf profiles: %s" % " -> ".join(chain[chain.index(name):] + (name,)))
+        profile = get_profile(name)
+        resolved.update(_resolve_profiles(profile.extends, chain=chain + (name,)))
+        resolved.update(profile.spark_conf)
+    return resolved
+
+
+def apply_spark_conf_profiles(spec: SparkAppSpec, profile_names: list[str], overrides: dict[str, str] = None) -> SparkAppSpec:
+    """
+    Precedence, from lowest to highest:
+    1. profiles, in the given order
+    2. the spec's own `spark_conf`
+    3. `overrides`
+    """
+    spark_conf = resolve_profiles(profile_names)
+    spark_conf.update(spec.spark_conf or dict())
+    spark_conf.update(overrides or dict())
+    spec.spark_conf = spark_conf
+    return spec
+
+
+def diff_spark_conf(spark_conf: dict[str, str] | SparkAppSpec, profile_names: list[str]) -> SparkConfDiff:
+    if isinstance(spark_conf, SparkAppSpec):
+        spark_conf = spark_conf.spark_conf
+    spark_conf = spark_conf or dict()
+    expected = resolve_profiles(profile_names)
+
+    return SparkConfDiff(
+        missing={key: value for key, value in expected.items() if key not in spark_conf},
+        changed={
+            key: (spark_conf[key], value) for key, value in expected.items()
+            if key in spark_conf and str(spark_conf[key]) != str(value)
+        },
+        extra={key: value for key, value in spark_conf.items() if key not in expected},
+    )
+
+
+class SparkConfProfileHook():
+    """
+    Applies profiles when the client runs its hooks, see `apply_spark_conf_profiles` for precedence
+    """
+
+    def __init__(self, profile_names: list[str], overrides: dict[str, str] = None) -> None:
+        for name in profile_names:
+            get_profile(name)
+        self.profile_names = profile_names
+        self.overrides = overrides
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._setup_logger()
+
+
+    def _setup_logger(self) -> logging.Logger:
+        """
+        Override this function if you need to customize the logger
+        """
+        logger_name = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        return logging.getLogger(logger_name)
+
+
+    def __call__(self, spark_app: SparkApp, **kwargs) -> None:
+        apply_spark_conf_profiles(spark_app.spec, self.profile_names, overrides=self.overrides)
+        self.logger.info("SparkApp %s | Applied spark_conf profiles %s" % (spark_app.metadata.name, self.profile_names))
+
+
+# region profiles
+register_profile(SparkConfProfile(
+    name="adaptive",
+    description="Adaptive query execution with partition coalescing",
+    spark_conf={
+        "spark.sql.adaptive.enabled": "true",
+        "spark.sql.adaptive.coalescePartitions.enabled": "true",
+        "spark.sql.adaptive.advisoryPartitionSizeInBytes": "128MB",
+    },
+))
+
+register_profile(SparkConfProfile(
+    name="adaptive_skew_join",
+    description="AQE with skew join splitting",
+    extends=["adaptive"],
+    spark_conf={
+        "spark.sql.adaptive.skewJoin.enabled": "true",
+        "spark.sql.adaptive.skewJoin.skewedPartitionFactor": "5",
+        "spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes": "256MB",
+    },
+))
+
+register_profile(SparkConfProfile(
+    name="kryo",
+    description="Kryo serializer for RDD shuffles and caching",
+    spark_conf={
+        "spark.serializer": "org.apache.spark.serializer.KryoSerializer",
+        "spark.kryoserializer.buffer": "64k",
+        "spark.kryoserializer.buffer.max": "512m",
+        "spark.kryo.unsafe": "true",
+    },
+))
+
+register_profile(SparkConfProfile(
+    name="shuffle_heavy",
+    description="Large shuffles: bigger buffers, zstd compression and patient fetch retries",
+    extends=["adaptive"],
+    spark_conf={
+        "spark.io.compression.codec": "zstd",
+        "spark.shuffle.compress": "true",
+        "spark.shuffle.spill.compress": "true",
+        "spark.shuffle.file.buffer": "1m",
+        "spark.shuffle.unsafe.file.output.buffer": "5m",
+        "spark.reducer.maxSizeInFlight": "96m",
+        "spark.shuffle.io.maxRetries": "10",
+        "spark.shuffle.io.retryWait": "10s",
+        "spark.network.timeout": "300s",
+    },
+))
+
+register_profile(SparkConfProfile(
+    name="small_files_compaction",
+    description="Read many small files into few large partitions and write large files",
+    extends=["adaptive"],
+    spark_conf={
+        "spark.sql.files.maxPartitionBytes": "256MB",
+        "spark.sql.files.openCostInBytes": "1MB",
+        "spark.sql.adaptive.advisoryPartitionSizeInBytes": "256MB",
+        "spark.sql.parquet.mergeSchema": "false",
+    },
+))
+
+register_profile(SparkConfProfile(
+    name="output_committer_v2",
+    description="Faster job commit with FileOutputCommitter v2, not atomic: a failed job can leave partial output",
+    spark_conf={
+        "spark.hadoop.mapreduce.fileoutputcommitter.algorithm.version": "2",
+    },
+))
+
+register_profile(SparkConfProfile(
+    name="streaming_low_latency",
+    description="Structured streaming with small micro-batches",
+    spark_conf={
+        "spark.sql.shuffle.partitions": "16",
+        "spark.locality.wait": "0s",
+        "spark.speculation": "false",
+        "spark.sql.streaming.noDataMicroBatches.enabled": "false",
+        "spark.sql.streaming.stateStore.providerClass": "org.apache.spark.sql.execution.streaming.state.RocksDBStateStoreProvider",
+    },
+))
+# endregion profiles
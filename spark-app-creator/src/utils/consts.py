@@ -2,3 +2,16 @@ SPARK_APP_GROUP = "sparkoperator.k8s.io"
 SPARK_APP_VERSION = "v1beta2"
 SPARK_APP_PLURAL = "sparkapplications"
 
+SPARK_APP_TEMPLATE_LABEL = "spark-app-creator/template"
+SPARK_APP_MANAGED_BY_LABEL = "app.kubernetes.io/managed-by"
+SPARK_APP_MANAGED_BY = "spark-app-creator"
+SPARK_APP_COLLECTABLE_LABEL = "spark-app-creator/collectable"
+SPARK_IMAGE_WARMER_LABEL = "spark-app-creator/image-warmer"
+SPARK_IMAGE_WARMER_IMAGES_ANNOTATION = "spark-app-creator/warmed-images"
+SPARK_CONF_CONFIG_MAP_LABEL = "spark-app-creator/conf-config-map"
+SPARK_CONF_CONFIG_MAP_UNREFERENCED_ANNOTATION = "spark-app-creator/unreferenced-since"
+# full hash in the annotation, truncated to the 63 characters of a label value in the label used to LIST
+SPARK_APP_SPEC_HASH_ANNOTATION = "spark-app-creator/spec-hash"
+SPARK_APP_SPEC_HASH_LABEL = "spark-app-creator/spec-hash"
+SPARK_APP_MONITOR_SHARD_LABEL = "spark-app-creator/monitor-shard"
+SPARK_APP_MONITOR_SHARDS = 256
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import json
 import os
 import re
@@ -9,7 +10,8 @@ import kubernetes.client.models
 import six
 from dateutil.parser import parse
 from kubernetes.client import rest
-from kubernetes.client.models import V1Pod, V1Status
+from kubernetes.client.models import V1ObjectMeta, V1Pod, V1Status
+from utils import consts
 
 
 class PodStatusPhaseEnum(Enum):
@@ -40,6 +42,69 @@ def get_pod_status_phase(pod: V1Pod):
     status: V1Status = pod.status
     return status.phase
 
+def get_spark_app_template(spark_app) -> str:
+    """
+    Template a SparkApp was built from, taken from the `SPARK_APP_TEMPLATE_LABEL` label, falls back to the SparkApp name
+    """
+    metadata: V1ObjectMeta = spark_app.metadata
+    if metadata.labels and metadata.labels.get(consts.SPARK_APP_TEMPLATE_LABEL):
+        return metadata.labels[consts.SPARK_APP_TEMPLATE_LABEL]
+    return metadata.name
+
+MEMORY_UNITS_MB = {
+    "b": 1 / (1024 * 1024),
+    "k": 1 / 1024, "kb": 1 / 1024, "ki": 1 / 1024,
+    "m": 1, "mb": 1, "mi": 1,
+    "g": 1024, "gb": 1024, "gi": 1024,
+    "t": 1024 * 1024, "tb": 1024 * 1024, "ti": 1024 * 1024,
+}
+
+def parse_memory_mb(memory: str | None) -> int | None:
+    """
+    Spark / Kubernetes memory quantity (512m, 4g, 4Gi, 1024) to MiB, rounded down, a bare number is MiB like in Spark
+    """
+    if memory is None:
+        return None
+    matched = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", str(memory))
+    unit = (matched.group(2).lower() or "m") if matched is not None else None
+    if unit not in MEMORY_UNITS_MB:
+        raise ValueError("Cannot parse memory %s" % memory)
+    return int(float(matched.group(1)) * MEMORY_UNITS_MB[unit])
+
+def format_memory_mb(memory_mb: int) -> str:
+    if memory_mb % 1024 == 0:
+        return "%dg" % (memory_mb // 1024)
+    return "%dm" % memory_mb
+
+def get_monitor_shard(namespace: str, name: str) -> str:
+    """
+    Monitor shard of a SparkApp, stamped as the `SPARK_APP_MONITOR_SHARD_LABEL` label so that monitors
+    can watch their shards only
+    """
+    digest = hashlib.blake2b(("%s/%s" % (namespace, name)).encode(), digest_size=8).digest()
+    return str(int.from_bytes(digest, "big") % consts.SPARK_APP_MONITOR_SHARDS)
+
+def _canonical_spec(value):
+    """
+    Drops unset fields (None, empty dicts and lists) so that a spec hashes the same whether a field
+    is missing or explicitly empty, list order is kept since it matters (arguments, volumes, ...)
+    """
+    if isinstance(value, dict):
+        canonical = ((key, _canonical_spec(item)) for key, item in value.items())
+        return {key: item for key, item in canonical if item is not None and item != {} and item != []}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_spec(item) for item in value]
+    if hasattr(value, "to_dict"):
+        return _canonical_spec(value.to_dict())
+    return value
+
+def compute_spec_hash(spec) -> str:
+    """
+    sha256 of the SparkAppSpec, independent of the order of dict entries and of unset fields
+    """
+    serialized = json.dumps(_canonical_spec(spec), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
 
 class MyDeserializer():
     """
@@ -99,13 +164,14 @@ class MyDeserializer():
             return None
 
         if type(klass) == str:
-            if klass.startswith('list['):
-                sub_kls = re.match(r'list\[(.*)\]', klass).group(1)
+            # newer clients spell them List[...] and Dict[...]
+            if klass.lower().startswith('list['):
+                sub_kls = re.match(r'list\[(.*)\]', klass, re.IGNORECASE).group(1)
                 return [self.__deserialize(sub_data, sub_kls)
                         for sub_data in data]
 
-            if klass.startswith('dict['):
-                sub_kls = re.match(r'dict\[\s*([^,\]]*)\s*,\s*([^\]]*)\s*\]', klass).group(2)
+            if klass.lower().startswith('dict['):
+                sub_kls = re.match(r'dict\[\s*([^,\]]*)\s*,\s*([^\]]*)\s*\]', klass, re.IGNORECASE).group(2)
                 return {k: self.__deserialize(v, sub_kls)
                         for k, v in six.iteritems(data)}
 
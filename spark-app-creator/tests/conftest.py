@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+from k8s_objects.spark_app import (ApplicationState, SparkApp, SparkAppSpec,
+                                   SparkAppStatus, SparkDriverSpec,
+                                   SparkExecutorSpec)
+from kubernetes.client.models import V1ObjectMeta
+
+
+def build_spark_app(name: str = "etl",
+                    namespace: str = "spark",
+                    labels: dict[str, str] = None,
+                    resource_version: str = None,
+                    creation_timestamp: datetime = None,
+                    state: str = None,
+                    status: SparkAppStatus = None,
+                    **spec_kwargs) -> SparkApp:
+    """
+    SparkApp with a minimal valid spec, `spec_kwargs` override or complete the `SparkAppSpec` fields.
+    `state` is a shortcut for a status holding only the application state.
+    """
+    spec_kwargs.setdefault("spark_version", "3.5.0")
+    spec_kwargs.setdefault("image", "spark:3.5.0")
+    spec_kwargs.setdefault("main_application_file", "local:///app/main.py")
+    spec_kwargs.setdefault("driver", SparkDriverSpec(cores=1, memory="1g"))
+    spec_kwargs.setdefault("executor", SparkExecutorSpec(instances=2, cores=2, memory="4g"))
+    if status is None and state is not None:
+        status = SparkAppStatus(application_state=ApplicationState(state=state))
+
+    return SparkApp(
+        metadata=V1ObjectMeta(
+            name=name, namespace=namespace, labels=labels, resource_version=resource_version, creation_timestamp=creation_timestamp,
+        ),
+        spec=SparkAppSpec(**spec_kwargs),
+        status=status,
+    )
+
+
+@pytest.fixture
+def make_spark_app():
+    return build_spark_app
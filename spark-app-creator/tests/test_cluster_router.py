@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import kubernetes
+import pytest
+from custom_exceptions import NoHealthyClusterException
+from k8s_manipulators.launcher import SparkAppLauncher
+from k8s_manipulators.router import ClusterRouter, ClusterTarget
+from kubernetes.client.rest import ApiException
+from utils import consts
+
+# what a create stores, the SparkApps of these tests differ by their metadata only
+STORED_SPEC = {
+    "sparkVersion": "3.5.0", "mainApplicationFile": "local:///app/main.py", "image": "spark:3.5.0",
+    "driver": {"cores": 1, "memory": "1g"}, "executor": {"instances": 2, "cores": 2, "memory": "4g"},
+}
+
+class FakeCluster():
+    """
+    Lists SparkApps per namespace from `states`, answers 500 to everything when `broken` and never answers a LIST
+    when `hanging`. A create answers `create_status`: a 503 is empty and stores nothing, a 504 has a body
+    and stores the SparkApp when `times_out_after_create`. A GET by name answers 500 when `gets_fail`.
+    """
+
+    def __init__(self, states: dict[str, list[str]], broken: bool = False, hanging: bool = False,
+                 create_status: int = 201, times_out_after_create: bool = True) -> None:
+        self.states = states
+        self.broken = broken
+        self.hanging = hanging
+        self.create_status = create_status
+        self.times_out_after_create = times_out_after_create
+        self.gets_fail = False
+        self.lists = 0
+        self.selectors: list[str] = []
+        self.spark_apps: dict[str, dict] = dict()
+
+        cluster = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: dict | None) -> None:
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                name = url.path.split("/")[7] if len(url.path.split("/")) > 7 else None
+                if name is not None:
+                    if cluster.gets_fail:
+                        return self._reply(500, {"kind": "Status", "code": 500})
+                    if name in cluster.spark_apps:
+                        return self._reply(200, cluster.spark_apps[name])
+                    return self._reply(404, {"kind": "Status", "code": 404})
+
+                cluster.lists += 1
+                cluster.selectors.append(parse_qs(url.query).get("labelSelector", [None])[0])
+                if cluster.hanging:
+                    time.sleep(2)
+                namespace = url.path.split("/")[5]
+                items = [{"status": {"applicationState": {"state": state}}} for state in cluster.states.get(namespace, [])]
+                self._reply(*((500, {"kind": "Status", "code": 500}) if cluster.broken else (200, {"items": items})))
+
+            def do_POST(self):
+                metadata = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["metadata"]
+                if cluster.create_status == 201 or (cluster.create_status == 504 and cluster.times_out_after_create):
+                    cluster.spark_apps[metadata["name"]] = {"metadata": metadata, "spec": STORED_SPEC}
+                if cluster.create_status == 201:
+                    return self._reply(201, cluster.spark_apps[metadata["name"]])
+                if cluster.create_status == 504:
+                    return self._reply(504, {"kind": "Status", "reason": "Timeout", "code": 504})
+                self._reply(cluster.create_status, None)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def target(self, name: str, **kwargs) -> ClusterTarget:
+        configuration = kubernetes.client.Configuration()
+        configuration.host = "http://127.0.0.1:%s" % self.server.server_address[1]
+        target = ClusterTarget(name, **kwargs)
+        target.api_client = kubernetes.client.ApiClient(configuration)
+        return target
+
+
+def test_router_scores_clusters_per_namespace(make_spark_app):
+    busy_etl = FakeCluster({"etl": ["SUBMITTED"] * 3 + ["RUNNING"], "ml": []})
+    busy_ml = FakeCluster({"etl": ["COMPLETED"], "ml": ["SUBMITTED"] * 3})
+    a, b = busy_etl.target("a"), busy_ml.target("b")
+    router = ClusterRouter([a, b], stats_ttl=60)
+
+    assert router.route(make_spark_app("etl-job", "etl")) is b
+    # within the TTL of the etl counts, ml is scored with its own counts
+    assert router.route(make_spark_app("ml-job", "ml")) is a
+    assert (a.pending("etl"), a.active("etl"), a.pending("ml")) == (3, 4, 1)
+    assert (b.pending("etl"), b.pending("ml")) == (1, 3)
+
+    router.route(make_spark_app("etl-job-2", "etl"))
+    assert (busy_etl.lists, busy_ml.lists) == (2, 2)
+
+    client = router.client_for(a, make_spark_app("ml-job", "ml"))
+    assert client.api_client is a.api_client
+    busy_etl.server.shutdown()
+    busy_ml.server.shutdown()
+
+
+def test_router_skips_unhealthy_clusters(make_spark_app):
+    healthy, broken = FakeCluster({"etl": ["RUNNING"] * 5}), FakeCluster({}, broken=True)
+    a, b = healthy.target("a"), broken.target("b")
+    router = ClusterRouter([a, b], unhealthy_cooldown=60)
+
+    assert router.route(make_spark_app("job", "etl")) is a
+    assert not b.healthy
+    assert broken.lists == 1
+
+    # b stays out during its cooldown, without being listed again
+    with pytest.raises(NoHealthyClusterException):
+        router.route(make_spark_app("job", "etl"), exclude={"a"})
+    assert broken.lists == 1
+    healthy.server.shutdown()
+    broken.server.shutdown()
+
+
+def test_router_lists_managed_spark_apps_within_a_timeout(make_spark_app):
+    hanging, healthy = FakeCluster({}, hanging=True), FakeCluster({"etl": ["RUNNING"] * 5})
+    a, b = hanging.target("a"), healthy.target("b")
+    router = ClusterRouter([a, b], request_timeout=0.2)
+
+    started_at = time.monotonic()
+    assert router.route(make_spark_app("job", "etl")) is b
+    assert time.monotonic() - started_at < 2
+    assert not a.healthy
+    assert healthy.selectors == ["%s=%s" % (consts.SPARK_APP_MANAGED_BY_LABEL, consts.SPARK_APP_MANAGED_BY)]
+    hanging.server.shutdown()
+    healthy.server.shutdown()
+
+
+@pytest.fixture
+def no_monitoring(monkeypatch):
+    monitored = []
+    monkeypatch.setattr(SparkAppLauncher, "monitor_spark_app", lambda self, spark_app, resource_version=None: monitored.append(spark_app))
+    monkeypatch.setattr(SparkAppLauncher, "delete_spark_app", lambda self, spark_app: None)
+    return monitored
+
+
+def test_router_fails_over_from_a_pristine_copy_when_the_create_never_happened(make_spark_app, no_monitoring):
+    down, up = FakeCluster({}, create_status=503), FakeCluster({"etl": ["RUNNING"]})
+    a, b = down.target("a"), up.target("b")
+    router = ClusterRouter([a, b])
+
+    def hook(spark_app):
+        # a hook with cluster-side effects, e.g. the ConfigMap of an externalized conf
+        assert spark_app.spec.hadoop_config_map is None
+        spark_app.spec.hadoop_config_map = "conf"
+
+    spark_app = make_spark_app("job", "etl")
+    assert router.run_spark_app(spark_app, hooks=[hook]) is b
+    assert not a.healthy and list(up.spark_apps) == ["job"]
+    assert [monitored.spec.hadoop_config_map for monitored in no_monitoring] == ["conf"]
+    down.server.shutdown()
+    up.server.shutdown()
+
+
+def test_router_monitors_a_create_whose_response_was_lost(make_spark_app, no_monitoring):
+    timing_out, other = FakeCluster({}, create_status=504), FakeCluster({"etl": ["SUBMITTED"] * 5})
+    a, b = timing_out.target("a"), other.target("b")
+    router = ClusterRouter([a, b])
+
+    assert router.run_spark_app(make_spark_app("job", "etl")) is a
+    assert list(timing_out.spark_apps) == ["job"] and not other.spark_apps
+    assert len(no_monitoring) == 1 and a.healthy
+
+    # the GET proves it was not created: safe to create elsewhere
+    timing_out.spark_apps.clear()
+    timing_out.times_out_after_create = False
+    assert router.run_spark_app(make_spark_app("job", "etl")) is b
+    assert not timing_out.spark_apps and list(other.spark_apps) == ["job"]
+    assert not a.healthy
+    timing_out.server.shutdown()
+    other.server.shutdown()
+
+
+def test_router_does_not_fail_over_a_create_it_cannot_check(make_spark_app, no_monitoring):
+    timing_out, other = FakeCluster({}, create_status=504), FakeCluster({"etl": ["SUBMITTED"] * 5})
+    a, b = timing_out.target("a"), other.target("b")
+    router = ClusterRouter([a, b])
+
+    # neither proven created nor proven absent
+    timing_out.gets_fail = True
+    with pytest.raises(ApiException) as raised:
+        router.run_spark_app(make_spark_app("job", "etl"))
+    assert raised.value.status == 504
+    assert not other.spark_apps
+    timing_out.server.shutdown()
+    other.server.shutdown()
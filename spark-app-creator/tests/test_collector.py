@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from history import RunHistoryStore
+from k8s_manipulators.collector import SparkAppCollector
+from k8s_objects.spark_app import SparkApp
+from kubernetes.client.models import V1ConfigMap, V1ConfigMapList, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+from utils import consts
+
+
+def raw_spark_app(name: str, state: str, finished_at: str, ttl: int = None, collectable: bool = False) -> dict:
+    labels = {"app.kubernetes.io/managed-by": "spark-app-creator"}
+    if collectable:
+        labels["spark-app-creator/collectable"] = "true"
+    return {
+        "metadata": {"name": name, "namespace": "spark", "uid": name, "labels": labels, "creationTimestamp": "2026-01-01T00:00:00Z"},
+        "spec": {"timeToLiveSeconds": ttl} if ttl is not None else {},
+        "status": {"applicationState": {"state": state}, "terminationTime": finished_at},
+    }
+
+
+def test_collector_enforces_retention_and_limit():
+    items = [
+        raw_spark_app("marked", "COMPLETED", "2026-01-01T11:59:00Z", collectable=True),
+        raw_spark_app("running", "RUNNING", None),
+        raw_spark_app("old-completed", "COMPLETED", "2026-01-01T10:00:00Z"),
+        raw_spark_app("recent-failed", "FAILED", "2026-01-01T11:00:00Z"),
+        raw_spark_app("ttl-expired", "FAILED", "2026-01-01T11:58:00Z", ttl=60),
+        raw_spark_app("newest-completed", "COMPLETED", "2026-01-01T11:59:00Z"),
+    ]
+    with mock.patch("kubernetes.client.CustomObjectsApi") as custom_objects_api, mock.patch("kubernetes.client.CoreV1Api") as core_v1_api:
+        core_v1_api.return_value.list_namespaced_config_map.return_value = V1ConfigMapList(items=[])
+        api = custom_objects_api.return_value
+        api.delete_collection_namespaced_custom_object.return_value = {"items": [items[0]]}
+        api.list_namespaced_custom_object.side_effect = [
+            {"items": items[:3], "metadata": {"continue": "page-2"}},
+            {"items": items[3:], "metadata": {}},
+        ]
+        collector = SparkAppCollector(mock.Mock(), namespaces=["spark"], max_finished_per_namespace=1, deletes_per_second=1000)
+
+        [stats] = collector.collect(now=datetime(2026, 1, 1, 12, tzinfo=timezone.utc))
+
+    deleted = [call.kwargs["name"] for call in api.delete_namespaced_custom_object.call_args_list]
+    assert deleted == ["old-completed", "ttl-expired", "recent-failed"]
+    assert (stats.collected, stats.expired, stats.over_limit, stats.remaining) == (1, 2, 1, 1)
+    assert api.delete_collection_namespaced_custom_object.call_args.kwargs["label_selector"] == (
+        "app.kubernetes.io/managed-by=spark-app-creator,spark-app-creator/collectable=true"
+    )
+
+
+def test_collector_archives_each_run_once_before_deleting_it(tmp_path):
+    history = RunHistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+    seen_by_client = raw_spark_app("seen-by-client", "COMPLETED", "2026-01-01T10:00:00Z")
+    expired = raw_spark_app("expired", "COMPLETED", "2026-01-01T10:00:00Z")
+    for item in (seen_by_client, expired):
+        item["spec"] = {
+            "sparkVersion": "3.5.0", "mainApplicationFile": "local:///app/main.py", "image": "spark:3.5.0",
+            "driver": {"cores": 1, "memory": "1g"}, "executor": {"instances": 2, "cores": 2, "memory": "4g"},
+        }
+    with mock.patch("kubernetes.client.CustomObjectsApi") as custom_objects_api:
+        api = custom_objects_api.return_value
+        api.delete_collection_namespaced_custom_object.return_value = {"items": []}
+        api.list_namespaced_custom_object.return_value = {"items": [seen_by_client, expired], "metadata": {}}
+        collector = SparkAppCollector(mock.Mock(), namespaces=["spark"], deletes_per_second=1000, history=history, config_map_grace_seconds=None)
+        history.observe(collector._deserializer.deserialize_data(seen_by_client, SparkApp))
+
+        # archived first: a failed delete does not lose the run, the next sweep does not archive it again
+        api.delete_namespaced_custom_object.side_effect = [None, ApiException(status=500)]
+        with pytest.raises(ApiException):
+            collector.collect(now=datetime(2026, 1, 1, 12, tzinfo=timezone.utc))
+        api.delete_namespaced_custom_object.side_effect = None
+        [stats] = collector.collect(now=datetime(2026, 1, 1, 12, tzinfo=timezone.utc))
+
+    history.flush()
+    assert sorted(run.name for run in history.runs_between()) == ["expired", "seen-by-client"]
+    assert (stats.expired, stats.archived) == (2, 0)
+    history.close()
+
+
+def test_collector_deletes_config_maps_unreferenced_for_the_grace_period():
+    running = raw_spark_app("running", "RUNNING", None)
+    running["spec"] = {"hadoopConfigMap": "conf-used"}
+    expired = raw_spark_app("expired", "COMPLETED", "2026-01-01T10:00:00Z")
+    expired["spec"] = {"hadoopConfigMap": "conf-of-expired", "sparkConfigMap": "conf-used"}
+
+    def config_map(name, unreferenced_since=None):
+        annotations = {consts.SPARK_CONF_CONFIG_MAP_UNREFERENCED_ANNOTATION: unreferenced_since} if unreferenced_since else None
+        return V1ConfigMap(metadata=V1ObjectMeta(name=name, uid=name, resource_version="1", annotations=annotations))
+
+    with mock.patch("kubernetes.client.CustomObjectsApi") as custom_objects_api, mock.patch("kubernetes.client.CoreV1Api") as core_v1_api:
+        api, core_api = custom_objects_api.return_value, core_v1_api.return_value
+        api.delete_collection_namespaced_custom_object.return_value = {"items": []}
+        api.list_namespaced_custom_object.return_value = {"items": [running, expired], "metadata": {}}
+        core_api.list_namespaced_config_map.return_value = V1ConfigMapList(items=[
+            config_map("conf-used", unreferenced_since="2026-01-01T09:00:00+00:00"),
+            config_map("conf-of-expired"),
+            config_map("conf-stale", unreferenced_since="2026-01-01T10:59:00+00:00"),
+            config_map("conf-recently-unreferenced", unreferenced_since="2026-01-01T11:30:00+00:00"),
+        ])
+        collector = SparkAppCollector(mock.Mock(), namespaces=["spark"], deletes_per_second=1000)
+
+        [stats] = collector.collect(now=datetime(2026, 1, 1, 12, tzinfo=timezone.utc))
+
+    annotations = {
+        call.kwargs["name"]: call.kwargs["body"]["metadata"]["annotations"][consts.SPARK_CONF_CONFIG_MAP_UNREFERENCED_ANNOTATION]
+        for call in core_api.patch_namespaced_config_map.call_args_list
+    }
+    assert annotations == {"conf-used": None, "conf-of-expired": "2026-01-01T12:00:00+00:00"}
+    [deleted] = core_api.delete_namespaced_config_map.call_args_list
+    assert deleted.kwargs["name"] == "conf-stale"
+    assert deleted.kwargs["body"].preconditions.resource_version == "1"
+    assert stats.config_maps == 1
+    assert core_api.list_namespaced_config_map.call_args.kwargs["label_selector"] == consts.SPARK_CONF_CONFIG_MAP_LABEL
@@ -0,0 +1,131 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import kubernetes
+from k8s_manipulators.client import SparkAppClient
+from k8s_manipulators.config_map import ConfExternalizer
+from k8s_objects.spark_app import SparkApp
+from utils import consts
+
+CONFIG_MAPS = "/api/v1/namespaces/spark/configmaps"
+
+
+class FakeKubernetesApi():
+    """Stores the created ConfigMaps by name, answers 409 to a second create."""
+
+    def __init__(self) -> None:
+        self.config_maps: dict[str, dict] = dict()
+        self.creates = 0
+        self.paths: list[str] = []
+
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                api.creates += 1
+                api.paths.append(self.path)
+                status = 409 if body["metadata"]["name"] in api.config_maps else 201
+                api.config_maps.setdefault(body["metadata"]["name"], body)
+                data = json.dumps(body if status == 201 else {"kind": "Status", "reason": "AlreadyExists", "code": 409}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def api_client(self) -> kubernetes.client.ApiClient:
+        configuration = kubernetes.client.Configuration()
+        configuration.host = "http://127.0.0.1:%s" % self.server.server_address[1]
+        return kubernetes.client.ApiClient(configuration)
+
+
+def conf_heavy_app(make_spark_app, name: str) -> SparkApp:
+    spark_conf = {"spark.hadoop.fs.s3a.opt%s" % i: str(i) for i in range(3)}
+    spark_conf.update({"spark.sql.opt%s" % i: str(i) for i in range(3)})
+    spark_conf.update({"spark.executor.memory": "4g", "spark.kubernetes.driver.label.team": "data", "spark.app.run": name})
+    return make_spark_app(name, spark_conf=spark_conf, hadoop_conf={"fs.defaultFS": "s3a://bucket", "fs.s3a.opt0": "0"})
+
+
+def test_conf_externalizer_shares_content_addressed_config_maps(make_spark_app):
+    api = FakeKubernetesApi()
+    externalizer = ConfExternalizer(api.api_client(), spark_defaults=True, min_entries=3, inline_prefixes=["spark.app."])
+
+    first, second = conf_heavy_app(make_spark_app, "etl-1"), conf_heavy_app(make_spark_app, "etl-2")
+    externalizer(spark_app=first)
+    spec = first.spec
+    assert spec.hadoop_conf is None
+    assert spec.spark_conf == {"spark.executor.memory": "4g", "spark.kubernetes.driver.label.team": "data", "spark.app.run": "etl-1"}
+    assert spec.hadoop_config_map.startswith("spark-app-creator-hadoop-conf-")
+    assert spec.spark_config_map.startswith("spark-app-creator-spark-conf-")
+
+    core_site = api.config_maps[spec.hadoop_config_map]
+    assert core_site["immutable"] is True
+    assert core_site["metadata"]["labels"][consts.SPARK_CONF_CONFIG_MAP_LABEL] == "hadoop-conf"
+    assert "<name>fs.s3a.opt2</name>" in core_site["data"]["core-site.xml"]
+    assert "<value>s3a://bucket</value>" in core_site["data"]["core-site.xml"]
+    assert api.config_maps[spec.spark_config_map]["data"]["spark-defaults.conf"] == "spark.sql.opt0 0\nspark.sql.opt1 1\nspark.sql.opt2 2\n"
+
+    # same blocks: same ConfigMaps, no further create from this process
+    externalizer(spark_app=second)
+    assert (second.spec.hadoop_config_map, second.spec.spark_config_map) == (spec.hadoop_config_map, spec.spark_config_map)
+    assert api.creates == 2
+
+    # another process creating them again gets a 409, which is fine
+    ConfExternalizer(api.api_client(), spark_defaults=True, min_entries=3)(spark_app=conf_heavy_app(make_spark_app, "etl-3"))
+    assert len(api.config_maps) == 2
+    api.server.shutdown()
+
+
+def test_conf_externalizer_keeps_small_and_conflicting_confs_inline(make_spark_app):
+    api = FakeKubernetesApi()
+    externalizer = ConfExternalizer(api.api_client(), min_entries=4)
+
+    app = conf_heavy_app(make_spark_app, "small")
+    app.spec.spark_conf["spark.hadoop.fs.defaultFS"] = "s3a://other"
+    externalizer(spark_app=app)
+    # fs.defaultFS is set twice with different values, only 3 movable entries are left
+    assert app.spec.hadoop_config_map is None
+    assert app.spec.hadoop_conf == {"fs.defaultFS": "s3a://bucket", "fs.s3a.opt0": "0"}
+    assert "spark.hadoop.fs.s3a.opt0" in app.spec.spark_conf
+    assert not api.config_maps
+    api.server.shutdown()
+
+
+def test_conf_externalizer_hook_gets_the_namespace_of_run_spark_app(make_spark_app):
+    api = FakeKubernetesApi()
+    app = conf_heavy_app(make_spark_app, "etl")
+    app.metadata.namespace = None
+    client = SparkAppClient(spark_app=app, hooks=[ConfExternalizer(api.api_client(), min_entries=3)], api_client=api.api_client())
+    created = []
+    client.launcher.create_spark_app = lambda namespace, spark_app: created.append(namespace) or spark_app.metadata.name
+    client.launcher.monitor_spark_app = lambda spark_app, resource_version=None: None
+    client.launcher.delete_spark_app = lambda spark_app: None
+
+    client.run_spark_app(namespace="spark")
+    assert created == ["spark"]
+    assert app.metadata.namespace == "spark"
+    assert app.spec.hadoop_config_map is not None
+    assert api.paths == [CONFIG_MAPS]
+    api.server.shutdown()
+
+
+def test_conf_externalizer_recreates_config_maps_deleted_since(make_spark_app):
+    api = FakeKubernetesApi()
+    externalizer = ConfExternalizer(api.api_client(), min_entries=3, recheck_seconds=0)
+
+    externalizer(spark_app=conf_heavy_app(make_spark_app, "etl-1"))
+    # deleted by the collector once no SparkApp referenced it
+    api.config_maps.clear()
+    app = conf_heavy_app(make_spark_app, "etl-2")
+    externalizer(spark_app=app)
+    assert list(api.config_maps) == [app.spec.hadoop_config_map]
+    assert api.creates == 2
+    api.server.shutdown()
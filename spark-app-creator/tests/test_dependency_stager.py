@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from k8s_objects.spark_app import SparkDependencies
+from metrics import MetricsRegistry
+from staging import DependencyStager, FileSystemBlobStore, S3BlobStore
+
+
+class FakeS3():
+    """Path-style PUT / HEAD and multipart uploads, keeps the Authorization headers it got."""
+
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = dict()
+        self.uploads: dict[str, dict[int, bytes]] = dict()
+        self.authorizations: list[str] = []
+
+        s3 = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, data: bytes = b"", headers: dict = None) -> None:
+                self.send_response(status)
+                for name, value in (headers or dict()).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            def _parse(self) -> tuple[str, dict, bytes]:
+                s3.authorizations.append(self.headers.get("Authorization"))
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                return url.path, parse_qs(url.query, keep_blank_values=True), self.rfile.read(length)
+
+            def do_HEAD(self):
+                path, _, _ = self._parse()
+                self._reply(200 if path in s3.objects else 404)
+
+            def do_PUT(self):
+                path, query, body = self._parse()
+                if "uploadId" in query:
+                    s3.uploads[query["uploadId"][0]][int(query["partNumber"][0])] = body
+                else:
+                    s3.objects[path] = body
+                self._reply(200, headers={"ETag": '"%s"' % hashlib.md5(body).hexdigest()})
+
+            def do_POST(self):
+                path, query, _ = self._parse()
+                if "uploads" in query:
+                    upload_id = "upload-%s" % len(s3.uploads)
+                    s3.uploads[upload_id] = dict()
+                    xml = '<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"><UploadId>%s</UploadId></InitiateMultipartUploadResult>'
+                    return self._reply(200, (xml % upload_id).encode())
+                parts = s3.uploads.pop(query["uploadId"][0])
+                s3.objects[path] = b"".join(parts[number] for number in sorted(parts))
+                self._reply(200, b"<CompleteMultipartUploadResult/>")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint_url = "http://127.0.0.1:%s" % self.server.server_address[1]
+
+
+def write(path: str, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_dependency_stager_uploads_missing_blobs_only(tmp_path, make_spark_app):
+    libs = write(tmp_path / "libs.zip", os.urandom(10_000))
+    main = write(tmp_path / "main.py", b"print('etl')\n")
+    store = FileSystemBlobStore(str(tmp_path / "store"), uri_prefix="local:///mnt/deps", chunk_size=1024)
+    metrics = MetricsRegistry()
+    stager = DependencyStager(store, metrics=metrics)
+
+    app = make_spark_app(
+        deps=SparkDependencies(py_files=[libs, "s3a://bucket/shared.zip"], jars=["local:///opt/spark/jars/x.jar"]),
+        main_application_file="file://" + main,
+    )
+    stager(spark_app=app)
+    digest = hashlib.sha256(open(libs, "rb").read()).hexdigest()
+    assert app.spec.deps.py_files == ["local:///mnt/deps/%s/libs.zip" % digest, "s3a://bucket/shared.zip"]
+    assert app.spec.deps.jars == ["local:///opt/spark/jars/x.jar"]
+    assert app.spec.main_application_file.endswith("/main.py") and app.spec.main_application_file.startswith("local:///mnt/deps/")
+    with open(tmp_path / "store" / digest / "libs.zip", "rb") as f:
+        assert f.read() == open(libs, "rb").read()
+
+    # unchanged artifacts, even through another stager: nothing uploaded
+    artifacts = DependencyStager(store).stage(make_spark_app(deps=SparkDependencies(py_files=[libs]), main_application_file=main).spec)
+    assert [artifact.uploaded for artifact in artifacts] == [False, False]
+
+    write(libs, os.urandom(10_000))
+    artifacts = stager.stage(make_spark_app(deps=SparkDependencies(py_files=[libs]), main_application_file=main).spec)
+    assert [artifact.uploaded for artifact in artifacts] == [True, False]
+    assert 'spark_app_creator_staged_bytes_total{result="uploaded"} 20013' in metrics.render()
+
+
+def test_dependency_stager_skips_missing_schemeless_paths_and_rechecks_the_store(tmp_path, make_spark_app, caplog):
+    libs = write(tmp_path / "libs.zip", b"libs")
+    store = FileSystemBlobStore(str(tmp_path / "store"))
+    stager = DependencyStager(store, present_ttl=0)
+
+    app = make_spark_app(deps=SparkDependencies(py_files=[libs, "/opt/shared/missing.zip"]), main_application_file="app/main.py")
+    with caplog.at_level(logging.WARNING):
+        artifacts = stager.stage(app.spec)
+    assert [artifact.uploaded for artifact in artifacts] == [True]
+    assert app.spec.deps.py_files[1] == "/opt/shared/missing.zip"
+    assert app.spec.main_application_file == "app/main.py"
+    assert "/opt/shared/missing.zip not found locally" in caplog.text
+
+    # blobs removed from the store behind the stager's back are uploaded again once the cache expired
+    shutil.rmtree(tmp_path / "store")
+    artifacts = stager.stage(make_spark_app(deps=SparkDependencies(py_files=[libs])).spec)
+    assert [artifact.uploaded for artifact in artifacts] == [True]
+    assert store.exists(artifacts[0].key)
+
+
+def test_s3_blob_store_multipart_upload(tmp_path, make_spark_app):
+    s3 = FakeS3()
+    data = os.urandom(2500)
+    libs = write(tmp_path / "libs.zip", data)
+    store = S3BlobStore(s3.endpoint_url, "deps", prefix="staging", access_key="key", secret_key="secret", chunk_size=1000)
+
+    app = make_spark_app(deps=SparkDependencies(py_files=[libs]), main_application_file="local:///app/main.py")
+    DependencyStager(store)(spark_app=app)
+    key = "%s/libs.zip" % hashlib.sha256(data).hexdigest()
+    assert app.spec.deps.py_files == ["s3a://deps/staging/%s" % key]
+    assert app.spec.main_application_file == "local:///app/main.py"
+    assert s3.objects["/deps/staging/%s" % key] == data
+    assert all(authorization.startswith("AWS4-HMAC-SHA256 Credential=key/") for authorization in s3.authorizations)
+
+    # HEAD, 1 create, 3 parts, 1 complete
+    assert len(s3.authorizations) == 6
+    assert store.exists(key) and not store.exists("missing/libs.zip")
+    s3.server.shutdown()
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from analytics import DynamicAllocationAdvisor
+from k8s_objects.spark_app import (ApplicationState, DynamicAllocation,
+                                   SparkAppStatus)
+
+STARTED_AT = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def observe(make_spark_app):
+    def observe(advisor, minutes, state, executors, min_executors=1, max_executors=200):
+        spark_app = make_spark_app(
+            dynamic_allocation=DynamicAllocation(enabled=True, min_executors=min_executors, max_executors=max_executors),
+            status=SparkAppStatus(application_state=ApplicationState(state=state), executor_state=executors),
+        )
+        advisor.observe(spark_app, observed_at=STARTED_AT + timedelta(minutes=minutes))
+    return observe
+
+
+def executors(state, ids):
+    return {str(executor_id): state for executor_id in ids}
+
+
+def test_static_app_ramp_up_is_not_churn(observe):
+    advisor = DynamicAllocationAdvisor()
+    observe(advisor, 0, "RUNNING", executors("RUNNING", range(1, 121)))
+    observe(advisor, 30, "COMPLETED", executors("COMPLETED", range(1, 121)))
+
+    run, = advisor.runs("etl")
+    assert (run.adds, run.removes) == (0, 0)
+    recommendation = advisor.recommend("etl")
+    assert recommendation.min_executors is None
+    assert recommendation.max_executors == 144
+
+
+def test_executors_added_back_after_removals_raise_min_executors(observe):
+    advisor = DynamicAllocationAdvisor()
+    observe(advisor, 0, "RUNNING", executors("RUNNING", range(1, 5)))
+    observe(advisor, 1, "RUNNING", {**executors("RUNNING", (1, 2)), **executors("COMPLETED", (3, 4))})
+    observe(advisor, 1.5, "RUNNING", {**executors("RUNNING", (1, 2, 5, 6)), **executors("COMPLETED", (3, 4))})
+    observe(advisor, 2, "RUNNING", {**executors("RUNNING", (1, 2)), **executors("COMPLETED", (3, 4, 5, 6))})
+    # a removal and its replacement in the same snapshot
+    observe(advisor, 2.5, "RUNNING", {**executors("RUNNING", (1, 7)), **executors("COMPLETED", (2, 3, 4, 5, 6))})
+    observe(advisor, 3, "COMPLETED", executors("COMPLETED", range(1, 8)))
+
+    run, = advisor.runs("etl")
+    assert (run.adds, run.removes) == (3, 5)
+    recommendation = advisor.recommend("etl")
+    assert recommendation.min_executors == 2
+    assert any("never fewer than 2 running" in reason for reason in recommendation.reasons)
+
+
+def test_saturated_runs_grow_max_executors(observe):
+    advisor = DynamicAllocationAdvisor(saturated_growth=2.0)
+    observe(advisor, 0, "RUNNING", executors("RUNNING", range(1, 5)), max_executors=4)
+    observe(advisor, 10, "COMPLETED", executors("COMPLETED", range(1, 5)), max_executors=4)
+
+    recommendation = advisor.recommend("etl")
+    assert recommendation.max_executors == 8
+    assert recommendation.min_executors is None
+
+
+def test_max_executors_stays_above_min_executors_and_runs_are_capped(observe):
+    advisor = DynamicAllocationAdvisor(max_runs_per_template=2)
+    for run in range(3):
+        observe(advisor, 10 * run, "RUNNING", executors("RUNNING", (1, 2)), min_executors=5, max_executors=50)
+        observe(advisor, 10 * run + 5, "COMPLETED", executors("COMPLETED", (1, 2)), min_executors=5, max_executors=50)
+
+    assert len(advisor.runs("etl")) == 2
+    recommendation = advisor.recommend("etl")
+    # a peak of 2 with headroom would give 3
+    assert recommendation.max_executors == 5
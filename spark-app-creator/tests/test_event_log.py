@@ -0,0 +1,74 @@
+import gzip
+import json
+
+from analytics import EventLogAnalyzer
+from k8s_objects.spark_app import SparkExecutorSpec
+from sizing import EventLogAdvisor, SizingBounds
+
+GIB = 1024 ** 3
+
+
+def task_end(stage_id: int, duration_ms: int, **metrics) -> dict:
+    return {
+        "Event": "SparkListenerTaskEnd", "Stage ID": stage_id, "Stage Attempt ID": 0,
+        "Task Info": {"Launch Time": 1000, "Finish Time": 1000 + duration_ms, "Failed": False},
+        "Task Metrics": {"Executor Run Time": duration_ms, **metrics},
+    }
+
+
+def write_event_log(path: str) -> None:
+    events = [
+        {"Event": "SparkListenerLogStart", "Spark Version": "3.5.0"},
+        {"Event": "SparkListenerApplicationStart", "App Name": "etl", "App ID": "spark-1", "Timestamp": 0},
+        {"Event": "SparkListenerEnvironmentUpdate", "Spark Properties": {"spark.sql.shuffle.partitions": "8", "spark.executor.memory": "4g"}},
+        {"Event": "SparkListenerExecutorAdded", "Executor ID": "1", "Timestamp": 0, "Executor Info": {"Total Cores": 2}},
+        {"Event": "SparkListenerExecutorAdded", "Executor ID": "2", "Timestamp": 0, "Executor Info": {"Total Cores": 2}},
+    ]
+    events += [task_end(0, 1000, **{"Input Metrics": {"Bytes Read": GIB}}) for _ in range(8)]
+    # stage 1 reads 4GiB of shuffle, one straggler, spills
+    events += [
+        task_end(1, 60000 if task == 0 else 2000, **{"JVM GC Time": 100, "Disk Bytes Spilled": GIB // 8,
+                                                     "Shuffle Read Metrics": {"Remote Bytes Read": GIB // 2}})
+        for task in range(8)
+    ]
+    events += [
+        {"Event": "SparkListenerStageCompleted", "Stage Info": {"Stage ID": 1, "Stage Attempt ID": 0, "Stage Name": "join at etl.py:12"}},
+        {"Event": "SparkListenerApplicationEnd", "Timestamp": 100000},
+    ]
+    with gzip.open(path, "wt") as f:
+        for event in events:
+            f.write(json.dumps(event, separators=(",", ":")) + "\n")
+        f.write('{"Event":"SparkListenerTaskEnd","Stage ID":')
+
+
+def test_event_log_analyzer_and_advisor(tmp_path, make_spark_app):
+    paths = [str(tmp_path / "spark-1.gz"), str(tmp_path / "spark-2.gz")]
+    for path in paths:
+        write_event_log(path)
+
+    summaries = EventLogAnalyzer(max_workers=2).analyze(paths)
+    summary = summaries[1]
+    assert [s.path for s in summaries] == paths
+    assert (summary.app_id, summary.peak_executors, summary.executor_cores, summary.executor_ms) == ("spark-1", 2, 2, 200000)
+    assert summary.skipped_lines == 1
+
+    stage = summary.stages[(1, 0)]
+    assert (stage.name, stage.tasks, stage.shuffle_read_bytes, stage.disk_spilled_bytes) == ("join at etl.py:12", 8, 4 * GIB, GIB)
+    assert stage.skew == 30
+
+    spark_app = make_spark_app(
+        "etl",
+        main_application_file="local:///app/etl.py",
+        spark_conf={"spark.sql.adaptive.enabled": "true"},
+        executor=SparkExecutorSpec(instances=4, cores=2, memory="4g"),
+    )
+    advisor = EventLogAdvisor(bounds=SizingBounds(min_instances=2))
+    recommendation = advisor.recommend(summary, spark_app)
+    assert recommendation.spark_conf == {"spark.sql.adaptive.skewJoin.enabled": "true", "spark.sql.shuffle.partitions": "32"}
+    # 82s of tasks over 400 core-seconds
+    assert recommendation.instances == 2
+    assert recommendation.memory is None
+
+    advisor.apply_recommendation(spark_app, recommendation)
+    assert spark_app.spec.spark_conf["spark.sql.shuffle.partitions"] == "32"
+    assert spark_app.spec.executor.instances == 2
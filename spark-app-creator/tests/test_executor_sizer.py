@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import pytest
+from history import SparkAppRun
+from k8s_objects.spark_app import DynamicAllocation, SparkExecutorSpec
+from sizing import ExecutorSizer, SizingBounds
+from utils.k8s_utils import format_memory_mb, parse_memory_mb
+
+
+class FakeHistory():
+    def __init__(self, runs):
+        self.runs = runs
+
+    def runs_for_template(self, template, since=None, until=None, limit=None):
+        return list(self.runs)
+
+
+def run(final_state, error_message=None, peak_executors=None, steady_executors=None):
+    return SparkAppRun(
+        namespace="spark", name="etl", template="etl", final_state=final_state, error_message=error_message,
+        peak_executors=peak_executors, steady_executors=steady_executors, executor_instances=10, executor_memory="4g", created_at=datetime.now(timezone.utc),
+    )
+
+
+@pytest.mark.parametrize("memory, memory_mb", [
+    ("1024", 1024), ("512m", 512), ("512MB", 512), ("4g", 4096), ("4Gi", 4096), ("1.5g", 1536),
+    ("1t", 1024 * 1024), ("2048k", 2), ("2048kb", 2), ("1b", 0), ("1048576b", 1), ("3145727b", 2), (None, None),
+])
+def test_parse_memory_mb(memory, memory_mb):
+    assert parse_memory_mb(memory) == memory_mb
+
+
+@pytest.mark.parametrize("memory", ["4x", "g", "4 gib", "-1g"])
+def test_parse_memory_mb_rejects_unknown_quantities(memory):
+    with pytest.raises(ValueError):
+        parse_memory_mb(memory)
+
+
+@pytest.mark.parametrize("memory_mb", [1, 384, 1024, 1536, 4096, 10 * 1024 + 1])
+def test_format_memory_mb_round_trips(memory_mb):
+    assert parse_memory_mb(format_memory_mb(memory_mb)) == memory_mb
+
+
+def test_executor_sizer_grows_memory_after_ooms_within_bounds(make_spark_app):
+    history = FakeHistory([run("FAILED", "java.lang.OutOfMemoryError: Java heap space")] * 3)
+    sizer = ExecutorSizer(history, bounds=SizingBounds(max_memory_mb=5 * 1024, max_memory_overhead_mb=512))
+
+    app = make_spark_app()
+    sizer(spark_app=app)
+    assert app.spec.executor.memory == "5g"
+    assert app.spec.executor.memory_overhead == "512m"
+
+
+def test_executor_sizer_caps_instances_to_the_peak_within_bounds(make_spark_app):
+    history = FakeHistory([run("COMPLETED", peak_executors=peak) for peak in (3, 4, 4)])
+    app = make_spark_app(executor=SparkExecutorSpec(instances=10, cores=2, memory="4g"))
+
+    recommendation = ExecutorSizer(history).recommend(app)
+    assert recommendation.instances == 5
+    assert recommendation.memory is None
+
+    ExecutorSizer(history, bounds=SizingBounds(min_instances=8))(spark_app=app)
+    assert app.spec.executor.instances == 8
+
+
+def test_executor_sizer_sets_min_executors_from_steady_executors(make_spark_app):
+    history = FakeHistory([run("COMPLETED", peak_executors=peak, steady_executors=steady) for peak, steady in ((20, 3), (12, 2), (25, 4))])
+    app = make_spark_app(dynamic_allocation=DynamicAllocation(enabled=True, min_executors=1, max_executors=100))
+
+    recommendation = ExecutorSizer(history).recommend(app)
+    # not the lowest peak, which the runs only reached while bursting
+    assert (recommendation.min_executors, recommendation.max_executors) == (2, 30)
+    assert ExecutorSizer(FakeHistory([run("COMPLETED", peak_executors=12)] * 3)).recommend(app).min_executors is None
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+import kubernetes
+from analytics import ExecutorStateAggregator, ExecutorStateTracker
+from k8s_manipulators.launcher import SparkAppLauncher
+from kubernetes.client.models import V1Pod, V1PodStatus
+
+OBSERVED_AT = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def test_snapshot_only_touches_changed_executors():
+    tracker = ExecutorStateTracker()
+    assert tracker.update({"1": "RUNNING", "2": "PENDING", "exec-a": "RUNNING"}, observed_at=OBSERVED_AT) == 3
+    assert tracker.update({"1": "RUNNING", "2": "RUNNING", "exec-a": "RUNNING"}, observed_at=OBSERVED_AT + timedelta(minutes=1)) == 1
+
+    assert len(tracker) == 3
+    assert tracker.running == 3
+    assert tracker.state_of("exec-a") == "RUNNING"
+    assert tracker.state_of("3") is None
+    assert [running for _, running in tracker.running_over_time()] == [2, 3]
+
+
+def test_deltas_move_counts_between_states():
+    tracker = ExecutorStateTracker()
+    tracker.apply_delta("1", "RUNNING")
+    tracker.apply_delta("2", "RUNNING")
+    assert tracker.apply_delta("2", "RUNNING") == 0
+    assert tracker.apply_delta("2", "FAILED") == 1
+
+    assert tracker.counts_by_state()["RUNNING"] == 1
+    assert tracker.count("FAILED") == 1
+    assert tracker.apply_delta("3", "not-a-state") == 1
+    assert tracker.count("UNKNOWN") == 1
+
+
+def test_executors_missing_from_a_snapshot_are_retired():
+    tracker = ExecutorStateTracker()
+    tracker.update({"1": "RUNNING", "2": "RUNNING", "exec-a": "RUNNING"}, observed_at=OBSERVED_AT)
+    assert tracker.update({"1": "RUNNING"}, observed_at=OBSERVED_AT + timedelta(minutes=1)) == 2
+
+    assert len(tracker) == 1
+    assert tracker.running == 1
+    assert tracker.state_of("2") is None and tracker.state_of("exec-a") is None
+    assert tracker.executor_seconds(until=OBSERVED_AT + timedelta(minutes=2)) == 3 * 60 + 60
+
+    # no snapshot leaves the executors as they are
+    assert tracker.update(None) == 0
+    assert tracker.running == 1
+
+
+def test_aggregator_forgets_finished_apps(make_spark_app):
+    aggregator = ExecutorStateAggregator()
+    spark_app = make_spark_app(state="RUNNING")
+    spark_app.status.executor_state = {"1": "RUNNING"}
+    aggregator.observe(spark_app)
+    assert aggregator.tracker("spark", "etl").running == 1
+
+    aggregator.forget("spark", "etl")
+    assert aggregator.tracker("spark", "etl").running == 0
+
+
+def test_aggregator_keeps_the_least_recently_used_finished_apps():
+    aggregator = ExecutorStateAggregator(max_finished=2)
+    for name in ("a", "b", "c", "running"):
+        aggregator.update("spark", name, {"1": "RUNNING"})
+    aggregator.finish("spark", "a")
+    aggregator.finish("spark", "b")
+    # read after it finished: b is evicted first
+    assert aggregator.tracker("spark", "a").running == 1
+
+    aggregator.finish("spark", "c")
+    assert sorted(name for _, name in aggregator._trackers) == ["a", "c", "running"]
+
+
+class PendingDriverApi():
+    def read_namespaced_pod(self, name, namespace):
+        return V1Pod(status=V1PodStatus(phase="Pending"))
+
+
+def test_launcher_keeps_executor_states_past_terminal_state(make_spark_app):
+    aggregator = ExecutorStateAggregator()
+    seen = []
+    launcher = SparkAppLauncher(
+        kubernetes.client.ApiClient(), executor_state_aggregator=aggregator,
+        listeners=[lambda spark_app: seen.append(aggregator.tracker("spark", "etl").running)],
+    )
+    launcher.core_v1_api = PendingDriverApi()
+
+    def monitor_spark_app_state(spark_app, resource_version=None):
+        for state in ("RUNNING", "COMPLETED"):
+            aggregator.update("spark", "etl", {"1": "RUNNING"} if state == "RUNNING" else {"1": "COMPLETED"})
+            yield make_spark_app(state=state)
+    launcher._monitor_spark_app_state = monitor_spark_app_state
+
+    launcher.monitor_spark_app(make_spark_app())
+    assert seen == [1, 0]
+    # the time series of the finished run can still be read
+    assert aggregator.tracker("spark", "etl").running == 0
+    assert list(aggregator._finished) == [("spark", "etl")]
@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta, timezone
+
+import kubernetes
+import pytest
+from history import RunHistoryStore, SubmissionJournal
+from k8s_manipulators.client import SparkAppClient
+from k8s_manipulators.index import stamp_spec_hash
+from k8s_manipulators.launcher import SparkAppLauncher
+from k8s_objects.spark_app import (ApplicationState, SparkApp, SparkAppStatus,
+                                   SparkExecutorSpec)
+from kubernetes.client.rest import ApiException
+
+
+@pytest.fixture
+def pi_run(make_spark_app):
+    def _pi_run(state: str, executor_state: dict[str, str] = None, error_message: str = None) -> SparkApp:
+        return make_spark_app(
+            "pi",
+            labels={"spark-app-creator/template": "pi-template"},
+            creation_timestamp=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            executor=SparkExecutorSpec(instances=4, cores=2, memory="4g"),
+            status=SparkAppStatus(
+                application_state=ApplicationState(state=state, error_message=error_message),
+                executor_state=executor_state,
+                last_submission_attempt_time=datetime(2026, 1, 1, 0, 1, tzinfo=timezone.utc),
+            ),
+        )
+    return _pi_run
+
+
+def test_history_store_records_finished_run(tmp_path, pi_run):
+    store = RunHistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+
+    store.observe(spark_app=pi_run("SUBMITTED"))
+    store.observe(spark_app=pi_run("RUNNING", executor_state={"1": "RUNNING", "2": "RUNNING", "3": "PENDING"}))
+    store.observe(spark_app=pi_run("RUNNING", executor_state={"1": "RUNNING"}))
+    store.observe(spark_app=pi_run("FAILED", error_message="java.lang.OutOfMemoryError"))
+    store.flush()
+
+    runs = store.runs_for_template("pi-template", since=datetime(2026, 1, 1, tzinfo=timezone.utc))
+    assert len(runs) == 1
+    assert runs[0].final_state == "FAILED"
+    assert runs[0].peak_executors == 2
+    assert runs[0].executor_instances == 4
+    assert runs[0].error_message == "java.lang.OutOfMemoryError"
+    assert [state for state, _ in store.transitions(runs[0].id)] == ["SUBMITTED", "RUNNING", "FAILED"]
+
+    assert store.runs_for_template("pi-template", until=datetime(2026, 1, 1, tzinfo=timezone.utc)) == []
+    store.close()
+
+
+def test_history_store_records_the_executors_a_run_spent_most_time_with(tmp_path, make_spark_app):
+    store = RunHistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+    started_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for minutes, state, running in ((0, "RUNNING", 2), (1, "RUNNING", 10), (2, "RUNNING", 2), (10, "COMPLETED", 0)):
+        spark_app = make_spark_app(state=state)
+        spark_app.status.executor_state = {str(executor_id): "RUNNING" for executor_id in range(running)}
+        store.observe(spark_app=spark_app, observed_at=started_at + timedelta(minutes=minutes))
+    store.flush()
+
+    run, = store.runs_between()
+    assert (run.peak_executors, run.steady_executors) == (10, 2)
+    store.close()
+
+
+def test_history_store_drops_in_flight_runs_after_the_ttl_or_forgotten(tmp_path, make_spark_app):
+    store = RunHistoryStore(str(tmp_path / "history.db"), flush_interval=0.01, in_flight_ttl=timedelta(hours=1))
+    started_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def observe(name, state, minutes):
+        store.observe(spark_app=make_spark_app(name, state=state), observed_at=started_at + timedelta(minutes=minutes))
+
+    observe("deleted", "RUNNING", 0)
+    observe("forgotten", "RUNNING", 0)
+    store.forget("spark", "forgotten")
+    assert store.in_flight() == 1
+
+    observe("alive", "RUNNING", 50)
+    observe("alive", "RUNNING", 90)
+    assert store.in_flight() == 1
+    observe("alive", "COMPLETED", 100)
+    store.flush()
+    assert store.in_flight() == 0
+    assert [run.name for run in store.runs_between()] == ["alive"]
+    store.close()
+
+
+def test_submission_journal_survives_restart(tmp_path, pi_run):
+    path = str(tmp_path / "journal.jsonl")
+    journal = SubmissionJournal(path, fsync=False)
+    journal.record_submitting("spark", "pi")
+    journal.record_created("spark", "pi")
+    journal.observe(spark_app=pi_run("RUNNING"))
+    journal.record_submitting("spark", "done")
+    journal.record_created("spark", "done")
+    journal.record_finished("spark", "done", state="COMPLETED")
+    journal.close()
+
+    with open(path, "a") as f:
+        f.write('{"op":"submitting","namespace":"spa')
+
+    reopened = SubmissionJournal(path, fsync=False)
+    [entry] = reopened.in_flight()
+    assert (entry.namespace, entry.name, entry.state, entry.created) == ("spark", "pi", "RUNNING", True)
+
+    reopened.record_finished("spark", "pi")
+    reopened.close()
+    assert SubmissionJournal(path).in_flight() == []
+
+
+def test_reattached_clients_resume_from_the_journaled_resource_version(tmp_path, make_spark_app, monkeypatch):
+    journal = SubmissionJournal(str(tmp_path / "journal.jsonl"), fsync=False)
+    for name, state in (("pi", "RUNNING"), ("done", "COMPLETED")):
+        journal.record_submitting("spark", name)
+        journal.record_created("spark", name)
+        journal.observe(spark_app=make_spark_app(name, resource_version="42", state=state))
+    monkeypatch.setattr(SparkAppLauncher, "get_spark_app", lambda self, namespace, name: make_spark_app(name, resource_version="50"))
+
+    clients = SparkAppClient.reattach_in_flight(journal, api_client=kubernetes.client.ApiClient())
+    # no event follows a terminal state, that one starts from the current state
+    assert {client.spark_app.metadata.name: client.resume_resource_version for client in clients} == {"pi": "42", "done": None}
+    journal.close()
+
+
+
+def test_launcher_resumes_the_watch_until_the_resource_version_is_gone(make_spark_app, monkeypatch):
+    completed = {
+        "metadata": {"name": "pi", "namespace": "spark"},
+        "spec": {
+            "sparkVersion": "3.5.0", "mainApplicationFile": "local:///app/main.py", "image": "spark:3.5.0",
+            "driver": {"cores": 1, "memory": "1g"}, "executor": {"instances": 1, "cores": 1, "memory": "1g"},
+        },
+        "status": {"applicationState": {"state": "COMPLETED"}},
+    }
+    streams = []
+
+    class FakeWatch():
+        def stream(self, func, **kwargs):
+            streams.append(kwargs.get("resource_version"))
+            if len(streams) == 1:
+                raise ApiException(status=410, reason="Gone")
+            yield {"type": "MODIFIED", "object": completed}
+
+    monkeypatch.setattr(kubernetes.watch, "Watch", FakeWatch)
+    launcher = SparkAppLauncher(kubernetes.client.ApiClient())
+    [spark_app] = launcher._monitor_spark_app_state(make_spark_app("pi"), resource_version="42")
+    assert spark_app.status.application_state.state == "COMPLETED"
+    assert streams == ["42", None]
+
+
+def conflicting_client(journal, make_spark_app, existing: SparkApp) -> tuple[SparkAppClient, list]:
+    """Client whose create gets a 409 because `existing` already has its name."""
+    def create_spark_app(namespace, spark_app):
+        stamp_spec_hash(spark_app)
+        raise ApiException(status=409, reason="AlreadyExists")
+
+    stamp_spec_hash(existing)
+    client = SparkAppClient(spark_app=make_spark_app("pi"), journal=journal, api_client=kubernetes.client.ApiClient())
+    monitored = []
+    client.launcher.create_spark_app = create_spark_app
+    client.launcher.get_spark_app = lambda namespace, name: existing
+    client.launcher.monitor_spark_app = lambda spark_app, resource_version: monitored.append(spark_app.metadata.name)
+    client.launcher.delete_spark_app = lambda spark_app: None
+    return client, monitored
+
+
+def test_conflicting_create_reattaches_to_the_same_spec_only(tmp_path, make_spark_app):
+    journal = SubmissionJournal(str(tmp_path / "journal.jsonl"), fsync=False)
+
+    # an earlier attempt created it but its response was lost
+    client, monitored = conflicting_client(journal, make_spark_app, make_spark_app("pi"))
+    client.run_spark_app()
+    assert monitored == ["pi"] and client.submitted
+    assert journal.entry("spark", "pi").created
+
+    client, monitored = conflicting_client(journal, make_spark_app, make_spark_app("pi", image="spark:3.4.0"))
+    with pytest.raises(ApiException):
+        client.run_spark_app()
+    assert monitored == []
+    entry = journal.entry("spark", "pi")
+    assert entry.finished and not entry.created
+    journal.close()
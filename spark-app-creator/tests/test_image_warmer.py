@@ -0,0 +1,151 @@
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import kubernetes
+from k8s_manipulators.warmer import ImageWarmer
+from utils import consts
+
+DAEMON_SETS = "/apis/apps/v1/namespaces/spark/daemonsets"
+NOW = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def pulled_event(pod: str, node: str, message: str, count: int = 1, namespace: str = "spark") -> dict:
+    return {
+        "metadata": {"name": "%s.1" % pod, "namespace": namespace},
+        "involvedObject": {"kind": "Pod", "name": pod, "namespace": namespace},
+        "source": {"component": "kubelet", "host": node},
+        "reason": "Pulled", "message": message, "count": count, "lastTimestamp": NOW,
+    }
+
+
+class FakeKubernetesApi():
+    """Answers the few API calls of the warmer, stores DaemonSets by name."""
+
+    def __init__(self) -> None:
+        self.daemon_sets: dict[str, dict] = dict()
+        self.warmer_events: list[dict] = []
+        self.calls: list[tuple[str, str]] = []
+        self.spark_apps = [
+            {"metadata": {"name": "etl", "creationTimestamp": NOW}, "spec": {"image": "spark:3.5.0", "executor": {"image": "spark-gpu:3.5.0"}}},
+            {"metadata": {"name": "pi", "creationTimestamp": NOW}, "spec": {"image": "spark:3.5.0"}},
+            {"metadata": {"name": "old", "creationTimestamp": "2020-01-01T00:00:00Z"}, "spec": {"image": "spark:2.4.8"}},
+        ]
+        self.events = [
+            pulled_event("spark-image-warmer-abc", "node-1", 'Successfully pulled image "spark:3.5.0" in 1m0.5s (1m0.5s including waiting)'),
+            pulled_event("spark-image-warmer-def", "node-2", 'Container image "spark:3.5.0" already present on machine'),
+            pulled_event("etl-driver", "node-3", 'Successfully pulled image "spark:3.5.0" in 40s'),
+            pulled_event("pi-driver", "node-1", 'Container image "spark:3.5.0" already present on machine'),
+            pulled_event("pi-8c3e-exec-1", "node-1", 'Container image "spark:3.5.0" already present on machine', count=2),
+            # the warmer did not pull it there
+            pulled_event("pi-8c3e-exec-2", "node-2", 'Container image "spark:3.5.0" already present on machine'),
+            pulled_event("etl-8c3e-exec-1", "node-3", 'Container image "spark:3.5.0" already present on machine'),
+            pulled_event("unrelated", "node-1", 'Container image "spark:3.5.0" already present on machine'),
+        ]
+
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> dict:
+                return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+            def _handle(self, method: str) -> None:
+                path = urlparse(self.path).path
+                api.calls.append((method, path))
+                name = path[len(DAEMON_SETS) + 1:] if path.startswith(DAEMON_SETS + "/") else None
+
+                if path == "/apis/sparkoperator.k8s.io/v1beta2/namespaces/spark/sparkapplications":
+                    return self._reply(200, {"items": api.spark_apps, "metadata": {}})
+                if path == "/api/v1/namespaces/spark/events":
+                    return self._reply(200, {"kind": "EventList", "items": api.events, "metadata": {}})
+                if path == "/api/v1/namespaces/warmers/events":
+                    return self._reply(200, {"kind": "EventList", "items": api.warmer_events, "metadata": {}})
+                if path == "/api/v1/namespaces/spark/pods" and method == "DELETE":
+                    return self._reply(200, {"kind": "PodList", "items": [], "metadata": {}})
+                if path == DAEMON_SETS and method == "POST":
+                    body = self._body()
+                    body["metadata"]["resourceVersion"] = "1"
+                    api.daemon_sets[body["metadata"]["name"]] = body
+                    return self._reply(201, body)
+                if name is not None and method == "GET" and name in api.daemon_sets:
+                    return self._reply(200, api.daemon_sets[name])
+                if name is not None and method == "PUT":
+                    api.daemon_sets[name] = self._body()
+                    return self._reply(200, api.daemon_sets[name])
+                if name is not None and method == "DELETE" and name in api.daemon_sets:
+                    del api.daemon_sets[name]
+                    return self._reply(200, {"kind": "Status", "status": "Success"})
+                self._reply(404, {"kind": "Status", "status": "Failure", "reason": "NotFound", "code": 404})
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def api_client(self) -> kubernetes.client.ApiClient:
+        configuration = kubernetes.client.Configuration()
+        configuration.host = "http://127.0.0.1:%s" % self.server.server_address[1]
+        return kubernetes.client.ApiClient(configuration)
+
+
+def test_image_warmer_manages_daemon_set_and_reports_savings():
+    api = FakeKubernetesApi()
+    warmer = ImageWarmer(api.api_client(), namespace="spark", node_selector={"pool": "spark"})
+
+    images = warmer.images_to_warm(namespaces=["spark"])
+    assert images == ["spark:3.5.0", "spark-gpu:3.5.0"]
+
+    assert warmer.warm(images)
+    daemon_set = api.daemon_sets["spark-image-warmer"]
+    pod_spec = daemon_set["spec"]["template"]["spec"]
+    assert [container["image"] for container in pod_spec["initContainers"]] == ["spark-gpu:3.5.0", "spark:3.5.0"]
+    assert pod_spec["nodeSelector"] == {"pool": "spark"}
+    assert daemon_set["metadata"]["labels"][consts.SPARK_APP_MANAGED_BY_LABEL] == consts.SPARK_APP_MANAGED_BY
+
+    assert not warmer.warm(list(reversed(images)))
+    assert warmer.warm(["spark:3.5.0"])
+    assert len(api.daemon_sets["spark-image-warmer"]["spec"]["template"]["spec"]["initContainers"]) == 1
+
+    report = warmer.startup_savings("spark")
+    stats = report.images["spark:3.5.0"]
+    assert (stats.pull_seconds, stats.warm_starts) == ([60.5, 40.0], 3)
+    assert report.saved_seconds == 3 * 60.5
+
+    warmer.cleanup()
+    assert not api.daemon_sets
+    assert ("DELETE", "/api/v1/namespaces/spark/pods") in api.calls
+    api.server.shutdown()
+
+
+def test_image_warmer_reads_warmer_pulls_from_its_own_namespace():
+    api = FakeKubernetesApi()
+    # the warmer pods live in another namespace than the Spark pods
+    api.warmer_events = [api.events.pop(0) | {"involvedObject": {"kind": "Pod", "name": "spark-image-warmer-abc", "namespace": "warmers"}}]
+    warmer = ImageWarmer(api.api_client(), namespace="warmers")
+
+    stats = warmer.startup_savings("spark").images["spark:3.5.0"]
+    assert (sorted(stats.pull_seconds), stats.warm_starts) == ([40.0, 60.5], 3)
+    api.server.shutdown()
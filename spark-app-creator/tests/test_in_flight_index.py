@@ -0,0 +1,128 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import kubernetes
+from k8s_manipulators.client import SparkAppClient
+from k8s_manipulators.index import InFlightIndex
+from k8s_manipulators.launcher import SparkAppLauncher
+from utils import consts
+from utils.k8s_utils import compute_spec_hash
+
+SPARK_APPS = "/apis/sparkoperator.k8s.io/v1beta2/namespaces/spark/sparkapplications"
+
+
+class FakeKubernetesApi():
+    """Stores the created SparkApps by name, LIST filters on a single label."""
+
+    def __init__(self) -> None:
+        self.spark_apps: dict[str, dict] = dict()
+        self.calls: list[str] = []
+
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                api.calls.append("create")
+                api.spark_apps[body["metadata"]["name"]] = body
+                self._reply(201, body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == SPARK_APPS:
+                    api.calls.append("list")
+                    key, value = parse_qs(url.query)["labelSelector"][0].split("=")
+                    items = [app for app in api.spark_apps.values() if app["metadata"].get("labels", dict()).get(key) == value]
+                    return self._reply(200, {"items": items, "metadata": {}})
+                api.calls.append("get")
+                name = url.path[len(SPARK_APPS) + 1:]
+                if name in api.spark_apps:
+                    return self._reply(200, api.spark_apps[name])
+                self._reply(404, {"kind": "Status", "status": "Failure", "reason": "NotFound", "code": 404})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def api_client(self) -> kubernetes.client.ApiClient:
+        configuration = kubernetes.client.Configuration()
+        configuration.host = "http://127.0.0.1:%s" % self.server.server_address[1]
+        return kubernetes.client.ApiClient(configuration)
+
+
+def test_compute_spec_hash_is_canonical(make_spark_app):
+    reference = compute_spec_hash(make_spark_app("a", spark_conf={"x": "1", "y": "2"}).spec)
+    assert compute_spec_hash(make_spark_app("b", spark_conf={"y": "2", "x": "1"}).spec) == reference
+    assert compute_spec_hash(make_spark_app("c").spec) == compute_spec_hash(make_spark_app("d", spark_conf={}, arguments=[]).spec)
+    assert compute_spec_hash(make_spark_app("e", spark_conf={"x": "1", "y": "3"}).spec) != reference
+    assert compute_spec_hash(make_spark_app("f", arguments=["1", "2"]).spec) != compute_spec_hash(make_spark_app("g", arguments=["2", "1"]).spec)
+
+
+def test_create_spark_app_attaches_to_identical_run(make_spark_app):
+    api = FakeKubernetesApi()
+    index = InFlightIndex(api.api_client())
+    launcher = SparkAppLauncher(api.api_client(), in_flight_index=index)
+
+    first = make_spark_app("etl-1", spark_conf={"spark.sql.shuffle.partitions": "64"})
+    assert launcher.create_spark_app("spark", first) == "etl-1"
+    spec_hash = first.metadata.annotations[consts.SPARK_APP_SPEC_HASH_ANNOTATION]
+    assert api.spark_apps["etl-1"]["metadata"]["labels"][consts.SPARK_APP_SPEC_HASH_LABEL] == spec_hash[:63]
+
+    # retried submission: found in the local index, checked with a GET
+    api.calls.clear()
+    assert launcher.create_spark_app("spark", make_spark_app("etl-2", spark_conf={"spark.sql.shuffle.partitions": "64"})) == "etl-1"
+    assert api.calls == ["get"]
+    assert launcher.create_spark_app("spark", make_spark_app("etl-3", spark_conf={"spark.sql.shuffle.partitions": "128"})) == "etl-3"
+
+    # another process finds it with a LIST
+    other = SparkAppLauncher(api.api_client(), in_flight_index=InFlightIndex(api.api_client()))
+    assert other.create_spark_app("spark", make_spark_app("etl-4", spark_conf={"spark.sql.shuffle.partitions": "64"})) == "etl-1"
+
+    # finished runs are no longer attached to
+    api.spark_apps["etl-1"]["status"] = {"applicationState": {"state": "COMPLETED"}}
+    assert other.create_spark_app("spark", make_spark_app("etl-5", spark_conf={"spark.sql.shuffle.partitions": "64"})) == "etl-5"
+    assert launcher.create_spark_app("spark", make_spark_app("etl-6", spark_conf={"spark.sql.shuffle.partitions": "64"})) == "etl-5"
+    assert sorted(api.spark_apps) == ["etl-1", "etl-3", "etl-5"]
+    api.server.shutdown()
+
+
+def test_attached_clients_clean_up_runs_of_other_processes_only(make_spark_app):
+    api = FakeKubernetesApi()
+    index = InFlightIndex(api.api_client())
+    deleted = []
+
+    def client(name):
+        spark_app_client = SparkAppClient(spark_app=make_spark_app(name), in_flight_index=index, api_client=api.api_client())
+        spark_app_client.launcher.monitor_spark_app = lambda spark_app, resource_version=None: None
+        spark_app_client.launcher.delete_spark_app = lambda spark_app: deleted.append(spark_app.metadata.name)
+        return spark_app_client
+
+    # created by another process, found through a LIST: its owner may be gone
+    SparkAppLauncher(api.api_client(), in_flight_index=InFlightIndex(api.api_client())).create_spark_app("spark", make_spark_app("etl-1"))
+    adopting = client("etl-2")
+    adopting.run_spark_app(namespace="spark")
+    assert (adopting.attached, adopting.adopted) == (True, True)
+    assert deleted == ["etl-1"]
+
+    # created from this process: left to its own client
+    api.spark_apps.clear()
+    owner = client("etl-3")
+    owner.launcher.create_spark_app("spark", owner.spark_app)
+    owner.submitted = True
+    attached = client("etl-4")
+    attached.run_spark_app(namespace="spark")
+    assert (attached.attached, attached.adopted) == (True, False)
+    assert deleted == ["etl-1"]
+    api.server.shutdown()
@@ -0,0 +1,65 @@
+import logging
+
+from k8s_objects.spark_app import SparkExecutorSpec
+from sizing import InputSizer, InputSizingRules, LocalFileSystemStatter
+
+MIB = 1024 * 1024
+
+
+def write_input(tmp_path):
+    for partition in range(3):
+        directory = tmp_path / "input" / ("day=%s" % partition)
+        directory.mkdir(parents=True)
+        for part in range(2):
+            (directory / ("part-%s.parquet" % part)).write_bytes(b"x" * MIB)
+        (directory / "_SUCCESS").write_bytes(b"")
+    return str(tmp_path / "input")
+
+
+def sizer(override=False, cap_instances=True):
+    rules = InputSizingRules(bytes_per_executor=2 * MIB, target_shuffle_partition_bytes=MIB, min_shuffle_partitions=1, min_max_partition_bytes=1)
+    return InputSizer(rules=rules, override=override, cap_instances=cap_instances)
+
+
+def test_local_statter_sizes_directories_and_reports_missing_paths(tmp_path):
+    statter = LocalFileSystemStatter()
+    stats = statter.stat("file://" + write_input(tmp_path))
+    assert (stats.total_bytes, stats.file_count) == (6 * MIB, 6)
+    assert statter.stat(str(tmp_path / "missing")) is None
+
+
+def test_input_sizer_fills_unset_values_only(tmp_path, make_spark_app):
+    path = write_input(tmp_path)
+    app = make_spark_app(
+        arguments=["--input", path], executor=SparkExecutorSpec(cores=2, memory="4g"),
+        spark_conf={"spark.sql.shuffle.partitions": "200"},
+    )
+    sizer()(spark_app=app)
+    assert app.spec.executor.instances == 3
+    assert app.spec.spark_conf == {"spark.sql.shuffle.partitions": "200", "spark.sql.files.maxPartitionBytes": str(MIB)}
+
+    # instances set in the spec are kept too, unless overridden
+    app = make_spark_app(arguments=["--input=" + path])
+    sizer()(spark_app=app)
+    assert app.spec.executor.instances == 2
+    sizer(override=True)(spark_app=app)
+    assert app.spec.executor.instances == 3
+    assert app.spec.spark_conf["spark.sql.shuffle.partitions"] == "6"
+
+
+def test_input_sizer_caps_explicit_instances_to_the_input(tmp_path, make_spark_app):
+    path = write_input(tmp_path)
+    app = make_spark_app(arguments=["--input", path], executor=SparkExecutorSpec(instances=10, cores=2, memory="4g"))
+    sizer(cap_instances=False)(spark_app=app)
+    assert app.spec.executor.instances == 10
+    sizer()(spark_app=app)
+    assert app.spec.executor.instances == 3
+
+
+def test_input_sizer_leaves_the_spec_alone_for_missing_inputs(tmp_path, make_spark_app, caplog):
+    app = make_spark_app(arguments=["--input", write_input(tmp_path), "--input-path", str(tmp_path / "missing")])
+    with caplog.at_level(logging.WARNING):
+        sizer(override=True)(spark_app=app)
+    assert app.spec.executor.instances == 2
+    assert app.spec.spark_conf is None
+    assert "missing not found, skipping input sizing" in caplog.text
@@ -0,0 +1,72 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from analytics import LifecycleAnalyzer, SparkAppTimeline, compare_summaries
+from k8s_objects.spark_app import ApplicationState, SparkAppStatus
+
+CREATED_AT = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def observe(analyzer, spark_app, state, minutes):
+    spark_app.status = SparkAppStatus(
+        application_state=ApplicationState(state=state), last_submission_attempt_time=CREATED_AT + timedelta(minutes=1),
+    )
+    return analyzer.observe(spark_app, observed_at=CREATED_AT + timedelta(minutes=minutes))
+
+
+def test_summary_percentiles_per_group(make_spark_app):
+    analyzer = LifecycleAnalyzer()
+    for index, run_minutes in enumerate((10, 20, 30, 40)):
+        spark_app = make_spark_app("etl-%s" % index, labels={"spark-app-creator/template": "etl"}, creation_timestamp=CREATED_AT)
+        assert observe(analyzer, spark_app, "RUNNING", 3) is None
+        timeline = observe(analyzer, spark_app, "COMPLETED", 3 + run_minutes)
+        assert (timeline.queueing_seconds, timeline.startup_seconds, timeline.run_seconds) == (60, 120, run_minutes * 60)
+    # never reached RUNNING: no startup nor run duration
+    analyzer.add_timeline(SparkAppTimeline(
+        "spark", "etl-failed", "etl", created_at=CREATED_AT, submitted_at=CREATED_AT, terminated_at=CREATED_AT, final_state="SUBMISSION_FAILED",
+    ))
+
+    summary = analyzer.summary()
+    etl = summary[("spark", "etl")]
+    assert etl["count"] == 5
+    assert etl["run"][50] == 25 * 60
+    assert etl["run"][95] == pytest.approx(38.5 * 60)
+    assert etl["queueing"][50] == 60
+
+    by_state = analyzer.summary(group_by=("final_state",))
+    assert by_state[("COMPLETED",)]["count"] == 4
+    assert math.isnan(by_state[("SUBMISSION_FAILED",)]["run"][50])
+    with pytest.raises(ValueError):
+        analyzer.summary(group_by=("name",))
+
+    slower = {("spark", "etl"): {**etl, "run": {95: etl["run"][95] * 2}}}
+    regression, = compare_summaries(summary, slower)
+    assert (regression["duration"], regression["ratio"]) == ("run", 2)
+
+
+def test_in_flight_timelines_are_dropped_after_the_ttl_or_forgotten(make_spark_app):
+    analyzer = LifecycleAnalyzer(in_flight_ttl=timedelta(hours=1))
+    observe(analyzer, make_spark_app("deleted"), "RUNNING", 0)
+    observe(analyzer, make_spark_app("forgotten"), "RUNNING", 0)
+    analyzer.forget("spark", "forgotten")
+    assert analyzer.in_flight() == 1
+
+    alive = make_spark_app("alive")
+    observe(analyzer, alive, "RUNNING", 50)
+    observe(analyzer, alive, "RUNNING", 90)
+    assert analyzer.in_flight() == 1
+    assert observe(analyzer, alive, "COMPLETED", 100) is not None
+    assert analyzer.in_flight() == 0 and len(analyzer) == 1
+
+
+def test_summary_groups_missing_values_apart():
+    analyzer = LifecycleAnalyzer()
+    analyzer.add_timeline(SparkAppTimeline("spark", "etl-1", "etl", created_at=CREATED_AT, final_state="COMPLETED"))
+    analyzer.add_timeline(SparkAppTimeline("spark", "etl-2", "etl", created_at=CREATED_AT))
+    analyzer.add_timeline(SparkAppTimeline("spark", "adhoc", None, created_at=CREATED_AT, final_state="FAILED"))
+
+    assert {group: stats["count"] for group, stats in analyzer.summary(group_by=("final_state",)).items()} == {
+        (None,): 1, ("COMPLETED",): 1, ("FAILED",): 1,
+    }
+    assert list(analyzer.summary()) == [("spark", None), ("spark", "etl")]
@@ -0,0 +1,51 @@
+from unittest import mock
+
+from k8s_manipulators.launcher import PodLogFollower
+from k8s_manipulators.launcher.log_follower import parse_log_timestamp
+from urllib3.exceptions import ProtocolError
+
+
+class FakeLogResponse():
+    def __init__(self, lines: list[bytes], error: Exception = None) -> None:
+        self.lines = lines
+        self.error = error
+
+
+    def __iter__(self):
+        yield from self.lines
+        if self.error is not None:
+            raise self.error
+
+
+    def release_conn(self) -> None:
+        pass
+
+
+def test_parse_log_timestamp_orders_trimmed_fractions():
+    assert parse_log_timestamp(b"2026-01-01T00:00:01.5Z") > parse_log_timestamp(b"2026-01-01T00:00:01.123456789Z")
+    assert parse_log_timestamp(b"2026-01-01T00:00:01Z") == ("2026-01-01T00:00:01", 0)
+
+
+def test_log_follower_resumes_without_loss_or_duplicates():
+    core_v1_api = mock.Mock()
+    core_v1_api.read_namespaced_pod_log.side_effect = [
+        FakeLogResponse([
+            b"2026-01-01T00:00:01.1Z starting\n",
+            b"2026-01-01T00:00:02Z same timestamp 1\n",
+            b"2026-01-01T00:00:02Z same tim",
+        ], error=ProtocolError("connection reset")),
+        FakeLogResponse([
+            b"2026-01-01T00:00:01.1Z starting\n",
+            b"2026-01-01T00:00:02Z same timestamp 1\n",
+            b"2026-01-01T00:00:02Z same timestamp 2\n",
+            b"2026-01-01T00:00:03Z done",
+        ]),
+    ]
+    core_v1_api.read_namespaced_pod.return_value.status.phase = "Succeeded"
+
+    follower = PodLogFollower(core_v1_api, namespace="spark", pod_name="pi-driver", backoff_base=0)
+    lines = list(follower.follow())
+
+    assert lines == [b"starting\n", b"same timestamp 1\n", b"same timestamp 2\n", b"done"]
+    assert follower.offset == sum(len(line) for line in lines)
+    assert "since_seconds" in core_v1_api.read_namespaced_pod_log.call_args_list[1].kwargs
@@ -0,0 +1,92 @@
+import gzip
+import io
+import threading
+from datetime import datetime, timezone
+
+from logs import (CallbackSink, LogArchive, LogArchiveSink, LogArchiveWriter,
+                  LogPipeline, LogSink, RotatingFileSink, StdoutSamplerSink)
+
+
+def test_log_pipeline_batches_lines_per_app(tmp_path):
+    chunks = []
+    stdout = io.BytesIO()
+    file_sink = RotatingFileSink(str(tmp_path), max_bytes=64, backup_count=1)
+    pipeline = LogPipeline(
+        [CallbackSink(lambda namespace, app, chunk: chunks.append((app, chunk))), file_sink, StdoutSamplerSink(every_n_lines=3, stream=stdout)],
+        batch_bytes=1024 * 1024, flush_interval=0.05,
+    )
+
+    for i in range(10):
+        pipeline.submit("spark", "pi", b"line %d\n" % i)
+    pipeline.submit("spark", "etl", b"no newline")
+    pipeline.close()
+
+    assert b"".join(chunk for app, chunk in chunks if app == "pi") == b"".join(b"line %d\n" % i for i in range(10))
+    assert ("etl", b"no newline\n") in chunks
+    assert len(chunks) == 2
+    assert stdout.getvalue() == b"spark/pi | line 0\nspark/pi | line 3\nspark/pi | line 6\nspark/pi | line 9\nspark/etl | no newline\n"
+
+    path = file_sink.path("spark", "pi")
+    with gzip.open(path) as f:
+        assert f.read() == b"".join(b"line %d\n" % i for i in range(10))
+
+
+def test_log_pipeline_drops_when_full_without_blocking():
+    release = threading.Event()
+
+    class SlowSink(LogSink):
+        def write(self, namespace, app, chunk):
+            release.wait()
+
+    pipeline = LogPipeline([SlowSink()], max_buffer_bytes=20, batch_bytes=5, flush_interval=0.01, block=False)
+    accepted = [pipeline.submit("spark", "pi", b"0123456789\n") for _ in range(5)]
+    release.set()
+    pipeline.close()
+
+    assert not all(accepted)
+    assert pipeline.dropped_bytes == 11 * accepted.count(False)
+
+
+def test_log_archive_searches_by_time_level_and_exception(tmp_path):
+    path = str(tmp_path / "pi.logarchive")
+    writer = LogArchiveWriter(path, block_size=256)
+    for minute in range(10):
+        writer.write(b"26/01/01 12:%02d:00 INFO DAGScheduler: Job %d finished\n" % (minute, minute))
+        if minute == 7:
+            writer.write(b"26/01/01 12:07:30 ERROR Executor: Exception in task 0.0\n")
+            writer.write(b"java.lang.OutOfMemoryError: Java heap space\n\tat org.apache.spark.Foo.bar(Foo.scala:1)\n")
+    writer.close()
+
+    with LogArchive(path) as archive:
+        assert len(archive.blocks) > 1
+        assert archive.line_count == 13
+
+        in_range = list(archive.search(
+            since=datetime(2026, 1, 1, 12, 2, tzinfo=timezone.utc), until=datetime(2026, 1, 1, 12, 4, tzinfo=timezone.utc)
+        ))
+        assert [line.text for line in in_range] == [b"26/01/01 12:02:00 INFO DAGScheduler: Job 2 finished", b"26/01/01 12:03:00 INFO DAGScheduler: Job 3 finished"]
+
+        errors = list(archive.search(levels=["ERROR"]))
+        assert [line.text for line in errors][1:] == [b"java.lang.OutOfMemoryError: Java heap space", b"\tat org.apache.spark.Foo.bar(Foo.scala:1)"]
+
+        first_exception = archive.first_exception(context_lines=1)
+        assert [line.text for line in first_exception] == [b"java.lang.OutOfMemoryError: Java heap space", b"\tat org.apache.spark.Foo.bar(Foo.scala:1)"]
+
+
+def test_log_archive_sink_reopens_evicted_archives(tmp_path):
+    sink = LogArchiveSink(str(tmp_path), block_size=1, max_open_writers=1)
+    sink.write("spark", "a", b"26/01/01 12:00:00 INFO Driver: started\n")
+    sink.write("spark", "b", b"26/01/01 12:00:00 INFO Driver: started\n")
+    sink.write("spark", "a", b"26/01/01 12:01:00 ERROR Executor: Exception in task 0.0\n")
+    sink.write("spark", "a", b"java.lang.OutOfMemoryError: Java heap space\n\tat org.apache.spark.Foo.bar(Foo.scala:1)\n")
+    sink.close_app("spark", "a")
+    sink.close()
+
+    with LogArchive(sink.path("spark", "a")) as archive:
+        assert archive.line_count == 4 and len(archive.blocks) == 4
+        # the stack trace lines are blocks of their own, they inherit the level of the line before
+        errors = list(archive.search(levels=["ERROR"]))
+        assert [line.number for line in errors] == [1, 2, 3]
+        assert [line.text for line in archive.exceptions()] == [b"java.lang.OutOfMemoryError: Java heap space"]
+    with LogArchive(sink.path("spark", "b")) as archive:
+        assert archive.line_count == 1
@@ -0,0 +1,69 @@
+from urllib.request import urlopen
+
+import kubernetes
+import pytest
+from k8s_manipulators.launcher import SparkAppLauncher
+from metrics import LauncherMetrics, MetricsRegistry, MetricsServer
+from urllib3.exceptions import ProtocolError
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("events_total", "Events", ("namespace", "app")).labels(namespace="spark", app="pi").inc(3)
+    registry.histogram("latency_seconds", "Latency", ("app",), buckets=(0.1, 1.0)).labels(app="pi").observe(0.5)
+
+    text = registry.render()
+
+    assert 'events_total{namespace="spark",app="pi"} 3.0' in text
+    assert 'latency_seconds_bucket{app="pi",le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{app="pi",le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{app="pi",le="+Inf"} 1' in text
+    assert 'latency_seconds_count{app="pi"} 1' in text
+
+
+def test_registry_removes_the_series_of_an_app():
+    registry = MetricsRegistry()
+    reconnects = registry.counter("reconnects_total", "Reconnects", ("namespace", "app", "reason"))
+    for app, reason in (("pi", "410"), ("pi", "ProtocolError"), ("etl", "410")):
+        reconnects.labels(namespace="spark", app=app, reason=reason).inc()
+
+    assert reconnects.remove(namespace="spark", app="pi") == 2
+    assert 'app="pi"' not in registry.render() and 'app="etl"' in registry.render()
+    with pytest.raises(ValueError):
+        reconnects.remove(node="node-1")
+
+
+def test_launcher_counts_the_watch_error_it_gives_up_on_then_forgets_the_app(make_spark_app, monkeypatch):
+    registry = MetricsRegistry()
+    rendered_before_forget = []
+
+    class RecordingMetrics(LauncherMetrics):
+        def forget(self, namespace, app):
+            rendered_before_forget.append(registry.render())
+            super().forget(namespace, app)
+
+    class FakeWatch():
+        def stream(self, func, **kwargs):
+            raise ProtocolError("Connection broken")
+            yield
+
+    monkeypatch.setattr(kubernetes.watch, "Watch", FakeWatch)
+    launcher = SparkAppLauncher(kubernetes.client.ApiClient(), metrics=RecordingMetrics(registry))
+    with pytest.raises(ProtocolError):
+        launcher.monitor_spark_app(make_spark_app("pi"))
+
+    assert 'spark_app_creator_watch_reconnects_total{namespace="spark",app="pi",reason="ProtocolError"} 1.0' in rendered_before_forget[0]
+    assert 'app="pi"' not in registry.render()
+
+
+def test_metrics_server_exposes_registry():
+    registry = MetricsRegistry()
+    registry.gauge("running_apps", "Running apps").labels().set(2)
+
+    server = MetricsServer(registry, port=0)
+    server.start()
+    try:
+        with urlopen("http://127.0.0.1:%s/metrics" % server.port) as response:
+            assert "running_apps 2.0" in response.read().decode()
+    finally:
+        server.stop()
@@ -0,0 +1,62 @@
+import json
+import os
+from collections import Counter
+from time import perf_counter, sleep
+
+from profiling import PhaseProfiler, SamplingProfiler
+
+
+def busy_wait(seconds):
+    deadline = perf_counter() + seconds
+    while perf_counter() < deadline:
+        pass
+
+
+def test_phases_and_marks_are_timed_from_the_start_of_the_run():
+    profiler = PhaseProfiler()
+    with profiler.phase("create_spark_app", app="etl") as outer:
+        sleep(0.02)
+        with profiler.phase("api_call"):
+            sleep(0.01)
+        profiler.mark("first_log_byte", pod="etl-driver")
+
+    names = [record.name for record in profiler.timeline]
+    assert names == ["create_spark_app", "api_call", "first_log_byte"]
+    api_call, mark = profiler.timeline[1], profiler.timeline[2]
+    assert outer.duration >= 0.03 and 0.01 <= api_call.duration < outer.duration
+    assert outer.start <= api_call.start and api_call.end <= mark.start <= outer.end
+    assert mark.duration == 0.0 and mark.attributes == {"pod": "etl-driver"}
+    assert "create_spark_app app=etl" in profiler.report()
+
+
+def test_dump_writes_the_timeline_and_folded_stacks(tmp_path):
+    profiler = PhaseProfiler(output_dir=str(tmp_path), sampling=True, sampling_interval=0.001)
+    with profiler.phase("monitor_spark_app", sample=True):
+        busy_wait(0.1)
+    with profiler.phase("not_sampled"):
+        pass
+    folded = profiler.to_folded()
+
+    path = profiler.dump(run_name="etl")
+    with open(path) as f:
+        timeline = json.load(f)
+    assert timeline["run"] == "etl"
+    assert [phase["name"] for phase in timeline["phases"]] == ["monitor_spark_app", "not_sampled"]
+
+    with open(path.replace(".timeline.json", ".folded")) as f:
+        assert f.read() == folded
+    lines = folded.splitlines()
+    assert lines and all(line.startswith("monitor_spark_app;") for line in lines)
+    assert any("busy_wait" in line for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) > 0
+
+    # a new run starts empty
+    assert profiler.timeline == [] and profiler.to_folded() == ""
+    assert profiler.dump(run_name="empty") is not None
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".folded")]) == 1
+
+
+def test_sampling_profiler_folds_stacks_root_first():
+    sampler = SamplingProfiler()
+    sampler.samples = Counter({"b;c": 2, "a;b": 1})
+    assert sampler.to_folded() == "a;b 1\nb;c 2\n"
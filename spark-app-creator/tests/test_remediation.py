@@ -0,0 +1,95 @@
+import kubernetes
+import pytest
+from custom_exceptions import SparkAppFailedException
+from k8s_manipulators.client import SparkAppClient
+from k8s_manipulators.launcher import SparkAppLauncher
+from k8s_objects.spark_app import SparkDriverSpec, SparkExecutorSpec
+from remediation import FailureClassifier, RemediationRunner
+from remediation.failure_classifier import (BAD_ARGUMENTS, EXECUTOR_OOM,
+                                            SHUFFLE_FETCH, UNKNOWN)
+from sizing import SizingBounds
+from utils import consts
+from utils.k8s_utils import get_monitor_shard
+
+
+def test_classifier_picks_highest_priority_category():
+    classifier = FailureClassifier()
+    classifier.write("spark", "etl", b"INFO start\nWARN Lost task 1.0 in stage 2.0: FetchFailedException\n")
+    assert classifier.classify("spark", "etl").category == SHUFFLE_FETCH
+
+    classifier.write("spark", "etl", b"ERROR ExecutorLostFailure (executor 3 exited) Reason: Container killed: OOMKilled\n")
+    classification = classifier.classify("spark", "etl")
+    assert (classification.category, classification.heap, classification.retryable) == (EXECUTOR_OOM, False, True)
+
+    classifier.write("spark", "etl", b"Error: Unrecognized option: --inptu\n")
+    assert classifier.classify("spark", "etl").category == BAD_ARGUMENTS
+    assert not classifier.classify("spark", "etl").retryable
+
+    classifier.forget("spark", "etl")
+    assert classifier.classify("spark", "etl").category == UNKNOWN
+
+
+def test_remediation_grows_memory_within_bounds(make_spark_app):
+    runner = RemediationRunner(executor_bounds=SizingBounds(max_memory_mb=8192, max_memory_overhead_mb=1000))
+    spark_app = make_spark_app(
+        "etl", resource_version="42",
+        driver=SparkDriverSpec(cores=1, memory="2g"), executor=SparkExecutorSpec(instances=4, cores=2, memory="4g"),
+    )
+    classifier = FailureClassifier()
+
+    classifier.write("spark", "etl", b"WARN Lost task 0.0 in stage 1.0 (TID 1): java.lang.OutOfMemoryError: Java heap space\n")
+    heap_attempt = runner.next_attempt(spark_app, classifier.classify("spark", "etl"), "etl-r1")
+    assert heap_attempt.metadata.name == "etl-r1" and heap_attempt.metadata.resource_version is None
+    assert heap_attempt.spec.executor.memory == "6g"
+    assert spark_app.spec.executor.memory == "4g"
+
+    classifier.forget("spark", "etl")
+    classifier.write("spark", "etl", b"ExecutorLostFailure (executor 1 exited) exit code 137\n")
+    overhead_attempt = runner.next_attempt(heap_attempt, classifier.classify("spark", "etl"), "etl-r2")
+    # Spark's default overhead is 10% of the 6g memory
+    assert overhead_attempt.spec.executor.memory_overhead == "921m"
+    capped_attempt = runner.next_attempt(overhead_attempt, classifier.classify("spark", "etl"), "etl-r3")
+    assert capped_attempt.spec.executor.memory_overhead == "1000m"
+    assert runner.next_attempt(capped_attempt, classifier.classify("spark", "etl"), "etl-r4") is None
+
+
+def test_remediation_forgets_findings_of_every_attempt(make_spark_app, monkeypatch):
+    runner = RemediationRunner()
+
+    def run_spark_app(client, namespace=None, **kwargs):
+        metadata = client.spark_app.metadata
+        metadata.namespace = namespace
+        runner.classifier.write(namespace, metadata.name, b"WARN Lost task 3.0 in stage 2.0: FetchFailedException\n")
+        if metadata.name == "etl":
+            raise SparkAppFailedException()
+    monkeypatch.setattr(SparkAppClient, "run_spark_app", run_spark_app)
+
+    client = runner.run_spark_app(make_spark_app("etl"), namespace="spark", api_client=kubernetes.client.ApiClient())
+    assert client.spark_app.metadata.name == "etl-r1"
+    assert client.spark_app.spec.spark_conf
+    assert runner.classifier._found == {}
+
+    # attempts that are not retried are forgotten as well
+    runner = RemediationRunner(max_attempts=1)
+    with pytest.raises(SparkAppFailedException):
+        runner.run_spark_app(make_spark_app("etl"), namespace="spark", api_client=kubernetes.client.ApiClient())
+    assert runner.classifier._found == {}
+
+
+def test_next_attempt_is_stamped_with_the_shard_of_its_own_name(make_spark_app):
+    launcher = SparkAppLauncher(kubernetes.client.ApiClient())
+    bodies = []
+    launcher.custom_object_api.create_namespaced_custom_object = lambda body, **kwargs: bodies.append(body)
+    spark_app = make_spark_app("etl")
+    launcher.create_spark_app("spark", spark_app)
+
+    classifier = FailureClassifier()
+    classifier.write("spark", "etl", b"WARN Lost task 0.0 in stage 1.0 (TID 1): java.lang.OutOfMemoryError: Java heap space\n")
+    next_attempt = RemediationRunner().next_attempt(spark_app, classifier.classify("spark", "etl"), "etl-r1")
+    assert consts.SPARK_APP_MONITOR_SHARD_LABEL not in next_attempt.metadata.labels
+    assert consts.SPARK_APP_SPEC_HASH_ANNOTATION not in next_attempt.metadata.annotations
+
+    launcher.create_spark_app("spark", next_attempt)
+    assert [body["metadata"]["labels"][consts.SPARK_APP_MONITOR_SHARD_LABEL] for body in bodies] == [
+        get_monitor_shard("spark", "etl"), get_monitor_shard("spark", "etl-r1"),
+    ]
@@ -0,0 +1,70 @@
+import kubernetes
+import pytest
+from k8s_manipulators.client import SparkAppClient
+from k8s_manipulators.scheduler import SchedulerTicket, SparkAppScheduler
+from k8s_objects.spark_app import BatchSchedulerConfiguration, SparkApp
+
+
+def scheduled_app(make_spark_app, name: str, queue: str = None, priority_class_name: str = None, team: str = None) -> SparkApp:
+    return make_spark_app(
+        name,
+        labels={"team": team} if team else None,
+        batch_scheduler_options=BatchSchedulerConfiguration(queue=queue, priority_class_name=priority_class_name),
+    )
+
+
+def test_scheduler_respects_queue_limit(make_spark_app):
+    scheduler = SparkAppScheduler(queue_limits={"etl": 1})
+
+    first = scheduler.submit("spark", scheduled_app(make_spark_app, "a", queue="etl"))
+    second = scheduler.submit("spark", scheduled_app(make_spark_app, "b", queue="etl"))
+
+    assert first.wait(timeout=0)
+    assert not second.wait(timeout=0)
+
+    scheduler.release(first)
+    assert second.wait(timeout=0)
+
+
+def test_scheduler_admits_high_priority_first(make_spark_app):
+    scheduler = SparkAppScheduler(default_queue_limit=1, priority_classes={"sla": 100}, aging_rate=0)
+
+    running = scheduler.submit("spark", scheduled_app(make_spark_app, "running"))
+    low = scheduler.submit("spark", scheduled_app(make_spark_app, "low"))
+    high = scheduler.submit("spark", scheduled_app(make_spark_app, "high", priority_class_name="sla"))
+
+    scheduler.release(running)
+    assert high.wait(timeout=0)
+    assert not low.wait(timeout=0)
+
+
+def test_scheduler_fair_share_between_teams(make_spark_app):
+    scheduler = SparkAppScheduler(default_queue_limit=2, aging_rate=0)
+
+    a1 = scheduler.submit("spark", scheduled_app(make_spark_app, "a1", team="a"))
+    scheduler.submit("spark", scheduled_app(make_spark_app, "a2", team="a"))
+    a3 = scheduler.submit("spark", scheduled_app(make_spark_app, "a3", team="a"))
+    b1 = scheduler.submit("spark", scheduled_app(make_spark_app, "b1", team="b"))
+    assert scheduler.stats()["default"]["waiting"] == 2
+
+    scheduler.release(a1)
+    assert b1.wait(timeout=0)
+    assert not a3.wait(timeout=0)
+
+
+def test_client_interrupted_while_queued_gives_up_its_ticket(make_spark_app, monkeypatch):
+    scheduler = SparkAppScheduler(queue_limits={"etl": 1})
+    running = scheduler.submit("spark", scheduled_app(make_spark_app, "running", queue="etl"))
+
+    def interrupted(ticket, timeout=None):
+        raise KeyboardInterrupt()
+    monkeypatch.setattr(SchedulerTicket, "wait", interrupted)
+    client = SparkAppClient(spark_app=scheduled_app(make_spark_app, "queued", queue="etl"), scheduler=scheduler, api_client=kubernetes.client.ApiClient())
+    with pytest.raises(KeyboardInterrupt):
+        client.run_spark_app(namespace="spark")
+    monkeypatch.undo()
+    assert scheduler.stats()["etl"]["waiting"] == 0
+
+    # the slot freed by the running SparkApp goes to the next one, not to the interrupted one
+    scheduler.release(running)
+    assert scheduler.submit("spark", scheduled_app(make_spark_app, "next", queue="etl")).wait(timeout=0)
@@ -0,0 +1,43 @@
+import pytest
+from tuning import (PROFILES, SparkConfProfile, SparkConfProfileHook,
+                    diff_spark_conf, resolve_profiles)
+
+
+def test_profiles_resolve_in_order_over_what_they_extend(monkeypatch):
+    monkeypatch.setitem(PROFILES, "base", SparkConfProfile("base", {"a": "1", "b": "1"}))
+    monkeypatch.setitem(PROFILES, "child", SparkConfProfile("child", {"b": "2"}, extends=["base"]))
+    monkeypatch.setitem(PROFILES, "last", SparkConfProfile("last", {"a": "3"}))
+
+    assert resolve_profiles(["child"]) == {"a": "1", "b": "2"}
+    assert resolve_profiles(["child", "last"]) == {"a": "3", "b": "2"}
+    # a profile reached twice through different branches is not a cycle
+    monkeypatch.setitem(PROFILES, "diamond", SparkConfProfile("diamond", {}, extends=["base", "child"]))
+    assert resolve_profiles(["diamond"]) == {"a": "1", "b": "2"}
+
+
+def test_cyclic_profiles_are_rejected(monkeypatch):
+    monkeypatch.setitem(PROFILES, "a", SparkConfProfile("a", {"x": "1"}, extends=["b"]))
+    monkeypatch.setitem(PROFILES, "b", SparkConfProfile("b", {"x": "2"}, extends=["c"]))
+    monkeypatch.setitem(PROFILES, "c", SparkConfProfile("c", {"x": "3"}, extends=["a"]))
+
+    with pytest.raises(ValueError, match="a -> b -> c -> a"):
+        resolve_profiles(["a"])
+    with pytest.raises(ValueError, match="Unknown spark_conf profile"):
+        resolve_profiles(["unknown"])
+
+
+def test_hook_applies_profiles_under_the_spec_conf(make_spark_app):
+    app = make_spark_app(spark_conf={"spark.sql.adaptive.advisoryPartitionSizeInBytes": "64MB"})
+    SparkConfProfileHook(["small_files_compaction"], overrides={"spark.sql.files.openCostInBytes": "4MB"})(spark_app=app)
+
+    spark_conf = app.spec.spark_conf
+    assert spark_conf["spark.sql.adaptive.enabled"] == "true"
+    assert spark_conf["spark.sql.adaptive.advisoryPartitionSizeInBytes"] == "64MB"
+    assert spark_conf["spark.sql.files.openCostInBytes"] == "4MB"
+    # the non-atomic v2 committer is opt-in
+    assert "spark.hadoop.mapreduce.fileoutputcommitter.algorithm.version" not in spark_conf
+
+    diff = diff_spark_conf(app.spec, ["small_files_compaction", "output_committer_v2"])
+    assert not diff.matches
+    assert diff.missing == {"spark.hadoop.mapreduce.fileoutputcommitter.algorithm.version": "2"}
+    assert set(diff.changed) == {"spark.sql.adaptive.advisoryPartitionSizeInBytes", "spark.sql.files.openCostInBytes"}
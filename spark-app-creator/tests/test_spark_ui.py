@@ -0,0 +1,157 @@
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from history import RunHistoryStore
+from k8s_objects.spark_app import (ApplicationState, DriverInfo, SparkApp,
+                                   SparkAppStatus, SparkExecutorSpec)
+from metrics import MetricsRegistry
+from spark_ui import SparkUiPoller, driver_ui_url
+
+
+class FakeSparkUi():
+    def __init__(self) -> None:
+        self.stages = [
+            {"stageId": 0, "attemptId": 0, "status": "COMPLETE", "numCompleteTasks": 10, "executorRunTime": 5000,
+             "executorCpuTime": 4000000000, "inputBytes": 1024},
+            {"stageId": 1, "attemptId": 0, "status": "ACTIVE", "numCompleteTasks": 2, "executorRunTime": 1000,
+             "shuffleReadBytes": 512},
+        ]
+        self.executors = [
+            {"id": "driver", "isActive": True, "activeTasks": 0, "maxTasks": 0},
+            {"id": "1", "isActive": True, "activeTasks": 1, "maxTasks": 2},
+        ]
+        self.requests = []
+        self.client_ports = set()
+        self.down = False
+        self.on_request = None
+
+        ui = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                ui.requests.append(self.path)
+                ui.client_ports.add(self.client_address[1])
+                if ui.on_request is not None:
+                    ui.on_request()
+                routes = {
+                    "/api/v1/applications/spark-123/stages": ui.stages,
+                    "/api/v1/applications/spark-123/executors": ui.executors,
+                }
+                body = json.dumps(routes[self.path]).encode()
+                self.send_response(503 if ui.down else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def ui_app(make_spark_app, state: str, port: int, spark_application_id: str = "spark-123") -> SparkApp:
+    return make_spark_app(
+        "pi",
+        creation_timestamp=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        executor=SparkExecutorSpec(instances=1, cores=2, memory="4g"),
+        status=SparkAppStatus(
+            application_state=ApplicationState(state=state),
+            spark_application_id=spark_application_id,
+            driver_info=DriverInfo(web_ui_address="127.0.0.1:%s" % port, web_ui_port=4040),
+        ),
+    )
+
+
+def test_driver_ui_url():
+    assert driver_ui_url("spark", DriverInfo(web_ui_service_name="pi-ui-svc", web_ui_port=4040)) == "http://pi-ui-svc.spark.svc:4040"
+    driver_info = DriverInfo(web_ui_address="10.0.0.5:4040", web_ui_ingress_address="https://spark.example.com/pi/")
+    assert driver_ui_url("spark", driver_info) == "http://10.0.0.5:4040"
+    assert driver_ui_url("spark", driver_info, prefer_ingress=True) == "https://spark.example.com/pi"
+
+
+def test_spark_ui_poller_processes_deltas(tmp_path, make_spark_app):
+    ui = FakeSparkUi()
+    port = ui.server.server_address[1]
+    registry = MetricsRegistry()
+    history = RunHistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+    poller = SparkUiPoller(metrics=registry, history=history)
+
+    running = ui_app(make_spark_app, "RUNNING", port)
+    history.observe(running)
+    poller.observe(running)
+    assert poller.poll("spark", "pi")
+    assert not poller.poll("spark", "pi")
+
+    ui.stages[1].update(status="COMPLETE", numCompleteTasks=4, executorRunTime=3000)
+    assert poller.poll("spark", "pi")
+
+    rendered = registry.render()
+    assert 'spark_app_creator_spark_tasks_total{namespace="spark",app="pi",status="completed"} 14' in rendered
+    assert 'spark_app_creator_spark_executor_seconds_total{namespace="spark",app="pi",kind="cpu"} 4' in rendered
+    assert 'spark_app_creator_spark_slot_utilization{namespace="spark",app="pi"} 0.5' in rendered
+    # three polls, one keep-alive connection
+    assert len(ui.requests) == 6 and len(ui.client_ports) == 1
+
+    # the last stage finishes after the previous poll, the app is polled one last time when it terminates
+    ui.stages.append({"stageId": 2, "attemptId": 0, "status": "COMPLETE", "numCompleteTasks": 6, "executorRunTime": 2000})
+    finished = ui_app(make_spark_app, "COMPLETED", port)
+    poller.observe(finished)
+    history.observe(finished)
+    history.flush()
+    [run] = history.runs_between()
+    assert (run.tasks_completed, run.executor_run_time_ms, run.executor_cpu_time_ms, run.input_bytes, run.shuffle_read_bytes) == (20, 10000, 4000, 1024, 512)
+    assert 'spark_app_creator_spark_tasks_total{namespace="spark",app="pi",status="completed"} 20' in registry.render()
+    assert not poller.poll("spark", "pi")
+
+    poller.stop()
+    history.close()
+    ui.server.shutdown()
+
+
+def test_spark_ui_poller_drops_apps_whose_driver_is_gone(make_spark_app):
+    ui = FakeSparkUi()
+    port = ui.server.server_address[1]
+    registry = MetricsRegistry()
+    poller = SparkUiPoller(metrics=registry)
+
+    poller.observe(ui_app(make_spark_app, "RUNNING", port))
+    assert poller.poll("spark", "pi")
+    ui.down = True
+
+    poller.observe(ui_app(make_spark_app, "FAILED", port))
+    assert not poller.poll("spark", "pi")
+    assert 'spark_app_creator_spark_ui_poll_errors_total{namespace="spark",app="pi"} 1' in registry.render()
+    poller.stop()
+    ui.server.shutdown()
+
+
+def test_spark_ui_poller_keeps_counts_across_transient_states(make_spark_app):
+    ui = FakeSparkUi()
+    port = ui.server.server_address[1]
+    registry = MetricsRegistry()
+    poller = SparkUiPoller(metrics=registry)
+    completed = 'spark_app_creator_spark_tasks_total{namespace="spark",app="pi",status="completed"} 12'
+
+    poller.observe(ui_app(make_spark_app, "RUNNING", port))
+    assert poller.poll("spark", "pi")
+    # the driver was unreachable for a while
+    poller.observe(ui_app(make_spark_app, "UNKNOWN", port))
+    poller.observe(ui_app(make_spark_app, "RUNNING", port))
+    assert not poller.poll("spark", "pi")
+    assert completed in registry.render()
+
+    # the listener thread polls a terminated app while the poller thread may be diffing the same stages
+    locked = []
+    ui.on_request = lambda: locked.append(poller._apps[("spark", "pi")].lock.locked())
+    ui.stages[1].update(status="COMPLETE", numCompleteTasks=4)
+    assert poller.poll("spark", "pi")
+    assert locked == [True, True]
+    assert 'status="completed"} 14' in registry.render()
+    poller.stop()
+    ui.server.shutdown()
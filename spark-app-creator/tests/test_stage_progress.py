@@ -0,0 +1,52 @@
+from logs import LogPipeline, StageProgressParser, StageProgressTracker
+from logs.stage_progress import (SHUFFLE_WARNING, SPILL, STAGE_COMPLETED,
+                                 STAGE_STARTED, TASK_FINISHED)
+from metrics import MetricsRegistry
+
+DRIVER_LOG = b"""\
+25/10/19 12:00:00 INFO SparkContext: Running Spark version 3.5.0
+25/10/19 12:00:10 INFO DAGScheduler: Submitting ResultStage 3 (MapPartitionsRDD[12] at count at etl.py:10), which has no missing parents
+25/10/19 12:00:10 INFO DAGScheduler: Submitting 4 missing tasks from ResultStage 3 (MapPartitionsRDD[12] at count at etl.py:10) (first 15 tasks are for partitions Vector(0, 1, 2, 3))
+25/10/19 12:00:10 INFO TaskSchedulerImpl: Adding task set 3.0 with 4 tasks resource profile 0
+25/10/19 12:00:10 INFO TaskSetManager: Starting task 0.0 in stage 3.0 (TID 10) (10.0.0.1, executor 1, partition 0, PROCESS_LOCAL, 4567 bytes)
+25/10/19 12:00:20 INFO TaskSetManager: Finished task 0.0 in stage 3.0 (TID 10) in 10000 ms on 10.0.0.1 (executor 1) (1/4)
+25/10/19 12:00:21 INFO UnsafeExternalSorter: Thread 68 spilling sort data of 1024.0 MiB to disk (0  time so far)
+25/10/19 12:00:25 WARN RetryingBlockTransferor: Retrying fetch (1/3) for 1 outstanding blocks after 5000 ms
+25/10/19 12:00:30 INFO TaskSetManager: Finished task 1.0 in stage 3.0 (TID 11) in 20000 ms on 10.0.0.2 (executor 2) (2/4)
+"""
+
+
+def test_stage_progress_parser_tracks_tasks_and_eta():
+    parser = StageProgressParser("spark", "etl")
+    events = [event for event in map(parser.feed, DRIVER_LOG.splitlines()) if event is not None]
+
+    assert [event.kind for event in events] == [STAGE_STARTED, TASK_FINISHED, SPILL, SHUFFLE_WARNING, TASK_FINISHED]
+    assert events[2].detail["spilled_bytes"] == 1024 ** 3
+
+    stage = parser.stages[3]
+    assert (stage.name, stage.kind, stage.tasks_done, stage.tasks_total) == ("MapPartitionsRDD[12] at count at etl.py:10", "ResultStage", 2, 4)
+    # 2 tasks in 20s, 2 left
+    assert parser.eta_seconds() == 20.0
+    assert stage.skew() == 20000 / 15000
+    assert stage.stalled_seconds(stage.last_progress_at + 60) == 60
+
+    event = parser.feed(b"25/10/19 12:00:50 INFO DAGScheduler: ResultStage 3 (count at etl.py:10) finished in 40.123 s")
+    assert event.kind == STAGE_COMPLETED and not stage.active and stage.tasks_done == 4
+    assert parser.eta_seconds() is None
+
+
+def test_stage_progress_tracker_in_log_pipeline():
+    events = []
+    registry = MetricsRegistry()
+    tracker = StageProgressTracker(listeners=[lambda event: events.append(event)], metrics=registry)
+    pipeline = LogPipeline([tracker], flush_interval=0.05)
+    for line in DRIVER_LOG.splitlines():
+        pipeline.submit("spark", "etl", line)
+    pipeline.drain(timeout=5)
+
+    assert len(events) == 5
+    assert tracker.progress("spark", "etl").stages[3].tasks_done == 2
+    rendered = registry.render()
+    assert 'spark_app_creator_stage_eta_seconds{namespace="spark",app="etl"} 20' in rendered
+    assert 'spark_app_creator_shuffle_fetch_warnings_total{namespace="spark",app="etl"} 1' in rendered
+    pipeline.close()
@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+
+import kubernetes
+import pytest
+from custom_exceptions import ResourceObjectNotFoundException
+from k8s_manipulators.supervisor import (HashRing, MonitorSupervisor,
+                                         monitor_worker)
+from k8s_manipulators.supervisor.monitor_supervisor import (DELETED, SHARDS,
+                                                            STATE, STATS,
+                                                            STOP, WATCH)
+from metrics import MetricsRegistry
+
+
+def fake_worker(worker_id, commands, results, *args):
+    while True:
+        kind, namespace, name = commands.get()
+        if kind == STOP:
+            return
+        if kind == WATCH:
+            results.put((STATE, worker_id, namespace, name, "RUNNING"))
+            if name.startswith("done"):
+                results.put((STATE, worker_id, namespace, name, "COMPLETED"))
+            if name.startswith("gone"):
+                results.put((STATE, worker_id, namespace, name, DELETED))
+
+
+class FakeWatch():
+    """
+    Stands in for `kubernetes.watch.Watch`, streams the events put in `events` and records the stream arguments
+    """
+    events = queue.Queue()
+    streams = queue.Queue()
+
+    def __init__(self):
+        self._stop = False
+
+
+    def stop(self):
+        self._stop = True
+
+
+    def stream(self, func, **kwargs):
+        self._stop = False
+        FakeWatch.streams.put(kwargs)
+        while not self._stop:
+            try:
+                yield FakeWatch.events.get(timeout=0.05)
+            except queue.Empty:
+                continue
+
+
+def spark_app_event(event_type, name, state):
+    return {"type": event_type, "object": {"metadata": {"name": name}, "status": {"applicationState": {"state": state}}}}
+
+
+def wait_until(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_hash_ring_only_moves_keys_of_removed_node():
+    ring = HashRing(["w0", "w1", "w2", "w3"])
+    keys = ["spark/app-%s" % i for i in range(1000)]
+    before = {key: ring.owner(key) for key in keys}
+    assert set(before.values()) == {"w0", "w1", "w2", "w3"}
+
+    ring.remove("w2")
+    after = {key: ring.owner(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert moved and all(before[key] == "w2" for key in moved)
+    assert "w2" not in after.values()
+
+
+def test_monitor_worker_watches_its_shards_and_reports_deleted_apps(monkeypatch):
+    monkeypatch.setattr(kubernetes.config, "load_incluster_config", lambda: None)
+    monkeypatch.setattr(kubernetes.watch, "Watch", FakeWatch)
+    commands, results = queue.Queue(), queue.Queue()
+    worker = threading.Thread(target=monitor_worker, args=("worker-0", commands, results), kwargs={"stats_interval": 60}, daemon=True)
+    worker.start()
+    try:
+        commands.put((SHARDS, None, ("1", "7")))
+        commands.put((WATCH, "spark", "etl"))
+        stream = FakeWatch.streams.get(timeout=10)
+        assert stream["namespace"] == "spark"
+        assert stream["label_selector"] == "spark-app-creator/monitor-shard in (1,7)"
+
+        FakeWatch.events.put(spark_app_event("ADDED", "etl", "RUNNING"))
+        FakeWatch.events.put(spark_app_event("MODIFIED", "other", "RUNNING"))
+        FakeWatch.events.put(spark_app_event("MODIFIED", "etl", "RUNNING"))
+        FakeWatch.events.put(spark_app_event("DELETED", "etl", "RUNNING"))
+        assert results.get(timeout=10) == (STATE, "worker-0", "spark", "etl", "RUNNING")
+        assert results.get(timeout=10) == (STATE, "worker-0", "spark", "etl", DELETED)
+    finally:
+        commands.put((STOP, None, None))
+        worker.join(10)
+    assert not worker.is_alive()
+    # SparkApps of other shards or not watched are neither reported nor counted
+    assert results.get(timeout=1) == (STATS, "worker-0", None, None, {("spark", "etl"): 3})
+
+
+def test_supervisor_fails_futures_of_deleted_apps_and_counts_restarts():
+    metrics = MetricsRegistry()
+    supervisor = MonitorSupervisor(
+        workers=2, health_interval=0.1, mp_context="fork", worker_target=fake_worker, metrics=metrics,
+    ).start()
+    try:
+        gone = supervisor.monitor("spark", "gone-1")
+        with pytest.raises(ResourceObjectNotFoundException):
+            gone.result(timeout=10)
+        assert supervisor.owner_of("spark", "gone-1") is None
+
+        supervisor._workers["worker-0"].process.kill()
+        assert wait_until(lambda: "worker-0" not in supervisor._workers)
+        assert "spark_app_creator_monitor_worker_restarts_total 1.0" in metrics.render()
+    finally:
+        supervisor.stop()
+
+
+def test_supervisor_resolves_futures_and_rebalances_dead_workers():
+    states = queue.Queue()
+    supervisor = MonitorSupervisor(
+        workers=3, health_interval=0.1, mp_context="fork", worker_target=fake_worker,
+        state_listeners=[lambda namespace, name, state: states.put((name, state))],
+    ).start()
+    try:
+        done = supervisor.monitor("spark", "done-1")
+        assert done.result(timeout=10) == "COMPLETED"
+
+        for i in range(30):
+            supervisor.monitor("spark", "app-%s" % i)
+        before = supervisor.assignments()
+        victim = before[("spark", "app-0")]
+        supervisor._workers[victim].process.kill()
+
+        assert wait_until(lambda: victim not in supervisor.assignments().values())
+        after = supervisor.assignments()
+        assert len(after) == 30
+        replacement = set(supervisor._workers) - {"worker-0", "worker-1", "worker-2"}
+        assert len(replacement) == 1
+        # only the SparkApps of the dead worker and the ones taken by its replacement moved
+        assert all(after[key] in (owner, *replacement) for key, owner in before.items() if owner != victim)
+    finally:
+        supervisor.stop()